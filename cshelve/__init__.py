@@ -6,28 +6,61 @@ Based on the file extension, it will open a local or cloud shelf, but in any cas
 
 If the file extension is `.ini`, the file is considered a configuration file and handled by `cshelve`; otherwise, it will be handled by the standard `shelve` module.
 """
+from io import BytesIO
 import logging
 from pathlib import Path
+import pickle
 import shelve
 
+from . import _arrays
+from ._arrays import CloudArray
+from ._arrays import configure as _configure_arrays
 from ._data_processing import DataProcessing
 from ._database import _Database
+from ._bloom import configure as _configure_bloom
+from ._chunking import configure as _configure_chunking
+from . import _columnar
+from ._columnar import configure as _configure_columnar
+from ._composite import build as _build_provider
 from ._compression import configure as _configure_compression
+from ._concurrency import configure as _configure_concurrency
+from ._dedup import configure as _configure_dedup
+from . import _dicts
+from ._dicts import CloudDict, NodeCache
+from ._latency import configure as _configure_latency
+from ._layout import configure as _configure_layout
+from ._layout import detects as _detects_layout
+from ._listing import configure as _configure_listing
+from . import _lists
+from ._lists import CloudList
+from ._log import configure as _configure_log
+from ._manifest import configure as _configure_manifest
+from ._namespace import _NamespaceDatabase
+from ._packing import configure as _configure_packing
+from ._prefetch import configure as _configure_prefetch
+from ._prefetch import PrefetchItemsView, PrefetchValuesView, PrefixKeysView
+from . import _parallel
 from ._encryption import configure as _configure_encryption
 from ._factory import factory as _factory
 from ._parser import load as _config_loader
 from ._parser import use_local_shelf
+from ._shared import SharedObjects
+from ._values import configure as _configure_values
+from ._values import decode_head
 from .exceptions import (
     AuthArgumentError,
     AuthTypeError,
     CanNotCreateDBError,
+    ConcurrentWriterError,
     ConfigurationError,
     DataProcessingSignatureError,
     DBDoesNotExistsError,
+    DeadlineExceededError,
     EncryptedDataCorruptionError,
     KeyNotFoundError,
     MissingEncryptionKeyError,
     ReadOnlyError,
+    ThrottlingError,
     UnknownCompressionAlgorithmError,
     UnknownEncryptionAlgorithmError,
     UnknownProviderError,
@@ -38,15 +71,18 @@ __all__ = [
     "AuthArgumentError",
     "AuthTypeError",
     "CanNotCreateDBError",
+    "ConcurrentWriterError",
     "ConfigurationError",
     "DataProcessingSignatureError",
     "DBDoesNotExistsError",
+    "DeadlineExceededError",
     "EncryptedDataCorruptionError",
     "KeyNotFoundError",
     "MissingEncryptionKeyError",
     "open",
     "ReadOnlyError",
     "ResourceNotFoundError",
+    "ThrottlingError",
     "UnknownCompressionAlgorithmError",
     "UnknownEncryptionAlgorithmError",
     "UnknownProviderError",
@@ -75,31 +111,551 @@ class CloudShelf(shelve.Shelf):
         factory,
         logger,
         provider_params,
+        initialize=True,
     ):
+        # Arguments required to open the same shelf in another process.
+        self._open_args = (
+            filename,
+            flag,
+            protocol,
+            writeback,
+            config_loader,
+            factory,
+            logger,
+            provider_params,
+        )
+
         # Load the configuration file to retrieve the provider and its configuration.
         config = config_loader(logger, filename)
 
+        # Controller limiting the concurrency of the bulk operations based on the provider feedback.
+        concurrency = _configure_concurrency(logger, config.concurrency)
+
         # Let the factory create the provider interface object based on the provider name then configure it.
-        provider_interface = factory(logger, config.provider)
-        provider_interface.configure_logging(config.logging)
-        provider_interface.configure_default(config.default)
-        provider_interface.set_provider_params(
-            {**provider_params, **config.provider_params}
+        # Composite providers are made of the providers of the sections they reference.
+        provider_interface = _build_provider(
+            logger,
+            factory,
+            concurrency,
+            config.provider,
+            config.default,
+            config.sections,
+            config.logging,
+            {**provider_params, **config.provider_params},
+        )
+        # Large records may be split into chunks stored once, so only the modified chunks are uploaded.
+        provider_interface = _configure_chunking(
+            logger, provider_interface, concurrency, config.chunking
+        )
+        # Identical records may be stored once, keys pointing to them.
+        provider_interface = _configure_dedup(
+            logger, provider_interface, concurrency, config.dedup
         )
+        # Keys may be stored with a layout easing their partitioning.
+        provider_interface = _configure_layout(
+            logger, provider_interface, config.layout
+        )
+        # Otherwise, the layout recorded in the container is detected on the first access to a key.
+        undetected = provider_interface if _detects_layout(config.layout) else None
 
         # Data processing object used to apply pre and post processing to the data.
         data_processing = DataProcessing(logger)
         _configure_compression(logger, data_processing, config.compression)
         _configure_encryption(logger, data_processing, config.encryption)
 
+        # Deadlines and hedging of the requests sent to the provider.
+        latency = _configure_latency(logger, config.latency)
+        # Small values may be packed into segments to reduce the number of requests.
+        provider_interface = _configure_packing(
+            logger, provider_interface, concurrency, config.packing
+        )
+        # Or writes may be appended to a log to be limited by the bytes written instead of the requests.
+        provider_interface = _configure_log(
+            logger, provider_interface, concurrency, config.log
+        )
+        # Concurrent listing of the keys.
+        listing = _configure_listing(logger, config.listing)
+        # Optional index of the keys stored in the internal namespace.
+        manifest = _configure_manifest(
+            logger, provider_interface, concurrency, config.manifest
+        )
+        # Optional filter of the keys answering locally the lookups of missing keys.
+        bloom = _configure_bloom(logger, provider_interface, config.bloom)
+        # Parts of the overwritten structured values are deleted after a grace period.
+        sweeper = _configure_values(
+            logger, provider_interface, concurrency, config.values
+        )
+
         # The CloudDatabase object is the class that interacts with the cloud storage backend.
         # This class doesn't perform or respect the shelve.Shelf logic and interface so we need to wrap it.
-        database = _Database(logger, provider_interface, flag, data_processing)
-        database._init()
+        database = _Database(
+            logger,
+            provider_interface,
+            flag,
+            data_processing,
+            concurrency,
+            latency,
+            listing,
+            manifest,
+            bloom,
+            sweeper,
+            undetected,
+        )
+        # A shelf restored from a pickle was already initialized by its original process.
+        # Skipping the initialization avoids any request until the shelf is used.
+        if initialize:
+            database._init()
+
+        # Pipeline used to iterate over the items and values.
+        self._prefetcher = _configure_prefetch(logger, config.prefetch)
+        # Inner nodes of the dictionaries, immutable so they can be cached.
+        self._nodes = NodeCache()
+        # DataFrames may be stored by column chunks, so a subset of the columns can be read.
+        self._columnar = _configure_columnar(logger, config.columnar)
+        # Arrays may be stored by chunks, so a window can be read or written.
+        self._arrays = _configure_arrays(logger, config.arrays)
+        # Objects stored once and referenced by the other values.
+        self._shared = SharedObjects()
 
         # Let the standard shelve.Shelf class handle the rest.
         super().__init__(database, protocol, writeback)
 
+    def __getitem__(self, key):
+        """
+        Return the value of the key, lists stored as segments being assembled.
+        """
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        value = self._shared.get(key)
+        if value is None:
+            value = self._loads(self.dict[key.encode(self.keyencoding)])
+        if self.writeback:
+            self.cache[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        """
+        Set the value of the key, DataFrames and arrays being stored by chunks in columnar and array modes.
+        """
+        # The key no longer holds its shared object, unless it is updated.
+        self._shared.discard(key, value)
+        if self.writeback:
+            self.cache[key] = value
+        self.dict[key.encode(self.keyencoding)] = self._dumps(value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super().__delitem__(key)
+
+    def keys(self, prefix=""):
+        """
+        Return a view on the keys of the shelf, optionally restricted to the keys starting with `prefix`.
+        The prefix is pushed down to the provider: only the matching keys are listed.
+        """
+        return PrefixKeysView(self, prefix)
+
+    def items(self, lookahead=None, ordered=None, max_buffer_bytes=None, prefix=""):
+        """
+        Return a view on the items of the shelf, optionally restricted to the keys starting with `prefix`.
+        Values are downloaded and decoded ahead of the iteration, `lookahead` at a time.
+        If `ordered` is False, items are yielded as soon as they are available instead of in listing order.
+        The bytes downloaded but not yet consumed are bounded by `max_buffer_bytes`.
+        """
+        return PrefetchItemsView(
+            self,
+            prefix,
+            lookahead=lookahead,
+            ordered=ordered,
+            max_buffer_bytes=max_buffer_bytes,
+        )
+
+    def values(self, lookahead=None, ordered=None, max_buffer_bytes=None, prefix=""):
+        """
+        Return a view on the values of the shelf, prefetched like the items.
+        """
+        return PrefetchValuesView(
+            self,
+            prefix,
+            lookahead=lookahead,
+            ordered=ordered,
+            max_buffer_bytes=max_buffer_bytes,
+        )
+
+    def count(self, prefix=""):
+        """
+        Return the number of keys starting with `prefix`, without listing the other keys.
+        """
+        if not prefix:
+            return len(self)
+        return self.dict.count(prefix.encode(self.keyencoding))
+
+    def delete_prefix(self, prefix):
+        """
+        Delete all the keys starting with `prefix` and return their number.
+        Deletions are sent concurrently.
+        """
+        if not prefix:
+            raise ValueError("An empty prefix would delete the whole shelf.")
+
+        if self.writeback:
+            for key in [k for k in self.cache if k.startswith(prefix)]:
+                del self.cache[key]
+        return self.dict.delete_prefix(prefix.encode(self.keyencoding))
+
+    def get_many(self, keys):
+        """
+        Return a dictionary of the values of the keys, missing keys being ignored.
+        Values are downloaded concurrently, and with the packed storage, reads of adjacent values are coalesced.
+        """
+        keys = list(keys)
+        values = {}
+        if self.writeback:
+            # The cache is the source of truth.
+            values = {key: self.cache[key] for key in keys if key in self.cache}
+
+        missing = [key for key in keys if key not in values]
+        data = self.dict.get_many(key.encode(self.keyencoding) for key in missing)
+        for key, value in data.items():
+            key = key.decode(self.keyencoding)
+            values[key] = self._loads(value)
+            if self.writeback:
+                self.cache[key] = values[key]
+        return values
+
+    def list(self, key):
+        """
+        Return a view on the list of the key, stored as segments by `append` and `extend`.
+        Items are downloaded segment by segment when iterating, and indexing downloads only the segments containing the items.
+        """
+        return CloudList(self, key)
+
+    def append(self, key, item):
+        """
+        Append an item to the list of the key, created if missing.
+        Only a segment containing the item is uploaded, instead of the whole list.
+        """
+        self.list(key).append(item)
+
+    def extend(self, key, items):
+        """
+        Append the items to the list of the key, created if missing.
+        Only a segment containing the items is uploaded, instead of the whole list.
+        """
+        self.list(key).extend(items)
+
+    def mapping(self, key):
+        """
+        Return a view on the dictionary of the key, stored as a trie of nodes so a write uploads only the nodes on the path of the entry.
+        Lookups download the leaf containing the entry, the other nodes being cached.
+        """
+        return CloudDict(self, key)
+
+    def read_columns(self, key, columns):
+        """
+        Return the DataFrame of the key restricted to the columns.
+        In columnar mode, only the chunks of these columns are downloaded, concurrently.
+        """
+        return _columnar.read_columns(self, key, columns)
+
+    def array(self, key):
+        """
+        Return a view on the array of the key, stored by chunks in array mode.
+        Indexing the view (ex: `db.array(key)[1000:2000, :]`) downloads the chunks overlapping the window concurrently,
+        and assigning a window rewrites only these chunks.
+        """
+        return CloudArray(self, key)
+
+    def share(self, key, value):
+        """
+        Store the object under the key once, the values stored afterwards embedding it being stored with a reference to the key.
+        The object is recognized by identity, and the references are resolved through the cache of the shared objects on load,
+        so the values loaded embed the same instance.
+        """
+        self[key] = value
+        self._shared.add(key, value)
+
+    def compact(self, background=False):
+        """
+        Reclaim the space of the overwritten and deleted values of the packed storage or of the log,
+        and delete the parts of structured values, deduplicated records, chunks and routed values no key points to anymore for their grace period.
+        With `background`, the compaction runs in a thread which is returned, and joined when the shelf is closed.
+        """
+        return self.dict.compact(background)
+
+    def rebalance(self):
+        """
+        Move the keys of a striped shelf to their stripe after a stripe is added or removed.
+        Return the number of keys moved.
+        """
+        return self.dict.rebalance()
+
+    def map(
+        self,
+        fct,
+        keys=None,
+        processes=None,
+        chunksize=_parallel.DEFAULT_CHUNKSIZE,
+        ordered=True,
+        mp_context=None,
+    ):
+        """
+        Apply the function on the values of the keys (all keys by default) using a pool of processes.
+        Each worker uses its own copy of the shelf, downloads and unpickles the values locally, so only the keys and the results are exchanged.
+        Yield the keys and the results of the function, in order unless `ordered` is False.
+        The function must be picklable (defined at the top level of a module).
+        """
+        return _parallel.map(
+            self,
+            fct,
+            self._keys_stream(keys),
+            processes=processes,
+            chunksize=chunksize,
+            ordered=ordered,
+            mp_context=mp_context,
+        )
+
+    def reduce(
+        self,
+        fct,
+        reducer,
+        initial,
+        keys=None,
+        processes=None,
+        chunksize=_parallel.DEFAULT_CHUNKSIZE,
+        mp_context=None,
+    ):
+        """
+        Apply the function on the values using a pool of processes and fold the results with the reducer.
+        Results are folded by the workers before being sent back, so the reducer must be associative and commutative,
+        and `initial` must be its neutral element.
+        """
+        return _parallel.reduce(
+            self,
+            fct,
+            reducer,
+            initial,
+            self._keys_stream(keys),
+            processes=processes,
+            chunksize=chunksize,
+            mp_context=mp_context,
+        )
+
+    def iter_partition(self, index, count):
+        """
+        Iterate over the keys of the partition `index` (starting at 0) among `count` partitions.
+        The assignment is stable across runs, so several nodes can each process their own partition.
+        With the hash prefix layout, each node only lists its own share of the keys.
+        """
+        for key in self.dict.iter_partition(index, count):
+            yield key.decode(self.keyencoding)
+
+    def list_keys(self, prefix="", page_size=None, continuation_token=None):
+        """
+        Return a page of the keys starting with the prefix and the token to retrieve the next page, or None if it was the last one.
+        Useful to resume a listing or to display the keys page by page.
+        """
+        page = self.dict.list_keys(
+            prefix.encode(self.keyencoding), page_size, continuation_token
+        )
+        return [
+            key.decode(self.keyencoding) for key in page.keys
+        ], page.continuation_token
+
+    def namespace(self, prefix):
+        """
+        Return a shelf restricted to the keys starting with `prefix` (ex: `tenant-a/`), the prefix being removed from its keys.
+        The namespace shares the provider client, the configuration and the caches of this shelf, and must be used while it is open.
+        """
+        return _NamespaceShelf(self, prefix)
+
+    def repair_manifest(self):
+        """
+        Rebuild the manifest from a full listing, for example after writes made without the manifest.
+        """
+        self.dict.repair_manifest()
+
+    def rebuild_bloom(self):
+        """
+        Rebuild the Bloom filter from the keys of the shelf, for example after writes made without the filter.
+        """
+        self.dict.rebuild_bloom()
+
+    def __reduce__(self):
+        """
+        Pickle the shelf as the arguments required to open it again.
+        Provider clients, caches and thread pools are not pickled: the restored shelf connects on its first use.
+        """
+        if self.writeback and self.cache:
+            self.dict.logger.warning(
+                "Entries of the writeback cache are not synchronized and not pickled."
+            )
+
+        filename, flag, *others = self._open_args
+        # The database was already created or purged by the original shelf.
+        flag = "w" if flag == "n" else flag
+        return _restore, (filename, flag, *others)
+
+    def update(self, other=(), /, **kwds):
+        """
+        Update the shelf from a mapping or an iterable of key/value pairs.
+        Values are uploaded concurrently instead of one after the other.
+        """
+        if self.writeback:
+            # Values are only cached, there is nothing to upload yet.
+            return super().update(other, **kwds)
+
+        items = dict(other, **kwds)
+        for key, value in items.items():
+            self._shared.discard(key, value)
+        self.dict.set_many(
+            (key.encode(self.keyencoding), self._dumps(value))
+            for key, value in items.items()
+        )
+
+    def sync(self):
+        """
+        Write back the entries of the cache if the shelf was opened with `writeback=True`.
+        Contrary to the standard Shelf, entries are uploaded concurrently.
+        """
+        if self.writeback and self.cache:
+            self.dict.set_many(
+                (key.encode(self.keyencoding), self._dumps(entry))
+                for key, entry in self.cache.items()
+            )
+            self.cache = {}
+        if hasattr(self.dict, "sync"):
+            self.dict.sync()
+
+    def _iter_prefix(self, prefix):
+        """
+        Yield the decoded keys starting with the prefix.
+        """
+        if not prefix:
+            yield from self
+            return
+        for key in self.dict.iter_prefix(prefix.encode(self.keyencoding)):
+            yield key.decode(self.keyencoding)
+
+    def _keys_stream(self, keys=None):
+        """
+        Return the keys provided by the user or stream all the keys of the shelf.
+        """
+        return iter(self) if keys is None else keys
+
+    def _prefetch(self, keys=None, **options):
+        """
+        Yield the decoded keys and values (all keys by default) using the prefetcher.
+        """
+        keys = (
+            iter(self.dict)
+            if keys is None
+            else (k.encode(self.keyencoding) for k in keys)
+        )
+        for key, value in self._prefetcher.iter(
+            self.dict.concurrency, keys, self._load, **options
+        ):
+            key = key.decode(self.keyencoding)
+            if self.writeback:
+                # Keep the same behavior as `__getitem__`: the cache is the source of truth.
+                value = self.cache.setdefault(key, value)
+            yield key, value
+
+    def _load(self, key: bytes):
+        """
+        Download and unpickle the value of the key, returning it with its size.
+        Executed in the prefetcher workers.
+        """
+        if self.writeback:
+            try:
+                return self.cache[key.decode(self.keyencoding)], 0
+            except KeyError:
+                pass
+        data = self.dict[key]
+        return self._loads(data), len(data)
+
+    def _dumps(self, value) -> bytes:
+        """
+        Pickle the value the same way the standard Shelf does.
+        In columnar and array modes, the parts of a DataFrame or an array are uploaded and its head is returned instead.
+        """
+        if self._columnar is not None and _columnar.is_frame(value):
+            return self._columnar.dump(self, value)
+        if self._arrays is not None and _arrays.is_array(value):
+            return self._arrays.dump(self, value)
+        if len(self._shared):
+            # Shared objects are replaced by their key.
+            return self._shared.dumps(value, self._protocol)
+        f = BytesIO()
+        p = pickle.Pickler(f, self._protocol)
+        p.dump(value)
+        return f.getvalue()
+
+    def _loads(self, data: bytes):
+        """
+        Unpickle the value the same way the standard Shelf does, or assemble a structured value from its parts.
+        References to the shared objects are resolved through their cache.
+        """
+        head = decode_head(data)
+        if head is not None:
+            if head.kind == _lists.KIND:
+                return _lists.load(self, head)
+            if head.kind == _dicts.KIND:
+                return _dicts.load(self, head)
+            if head.kind == _columnar.KIND:
+                return _columnar.load(self, head)
+            if head.kind == _arrays.KIND:
+                return _arrays.load(self, head)
+            raise ValueError(f"Unknown kind of structured value: {head.kind}.")
+        return self._shared.loads(data, self._load_shared)
+
+    def _load_shared(self, key: str):
+        """
+        Download and unpickle the shared object referenced by a value.
+        """
+        return self._loads(self.dict[key.encode(self.keyencoding)])
+
+    def _uncache(self, key):
+        """
+        Write back and drop the entry of the writeback cache, before the value is updated in place.
+        """
+        if self.writeback and key in self.cache:
+            self.dict[key.encode(self.keyencoding)] = self._dumps(self.cache.pop(key))
+
+
+class _NamespaceShelf(CloudShelf):
+    """
+    Shelf over a namespace of a cloud shelf.
+    """
+
+    def __init__(self, parent, prefix):
+        self._parent = parent
+        self._namespace = prefix
+        self._prefetcher = parent._prefetcher
+        self._nodes = parent._nodes
+        self._columnar = parent._columnar
+        self._arrays = parent._arrays
+        # References are resolved by the keys of the namespace.
+        self._shared = SharedObjects()
+        database = _NamespaceDatabase(parent.dict, prefix.encode(parent.keyencoding))
+        shelve.Shelf.__init__(
+            self, database, parent._protocol, parent.writeback, parent.keyencoding
+        )
+
+    def __reduce__(self):
+        """
+        Pickle the namespace as its parent and its prefix.
+        """
+        return _NamespaceShelf, (self._parent, self._namespace)
+
+
+def _restore(*open_args) -> CloudShelf:
+    """
+    Open a shelf from the arguments of a pickled shelf.
+    """
+    return CloudShelf(*open_args, initialize=False)
+
 
 def open(
     filename,
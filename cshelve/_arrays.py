@@ -0,0 +1,355 @@
+"""
+Arrays module for cshelve.
+
+Large NumPy arrays are often read or written by windows, but a pickled array is always downloaded and uploaded entirely.
+In array mode, arrays are split into chunks of a fixed shape, and the object of the key is a small header (dtype, shape, chunk shape):
+- Each chunk holds the raw bytes of its elements, compressed and encrypted like any record.
+- `db.array(key)[1000:2000, :]` downloads the chunks overlapping the window concurrently and copies them into the result.
+- `db.array(key)[1000:2000, :] = values` only rewrites the chunks overlapping the window,
+  downloading the ones partially overwritten.
+
+The chunk shape is chosen by halving the outermost dimensions until a chunk is smaller than `chunk_bytes`.
+Arrays of objects and 0-dimensional arrays are pickled as usual.
+A chunked array is updated by a single writer at a time.
+"""
+from itertools import product
+from logging import Logger
+import pickle
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from ._values import Head, decode_head, encode_head, new_id, part_name
+from .exceptions import ConfigurationError, KeyNotFoundError
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+CHUNK_BYTES_KEY = "chunk_bytes"
+
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+# Kind of the value in its head.
+KIND = b"A"
+
+
+def is_array(value: Any) -> bool:
+    """
+    Return whether the value is an array stored by chunks, without importing NumPy.
+    """
+    numpy = sys.modules.get("numpy")
+    return (
+        numpy is not None
+        and type(value) is numpy.ndarray
+        and value.ndim > 0
+        and not value.dtype.hasobject
+    )
+
+
+def chunk_shape(
+    shape: Tuple[int, ...], itemsize: int, chunk_bytes: int
+) -> Tuple[int, ...]:
+    """
+    Return the shape of the chunks: the outermost dimensions are halved until a chunk fits in `chunk_bytes`,
+    so chunks are contiguous slabs of the array as long as possible.
+
+    >>> chunk_shape((10000, 100), 8, 1024 * 1024)
+    (1250, 100)
+    """
+    chunks = [max(1, n) for n in shape]
+    dim = 0
+    while _size(chunks) * itemsize > chunk_bytes and dim < len(chunks):
+        if chunks[dim] == 1:
+            dim += 1
+        else:
+            chunks[dim] = (chunks[dim] + 1) // 2
+    return tuple(chunks)
+
+
+def _size(shape) -> int:
+    size = 1
+    for n in shape:
+        size *= n
+    return size
+
+
+def _chunk_name(value_id: bytes, coords: Tuple[int, ...]) -> bytes:
+    return part_name(value_id, ".".join(map(str, coords)).encode())
+
+
+def _normalize(index, shape: Tuple[int, ...]) -> Tuple[List[slice], List[int]]:
+    """
+    Return a slice per dimension and the dimensions indexed by an integer, removed from the result.
+    Only the basic indexing is supported: integers, slices and an ellipsis.
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    if any(i is Ellipsis for i in index):
+        position = index.index(Ellipsis)
+        missing = len(shape) - len(index) + 1
+        index = index[:position] + (slice(None),) * missing + index[position + 1 :]
+    if len(index) > len(shape):
+        raise IndexError(f"Too many indices for an array of {len(shape)} dimensions.")
+    index = index + (slice(None),) * (len(shape) - len(index))
+
+    slices, dropped = [], []
+    for dim, (i, n) in enumerate(zip(index, shape)):
+        if isinstance(i, slice):
+            slices.append(i)
+        elif hasattr(i, "__index__"):
+            i = i.__index__()
+            if not -n <= i < n:
+                raise IndexError(f"Index {i} out of bounds for axis {dim} of size {n}.")
+            i %= n
+            slices.append(slice(i, i + 1))
+            dropped.append(dim)
+        else:
+            raise IndexError("Only integers, slices and ellipsis are supported.")
+    return slices, dropped
+
+
+def _plan(index, shape, chunks) -> Tuple[Tuple[int, ...], List[int], Dict]:
+    """
+    Return the shape of the selection, its dimensions removed, and for each dimension
+    the chunks overlapping the selection with the slice of the selection and of the chunk they cover.
+    """
+    import numpy as np
+
+    slices, dropped = _normalize(index, shape)
+    selection, covered = [], []
+    for s, n, c in zip(slices, shape, chunks):
+        start, stop, step = s.indices(n)
+        positions = np.arange(start, stop, step)
+        selection.append(len(positions))
+
+        by_chunk = {}
+        if len(positions):
+            owners = positions // c
+            # Positions are monotonic, so the positions of a chunk are contiguous in the selection.
+            boundaries = np.flatnonzero(np.diff(owners)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(positions)]))
+            for first, end in zip(starts.tolist(), ends.tolist()):
+                k = int(owners[first])
+                local_first = int(positions[first]) - k * c
+                local_last = int(positions[end - 1]) - k * c
+                local_stop = local_last + (1 if step > 0 else -1)
+                by_chunk[k] = (
+                    slice(first, end),
+                    slice(local_first, None if local_stop < 0 else local_stop, step),
+                )
+        covered.append(by_chunk)
+    return tuple(selection), dropped, covered
+
+
+def load(shelf, head: Head):
+    """
+    Download the chunks of an array concurrently and return the array.
+    """
+    return CloudArray(shelf, None)._read_window(head, Ellipsis)
+
+
+class ChunkedArrays:
+    """
+    Writer of the arrays by chunks.
+    """
+
+    def __init__(self, logger: Logger, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> None:
+        if chunk_bytes < 1:
+            raise ConfigurationError(
+                f"The size of a chunk must be positive, not {chunk_bytes}."
+            )
+
+        self.logger = logger
+        self.chunk_bytes = chunk_bytes
+
+    def dump(self, shelf, array) -> bytes:
+        """
+        Upload the chunks of the array concurrently, and return its header.
+        """
+        value_id = new_id()
+        chunks = chunk_shape(array.shape, array.dtype.itemsize, self.chunk_bytes)
+        grid = [range(max(1, -(-n // c))) for n, c in zip(array.shape, chunks)]
+
+        def parts():
+            for coords in product(*grid):
+                window = tuple(
+                    slice(k * c, (k + 1) * c) for k, c in zip(coords, chunks)
+                )
+                yield _chunk_name(value_id, coords), array[window].tobytes()
+
+        shelf.dict.set_parts(parts())
+        header = {"dtype": array.dtype, "shape": array.shape, "chunks": chunks}
+        return encode_head(KIND, value_id, pickle.dumps(header, shelf._protocol))
+
+
+class CloudArray:
+    """
+    View on an array stored by chunks.
+    The header is read on each operation, so the view reflects the writes of the other shelves.
+    """
+
+    def __init__(self, shelf, key: str) -> None:
+        self._shelf = shelf
+        self.key = key
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._header()[1]["shape"]
+
+    @property
+    def dtype(self):
+        return self._header()[1]["dtype"]
+
+    @property
+    def chunks(self) -> Tuple[int, ...]:
+        """
+        Shape of the chunks.
+        """
+        return self._header()[1]["chunks"]
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+
+        array = self[...]
+        return array if dtype is None else np.asarray(array, dtype=dtype)
+
+    def __repr__(self) -> str:
+        return f"CloudArray({self.key!r})"
+
+    def __getitem__(self, index):
+        """
+        Return the window of the array, downloading only the chunks overlapping it.
+        """
+        head, _ = self._header()
+        if head is None:
+            return self._pickled()[index]
+        return self._read_window(head, index)
+
+    def __setitem__(self, index, values) -> None:
+        """
+        Write the window of the array, rewriting only the chunks overlapping it.
+        """
+        import numpy as np
+
+        self._shelf._uncache(self.key)
+        head, header = self._header()
+        if head is None:
+            # An array stored as a regular value is stored by chunks first.
+            array = self._pickled()
+            writer = self._shelf._arrays or ChunkedArrays(self._shelf.dict.logger)
+            self._shelf.dict[self._encoded] = writer.dump(self._shelf, array)
+            head, header = self._header()
+
+        dtype, shape, chunks = header["dtype"], header["shape"], header["chunks"]
+        selection, dropped, covered = _plan(index, shape, chunks)
+        # Values have the shape of the selection, with the dimensions indexed by an integer.
+        values = np.asarray(values, dtype=dtype)
+        expanded = [n for dim, n in enumerate(selection) if dim not in dropped]
+        values = np.broadcast_to(values, expanded).reshape(selection)
+
+        def write(coords):
+            target = tuple(covered[dim][k][1] for dim, k in enumerate(coords))
+            source = tuple(covered[dim][k][0] for dim, k in enumerate(coords))
+            actual = self._chunk_shape(coords, shape, chunks)
+            name = _chunk_name(head.id, coords)
+            if all(
+                t.step == 1 and t.start == 0 and t.stop == n
+                for t, n in zip(target, actual)
+            ):
+                # The chunk is entirely overwritten: it doesn't need to be downloaded.
+                chunk = np.ascontiguousarray(values[source])
+            else:
+                data = next(self._shelf.dict.get_parts([name]))
+                chunk = np.frombuffer(data, dtype).reshape(actual).copy()
+                chunk[target] = values[source]
+            self._shelf.dict.set_parts([(name, chunk.tobytes())])
+
+        grid = product(*(sorted(c) for c in covered))
+        try:
+            for _ in self._shelf.dict.concurrency.map(write, grid):
+                pass
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Chunk of {self.key} not found.") from e
+
+    def _read_window(self, head: Head, index):
+        import numpy as np
+
+        header = pickle.loads(head.payload)
+        dtype, shape, chunks = header["dtype"], header["shape"], header["chunks"]
+        selection, dropped, covered = _plan(index, shape, chunks)
+        result = np.empty(selection, dtype=dtype)
+
+        grid = list(product(*(sorted(c) for c in covered)))
+        names = [_chunk_name(head.id, coords) for coords in grid]
+        try:
+            for coords, data in zip(grid, self._shelf.dict.get_parts(names)):
+                chunk = np.frombuffer(data, dtype).reshape(
+                    self._chunk_shape(coords, shape, chunks)
+                )
+                target = tuple(covered[dim][k][0] for dim, k in enumerate(coords))
+                source = tuple(covered[dim][k][1] for dim, k in enumerate(coords))
+                result[target] = chunk[source]
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Chunk of {self.key} not found.") from e
+
+        if dropped:
+            result = result.reshape(
+                [n for dim, n in enumerate(selection) if dim not in dropped]
+            )
+        return result
+
+    def _header(self) -> Tuple[Optional[Head], Dict[str, Any]]:
+        """
+        Return the head and the header of the array, or no head if the array is pickled.
+        """
+        data = self._shelf.dict[self._encoded]
+        head = decode_head(data)
+        if head is None:
+            array = self._shelf._loads(data)
+            if not is_array(array):
+                raise TypeError(f"The value of {self.key} is not an array.")
+            header = {"dtype": array.dtype, "shape": array.shape}
+            return None, {**header, "chunks": array.shape}
+        if head.kind != KIND:
+            raise TypeError(f"The value of {self.key} is not an array.")
+        return head, pickle.loads(head.payload)
+
+    def _pickled(self):
+        return self._shelf._loads(self._shelf.dict[self._encoded])
+
+    @staticmethod
+    def _chunk_shape(coords, shape, chunks) -> Tuple[int, ...]:
+        """
+        Shape of a chunk, smaller than the others at the end of a dimension.
+        """
+        return tuple(
+            max(0, min(c, n - k * c)) for k, n, c in zip(coords, shape, chunks)
+        )
+
+    @property
+    def _encoded(self) -> bytes:
+        return self.key.encode(self._shelf.keyencoding)
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> Optional[ChunkedArrays]:
+    """
+    Configure the array mode based on the `arrays` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return None
+
+    try:
+        arrays = ChunkedArrays(
+            logger, int(config.get(CHUNK_BYTES_KEY, DEFAULT_CHUNK_BYTES))
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid arrays configuration: {e}") from e
+
+    logger.debug(f"Arrays are stored by chunks of at most {arrays.chunk_bytes} bytes.")
+    return arrays
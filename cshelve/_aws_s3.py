@@ -1,20 +1,36 @@
-from typing import Any, Dict, Iterator
+from typing import Any, Dict, Iterator, Optional
 
 import boto3
 from botocore.exceptions import ClientError
 
 from .exceptions import key_access
-from .provider_interface import ProviderInterface
+from .provider_interface import KeysPage, ProviderInterface
 
 
 class AwsS3(ProviderInterface):
+    paginated_listing = True
+
     def __init__(self, logger) -> None:
         self.logger = logger
         self.bucket_name = None
-        self.s3 = None
         self.aws_access_key_id = None
         self.aws_secret_access_key = None
 
+        # The client is created when needed so it can be dropped and created again in a child process.
+        self._s3 = None
+        self._provider_params = {}
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = boto3.client(
+                "s3",
+                aws_access_key_id=self.aws_access_key_id,
+                aws_secret_access_key=self.aws_secret_access_key,
+                **self._provider_params,
+            )
+        return self._s3
+
     def close(self) -> None:
         # No specific close operation needed for boto3 client
         pass
@@ -31,12 +47,11 @@ class AwsS3(ProviderInterface):
 
     def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
         # Set any additional parameters if needed
-        self.s3 = boto3.client(
-            "s3",
-            aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key,
-            **provider_params,
-        )
+        self._provider_params = provider_params
+
+    def reconnect(self) -> None:
+        # The boto3 client is not fork-safe, drop it so a new one is created on the next operation.
+        self._s3 = None
 
     def contains(self, key: bytes) -> bool:
         try:
@@ -64,12 +79,60 @@ class AwsS3(ProviderInterface):
         response = self.s3.get_object(Bucket=self.bucket_name, Key=key.decode("utf-8"))
         return response["Body"].read()
 
+    @key_access(ClientError)
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        # HTTP ranges are inclusive.
+        try:
+            response = self.s3.get_object(
+                Bucket=self.bucket_name,
+                Key=key.decode("utf-8"),
+                Range=f"bytes={offset}-{offset + length - 1}",
+            )
+        except ClientError as e:
+            # The range starts past the end of the object.
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+            raise
+        return response["Body"].read()
+
     def iter(self) -> Iterator[bytes]:
         paginator = self.s3.get_paginator("list_objects_v2")
         for page in paginator.paginate(Bucket=self.bucket_name):
             for obj in page.get("Contents", []):
                 yield obj["Key"].encode("utf-8")
 
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        # The prefix is filtered by the S3 service.
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix.decode("utf-8")
+        ):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].encode("utf-8")
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        # A single page of the S3 listing, continued with the S3 continuation token.
+        params = {"Bucket": self.bucket_name, "Prefix": prefix.decode("utf-8")}
+        if page_size:
+            params["MaxKeys"] = page_size
+        if continuation_token:
+            params["ContinuationToken"] = continuation_token
+        if delimiter:
+            params["Delimiter"] = delimiter.decode("utf-8")
+
+        response = self.s3.list_objects_v2(**params)
+        return KeysPage(
+            [obj["Key"].encode("utf-8") for obj in response.get("Contents", [])],
+            [p["Prefix"].encode("utf-8") for p in response.get("CommonPrefixes", [])],
+            response.get("NextContinuationToken"),
+        )
+
     def len(self) -> int:
         paginator = self.s3.get_paginator("list_objects_v2")
         return sum(
@@ -17,15 +17,15 @@ import os
 from typing import Any, Dict, Iterator, Optional
 
 try:
-    from azure.core.exceptions import ResourceNotFoundError
-    from azure.storage.blob import BlobType
+    from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+    from azure.storage.blob import BlobPrefix, BlobType
 except ImportError:
     raise ImportError(
         "The Azure SDK for Python is required to use the Azure Blob Storage implementation. "
         "You can install it with `pip install cshelve[azure-blob]`"
     )
 
-from .provider_interface import ProviderInterface
+from .provider_interface import KeysPage, ProviderInterface
 from .exceptions import (
     AuthTypeError,
     AuthArgumentError,
@@ -37,6 +37,9 @@ from .exceptions import (
 # Blob clients are cached to avoid creating a new client for each operation.
 LRU_CACHE_MAX_SIZE = 2048
 
+# Maximum size of a block appended to an append blob.
+APPEND_BLOCK_SIZE = 4 * 1024 * 1024
+
 # Logs messages.
 NO_HANDLER_PROVIDED = "Logging configuration for Azure SDK is set but no handler is provided, logs will be ignored."
 
@@ -46,6 +49,10 @@ class AzureBlobStorage(ProviderInterface):
     Implement the database based on the Azure Blob Storage technology.
     """
 
+    paginated_listing = True
+    # Logs are written as append blobs.
+    supports_append = True
+
     def __init__(self, logger) -> None:
         super().__init__(logger)
         self.container_name = None
@@ -151,6 +158,20 @@ class AzureBlobStorage(ProviderInterface):
         client.download_blob().readinto(stream)
         return stream.getvalue()
 
+    @key_access(ResourceNotFoundError)
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        """
+        Retrieve a range of the blob with a single ranged request.
+        """
+        client = self._get_client(key.decode())
+        try:
+            return client.download_blob(offset=offset, length=length).readall()
+        except HttpResponseError as e:
+            # The range starts past the end of the blob.
+            if e.status_code == 416:
+                return b""
+            raise
+
     def close(self) -> None:
         """
         Close the Azure Blob Storage client.
@@ -158,6 +179,14 @@ class AzureBlobStorage(ProviderInterface):
         self.container_client.close()
         self.blob_service_client.close()
 
+    def reconnect(self) -> None:
+        """
+        Drop the Azure clients so they are created again on the next operation.
+        """
+        self._blob_service_client = None
+        self._container_client = None
+        self._get_client.cache_clear()
+
     def sync(self) -> None:
         """
         Sync the Azure Blob Storage client.
@@ -183,6 +212,25 @@ class AzureBlobStorage(ProviderInterface):
             value, blob_type=BlobType.BLOCKBLOB, overwrite=True, length=len(value)
         )
 
+    def append(self, key: bytes, data: bytes) -> None:
+        """
+        Append the data to the append blob with the specified key, creating it if it doesn't exist.
+        """
+        client = self._get_client(key.decode())
+        # A block appended to an append blob is limited in size.
+        blocks = [
+            data[start : start + APPEND_BLOCK_SIZE]
+            for start in range(0, len(data), APPEND_BLOCK_SIZE)
+        ] or [b""]
+
+        try:
+            client.append_block(blocks[0])
+        except ResourceNotFoundError:
+            client.create_append_blob()
+            client.append_block(blocks[0])
+        for block in blocks[1:]:
+            client.append_block(block)
+
     # If an `ResourceNotFoundError` is raised by the SDK, it is converted to a `KeyError` to follow the `dbm` behavior based on a custom module error.
     @key_access(ResourceNotFoundError)
     def delete(self, key: bytes):
@@ -212,6 +260,48 @@ class AzureBlobStorage(ProviderInterface):
             # To respect the Shelf interface, we encode the string to bytes.
             yield i.encode()
 
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        """
+        Return an iterator over the keys starting with the prefix, filtered by the Azure Blob Storage service.
+        """
+        for i in self.container_client.list_blob_names(
+            name_starts_with=prefix.decode()
+        ):
+            yield i.encode()
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys starting with the prefix using the Azure Blob Storage pagination.
+        """
+        if delimiter:
+            items = self.container_client.walk_blobs(
+                name_starts_with=prefix.decode(),
+                delimiter=delimiter.decode(),
+                results_per_page=page_size,
+            )
+        else:
+            items = self.container_client.list_blob_names(
+                name_starts_with=prefix.decode(), results_per_page=page_size
+            )
+
+        pages = items.by_page(continuation_token=continuation_token)
+        keys, prefixes = [], []
+
+        for item in next(pages, []):
+            # Names are returned as strings by `list_blob_names` and as objects by `walk_blobs`.
+            if isinstance(item, BlobPrefix):
+                prefixes.append(item.name.encode())
+            else:
+                keys.append(getattr(item, "name", item).encode())
+
+        return KeysPage(keys, prefixes, pages.continuation_token or None)
+
     def len(self):
         """
         Return the number of objects stored in the database.
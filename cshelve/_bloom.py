@@ -0,0 +1,335 @@
+"""
+Bloom filter module for cshelve.
+
+Looking up a missing key costs a request answered by a 404.
+With the Bloom filter, keys that are definitely absent are answered locally and only the possible hits reach the provider.
+
+The filter is built with a vectorized NumPy pass over the keys of the manifest or of a listing,
+stored in the internal namespace (`__cshelve__/bloom`), and updated on each write of the shelf.
+Keys are never removed from the filter: deleted keys are false positives costing a request, as without the filter.
+
+The filter is merged with the stored one on `sync` and `close`, and reloaded after `max_staleness` seconds.
+Keys written by other writers are therefore reported missing during at most `max_staleness` seconds after they synchronized.
+"""
+from logging import Logger
+import math
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+import zlib
+
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+EXPECTED_KEYS_KEY = "expected_keys"
+FALSE_POSITIVE_RATE_KEY = "false_positive_rate"
+MAX_STALENESS_KEY = "max_staleness"
+
+DEFAULT_EXPECTED_KEYS = 1_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+# Seconds during which a filter loaded from the provider is considered up-to-date.
+DEFAULT_MAX_STALENESS = 60.0
+
+# Name of the object storing the filter.
+BLOOM_KEY = INTERNAL_PREFIX + b"bloom"
+# Header of the stored filter: format version, number of bits, number of hashes, number of keys added.
+_HEADER = struct.Struct("<4sQIQ")
+MAGIC = b"CSB\x00"
+# Number of keys hashed by each vectorized pass.
+BATCH_SIZE = 65536
+
+# FNV-1a 64 bits parameters.
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+_MASK = 2**64 - 1
+
+
+def fnv1a(key: bytes) -> int:
+    """
+    64 bits FNV-1a hash of a key.
+
+    >>> fnv1a(b"")
+    14695981039346656037
+    >>> fnv1a(b"a")
+    12638187200555641996
+    """
+    h = FNV_OFFSET
+    for byte in key:
+        h = ((h ^ byte) * FNV_PRIME) & _MASK
+    return h
+
+
+def fnv1a_many(keys):
+    """
+    Vectorized 64 bits FNV-1a hash of the keys, identical to `fnv1a`.
+    Keys are padded in a matrix processed column by column, so the loop is on the length of the longest key only.
+    """
+    import numpy as np
+
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=len(keys))
+    width = int(lengths.max()) if len(keys) else 0
+
+    matrix = np.zeros((len(keys), width), dtype=np.uint8)
+    for row, key in enumerate(keys):
+        matrix[row, : len(key)] = np.frombuffer(key, dtype=np.uint8)
+
+    hashes = np.full(len(keys), FNV_OFFSET, dtype=np.uint64)
+    prime = np.uint64(FNV_PRIME)
+    # Multiplications wrap around 2**64 as the scalar version.
+    with np.errstate(over="ignore"):
+        for column in range(width):
+            updated = (hashes ^ matrix[:, column].astype(np.uint64)) * prime
+            hashes = np.where(column < lengths, updated, hashes)
+    return hashes
+
+
+def optimal_size(expected_keys: int, false_positive_rate: float):
+    """
+    Return the number of bits and of hashes minimizing the size of the filter for the false positive rate.
+
+    >>> optimal_size(1000, 0.01)
+    (9592, 7)
+    """
+    bits = math.ceil(-expected_keys * math.log(false_positive_rate) / math.log(2) ** 2)
+    # Round to a full byte.
+    bits = max(8, (bits + 7) // 8 * 8)
+    hashes = max(1, round(bits / expected_keys * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Probabilistic set of the keys of the shelf, without false negatives for the keys it knows.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        expected_keys: int = DEFAULT_EXPECTED_KEYS,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+    ) -> None:
+        if not 0 < false_positive_rate < 1:
+            raise ConfigurationError(
+                f"The false positive rate must be between 0 and 1, not {false_positive_rate}."
+            )
+        if expected_keys < 1:
+            raise ConfigurationError(
+                f"The number of expected keys must be positive, not {expected_keys}."
+            )
+
+        self.logger = logger
+        self.provider = provider
+        self.expected_keys = expected_keys
+        self.false_positive_rate = false_positive_rate
+        self.max_staleness = max_staleness
+
+        self._lock = threading.Lock()
+        self._reset(*optimal_size(expected_keys, false_positive_rate))
+        # The filter is loaded on its first use.
+        self._loaded_at: Optional[float] = None
+        # Keys added since the last save, re-added if the stored filter is replaced.
+        self._unsaved = set()
+
+    @property
+    def count(self) -> int:
+        """
+        Number of keys added to the filter, including the ones added several times.
+        """
+        return self._count
+
+    def add(self, key: bytes) -> None:
+        """
+        Add a key to the filter.
+        """
+        with self._lock:
+            for position in self._positions(fnv1a(key)):
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+            self._unsaved.add(key)
+
+    def might_contain(self, key: bytes) -> bool:
+        """
+        Return False if the key is definitely absent, True if it may be present.
+        """
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(fnv1a(key))
+        )
+
+    def refresh(self, keys: Callable[[], Iterable[bytes]]) -> None:
+        """
+        Load the stored filter if it is stale, building it from the keys if it doesn't exist yet.
+        """
+        if (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at <= self.max_staleness
+        ):
+            return
+
+        stored = self._load()
+        if stored is None:
+            self.logger.info("No Bloom filter stored, building it...")
+            # Keys added before the first use may not be listed yet.
+            unsaved = set(self._unsaved)
+            self.build(keys())
+            for key in unsaved:
+                self.add(key)
+            self.save(merge=False)
+            return
+
+        self._absorb(stored)
+        self._loaded_at = time.monotonic()
+
+    def build(self, keys: Iterable[bytes]) -> None:
+        """
+        Replace the filter by a filter of the keys.
+        The filter is sized for the expected number of keys, or twice the number of keys if greater.
+        """
+        import numpy as np
+
+        keys = list(keys)
+        expected = max(self.expected_keys, 2 * len(keys))
+
+        with self._lock:
+            self._reset(*optimal_size(expected, self.false_positive_rate))
+            bits = np.frombuffer(self._bits, dtype=np.uint8)
+            size = np.uint64(self._size)
+
+            for start in range(0, len(keys), BATCH_SIZE):
+                h = fnv1a_many(keys[start : start + BATCH_SIZE])
+                h1, h2 = h & np.uint64(0xFFFFFFFF), (h >> np.uint64(32)) | np.uint64(1)
+                with np.errstate(over="ignore"):
+                    for i in range(self._hashes):
+                        positions = (h1 + np.uint64(i) * h2) % size
+                        np.bitwise_or.at(
+                            bits,
+                            (positions >> np.uint64(3)).astype(np.int64),
+                            (
+                                np.uint8(1)
+                                << (positions & np.uint64(7)).astype(np.uint8)
+                            ),
+                        )
+
+            self._count = len(keys)
+            self._unsaved = set()
+        self._loaded_at = time.monotonic()
+        self.logger.debug(
+            f"Bloom filter built with {len(keys)} keys and {self._size} bits."
+        )
+
+    def save(self, merge: bool = True) -> None:
+        """
+        Store the filter, merged with the stored one unless it must be replaced.
+        """
+        stored = self._load() if merge else None
+        if stored is not None:
+            self._absorb(stored)
+
+        with self._lock:
+            data = _HEADER.pack(MAGIC, self._size, self._hashes, self._count)
+            data += zlib.compress(bytes(self._bits))
+            self._unsaved = set()
+
+        self.provider.set(BLOOM_KEY, data)
+        self._loaded_at = time.monotonic()
+
+    def flush(self) -> None:
+        """
+        Store the filter if keys were added since the last save.
+        """
+        if self._unsaved:
+            self.save()
+
+    def _after_fork(self) -> None:
+        """
+        Reset the lock in a child process: locks of the parent are not usable.
+        """
+        self._lock = threading.Lock()
+
+    def _reset(self, size: int, hashes: int) -> None:
+        self._size, self._hashes = size, hashes
+        self._bits = bytearray(size // 8)
+        self._count = 0
+
+    def _absorb(self, stored) -> None:
+        """
+        Add the keys of the stored filter to the local one.
+        """
+        size, hashes, count, data = stored
+        with self._lock:
+            if (size, hashes) == (self._size, self._hashes):
+                self._merge(data, count)
+                return
+            # The stored filter was built with another size: it is used and the keys added locally are added again.
+            self._size, self._hashes, self._bits, self._count = (
+                size,
+                hashes,
+                data,
+                count,
+            )
+            unsaved, self._unsaved = self._unsaved, set()
+
+        for key in unsaved:
+            self.add(key)
+
+    def _merge(self, data: bytearray, count: int) -> None:
+        """
+        Add the keys of a filter of the same size: a Bloom filter union is the bitwise or.
+        """
+        merged = int.from_bytes(self._bits, "little") | int.from_bytes(data, "little")
+        self._bits = bytearray(merged.to_bytes(len(self._bits), "little"))
+        self._count = max(self._count, count)
+
+    def _positions(self, h: int):
+        """
+        Return the positions of the bits of a hash, with the double hashing scheme.
+        """
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return ((h1 + i * h2) % self._size for i in range(self._hashes))
+
+    def _load(self):
+        """
+        Return the size, the number of hashes, the number of keys and the bits of the stored filter.
+        """
+        try:
+            data = self.provider.get(BLOOM_KEY)
+        except KeyNotFoundError:
+            return None
+
+        magic, size, hashes, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Unsupported Bloom filter format.")
+        return size, hashes, count, bytearray(zlib.decompress(data[_HEADER.size :]))
+
+
+def configure(
+    logger: Logger, provider: ProviderInterface, config: Dict[str, str]
+) -> Optional[BloomFilter]:
+    """
+    Configure the Bloom filter based on the `bloom` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return None
+
+    try:
+        bloom = BloomFilter(
+            logger,
+            provider,
+            expected_keys=int(config.get(EXPECTED_KEYS_KEY, DEFAULT_EXPECTED_KEYS)),
+            false_positive_rate=float(
+                config.get(FALSE_POSITIVE_RATE_KEY, DEFAULT_FALSE_POSITIVE_RATE)
+            ),
+            max_staleness=float(config.get(MAX_STALENESS_KEY, DEFAULT_MAX_STALENESS)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid Bloom filter configuration: {e}") from e
+
+    logger.debug("Bloom filter enabled.")
+    return bloom
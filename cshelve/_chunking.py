@@ -0,0 +1,331 @@
+"""
+Chunking module for cshelve.
+
+Updating a few rows of a large DataFrame uploads the whole value again.
+In chunked mode, records larger than `threshold` are split into chunks stored once under their digest (`__cshelve__/chunks/<digest>`),
+and the object of the key is a small manifest listing its chunks:
+- Chunk boundaries depend on the content (rolling Gear hash), so a local change only alters the chunks around it.
+- A write only uploads the chunks the container doesn't have yet, checked and uploaded concurrently.
+- A read downloads the chunks concurrently.
+
+Boundaries are found with a vectorized NumPy pass, installed with `pip install cshelve[chunking]`.
+Chunks are never deleted with the keys as other keys may reference them.
+The garbage collection (`compact`) lists the manifests, then deletes the chunks no manifest references for `grace_period` seconds (mark-and-sweep),
+as a concurrent writer uploads the chunks before the manifest.
+"""
+import hashlib
+from logging import Logger
+import math
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ._concurrency import ConcurrencyController
+from ._manifest import _read_varint, _varint
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+THRESHOLD_KEY = "threshold"
+CHUNK_SIZE_KEY = "chunk_size"
+
+DEFAULT_THRESHOLD = 4 * 1024 * 1024
+# Average size of a chunk. Chunks are between a quarter and four times this size.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Bytes hashed by each vectorized pass.
+BLOCK_SIZE = 8 * 1024 * 1024
+
+CHUNK_PREFIX = INTERNAL_PREFIX + b"chunks/"
+# Header of a manifest, followed by the number of chunks then the length and digest of each chunk.
+# Records always start with their version, so they can't be mistaken for a manifest.
+MAGIC = b"CSC\x00"
+DIGEST_SIZE = 32
+
+# Number of bytes the rolling hash depends on.
+WINDOW = 32
+# Random but stable value of each byte for the Gear hash.
+GEAR = [
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "little")
+    for i in range(256)
+]
+
+
+def cut_points(data: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[int]:
+    """
+    Return the end offset of each chunk of the data.
+    A chunk ends after a byte whose Gear hash of the previous 32 bytes has its top bits at zero,
+    within a quarter and four times the average chunk size.
+    """
+    import numpy as np
+
+    min_size, max_size = chunk_size // 4, chunk_size * 4
+    bits = max(1, round(math.log2(chunk_size)))
+    mask = np.uint32(((1 << bits) - 1) << (32 - bits))
+    gear = np.array(GEAR, dtype=np.uint32)
+    array = np.frombuffer(data, dtype=np.uint8)
+
+    candidates = []
+    for start in range(0, len(array), BLOCK_SIZE):
+        # The window overlaps the previous block so the hash doesn't depend on the blocks.
+        origin = max(0, start - WINDOW + 1)
+        values = gear[array[origin : start + BLOCK_SIZE]]
+        # Gear hash of the last 32 bytes, computed by doubling the window: h(2w)[i] = h(w)[i] + h(w)[i - w] << w.
+        # Additions and shifts wrap around 2**32, so older bytes don't contribute.
+        hashes, width = values, 1
+        while width < WINDOW:
+            hashes[width:] += hashes[:-width] << np.uint32(width)
+            width *= 2
+        positions = np.nonzero((hashes & mask) == 0)[0] + origin + 1
+        candidates.extend(int(p) for p in positions if p > start)
+
+    points, last = [], 0
+    for point in candidates:
+        if point - last < min_size:
+            continue
+        while point - last > max_size:
+            last += max_size
+            points.append(last)
+        points.append(point)
+        last = point
+    while len(data) - last > max_size:
+        last += max_size
+        points.append(last)
+    if last < len(data):
+        points.append(len(data))
+    return points
+
+
+def encode_chunks(chunks: List[Tuple[int, bytes]]) -> bytes:
+    """
+    Serialize the length and digest of each chunk of a value.
+    """
+    data = bytearray(MAGIC) + _varint(len(chunks))
+    for length, digest in chunks:
+        data += _varint(length) + digest
+    return bytes(data)
+
+
+def decode_chunks(data: bytes) -> Optional[List[Tuple[int, bytes]]]:
+    """
+    Deserialize the chunks of a manifest, or return None if the data is a record stored as-is.
+    """
+    if not data.startswith(MAGIC):
+        return None
+
+    count, position = _read_varint(data, len(MAGIC))
+    chunks = []
+    for _ in range(count):
+        length, position = _read_varint(data, position)
+        chunks.append((length, data[position : position + DIGEST_SIZE]))
+        position += DIGEST_SIZE
+    return chunks
+
+
+class ChunkedProvider(ProviderInterface):
+    """
+    Provider wrapper storing the large records as chunks stored once, keys pointing to their chunks.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        threshold: int = DEFAULT_THRESHOLD,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+    ) -> None:
+        super().__init__(logger)
+        if chunk_size < 64 or threshold < chunk_size:
+            raise ConfigurationError(
+                f"Invalid chunking sizes: threshold={threshold}, chunk_size={chunk_size}."
+            )
+
+        self.provider = provider
+        self.controller = controller
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.sweeper = Sweeper(logger, provider, controller, b"chunks", grace_period)
+
+    @property
+    def paginated_listing(self) -> bool:
+        return self.provider.paginated_listing
+
+    @property
+    def supports_append(self) -> bool:
+        return self.provider.supports_append
+
+    def close(self) -> None:
+        self.provider.close()
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        self.provider.configure_default(config)
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        self.provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        self.provider.set_provider_params(provider_params)
+
+    def create(self) -> None:
+        self.provider.create()
+
+    def exists(self) -> bool:
+        return self.provider.exists()
+
+    def reconnect(self) -> None:
+        self.provider.reconnect()
+
+    def contains(self, key: bytes) -> bool:
+        return self.provider.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        value = self.provider.get(key)
+        chunks = decode_chunks(value)
+        if chunks is None:
+            return value
+        return b"".join(self._fetch(key, [digest for _, digest in chunks]))
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.get_range(key, offset, length)
+
+        value = self.provider.get(key)
+        chunks = decode_chunks(value)
+        if chunks is None:
+            return value[offset : offset + length]
+
+        # Only the chunks overlapping the range are downloaded.
+        start, digests, first = 0, [], None
+        for size, digest in chunks:
+            if start + size > offset and start < offset + length:
+                first = start if first is None else first
+                digests.append(digest)
+            start += size
+        data = b"".join(self._fetch(key, digests))
+        return data[offset - first : offset - first + length] if digests else b""
+
+    def set(self, key: bytes, value: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX) or len(value) < self.threshold:
+            return self.provider.set(key, value)
+
+        points = cut_points(value, self.chunk_size)
+        chunks = [
+            (end - start, value[start:end])
+            for start, end in zip([0] + points[:-1], points)
+        ]
+        digests = [hashlib.sha256(chunk).digest() for _, chunk in chunks]
+        distinct = {digest: chunk for digest, (_, chunk) in zip(digests, chunks)}
+
+        def upload(item):
+            digest, chunk = item
+            name = self._name(digest)
+            # Checked on each write, as the garbage collection of another process may have deleted the chunk.
+            if not self.provider.contains(name):
+                self.provider.set(name, chunk)
+                return 1
+            return 0
+
+        uploaded = sum(self.controller.map(upload, distinct.items()))
+        self.logger.debug(f"{uploaded} chunks uploaded out of {len(chunks)} for {key}.")
+
+        self.provider.set(
+            key, encode_chunks([(size, d) for (size, _), d in zip(chunks, digests)])
+        )
+
+    def delete(self, key: bytes) -> None:
+        self.provider.delete(key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self.provider.iter()
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        return self.provider.iter_prefix(prefix)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        return self.provider.list_keys(prefix, page_size, continuation_token, delimiter)
+
+    def len(self) -> int:
+        return self.provider.len()
+
+    def sync(self) -> None:
+        self.provider.sync()
+
+    def compact(self) -> int:
+        """
+        Delete the chunks no manifest references anymore for the grace period (mark-and-sweep).
+        Return the number of chunks deleted.
+        """
+        self.logger.info("Collecting the unreferenced chunks...")
+
+        def mark(key):
+            try:
+                chunks = decode_chunks(self.provider.get(key))
+            except KeyNotFoundError:
+                # Deleted since listed.
+                return []
+            return [digest for _, digest in chunks or []]
+
+        keys = (k for k in self.provider.iter() if not k.startswith(INTERNAL_PREFIX))
+        referenced = set()
+        for digests in self.controller.map(mark, keys):
+            referenced.update(self._name(digest) for digest in digests)
+
+        garbage = [
+            name
+            for name in self.provider.iter_prefix(CHUNK_PREFIX)
+            if name not in referenced
+        ]
+        deleted = len(self.sweeper.sweep(garbage))
+
+        self.logger.info(f"{deleted} unreferenced chunks deleted.")
+        return deleted
+
+    def _fetch(self, key: bytes, digests: List[bytes]) -> Iterator[bytes]:
+        """
+        Download the chunks concurrently, in order.
+        """
+        try:
+            yield from self.controller.map(
+                lambda digest: self.provider.get(self._name(digest)), digests
+            )
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Chunk of {key} not found.") from e
+
+    def _name(self, digest: bytes) -> bytes:
+        return CHUNK_PREFIX + digest.hex().encode()
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> ProviderInterface:
+    """
+    Wrap the provider with the chunked storage defined in the `chunking` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return provider
+
+    try:
+        chunked = ChunkedProvider(
+            logger,
+            provider,
+            controller,
+            threshold=int(config.get(THRESHOLD_KEY, DEFAULT_THRESHOLD)),
+            chunk_size=int(config.get(CHUNK_SIZE_KEY, DEFAULT_CHUNK_SIZE)),
+            grace_period=float(config.get(GRACE_PERIOD_KEY, DEFAULT_GRACE_PERIOD)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid chunking configuration: {e}") from e
+
+    logger.debug(f"Records larger than {chunked.threshold} bytes are chunked.")
+    return chunked
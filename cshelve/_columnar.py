@@ -0,0 +1,166 @@
+"""
+Columnar module for cshelve.
+
+A DataFrame stored as a single pickle is downloaded and unpickled entirely, even to read one of its columns.
+In columnar mode, DataFrames are stored as a small head describing their schema and a part per column chunk:
+- Each column is split into chunks of `chunk_rows` rows, compressed and encrypted like any record.
+- The index is stored in its own part.
+- Parts are uploaded concurrently.
+
+`db.read_columns(key, ["a", "b"])` downloads and unpickles only the chunks of these columns, concurrently,
+and reading the key (`db[key]`) does the same for all the columns.
+DataFrames stored as pickles stay readable, `read_columns` downloading them entirely.
+
+pandas is only imported if a DataFrame is stored or read, and installed with `pip install cshelve[columnar]`.
+"""
+from logging import Logger
+import pickle
+import sys
+from typing import Any, Dict, List, Optional
+
+from ._values import Head, decode_head, encode_head, new_id, part_name
+from .exceptions import ConfigurationError, KeyNotFoundError
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+CHUNK_ROWS_KEY = "chunk_rows"
+
+DEFAULT_CHUNK_ROWS = 1_048_576
+# Kind of the value in its head.
+KIND = b"F"
+
+
+def is_frame(value: Any) -> bool:
+    """
+    Return whether the value is a DataFrame, without importing pandas.
+    """
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(value, pandas.DataFrame)
+
+
+class Columnar:
+    """
+    Writer of the DataFrames as column chunks.
+    """
+
+    def __init__(self, logger: Logger, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> None:
+        if chunk_rows < 1:
+            raise ConfigurationError(
+                f"The number of rows of a chunk must be positive, not {chunk_rows}."
+            )
+
+        self.logger = logger
+        self.chunk_rows = chunk_rows
+
+    def dump(self, shelf, frame) -> bytes:
+        """
+        Upload the index and the column chunks of the DataFrame concurrently, and return its head.
+        """
+        value_id, rows = new_id(), len(frame)
+        # A DataFrame without rows still has a chunk per column, keeping its dtype.
+        starts = list(range(0, rows, self.chunk_rows)) or [0]
+        index_id = new_id()
+        chunk_ids = [[new_id() for _ in starts] for _ in range(frame.shape[1])]
+
+        def parts():
+            yield part_name(value_id, index_id), shelf._dumps(frame.index)
+            for position, ids in enumerate(chunk_ids):
+                column = frame.iloc[:, position]
+                for start, chunk_id in zip(starts, ids):
+                    chunk = column.iloc[start : start + self.chunk_rows]
+                    data = shelf._dumps(chunk.reset_index(drop=True))
+                    yield part_name(value_id, chunk_id), data
+
+        shelf.dict.set_parts(parts())
+
+        schema = {
+            "columns": frame.columns,
+            "attrs": frame.attrs,
+            "index": index_id,
+            "chunks": chunk_ids,
+        }
+        return encode_head(KIND, value_id, pickle.dumps(schema, shelf._protocol))
+
+
+def load(shelf, head: Head, columns: Optional[List[Any]] = None):
+    """
+    Download the index and the chunks of the columns (all by default) concurrently and return the DataFrame.
+    """
+    import pandas as pd
+
+    schema = pickle.loads(head.payload)
+    stored = list(schema["columns"])
+    if columns is None:
+        positions = list(range(len(stored)))
+        labels = schema["columns"]
+    else:
+        positions = []
+        for label in columns:
+            matching = [
+                p for p, stored_label in enumerate(stored) if stored_label == label
+            ]
+            if not matching:
+                raise KeyError(label)
+            positions.extend(matching)
+        labels = schema["columns"][positions]
+
+    names = [part_name(head.id, schema["index"])] + [
+        part_name(head.id, chunk_id)
+        for position in positions
+        for chunk_id in schema["chunks"][position]
+    ]
+
+    def fetch(name):
+        # Parts are unpickled by the workers too.
+        return shelf._loads(next(shelf.dict.get_parts([name])))
+
+    try:
+        parts = iter(shelf.dict.concurrency.map(fetch, names))
+        index = next(parts)
+        arrays = {}
+        for i, position in enumerate(positions):
+            chunks = [next(parts) for _ in schema["chunks"][position]]
+            column = (
+                chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+            )
+            arrays[i] = column.array
+    except KeyNotFoundError as e:
+        raise KeyNotFoundError("Column chunk not found.") from e
+
+    frame = pd.DataFrame(arrays, index=index, copy=False)
+    frame.columns = labels
+    frame.attrs = schema["attrs"]
+    return frame
+
+
+def read_columns(shelf, key: str, columns: List[Any]):
+    """
+    Return the DataFrame of the key restricted to the columns, downloading only their chunks if stored in columnar mode.
+    """
+    data = shelf.dict[key.encode(shelf.keyencoding)]
+    head = decode_head(data)
+    if head is None:
+        frame = shelf._loads(data)
+        if not is_frame(frame):
+            raise TypeError(f"The value of {key} is not a DataFrame.")
+        return frame[list(columns)]
+    if head.kind != KIND:
+        raise TypeError(f"The value of {key} is not a DataFrame.")
+    return load(shelf, head, list(columns))
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> Optional[Columnar]:
+    """
+    Configure the columnar mode based on the `columnar` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return None
+
+    try:
+        columnar = Columnar(logger, int(config.get(CHUNK_ROWS_KEY, DEFAULT_CHUNK_ROWS)))
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid columnar configuration: {e}") from e
+
+    logger.debug(f"DataFrames are stored by chunks of {columnar.chunk_rows} rows.")
+    return columnar
@@ -0,0 +1,219 @@
+"""
+Composite providers module for cshelve.
+
+A composite provider stores the keys in several providers, each one configured in its own section of the configuration file:
+
+    [default]
+    provider        = striped
+    stripes         = east, west
+
+    [east]
+    provider        = aws-s3
+    bucket_name     = bucket-east
+
+The providers of the sections are created by the factory and configured like the provider of a shelf,
+sharing the logging configuration and the provider parameters.
+A section can itself reference a composite provider.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from ._concurrency import ConcurrencyController
+from .exceptions import ConfigurationError
+from .provider_interface import ProviderInterface
+
+
+# Key containing the provider name in a section.
+PROVIDER_KEY = "provider"
+
+
+def split_names(value: str) -> List[str]:
+    """
+    Return the section names of a comma separated list.
+
+    >>> split_names("east, west,")
+    ['east', 'west']
+    """
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class CompositeProvider(ProviderInterface):
+    """
+    Base class of the providers storing the keys in several providers.
+    The operations applying to all the providers run concurrently.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        providers: Dict[str, ProviderInterface],
+        controller: ConcurrencyController,
+    ) -> None:
+        super().__init__(logger)
+        if not providers:
+            raise ConfigurationError(
+                "A composite provider requires at least one provider."
+            )
+
+        self.providers = providers
+        self.controller = controller
+        # Operations on all the providers have their own pool: they may be called by a bulk operation.
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def sections(config: Dict[str, str]) -> List[str]:
+        """
+        Return the sections of the configuration defining the providers composed.
+        """
+        raise NotImplementedError
+
+    @property
+    def supports_append(self) -> bool:
+        return all(p.supports_append for p in self.providers.values())
+
+    def close(self) -> None:
+        self._on_all(lambda p: p.close())
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        # The providers composed are configured by their own section.
+        pass
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        for provider in self.providers.values():
+            provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        for provider in self.providers.values():
+            provider.set_provider_params(provider_params)
+
+    def create(self) -> None:
+        for provider, exists in zip(
+            self.providers.values(), self._on_all(lambda p: p.exists())
+        ):
+            if not exists:
+                provider.create()
+
+    def exists(self) -> bool:
+        return all(self._on_all(lambda p: p.exists()))
+
+    def reconnect(self) -> None:
+        # Threads and locks of the parent process are not usable in a child process.
+        self._executor = None
+        self._lock = threading.Lock()
+        for provider in self.providers.values():
+            provider.reconnect()
+
+    def sync(self) -> None:
+        self._on_all(lambda p: p.sync())
+
+    def _on_all(
+        self,
+        fct: Callable[[ProviderInterface], Any],
+        providers: Iterable[ProviderInterface] = None,
+    ) -> List[Any]:
+        """
+        Apply the function on each provider concurrently and return the results in order.
+        """
+        providers = list(self.providers.values() if providers is None else providers)
+        if len(providers) == 1:
+            return [fct(providers[0])]
+        return list(self._get_executor().map(fct, providers))
+
+    def _iter_all(
+        self,
+        fct: Callable[[ProviderInterface], Iterable[Any]],
+        providers: Iterable[ProviderInterface] = None,
+    ) -> Iterator[Any]:
+        """
+        List the providers concurrently and yield the elements provider after provider.
+        """
+        for elements in self._on_all(lambda p: list(fct(p)), providers):
+            yield from elements
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=len(self.providers),
+                    thread_name_prefix="cshelve-composite",
+                )
+            return self._executor
+
+
+def _composite(name: str):
+    """
+    Return the class of the composite provider, or None if the provider is not a composite one.
+    """
+    if name == "striped":
+        from ._striped import StripedProvider
+
+        return StripedProvider
+    if name == "tiered":
+        from ._tiered import TieredProvider
+
+        return TieredProvider
+    if name == "replicated":
+        from ._replicated import ReplicatedProvider
+
+        return ReplicatedProvider
+    if name == "routed":
+        from ._routed import RoutedProvider
+
+        return RoutedProvider
+    return None
+
+
+def build(
+    logger: Logger,
+    factory: Callable[[Logger, str], ProviderInterface],
+    controller: ConcurrencyController,
+    provider: str,
+    config: Dict[str, str],
+    sections: Dict[str, Dict[str, str]],
+    logging: Dict[str, str],
+    provider_params: Dict[str, Any],
+    _parents: tuple = (),
+) -> ProviderInterface:
+    """
+    Create and configure the provider, and the providers of the sections it references if it is a composite one.
+    """
+    cls = _composite(provider)
+    if cls is None:
+        provider_interface = factory(logger, provider)
+        provider_interface.configure_logging(logging)
+        provider_interface.configure_default(config)
+        provider_interface.set_provider_params(provider_params)
+        return provider_interface
+
+    providers = {}
+    for name in cls.sections(config):
+        if name in _parents:
+            raise ConfigurationError(f"The section '{name}' references itself.")
+        if name not in sections or PROVIDER_KEY not in sections[name]:
+            raise ConfigurationError(
+                f"The section '{name}' defining a provider is missing."
+            )
+        section = sections[name]
+        providers[name] = build(
+            logger,
+            factory,
+            controller,
+            section[PROVIDER_KEY],
+            section,
+            sections,
+            logging,
+            provider_params,
+            _parents + (name,),
+        )
+
+    logger.info(f"Composing the {provider} provider from {list(providers)}.")
+    provider_interface = cls(logger, providers, controller)
+    provider_interface.configure_default(config)
+    return provider_interface
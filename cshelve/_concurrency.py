@@ -0,0 +1,357 @@
+"""
+Adaptive concurrency module for cshelve.
+
+Bulk operations (purge, batch writes, flush of the writeback cache, prefetching, ...) share a single controller per shelf.
+The controller limits the number of in-flight requests with an AIMD (Additive Increase, Multiplicative Decrease) window:
+- The window grows by one request each time a full window of requests completes without congestion signal.
+- The window is halved when the provider throttles (S3 `SlowDown`, Azure `ServerBusy`, HTTP 429/503...) or when the latency inflates.
+
+Throttled requests are retried with a full jitter exponential backoff, bounded by a retry budget shared by all the requests.
+The budget prevents retry storms: once exhausted, throttling errors are raised to the caller.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import Logger
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from .exceptions import ConfigurationError, ThrottlingError
+
+
+# Keys that can be defined in the INI file.
+MIN_CONCURRENCY_KEY = "min"
+MAX_CONCURRENCY_KEY = "max"
+INITIAL_CONCURRENCY_KEY = "initial"
+MAX_RETRIES_KEY = "max_retries"
+RETRY_RATIO_KEY = "retry_ratio"
+RETRY_RESERVE_KEY = "retry_reserve"
+BACKOFF_BASE_KEY = "backoff_base"
+BACKOFF_MAX_KEY = "backoff_max"
+LATENCY_TOLERANCE_KEY = "latency_tolerance"
+
+# Default values of the controller.
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+# Each successful request deposits 10% of a retry in the budget.
+DEFAULT_RETRY_RATIO = 0.1
+# Number of retries allowed without any successful request.
+DEFAULT_RETRY_RESERVE = 10
+DEFAULT_BACKOFF_BASE = 0.05
+DEFAULT_BACKOFF_MAX = 5.0
+# The latency is considered inflated when the smoothed latency is twice the baseline.
+DEFAULT_LATENCY_TOLERANCE = 2.0
+
+# Absolute slack (in seconds) added to the latency threshold so the jitter of very fast requests is not considered as congestion.
+LATENCY_SLACK = 0.005
+# Weight of the last sample in the smoothed latency.
+LATENCY_SMOOTHING = 0.2
+# The baseline slowly drifts upward so an old, unreachable minimum is forgotten.
+BASELINE_DRIFT = 1.01
+
+# Marks the threads of the controllers.
+_WORKER = threading.local()
+
+# Error codes and HTTP statuses returned by the providers when the request rate is too high.
+THROTTLING_CODES = {
+    "RequestLimitExceeded",
+    "ServerBusy",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+THROTTLING_STATUS = {429, 503}
+
+
+def is_throttling(exception: BaseException) -> bool:
+    """
+    Return whether the exception is a throttling signal from the provider.
+    SDK exceptions are inspected without importing the SDKs as they are optional dependencies.
+    """
+    if isinstance(exception, ThrottlingError):
+        return True
+
+    # AWS SDK errors (`botocore.exceptions.ClientError`) expose the response as a dictionary.
+    response = getattr(exception, "response", None)
+    if isinstance(response, dict):
+        if response.get("Error", {}).get("Code") in THROTTLING_CODES:
+            return True
+        if (
+            response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            in THROTTLING_STATUS
+        ):
+            return True
+
+    # Azure SDK errors (`azure.core.exceptions.HttpResponseError`) expose the error code and the status.
+    if getattr(exception, "error_code", None) in THROTTLING_CODES:
+        return True
+    return getattr(exception, "status_code", None) in THROTTLING_STATUS
+
+
+class ConcurrencyController:
+    """
+    Limit the number of in-flight requests of the bulk operations based on the feedback of the provider.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_ratio: float = DEFAULT_RETRY_RATIO,
+        retry_reserve: int = DEFAULT_RETRY_RESERVE,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+    ) -> None:
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ConfigurationError(
+                f"Invalid concurrency range: min={min_concurrency}, max={max_concurrency}."
+            )
+
+        self.logger = logger
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_ratio = retry_ratio
+        self.retry_reserve = retry_reserve
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_tolerance = latency_tolerance
+
+        # Number of requests allowed to be in-flight.
+        # It is a float so the additive increase can be spread over a full window of requests.
+        self._window = float(
+            min(max(initial_concurrency, min_concurrency), max_concurrency)
+        )
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        # Retries available, shared by all the requests.
+        self._retry_tokens = float(retry_reserve)
+        # Lowest latency observed (slowly drifting) and smoothed latency.
+        self._baseline = None
+        self._latency = None
+        # Requests started before the last decrease don't trigger a new decrease.
+        self._last_decrease = 0.0
+
+        # The thread pool is created only when a bulk operation is executed.
+        self._executor = None
+
+    @property
+    def window(self) -> int:
+        """
+        Number of requests currently allowed to be in-flight.
+        """
+        return int(self._window)
+
+    @property
+    def retry_tokens(self) -> float:
+        """
+        Number of retries currently available in the budget.
+        """
+        return self._retry_tokens
+
+    def call(self, fct: Callable[..., Any], *args) -> Any:
+        """
+        Execute the function once a slot is available in the window, retrying it on throttling.
+        """
+        attempt = 0
+
+        while True:
+            start = self._acquire()
+            try:
+                result = fct(*args)
+            except Exception as e:
+                throttled = is_throttling(e)
+                self._release(start, congested=throttled)
+
+                if not throttled or attempt >= self.max_retries:
+                    raise
+                if not self._withdraw_retry():
+                    self.logger.warning(
+                        "Retry budget exhausted, throttling error raised."
+                    )
+                    raise
+
+                attempt += 1
+                self._backoff(attempt)
+                continue
+
+            self._release(start, congested=False)
+            return result
+
+    def submit(self, fct: Callable[..., Any], *args) -> Future:
+        """
+        Schedule the function in the thread pool of the controller.
+        """
+        return self._get_executor().submit(self.call, fct, *args)
+
+    def map(self, fct: Callable[..., Any], iterable: Iterable[Any]) -> Iterator[Any]:
+        """
+        Apply the function on each element concurrently and yield the results in order.
+        The iterable is consumed as a stream: the number of pending tasks is bounded.
+        """
+        if getattr(_WORKER, "active", False):
+            # A task waiting for other tasks could fill the pool and the window with waiting tasks:
+            # nested bulk operations (ex: a provider wrapper called by `set_many`) run in the calling task.
+            for item in iterable:
+                yield fct(item)
+            return
+
+        pending = deque()
+
+        for item in iterable:
+            pending.append(self.submit(fct, item))
+
+            # Yield results as soon as possible to bound the memory used by the pending tasks.
+            while pending and (
+                pending[0].done() or len(pending) >= 2 * self.max_concurrency
+            ):
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self) -> None:
+        """
+        Release the thread pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _after_fork(self) -> None:
+        """
+        Reset the state of the controller in a child process: threads and locks of the parent are not usable.
+        """
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # Threads are limited by the maximum window; the effective concurrency is limited by the window itself.
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="cshelve",
+                initializer=_mark_worker,
+            )
+        return self._executor
+
+    def _acquire(self) -> float:
+        """
+        Wait for a free slot in the window and return the start time of the request.
+        """
+        with self._condition:
+            while self._in_flight >= self.window:
+                self._condition.wait()
+            self._in_flight += 1
+        return time.monotonic()
+
+    def _release(self, start: float, congested: bool) -> None:
+        """
+        Free the slot and adapt the window based on the outcome of the request.
+        """
+        now = time.monotonic()
+
+        with self._condition:
+            self._in_flight -= 1
+
+            if not congested:
+                congested = self._latency_inflated(now - start)
+                # Only successful requests refill the retry budget.
+                self._retry_tokens = min(
+                    self._retry_tokens + self.retry_ratio, self.retry_reserve
+                )
+
+            if congested:
+                # Only one decrease per window: requests started before the previous decrease reflect the old window.
+                if start >= self._last_decrease:
+                    self._window = max(self.min_concurrency, self._window / 2)
+                    self._last_decrease = now
+                    self.logger.debug(
+                        f"Congestion detected, window reduced to {self.window}."
+                    )
+            else:
+                self._window = min(
+                    self.max_concurrency, self._window + 1 / self._window
+                )
+
+            self._condition.notify_all()
+
+    def _latency_inflated(self, latency: float) -> bool:
+        """
+        Update the latency statistics and return whether the latency is inflated compared to the baseline.
+        """
+        if self._baseline is None:
+            self._baseline = self._latency = latency
+            return False
+
+        self._baseline = min(self._baseline * BASELINE_DRIFT, latency)
+        self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+
+        return self._latency > self._baseline * self.latency_tolerance + LATENCY_SLACK
+
+    def _withdraw_retry(self) -> bool:
+        """
+        Consume a retry from the budget if possible.
+        """
+        with self._condition:
+            if self._retry_tokens >= 1:
+                self._retry_tokens -= 1
+                return True
+            return False
+
+    def _backoff(self, attempt: int) -> None:
+        """
+        Sleep with a full jitter exponential backoff.
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        time.sleep(random.uniform(0, delay))
+
+
+def _mark_worker() -> None:
+    _WORKER.active = True
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> ConcurrencyController:
+    """
+    Configure the concurrency controller based on the `concurrency` section of the configuration.
+    """
+    if not config:
+        return ConcurrencyController(logger)
+
+    try:
+        controller = ConcurrencyController(
+            logger,
+            min_concurrency=int(
+                config.get(MIN_CONCURRENCY_KEY, DEFAULT_MIN_CONCURRENCY)
+            ),
+            max_concurrency=int(
+                config.get(MAX_CONCURRENCY_KEY, DEFAULT_MAX_CONCURRENCY)
+            ),
+            initial_concurrency=int(
+                config.get(INITIAL_CONCURRENCY_KEY, DEFAULT_INITIAL_CONCURRENCY)
+            ),
+            max_retries=int(config.get(MAX_RETRIES_KEY, DEFAULT_MAX_RETRIES)),
+            retry_ratio=float(config.get(RETRY_RATIO_KEY, DEFAULT_RETRY_RATIO)),
+            retry_reserve=int(config.get(RETRY_RESERVE_KEY, DEFAULT_RETRY_RESERVE)),
+            backoff_base=float(config.get(BACKOFF_BASE_KEY, DEFAULT_BACKOFF_BASE)),
+            backoff_max=float(config.get(BACKOFF_MAX_KEY, DEFAULT_BACKOFF_MAX)),
+            latency_tolerance=float(
+                config.get(LATENCY_TOLERANCE_KEY, DEFAULT_LATENCY_TOLERANCE)
+            ),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid concurrency configuration: {e}") from e
+
+    logger.debug(
+        f"Concurrency configured: window between {controller.min_concurrency} and {controller.max_concurrency}."
+    )
+    return controller
@@ -6,16 +6,45 @@ The term _Database is used to follow the naming convention of the Python Shelve
 from collections import namedtuple
 from logging import Logger
 from collections.abc import MutableMapping
-from concurrent.futures import ThreadPoolExecutor
+import os
 import struct
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import weakref
 
+from ._bloom import BloomFilter
+from ._chunking import ChunkedProvider
+from ._concurrency import ConcurrencyController
 from ._data_processing import DataProcessing
-from .provider_interface import ProviderInterface
+from ._dedup import ContentAddressedProvider
+from ._dicts import KIND as DICT_KIND
+from ._dicts import reachable as dict_reachable
+from ._latency import LatencyPolicy
+from ._layout import HashPrefixLayout, check_partition, detect, in_partition
+from ._listing import ListingEngine
+from ._lists import KIND as LIST_KIND
+from ._lists import reachable as list_reachable
+from ._log import LogProvider
+from ._manifest import Manifest
+from ._packing import PackedProvider
+from ._routed import RoutedProvider
+from ._striped import StripedProvider
+from ._sweep import Sweeper
+from ._values import (
+    HEADS_PREFIX,
+    VALUES_PREFIX,
+    decode_head,
+    marked,
+    marker_name,
+    owner,
+)
+from .provider_interface import INTERNAL_PREFIX, KeysPage, ProviderInterface
 from ._flag import can_create, can_write, clear_db
 from .exceptions import (
     CanNotCreateDBError,
     DBDoesNotExistsError,
     DBDoesNotExistsError,
+    KeyNotFoundError,
 )
 
 
@@ -26,6 +55,21 @@ __all__ = ["_Database"]
 # This version must evolve if the record structure changes to ensure backward compatibility and allow migration scripts.
 VERSION = 0
 _Record = namedtuple("Record", ["version", "data"])
+# Number of structured values whose marker is known to be written.
+MARKERS_CACHE_SIZE = 100_000
+
+# Databases alive in the process, reset in the child process after a fork.
+# Mappings are not hashable, so they are indexed by their id.
+_DATABASES = weakref.WeakValueDictionary()
+
+
+def _after_fork() -> None:
+    for database in list(_DATABASES.values()):
+        database._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
 
 
 class _Database(MutableMapping):
@@ -39,70 +83,331 @@ class _Database(MutableMapping):
         db: ProviderInterface,
         flag: str,
         data_processing: DataProcessing,
+        concurrency: Optional[ConcurrencyController] = None,
+        latency: Optional[LatencyPolicy] = None,
+        listing: Optional[ListingEngine] = None,
+        manifest: Optional[Manifest] = None,
+        bloom: Optional[BloomFilter] = None,
+        sweeper: Optional[Sweeper] = None,
+        layout: Optional[ProviderInterface] = None,
     ) -> None:
         super().__init__()
         self.data_processing = data_processing
         self.db = db
         self.flag = flag
         self.logger = logger
+        # Controller shared by all the bulk operations.
+        self.concurrency = concurrency or ConcurrencyController(logger)
+        # Deadlines and hedging applied on each request sent to the provider.
+        self.latency = latency or LatencyPolicy(logger)
+        # Keys are listed by partitions listed concurrently.
+        self.listing = listing or ListingEngine(logger)
+        # Optional index of the keys answering `len`, the iteration and the membership tests.
+        self.manifest = manifest
+        # Optional filter answering locally the lookups of missing keys.
+        self.bloom = bloom
+        # Deletion of the parts of the structured values after their grace period.
+        self.sweeper = sweeper or Sweeper(logger, db, self.concurrency, b"values")
+        # Structured values whose marker was written by this process.
+        self._markers = set()
+        # Compactions running in the background, joined on close.
+        self._compactions = []
+        # Provider whose recorded layout is read on the first access to a key, if the layout is detected.
+        self._undetected = layout
+        self._layout_lock = threading.Lock()
+
+        _DATABASES[id(self)] = self
 
     def __getitem__(self, key: bytes) -> bytes:
         """
         Retrieve the value associated with the key from the database.
         """
-        value = self.db.get(key)
-        record = _Record._make(struct.unpack(f"<B{len(value) - 1}s", value))
+        self._detect_layout()
+        if self._absent(key):
+            raise KeyNotFoundError(f"Key not found: {key}")
 
-        if record.version > VERSION:
-            # If the version is greater than the current version, its a raw pickle from earlier cshelve versions.
-            self.logger.warning(
-                f"Version mismatch: {record.version} != {VERSION}. Migrating..."
-            )
-            value = DataProcessing.encapsulate(value)
-            record = _Record(VERSION, value)
-            self.logger.warning(f"Migration successful.")
-        return self.data_processing.apply_post_processing(record.data)
+        return self._from_record(self.latency.read(self.db.get, key))
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, bytes]:
+        """
+        Retrieve the values of several keys concurrently, missing keys being ignored.
+        With the packed storage, reads of adjacent values are coalesced.
+        """
+        self._detect_layout()
+        keys = [key for key in keys if not self._absent(key)]
+
+        if isinstance(self.db, PackedProvider):
+            values = self.latency.read(self.db.get_many, keys)
+        else:
+
+            def load(key):
+                try:
+                    return key, self.latency.read(self.db.get, key)
+                except KeyNotFoundError:
+                    return None
+
+            values = dict(v for v in self.concurrency.map(load, keys) if v is not None)
+
+        return {key: self._from_record(value) for key, value in values.items()}
 
     @can_write
     def __setitem__(self, key: bytes, value: bytes) -> None:
         """
         Set the value associated with the key in the database.
         """
-        value_processed = self.data_processing.apply_pre_processing(value)
-        record = struct.pack(f"<B{len(value_processed)}s", VERSION, value_processed)
-        self.db.set(key, record)
+        self._set(key, value)
 
     @can_write
     def __delitem__(self, key: bytes) -> None:
         """
         Delete the key from the database.
         """
-        self.db.delete(key)
+        self._delete(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        """
+        Check if the key exists without downloading its value.
+        """
+        self._detect_layout()
+        if self._absent(key):
+            return False
+        if self.manifest is not None:
+            return key in self.manifest
+        return self.latency.read(self.db.contains, key)
+
+    @can_write
+    def set_many(self, items: Iterable[Tuple[bytes, bytes]]) -> None:
+        """
+        Set multiple values concurrently.
+        """
+        for _ in self.concurrency.map(lambda item: self._set(*item), items):
+            pass
+
+    @can_write
+    def delete_many(self, keys: Iterable[bytes]) -> None:
+        """
+        Delete multiple keys concurrently.
+        """
+        for _ in self.concurrency.map(self._delete, keys):
+            pass
+
+    def get_parts(self, names: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Retrieve the parts of structured values concurrently, in order.
+        """
+        return self.concurrency.map(
+            lambda name: self._from_record(self.latency.read(self.db.get, name)),
+            names,
+        )
+
+    @can_write
+    def set_parts(self, parts: Iterable[Tuple[bytes, bytes]]) -> None:
+        """
+        Set the parts of structured values concurrently.
+        Parts are internal objects: they are not indexed by the manifest nor the Bloom filter.
+        """
+
+        def upload(part):
+            name, data = part
+            self.latency.write(self.db.set, name, self._to_record(data))
+
+        for _ in self.concurrency.map(upload, parts):
+            pass
+
+    @can_write
+    def delete_parts(self, names: Iterable[bytes]) -> None:
+        """
+        Delete the parts of structured values concurrently, missing parts being ignored.
+        """
+
+        def delete(name):
+            try:
+                self.latency.write(self.db.delete, name)
+            except KeyNotFoundError:
+                pass
+
+        for _ in self.concurrency.map(delete, names):
+            pass
 
     def __iter__(self):
         """
         Iterate over the keys in the database.
         """
-        yield from self.db.iter()
+        self._detect_layout()
+        if self.manifest is not None:
+            yield from self.manifest
+            return
+        yield from self.listing.iter(self.db, self.concurrency)
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        """
+        Iterate over the keys starting with the prefix, listing only these keys.
+        """
+        self._detect_layout()
+        if self.manifest is not None:
+            yield from (key for key in self.manifest if key.startswith(prefix))
+            return
+        yield from self.listing.iter(self.db, self.concurrency, prefix)
+
+    def count(self, prefix: bytes = b"") -> int:
+        """
+        Return the number of keys starting with the prefix.
+        """
+        self._detect_layout()
+        if self.manifest is not None:
+            return sum(1 for _ in self.iter_prefix(prefix))
+        return self.listing.count(self.db, self.concurrency, prefix)
+
+    @can_write
+    def delete_prefix(self, prefix: bytes) -> int:
+        """
+        Delete the keys starting with the prefix concurrently and return their number.
+        """
+        # Keys are listed first so the deletions don't disturb the pagination of the listing.
+        keys = list(self.iter_prefix(prefix))
+        self.delete_many(keys)
+        return len(keys)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys starting with the prefix.
+        """
+        self._detect_layout()
+        return self.latency.read(
+            self.db.list_keys, prefix, page_size, continuation_token
+        )
+
+    def iter_partition(self, index: int, count: int):
+        """
+        Iterate over the keys of the partition `index` among `count` partitions.
+        The assignment of a key to a partition is stable across runs.
+        """
+        check_partition(index, count)
+        self._detect_layout()
+
+        if isinstance(self.db, HashPrefixLayout):
+            # Only the shards of the partition are listed.
+            yield from self.db.iter_partition(index, count)
+            return
+
+        self.logger.info(
+            "No key layout configured, the partition is filtered from the full listing."
+        )
+        # The listing or the manifest skip the internal objects.
+        for key in self:
+            if in_partition(key, index, count):
+                yield key
 
     def __len__(self) -> int:
         """
         Return the number of elements in the database.
         """
-        return self.db.len()
+        self._detect_layout()
+        if self.manifest is not None:
+            return len(self.manifest)
+        return self.listing.count(self.db, self.concurrency)
 
     def close(self) -> None:
         """
-        Close the database.
+        Close the database, once the compactions running in the background are done.
         """
+        for thread in self._compactions:
+            thread.join()
+        self._flush_indexes()
+        self.concurrency.close()
+        self.latency.close()
         self.db.close()
 
     def sync(self) -> None:
         """
         Sync the database.
         """
+        self._flush_indexes()
         self.db.sync()
 
+    def repair_manifest(self) -> None:
+        """
+        Rebuild the manifest from a full listing of the keys.
+        Each value is downloaded to compute its entry.
+        """
+        if self.manifest is None:
+            raise ValueError("The manifest is not enabled.")
+
+        self.logger.info("Repairing the manifest...")
+        self._detect_layout()
+
+        def load(key):
+            try:
+                return key, self.latency.read(self.db.get, key)
+            except KeyNotFoundError:
+                # Deleted since listed.
+                return None
+
+        records = self.concurrency.map(
+            load, self.listing.iter(self.db, self.concurrency)
+        )
+        self.manifest.rebuild(record for record in records if record is not None)
+
+    def rebuild_bloom(self) -> None:
+        """
+        Rebuild the Bloom filter from the keys of the manifest or of a full listing.
+        """
+        if self.bloom is None:
+            raise ValueError("The Bloom filter is not enabled.")
+
+        self.bloom.build(iter(self))
+        self.bloom.save(merge=False)
+
+    @can_write
+    def compact(self, background: bool = False):
+        """
+        Reclaim the space of the overwritten and deleted packed or logged values, and of the unreferenced parts of structured values,
+        deduplicated records, chunks and routed values.
+        With `background`, the compaction runs in a thread which is returned, and joined when the database is closed.
+        Unreferenced objects are only deleted after their grace period, as concurrent writers upload them before their reference.
+        """
+        if not background:
+            return self._compact()
+
+        thread = threading.Thread(target=self._compact, daemon=True)
+        self._compactions = [t for t in self._compactions if t.is_alive()] + [thread]
+        thread.start()
+        return thread
+
+    @can_write
+    def rebalance(self) -> int:
+        """
+        Move the keys stored on another stripe than theirs.
+        """
+        provider = self.db
+        while provider is not None and not isinstance(provider, StripedProvider):
+            provider = getattr(provider, "provider", None)
+        if provider is None:
+            raise ValueError("The shelf is not striped.")
+
+        # Buffered writes are placed on their stripe first.
+        self.sync()
+        return provider.rebalance()
+
+    def _after_fork(self) -> None:
+        """
+        Drop the clients, threads and locks inherited from the parent process.
+        """
+        self._compactions = []
+        self._layout_lock = threading.Lock()
+        self.concurrency._after_fork()
+        self.latency._after_fork()
+        if self.manifest is not None:
+            self.manifest._after_fork()
+        if self.bloom is not None:
+            self.bloom._after_fork()
+        self.db.reconnect()
+
     def _init(self):
         """
         Initialize the database by:
@@ -126,8 +431,179 @@ class _Database(MutableMapping):
             # If the database exists, but the flag parameter indicates that it should be cleared, clear it.
             if clear_db(self.flag):
                 self.logger.info(f"Purging the database...")
+                self._detect_layout()
                 # Retrieve all the keys and delete them.
-                # Retrieving keys is quick, but deletion synchronously is slow, so we use threads to speed up the process.
-                with ThreadPoolExecutor() as executor:
-                    list(executor.map(self.db.delete, self.db.iter()))
+                # Retrieving keys is quick, but deletion synchronously is slow, so the deletions are done concurrently.
+                # The keys are listed from the provider as the manifest may be stale.
+                self.delete_many(self.listing.iter(self.db, self.concurrency))
+                # Segments and deduplicated records are internal objects: they are deleted once all their values are.
+                self._compact()
+                if self.manifest is not None:
+                    self.manifest.rebuild([])
+                if self.bloom is not None:
+                    self.bloom.build([])
+                    self.bloom.save(merge=False)
                 self.logger.info(f"Database purged.")
+
+    def _set(self, key: bytes, value: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX):
+            raise ValueError(f"Keys starting with {INTERNAL_PREFIX} are reserved.")
+        self._detect_layout()
+
+        record = self._to_record(value)
+        if self.bloom is not None:
+            # Added before the write so the key is never reported missing once written.
+            self.bloom.add(key)
+        head = decode_head(value)
+        if head is not None and head.id not in self._markers:
+            # Written before the head, so the garbage collection finds the head of each value.
+            self.latency.write(self.db.set, marker_name(head.id), self._to_record(key))
+            if len(self._markers) >= MARKERS_CACHE_SIZE:
+                self._markers.clear()
+            self._markers.add(head.id)
+        self.latency.write(self.db.set, key, record)
+        if self.manifest is not None:
+            self.manifest.record(key, record)
+
+    def _delete(self, key: bytes) -> None:
+        self._detect_layout()
+        self.latency.write(self.db.delete, key)
+        if self.manifest is not None:
+            self.manifest.remove(key)
+
+    def _detect_layout(self) -> None:
+        """
+        Read the layout recorded in the container on the first access to a key,
+        and insert it between the provider and the wrappers above it.
+        """
+        if self._undetected is None:
+            return
+        with self._layout_lock:
+            provider = self._undetected
+            if provider is None:
+                return
+            layout = detect(self.logger, provider)
+            if self.db is provider:
+                self.db = layout
+            elif layout is not provider:
+                # The packed or logged storage wraps the provider.
+                wrapper = self.db
+                while wrapper.provider is not provider:
+                    wrapper = wrapper.provider
+                wrapper.provider = layout
+            self._undetected = None
+
+    def _absent(self, key: bytes) -> bool:
+        """
+        Return whether the key is definitely absent according to the Bloom filter.
+        """
+        if self.bloom is None:
+            return False
+        self.bloom.refresh(lambda: iter(self))
+        return not self.bloom.might_contain(key)
+
+    def _flush_indexes(self) -> None:
+        """
+        Write the pending updates of the manifest and of the Bloom filter.
+        """
+        if self.manifest is not None:
+            self.manifest.flush()
+        if self.bloom is not None:
+            self.bloom.flush()
+
+    def _compactables(self) -> list:
+        """
+        Return the provider wrappers with garbage to reclaim, from the outermost one.
+        """
+        compactables, provider = [], self.db
+        while provider is not None:
+            if isinstance(
+                provider,
+                (
+                    PackedProvider,
+                    LogProvider,
+                    ContentAddressedProvider,
+                    ChunkedProvider,
+                    RoutedProvider,
+                ),
+            ):
+                compactables.append(provider)
+            provider = getattr(provider, "provider", None)
+        return compactables
+
+    def _compact(self) -> int:
+        self._detect_layout()
+        # Outer wrappers first, as they may release objects of the inner ones.
+        deleted = self._compact_values()
+        return deleted + sum(provider.compact() for provider in self._compactables())
+
+    def _compact_values(self) -> int:
+        """
+        Delete the parts of the structured values no head references anymore for the grace period (mark-and-sweep).
+        Only the head of the key recorded by the marker of each value is read, instead of all the values.
+        The segments of a list and the nodes of a dictionary replaced by its writes are deleted too,
+        once no longer referenced by its head.
+        Return the number of parts deleted.
+        """
+        objects = {}
+        for name in self.db.iter_prefix(VALUES_PREFIX):
+            objects.setdefault(owner(name), []).append(name)
+        for name in self.db.iter_prefix(HEADS_PREFIX):
+            objects.setdefault(marked(name), []).append(name)
+        if not objects:
+            return 0
+
+        self.logger.info("Collecting the parts of the overwritten structured values...")
+
+        def unreferenced(value_id):
+            names = objects[value_id]
+            try:
+                key = self._from_record(self.db.get(marker_name(value_id)))
+                head = decode_head(self._from_record(self.db.get(key)))
+            except KeyNotFoundError:
+                # Without marker, the head may not be written yet: the grace period protects the parts.
+                return names
+            if head is None or head.id != value_id:
+                return names
+            if head.kind == DICT_KIND:
+                parts = dict_reachable(self, head)
+            elif head.kind == LIST_KIND:
+                parts = list_reachable(head)
+            else:
+                return []
+            return [n for n in names if n.startswith(VALUES_PREFIX) and n not in parts]
+
+        garbage = [
+            name
+            for names in self.concurrency.map(unreferenced, objects)
+            for name in names
+        ]
+        deleted = sum(
+            1 for name in self.sweeper.sweep(garbage) if name.startswith(VALUES_PREFIX)
+        )
+
+        self.logger.info(f"{deleted} unreferenced parts deleted.")
+        return deleted
+
+    def _from_record(self, value: bytes) -> bytes:
+        """
+        Unwrap the record structure and apply the post-processing on the data.
+        """
+        record = _Record._make(struct.unpack(f"<B{len(value) - 1}s", value))
+
+        if record.version > VERSION:
+            # If the version is greater than the current version, its a raw pickle from earlier cshelve versions.
+            self.logger.warning(
+                f"Version mismatch: {record.version} != {VERSION}. Migrating..."
+            )
+            value = DataProcessing.encapsulate(value)
+            record = _Record(VERSION, value)
+            self.logger.warning(f"Migration successful.")
+        return self.data_processing.apply_post_processing(record.data)
+
+    def _to_record(self, value: bytes) -> bytes:
+        """
+        Apply the pre-processing on the value and wrap it in the record structure.
+        """
+        value_processed = self.data_processing.apply_pre_processing(value)
+        return struct.pack(f"<B{len(value_processed)}s", VERSION, value_processed)
@@ -0,0 +1,210 @@
+"""
+Content-addressed module for cshelve.
+
+Keys holding byte-identical values (ex: the same model artifact under several version aliases) are uploaded and stored once per key.
+In content-addressed mode, each record is stored once under its digest (`__cshelve__/cas/<digest>`) and the object of the key is a small pointer to it:
+- Writing a value already stored only checks the record exists and writes the pointer.
+- Reading a value costs a request for the pointer and one for the record.
+- Records smaller than `min_size` are stored inline, as without deduplication, the pointer being as costly as the record.
+
+Records are never deleted with the keys as other keys may point to them.
+The garbage collection (`compact`) lists the pointers, then deletes the records no pointer references for `grace_period` seconds (mark-and-sweep),
+as a concurrent writer uploads a record before its pointer.
+"""
+import hashlib
+from logging import Logger
+from typing import Any, Dict, Iterator, Optional
+
+from ._concurrency import ConcurrencyController
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+ALGORITHM_KEY = "algorithm"
+MIN_SIZE_KEY = "min_size"
+
+DEFAULT_ALGORITHM = "sha256"
+DEFAULT_MIN_SIZE = 1024
+
+CAS_PREFIX = INTERNAL_PREFIX + b"cas/"
+# Header of a pointer, followed by the hexadecimal digest of the record.
+# Records always start with their version, so they can't be mistaken for a pointer.
+MAGIC = b"CSA\x00"
+
+
+class ContentAddressedProvider(ProviderInterface):
+    """
+    Provider wrapper storing each distinct record once, keys pointing to their record.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        algorithm: str = DEFAULT_ALGORITHM,
+        min_size: int = DEFAULT_MIN_SIZE,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+    ) -> None:
+        super().__init__(logger)
+        if algorithm not in hashlib.algorithms_available:
+            raise ConfigurationError(f"Unknown hash algorithm: {algorithm}.")
+
+        self.provider = provider
+        self.controller = controller
+        self.algorithm = algorithm
+        self.min_size = min_size
+        self.sweeper = Sweeper(logger, provider, controller, b"cas", grace_period)
+
+    @property
+    def paginated_listing(self) -> bool:
+        return self.provider.paginated_listing
+
+    @property
+    def supports_append(self) -> bool:
+        return self.provider.supports_append
+
+    def close(self) -> None:
+        self.provider.close()
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        self.provider.configure_default(config)
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        self.provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        self.provider.set_provider_params(provider_params)
+
+    def create(self) -> None:
+        self.provider.create()
+
+    def exists(self) -> bool:
+        return self.provider.exists()
+
+    def reconnect(self) -> None:
+        self.provider.reconnect()
+
+    def contains(self, key: bytes) -> bool:
+        return self.provider.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        value = self.provider.get(key)
+        digest = self._digest_of(value)
+        if digest is None:
+            return value
+
+        try:
+            return self.provider.get(self._name(digest))
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Record of {key} not found: {digest}") from e
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.get_range(key, offset, length)
+        return self.get(key)[offset : offset + length]
+
+    def set(self, key: bytes, value: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX) or len(value) < self.min_size:
+            return self.provider.set(key, value)
+
+        digest = hashlib.new(self.algorithm, value).hexdigest()
+        name = self._name(digest)
+        # The record is checked on each write, as the garbage collection of another process may have deleted it.
+        if not self.provider.contains(name):
+            self.provider.set(name, value)
+        # The pointer is always written: another writer may have changed the key since it was read.
+        self.provider.set(key, MAGIC + digest.encode())
+
+    def delete(self, key: bytes) -> None:
+        self.provider.delete(key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self.provider.iter()
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        return self.provider.iter_prefix(prefix)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        return self.provider.list_keys(prefix, page_size, continuation_token, delimiter)
+
+    def len(self) -> int:
+        return self.provider.len()
+
+    def sync(self) -> None:
+        self.provider.sync()
+
+    def compact(self) -> int:
+        """
+        Delete the records no key points to anymore for the grace period (mark-and-sweep).
+        Return the number of records deleted.
+        """
+        self.logger.info("Collecting the unreferenced records...")
+
+        def mark(key):
+            try:
+                return self._digest_of(self.provider.get(key))
+            except KeyNotFoundError:
+                # Deleted since listed.
+                return None
+
+        keys = (k for k in self.provider.iter() if not k.startswith(INTERNAL_PREFIX))
+        referenced = set(self.controller.map(mark, keys))
+
+        garbage = [
+            name
+            for name in self.provider.iter_prefix(CAS_PREFIX)
+            if name[len(CAS_PREFIX) :].decode() not in referenced
+        ]
+        deleted = len(self.sweeper.sweep(garbage))
+
+        self.logger.info(f"{deleted} unreferenced records deleted.")
+        return deleted
+
+    def _digest_of(self, value: bytes) -> Optional[str]:
+        """
+        Return the digest a pointer references, or None if the value is a record stored inline.
+        """
+        if not value.startswith(MAGIC):
+            return None
+        return value[len(MAGIC) :].decode()
+
+    def _name(self, digest: str) -> bytes:
+        return CAS_PREFIX + digest.encode()
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> ProviderInterface:
+    """
+    Wrap the provider with the content-addressed storage defined in the `dedup` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return provider
+
+    try:
+        dedup = ContentAddressedProvider(
+            logger,
+            provider,
+            controller,
+            algorithm=config.get(ALGORITHM_KEY, DEFAULT_ALGORITHM),
+            min_size=int(config.get(MIN_SIZE_KEY, DEFAULT_MIN_SIZE)),
+            grace_period=float(config.get(GRACE_PERIOD_KEY, DEFAULT_GRACE_PERIOD)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid deduplication configuration: {e}") from e
+
+    logger.debug(f"Records larger than {dedup.min_size} bytes are deduplicated.")
+    return dedup
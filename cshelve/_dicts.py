@@ -0,0 +1,438 @@
+"""
+Dictionaries module for cshelve.
+
+Inserting into a large dictionary stored as a regular value downloads and uploads the whole dictionary.
+`db.mapping(key)` stores the dictionary as a hash array mapped trie of immutable nodes and a small head referencing its root:
+- Leaves contain up to `LEAF_SIZE` entries; the other nodes have up to 32 children, chosen by 5 bits of the hash of the keys.
+- A write uploads the leaf containing the key and the nodes on its path from the root, then the head.
+  The nodes it replaces are left to the garbage collection, as other readers may still walk the previous trie.
+- A lookup downloads the head and the leaf: the other nodes are immutable, so they are cached by the shelf.
+- `update` rewrites each leaf and node once for all the entries.
+
+Keys of the entries are strings, bytes or integers, hashed the same way in every process.
+Reading the key (`db[key]`) returns the whole dictionary, and writing the key replaces it.
+A dictionary is updated by a single writer at a time: concurrent updates may be lost.
+"""
+from collections import OrderedDict, namedtuple
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+from collections.abc import MutableMapping
+
+from ._manifest import _read_varint, _varint
+from ._values import ID_SIZE, Head, decode_head, encode_head, new_id, part_name
+from .exceptions import KeyNotFoundError
+
+
+# Kind of the value in its head.
+KIND = b"D"
+# Bits of the hash consumed by each level of the trie.
+BITS = 5
+# Maximum number of entries of a leaf, unless all the bits of the hash are consumed.
+LEAF_SIZE = 64
+MAX_DEPTH = 64 // BITS
+# Number of inner nodes cached by a shelf.
+CACHE_SIZE = 4096
+
+# Header of the nodes.
+LEAF = b"L"
+INNER = b"I"
+
+Leaf = namedtuple("Leaf", ["entries"])
+# Children of a node indexed by the bits of the hash.
+Inner = namedtuple("Inner", ["children"])
+
+# Marker of a deleted entry in a batch of changes.
+_DELETED = object()
+
+
+def key_hash(key) -> int:
+    """
+    Return the hash of a key, identical across runs, processes and platforms.
+
+    >>> key_hash("asterix") == key_hash("asterix")
+    True
+    >>> key_hash(1) == key_hash(True)
+    True
+    """
+    if isinstance(key, str):
+        data = b"s" + key.encode("utf-8")
+    elif isinstance(key, bytes):
+        data = b"b" + key
+    elif isinstance(key, int):
+        # Booleans are equal to their integer, so they must have the same hash.
+        data = b"i" + str(int(key)).encode()
+    else:
+        raise TypeError(
+            f"Keys must be strings, bytes or integers, not {type(key).__name__}."
+        )
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def index(hash: int, depth: int) -> int:
+    """
+    Return the child of a node at this depth containing the hash.
+    """
+    return (hash >> (BITS * depth)) & ((1 << BITS) - 1)
+
+
+def encode_inner(children: Dict[int, bytes]) -> bytes:
+    """
+    Serialize the bitmap of the children of a node and their ids, by index.
+    """
+    bitmap = sum(1 << i for i in children)
+    ids = b"".join(children[i] for i in sorted(children))
+    return INNER + bitmap.to_bytes(4, "little") + ids
+
+
+def decode_inner(data: bytes) -> Inner:
+    bitmap = int.from_bytes(data[1:5], "little")
+    indexes = [i for i in range(1 << BITS) if bitmap >> i & 1]
+    ids = [data[5 + n * ID_SIZE : 5 + (n + 1) * ID_SIZE] for n in range(len(indexes))]
+    return Inner(dict(zip(indexes, ids)))
+
+
+def new_node_id(inner: bool) -> bytes:
+    """
+    Return a random id for a node, whose lowest bit tells whether the node is an inner node.
+
+    >>> is_inner(new_node_id(True)), is_inner(new_node_id(False))
+    (True, False)
+    """
+    value = new_id()
+    return bytes([value[0] & 0xFE | inner]) + value[1:]
+
+
+def is_inner(node_id: bytes) -> bool:
+    return bool(node_id[0] & 1)
+
+
+def encode_head_payload(count: int, root: Optional[bytes]) -> bytes:
+    return _varint(count) + (root or b"")
+
+
+def decode_head_payload(payload: bytes) -> Tuple[int, Optional[bytes]]:
+    count, position = _read_varint(payload, 0)
+    return count, payload[position:] or None
+
+
+class NodeCache:
+    """
+    Least recently used inner nodes of the dictionaries, by name.
+    Nodes are never modified, so they don't need to be invalidated.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE) -> None:
+        self.size = size
+        self._nodes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: bytes) -> Optional[Inner]:
+        with self._lock:
+            node = self._nodes.get(name)
+            if node is not None:
+                self._nodes.move_to_end(name)
+            return node
+
+    def put(self, name: bytes, node: Inner) -> None:
+        with self._lock:
+            self._nodes[name] = node
+            if len(self._nodes) > self.size:
+                self._nodes.popitem(last=False)
+
+
+def _merge(
+    entries: Dict[Any, Any], changes: Dict[Any, Tuple[int, Any]]
+) -> Tuple[int, int]:
+    """
+    Apply the changes to the entries and return the number of entries added and deleted.
+    """
+    added, deleted = 0, 0
+    for sub, (_, value) in changes.items():
+        if value is _DELETED:
+            if sub in entries:
+                del entries[sub]
+                deleted += 1
+        else:
+            added += sub not in entries
+            entries[sub] = value
+    return added, deleted
+
+
+def load(shelf, head: Head) -> dict:
+    """
+    Download the nodes of a dictionary, level by level, and return its entries.
+    """
+    _, root = decode_head_payload(head.payload)
+    return dict(CloudDict(shelf, None)._items(head.id, root))
+
+
+def reachable(database, head: Head) -> Set[bytes]:
+    """
+    Return the names of the nodes reachable from the root of a dictionary, only downloading the inner nodes.
+    """
+    _, root = decode_head_payload(head.payload)
+    names, level = set(), [root] if root is not None else []
+    while level:
+        names.update(part_name(head.id, n) for n in level)
+        inner = [part_name(head.id, n) for n in level if is_inner(n)]
+        level = [
+            child
+            for data in database.get_parts(inner)
+            for child in decode_inner(data).children.values()
+        ]
+    return names
+
+
+class _Rewrite:
+    """
+    Nodes uploaded by a write, and the number of entries added and deleted.
+    Subtrees are rewritten concurrently.
+    """
+
+    def __init__(self) -> None:
+        self.uploads = []
+        self.added = 0
+        self.deleted = 0
+        self._lock = threading.Lock()
+
+    def count(self, added: int, deleted: int) -> None:
+        with self._lock:
+            self.added += added
+            self.deleted += deleted
+
+
+class CloudDict(MutableMapping):
+    """
+    View on a dictionary stored as a hash array mapped trie.
+    The head is read on each operation, so the view reflects the writes of the other shelves.
+    """
+
+    def __init__(self, shelf, key: str) -> None:
+        self._shelf = shelf
+        self.key = key
+
+    def __getitem__(self, sub):
+        hash = key_hash(sub)
+        value_id, _, root, inline = self._read()
+        if inline is not None:
+            return inline[sub]
+
+        node_id, depth = root, 0
+        while node_id is not None:
+            node = self._node(value_id, node_id)
+            if isinstance(node, Leaf):
+                return node.entries[sub]
+            node_id = node.children.get(index(hash, depth))
+            depth += 1
+        raise KeyError(sub)
+
+    def __setitem__(self, sub, value) -> None:
+        self._apply({sub: value})
+
+    def __delitem__(self, sub) -> None:
+        if not self._apply({sub: _DELETED}).deleted:
+            raise KeyError(sub)
+
+    def __iter__(self) -> Iterator[Any]:
+        value_id, _, root, inline = self._read()
+        if inline is not None:
+            return iter(list(inline))
+        return (sub for sub, _ in self._items(value_id, root))
+
+    def __len__(self) -> int:
+        _, count, _, inline = self._read()
+        return len(inline) if inline is not None else count
+
+    def __repr__(self) -> str:
+        return f"CloudDict({self.key!r})"
+
+    def update(self, other=(), /, **kwds) -> None:
+        """
+        Update the dictionary from a mapping or an iterable of key/value pairs, rewriting each node once.
+        """
+        self._apply(dict(other, **kwds))
+
+    def _apply(self, changes: Dict[Any, Any]) -> _Rewrite:
+        """
+        Write the changes, a deleted entry being marked by `_DELETED`.
+        Nothing is written if the changes are deletions of missing entries.
+        """
+        rewrite = _Rewrite()
+        if not changes:
+            return rewrite
+        hashed = {sub: (key_hash(sub), value) for sub, value in changes.items()}
+
+        self._shelf._uncache(self.key)
+        value_id, count, root, inline = self._read()
+        if inline is None:
+            root = self._rewrite(rewrite, value_id, root, 0, hashed)
+        else:
+            # A dictionary stored as a regular value becomes the first leaves.
+            entries = dict(inline)
+            rewrite.count(*_merge(entries, hashed))
+            hashes = {sub: key_hash(sub) for sub in entries}
+            root = self._build(rewrite, value_id, entries, hashes, 0)
+
+        if (
+            not rewrite.added
+            and not rewrite.deleted
+            and all(value is _DELETED for value in changes.values())
+        ):
+            return rewrite
+
+        self._shelf.dict.set_parts(rewrite.uploads)
+        self._shelf.dict[self._encoded] = encode_head(
+            KIND,
+            value_id,
+            encode_head_payload(count + rewrite.added - rewrite.deleted, root),
+        )
+        return rewrite
+
+    def _rewrite(
+        self,
+        rewrite: _Rewrite,
+        value_id: bytes,
+        node_id: Optional[bytes],
+        depth: int,
+        changes: Dict[Any, Tuple[int, Any]],
+    ) -> Optional[bytes]:
+        """
+        Apply the changes to the subtree and return the id of its new root, or None if it is empty.
+        """
+        node = Leaf({}) if node_id is None else self._node(value_id, node_id)
+
+        if isinstance(node, Leaf):
+            entries = dict(node.entries)
+            rewrite.count(*_merge(entries, changes))
+            hashes = {sub: key_hash(sub) for sub in entries}
+            return self._build(rewrite, value_id, entries, hashes, depth)
+
+        groups = {}
+        for sub, change in changes.items():
+            groups.setdefault(index(change[0], depth), {})[sub] = change
+
+        def rewrite_child(item):
+            i, group = item
+            child = node.children.get(i)
+            return i, self._rewrite(rewrite, value_id, child, depth + 1, group)
+
+        children = dict(node.children)
+        for i, child in self._shelf.dict.concurrency.map(rewrite_child, groups.items()):
+            if child is None:
+                children.pop(i, None)
+            else:
+                children[i] = child
+        return self._upload_inner(rewrite, value_id, children) if children else None
+
+    def _build(
+        self,
+        rewrite: _Rewrite,
+        value_id: bytes,
+        entries: Dict[Any, Any],
+        hashes: Dict[Any, int],
+        depth: int,
+    ) -> Optional[bytes]:
+        """
+        Upload the entries as a leaf, or as a subtree if they don't fit in a leaf.
+        """
+        if not entries:
+            return None
+        if len(entries) <= LEAF_SIZE or depth >= MAX_DEPTH:
+            leaf_id = new_node_id(False)
+            data = LEAF + self._shelf._dumps(entries)
+            rewrite.uploads.append((part_name(value_id, leaf_id), data))
+            return leaf_id
+
+        groups = {}
+        for sub, value in entries.items():
+            groups.setdefault(index(hashes[sub], depth), {})[sub] = value
+        children = {
+            i: self._build(rewrite, value_id, group, hashes, depth + 1)
+            for i, group in groups.items()
+        }
+        return self._upload_inner(rewrite, value_id, children)
+
+    def _upload_inner(
+        self, rewrite: _Rewrite, value_id: bytes, children: Dict[int, bytes]
+    ) -> bytes:
+        inner_id = new_node_id(True)
+        name = part_name(value_id, inner_id)
+        rewrite.uploads.append((name, encode_inner(children)))
+        # The writer is likely to read the nodes it wrote.
+        self._shelf._nodes.put(name, Inner(children))
+        return inner_id
+
+    def _read(self) -> Tuple[bytes, int, Optional[bytes], Optional[dict]]:
+        """
+        Return the id, the number of entries and the root of the dictionary, a missing key being an empty dictionary.
+        A dictionary stored as a regular value is returned as-is, without root.
+        """
+        try:
+            data = self._shelf.dict[self._encoded]
+        except KeyError:
+            return new_id(), 0, None, None
+
+        head = decode_head(data)
+        if head is None:
+            value = self._shelf._loads(data)
+            if not isinstance(value, dict):
+                raise TypeError(f"The value of {self.key} is not a dictionary.")
+            return new_id(), len(value), None, value
+        if head.kind != KIND:
+            raise TypeError(f"The value of {self.key} is not a dictionary.")
+        count, root = decode_head_payload(head.payload)
+        return head.id, count, root, None
+
+    def _node(self, value_id: bytes, node_id: bytes):
+        """
+        Return a node, the inner nodes being cached.
+        """
+        name = part_name(value_id, node_id)
+        node = self._shelf._nodes.get(name)
+        if node is not None:
+            return node
+
+        try:
+            data = next(self._shelf.dict.get_parts([name]))
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Node of {self.key} not found.") from e
+        return self._decode(name, data)
+
+    def _decode(self, name: bytes, data: bytes):
+        if data.startswith(LEAF):
+            return Leaf(self._shelf._loads(data[len(LEAF) :]))
+        node = decode_inner(data)
+        self._shelf._nodes.put(name, node)
+        return node
+
+    def _items(
+        self, value_id: bytes, root: Optional[bytes]
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Yield the entries of the trie, downloading the nodes of each level concurrently.
+        """
+        level = [root] if root is not None else []
+        while level:
+            names = [part_name(value_id, node_id) for node_id in level]
+            cached = [self._shelf._nodes.get(name) for name in names]
+            missing = [name for name, node in zip(names, cached) if node is None]
+            try:
+                downloaded = iter(self._shelf.dict.get_parts(missing))
+                nodes = [
+                    node if node is not None else self._decode(name, next(downloaded))
+                    for name, node in zip(names, cached)
+                ]
+            except KeyNotFoundError as e:
+                raise KeyNotFoundError(f"Node of {self.key} not found.") from e
+
+            level = []
+            for node in nodes:
+                if isinstance(node, Leaf):
+                    yield from node.entries.items()
+                else:
+                    level.extend(node.children[i] for i in sorted(node.children))
+
+    @property
+    def _encoded(self) -> bytes:
+        return self.key.encode(self._shelf.keyencoding)
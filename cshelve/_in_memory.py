@@ -1,6 +1,7 @@
 """
 In-memory storage implementation. Mainly for testing purposes.
 """
+import time
 from typing import Any, Dict, Iterator
 
 from .provider_interface import ProviderInterface
@@ -17,6 +18,8 @@ class InMemory(ProviderInterface):
     This is mainly for the package and users tests.
     """
 
+    supports_append = True
+
     def __init__(self, logger) -> None:
         super().__init__(logger)
         self.db = {}
@@ -28,6 +31,8 @@ class InMemory(ProviderInterface):
         self._synced = False
         self._logging = None
         self._provider_params = None
+        # Simulated latency of the requests on a key, in seconds.
+        self._latency = 0.0
 
     def configure_default(self, config: Dict[str, str]) -> None:
         """
@@ -38,6 +43,8 @@ class InMemory(ProviderInterface):
         self.persist_key = config.get("persist-key")
         # Simulate whether the database exists or must be created.
         self._exists = config.get("exists", "false").lower() == "true"
+        # Simulate a remote provider, ex: to test the replicas.
+        self._latency = float(config.get("latency", 0))
 
         # If defined, retrieve the previous database value.
         if self.persist_key:
@@ -70,6 +77,7 @@ class InMemory(ProviderInterface):
         Returns:
             bytes: The value associated with the key.
         """
+        self._wait()
         return self.db[key]
 
     def close(self) -> None:
@@ -93,8 +101,20 @@ class InMemory(ProviderInterface):
             key (bytes): The key for the entry.
             value (bytes): The value for the entry.
         """
+        self._wait()
         self.db[key] = value
 
+    def append(self, key: bytes, data: bytes) -> None:
+        """
+        Append the data to the value of the key, creating it if it doesn't exist.
+
+        Args:
+            key (bytes): The key of the entry.
+            data (bytes): The data to append.
+        """
+        self._wait()
+        self.db[key] = self.db.get(key, b"") + data
+
     @key_access(KeyError)
     def delete(self, key: bytes) -> None:
         """
@@ -103,6 +123,7 @@ class InMemory(ProviderInterface):
         Args:
             key (bytes): The key to delete.
         """
+        self._wait()
         del self.db[key]
 
     def contains(self, key: bytes) -> bool:
@@ -115,6 +136,7 @@ class InMemory(ProviderInterface):
         Returns:
             bool: True if the key exists, False otherwise.
         """
+        self._wait()
         return key in self.db
 
     def iter(self) -> Iterator[bytes]:
@@ -124,10 +146,27 @@ class InMemory(ProviderInterface):
         Returns:
             Iterator[bytes]: An iterator over the keys.
         """
+        self._wait()
         # Convert in list to avoid RuntimeError: dictionary changed size during iteration
         keys = list(self.db.keys())
         yield from keys
 
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        """
+        Return an iterator over the keys starting with the prefix, in lexicographic order like the cloud providers.
+
+        Returns:
+            Iterator[bytes]: An iterator over the keys.
+        """
+        self._wait()
+        # Convert in list to avoid RuntimeError: dictionary changed size during iteration
+        keys = sorted(
+            k
+            for k in self.db.keys()
+            if isinstance(k, type(prefix)) and k.startswith(prefix)
+        )
+        yield from keys
+
     def len(self) -> int:
         """
         Return the number of objects stored in the database.
@@ -135,6 +174,7 @@ class InMemory(ProviderInterface):
         Returns:
             int: The number of objects in the database.
         """
+        self._wait()
         return len(self.db)
 
     def exists(self) -> bool:
@@ -152,3 +192,7 @@ class InMemory(ProviderInterface):
         """
         self._created = True
         self._exists = True
+
+    def _wait(self) -> None:
+        if self._latency:
+            time.sleep(self._latency)
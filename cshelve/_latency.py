@@ -0,0 +1,210 @@
+"""
+Tail latency module for cshelve.
+
+The policy applies above the `ProviderInterface` so it works with every provider:
+- Deadlines: reads and writes taking longer than the configured timeout raise a `DeadlineExceededError`.
+- Hedging: reads are idempotent, so if a read takes longer than a percentile of the observed latencies,
+  a duplicate request is sent and the first successful response is used.
+
+Python threads can't be interrupted: a request that missed its deadline or lost the race keeps running in the background
+until the provider SDK returns, but its result is ignored.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import Logger
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .exceptions import ConfigurationError, DeadlineExceededError
+
+
+# Keys that can be defined in the INI file.
+READ_TIMEOUT_KEY = "read_timeout"
+WRITE_TIMEOUT_KEY = "write_timeout"
+HEDGE_PERCENTILE_KEY = "hedge_percentile"
+HEDGE_MIN_SAMPLES_KEY = "hedge_min_samples"
+
+# Number of latencies observed before hedging is enabled.
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+# Number of latencies kept to compute the percentile.
+LATENCY_WINDOW = 256
+# Maximum number of threads executing the requests with a deadline or a hedge.
+MAX_WORKERS = 64
+
+
+class LatencyPolicy:
+    """
+    Execute the provider requests with a deadline and, for reads, an optional hedge.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        read_timeout: Optional[float] = None,
+        write_timeout: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES,
+    ) -> None:
+        if hedge_percentile is not None and not 0 < hedge_percentile < 100:
+            raise ConfigurationError(
+                f"The hedge percentile must be between 0 and 100, not {hedge_percentile}."
+            )
+
+        self.logger = logger
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        # Latencies of the last successful reads.
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        # Number of hedged requests sent, mainly for monitoring.
+        self.hedged = 0
+
+        # The thread pool is created only if a deadline or a hedge is configured and used.
+        self._executor = None
+
+    def read(self, fct: Callable[..., Any], *args) -> Any:
+        """
+        Execute an idempotent read request.
+        """
+        if self.read_timeout is None and self.hedge_percentile is None:
+            return fct(*args)
+
+        start = time.monotonic()
+        deadline = start + self.read_timeout if self.read_timeout else None
+        futures = [self._get_executor().submit(fct, *args)]
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=self._remaining(deadline, hedge_delay))
+            if not done and not self._expired(deadline):
+                self.logger.debug(f"Read slower than {hedge_delay:.3f}s, hedging.")
+                futures.append(self._get_executor().submit(fct, *args))
+                self.hedged += 1
+
+        result = self._first_success(futures, deadline)
+
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return result
+
+    def write(self, fct: Callable[..., Any], *args) -> Any:
+        """
+        Execute a write request. Writes are never hedged.
+        """
+        if self.write_timeout is None:
+            return fct(*args)
+
+        deadline = time.monotonic() + self.write_timeout
+        return self._first_success([self._get_executor().submit(fct, *args)], deadline)
+
+    def close(self) -> None:
+        """
+        Release the thread pool without waiting for the requests that missed their deadline.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _after_fork(self) -> None:
+        """
+        Reset the state of the policy in a child process: threads and locks of the parent are not usable.
+        """
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _first_success(self, futures, deadline: Optional[float]) -> Any:
+        """
+        Return the result of the first successful request, or raise the first error if all failed.
+        """
+        error = None
+        pending = set(futures)
+
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=self._remaining(deadline),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                for f in pending:
+                    f.cancel()
+                raise DeadlineExceededError("The request exceeded its deadline.")
+
+            for f in done:
+                if f.exception() is None:
+                    # Cancel the loser if not already started, otherwise its result is ignored.
+                    for p in pending:
+                        p.cancel()
+                    return f.result()
+                error = error or f.exception()
+
+        raise error
+
+    def _hedge_delay(self) -> Optional[float]:
+        """
+        Return the delay after which a read is hedged, or None if hedging is not possible yet.
+        """
+        if self.hedge_percentile is None:
+            return None
+
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+
+        rank = math.ceil(self.hedge_percentile / 100 * len(latencies)) - 1
+        return latencies[rank]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix="cshelve-latency"
+            )
+        return self._executor
+
+    @staticmethod
+    def _remaining(deadline: Optional[float], delay: Optional[float] = None):
+        """
+        Return the time to wait based on the deadline and an optional delay.
+        """
+        if deadline is None:
+            return delay
+        remaining = max(0, deadline - time.monotonic())
+        return remaining if delay is None else min(remaining, delay)
+
+    @staticmethod
+    def _expired(deadline: Optional[float]) -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> LatencyPolicy:
+    """
+    Configure the latency policy based on the `latency` section of the configuration.
+    """
+    if not config:
+        return LatencyPolicy(logger)
+
+    try:
+        policy = LatencyPolicy(
+            logger,
+            read_timeout=_optional_float(config.get(READ_TIMEOUT_KEY)),
+            write_timeout=_optional_float(config.get(WRITE_TIMEOUT_KEY)),
+            hedge_percentile=_optional_float(config.get(HEDGE_PERCENTILE_KEY)),
+            hedge_min_samples=int(
+                config.get(HEDGE_MIN_SAMPLES_KEY, DEFAULT_HEDGE_MIN_SAMPLES)
+            ),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid latency configuration: {e}") from e
+
+    logger.debug("Latency policy configured.")
+    return policy
+
+
+def _optional_float(value: Optional[str]) -> Optional[float]:
+    return None if value is None else float(value)
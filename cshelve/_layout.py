@@ -0,0 +1,374 @@
+"""
+Key layout module for cshelve.
+
+By default, keys are stored as they are.
+With the hash prefix layout, each key is stored under a short prefix derived from a stable hash of the key (ex: `3f/my-key`).
+The keyspace is then split into shards that can be listed independently, allowing:
+- Each node of a multi-node job to list and read only its own partition of the keys.
+- The provider to spread the requests across its internal partitions instead of hot-spotting sequential key names.
+
+The hash is stable across runs and platforms so the assignment of a key to a shard or a partition never changes.
+The layout is recorded in the container (`__cshelve__/layout`) by the first write,
+so the shelves opened without number of shards detect it and read the keys where they are,
+and the shelves opened with another number of shards are refused.
+The layout is read on the first access to a key, so opening or unpickling a shelf doesn't send any request.
+The detection can be disabled with `detect = false`.
+"""
+import json
+from logging import Logger
+import threading
+from typing import Any, Dict, Iterator, Optional
+import zlib
+
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+SHARDS_KEY = "shards"
+DETECT_KEY = "detect"
+
+# Object recording the layout of the container.
+LAYOUT_KEY = INTERNAL_PREFIX + b"layout"
+HASH_PREFIX = "hash-prefix"
+
+# Separator between the shard prefix and the key.
+SEPARATOR = b"/"
+# Separator between the shard and the continuation token of the provider in a continuation token.
+TOKEN_SEPARATOR = ":"
+
+
+def key_hash(key: bytes) -> int:
+    """
+    Stable hash of a key, identical across runs, processes and platforms.
+    """
+    return zlib.crc32(key)
+
+
+def in_partition(key: bytes, index: int, count: int) -> bool:
+    """
+    Return whether the key belongs to the partition `index` among `count` partitions.
+    """
+    return key_hash(key) % count == index
+
+
+def encode_layout(shards: int) -> bytes:
+    """
+    Serialize the layout recorded in the container.
+
+    >>> encode_layout(256)
+    b'{"layout": "hash-prefix", "shards": 256}'
+    """
+    return json.dumps({"layout": HASH_PREFIX, "shards": shards}).encode()
+
+
+def decode_layout(data: bytes) -> int:
+    """
+    Deserialize the layout recorded in the container and return its number of shards.
+    """
+    try:
+        layout = json.loads(data)
+        if layout["layout"] != HASH_PREFIX:
+            raise ValueError(f"unknown layout {layout['layout']}")
+        return int(layout["shards"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ConfigurationError(
+            f"Invalid layout recorded in the container: {e}"
+        ) from e
+
+
+def read_layout(provider: ProviderInterface) -> Optional[int]:
+    """
+    Return the number of shards recorded in the container, or None if the keys are stored as they are.
+    """
+    try:
+        return decode_layout(provider.get(LAYOUT_KEY))
+    except KeyNotFoundError:
+        # Container without layout, or not created yet.
+        return None
+
+
+def check_partition(index: int, count: int) -> None:
+    """
+    Ensure the partition index is valid.
+    """
+    if not 0 <= index < count:
+        raise ValueError(
+            f"Partition index must be between 0 and {count - 1}, not {index}."
+        )
+
+
+class HashPrefixLayout(ProviderInterface):
+    """
+    Provider wrapper storing the keys under a shard prefix derived from their hash.
+    """
+
+    # Shards are listed concurrently whatever the provider.
+    paginated_listing = True
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        shards: int,
+        recorded: Optional[bool] = True,
+    ):
+        super().__init__(logger)
+        if shards < 1:
+            raise ConfigurationError(
+                f"The number of shards must be positive, not {shards}."
+            )
+
+        self.provider = provider
+        self.shards = shards
+        # Width of the hexadecimal prefix, so all the prefixes have the same length.
+        self._width = len(f"{shards - 1:x}")
+        # Whether the layout is recorded in the container, otherwise it is before the first write.
+        # If unknown, the recorded layout is checked on the first access to a key.
+        self._recorded = recorded
+        self._lock = threading.Lock()
+
+    def shard(self, key: bytes) -> int:
+        """
+        Return the shard of the key.
+        """
+        return key_hash(key) % self.shards
+
+    def prefix(self, shard: int) -> bytes:
+        """
+        Return the listing prefix of the shard.
+        """
+        return f"{shard:0{self._width}x}".encode() + SEPARATOR
+
+    def iter_partition(self, index: int, count: int) -> Iterator[bytes]:
+        """
+        Return an iterator over the keys of the partition, listing only the shards of the partition.
+        If the number of partitions divides the number of shards, each shard belongs to a single partition and no key is filtered.
+        """
+        check_partition(index, count)
+
+        if self.shards % count == 0:
+            for shard in range(index, self.shards, count):
+                yield from self.iter_shard(shard)
+            return
+
+        self.logger.info(
+            f"{count} partitions don't divide {self.shards} shards, keys are filtered while listing."
+        )
+        for shard in range(self.shards):
+            for key in self.iter_shard(shard):
+                if in_partition(key, index, count):
+                    yield key
+
+    def close(self) -> None:
+        self.provider.close()
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        self.provider.configure_default(config)
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        self.provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        self.provider.set_provider_params(provider_params)
+
+    @property
+    def supports_append(self) -> bool:
+        return self.provider.supports_append
+
+    def append(self, key: bytes, data: bytes) -> None:
+        self._record()
+        self.provider.append(self._to_name(key), data)
+
+    def contains(self, key: bytes) -> bool:
+        return self.provider.contains(self._to_name(key))
+
+    def create(self) -> None:
+        self.provider.create()
+
+    def delete(self, key: bytes) -> None:
+        self.provider.delete(self._to_name(key))
+
+    def exists(self) -> bool:
+        return self.provider.exists()
+
+    def get(self, key: bytes) -> bytes:
+        return self.provider.get(self._to_name(key))
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        return self.provider.get_range(self._to_name(key), offset, length)
+
+    def iter(self) -> Iterator[bytes]:
+        for shard in range(self.shards):
+            yield from self.iter_shard(shard)
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        if prefix.startswith(INTERNAL_PREFIX):
+            return self.provider.iter_prefix(prefix)
+        return self._iter_prefix(prefix)
+
+    def _iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        # Keys sharing a prefix are spread across all the shards.
+        for shard in range(self.shards):
+            yield from self.iter_shard(shard, prefix)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys, shard after shard.
+        The continuation token contains the shard and the continuation token of the provider in this shard.
+        Keys are sorted inside a shard, but not across shards.
+        """
+        if prefix.startswith(INTERNAL_PREFIX):
+            return self.provider.list_keys(
+                prefix, page_size, continuation_token, delimiter
+            )
+        if delimiter:
+            raise ValueError("The hash prefix layout doesn't support delimiters.")
+        self._check()
+
+        shard, token = 0, None
+        if continuation_token:
+            shard, token = continuation_token.split(TOKEN_SEPARATOR, 1)
+            shard, token = int(shard), token or None
+
+        while shard < self.shards:
+            page = self.provider.list_keys(
+                self.prefix(shard) + prefix, page_size, token
+            )
+            keys = [self._to_key(name) for name in page.keys]
+
+            if page.continuation_token:
+                next_token = f"{shard}{TOKEN_SEPARATOR}{page.continuation_token}"
+            elif shard + 1 < self.shards:
+                next_token = f"{shard + 1}{TOKEN_SEPARATOR}"
+            else:
+                next_token = None
+
+            # Empty shards are skipped to avoid returning empty pages.
+            if keys or next_token is None:
+                return KeysPage(keys, [], next_token)
+            if page.continuation_token:
+                token = page.continuation_token
+            else:
+                shard, token = shard + 1, None
+
+        return KeysPage([], [], None)
+
+    def len(self) -> int:
+        return self.provider.len()
+
+    def reconnect(self) -> None:
+        # Locks of the parent process are not usable in a child process.
+        self._lock = threading.Lock()
+        self.provider.reconnect()
+
+    def set(self, key: bytes, value: bytes) -> None:
+        self._record()
+        self.provider.set(self._to_name(key), value)
+
+    def sync(self) -> None:
+        self.provider.sync()
+
+    def iter_shard(self, shard: int, prefix: bytes = b"") -> Iterator[bytes]:
+        """
+        Return an iterator over the keys of the shard, optionally starting with a prefix.
+        """
+        self._check()
+        for name in self.provider.iter_prefix(self.prefix(shard) + prefix):
+            yield self._to_key(name)
+
+    def _check(self) -> None:
+        """
+        Ensure the layout recorded in the container, if any, is this one.
+        """
+        if self._recorded is not None:
+            return
+        with self._lock:
+            if self._recorded is None:
+                recorded = read_layout(self.provider)
+                if recorded is not None and recorded != self.shards:
+                    raise ConfigurationError(
+                        f"The container stores the keys in {recorded} shards, not {self.shards}."
+                    )
+                self._recorded = recorded is not None
+
+    def _record(self) -> None:
+        """
+        Record the layout in the container if not done yet, so the other shelves detect it.
+        """
+        self._check()
+        if self._recorded:
+            return
+        with self._lock:
+            if not self._recorded:
+                self.logger.info(
+                    f"Recording the layout of {self.shards} shards in the container."
+                )
+                self.provider.set(LAYOUT_KEY, encode_layout(self.shards))
+                self._recorded = True
+
+    def _to_name(self, key: bytes) -> bytes:
+        """
+        Return the name of the object storing the key.
+        Internal objects are not sharded.
+        """
+        if key.startswith(INTERNAL_PREFIX):
+            return key
+        self._check()
+        return self.prefix(self.shard(key)) + key
+
+    def _to_key(self, name: bytes) -> bytes:
+        """
+        Return the key stored in the object.
+        """
+        return name.split(SEPARATOR, 1)[1]
+
+
+def detects(config: Dict[str, str]) -> bool:
+    """
+    Return whether the layout recorded in the container is detected, the `layout` section not defining it.
+    """
+    config = config or {}
+    return SHARDS_KEY not in config and config.get(DETECT_KEY, "true").lower() == "true"
+
+
+def configure(
+    logger: Logger, provider: ProviderInterface, config: Dict[str, str]
+) -> ProviderInterface:
+    """
+    Wrap the provider with the key layout defined in the `layout` section of the configuration.
+    Without number of shards, the provider is returned as-is, the recorded layout being detected by the database.
+    """
+    config = config or {}
+    if SHARDS_KEY not in config:
+        return provider
+
+    try:
+        shards = int(config[SHARDS_KEY])
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid layout configuration: {e}") from e
+
+    logger.debug(f"Keys are stored in {shards} shards.")
+    # Unless disabled, the recorded layout is checked on the first access to a key.
+    detect = config.get(DETECT_KEY, "true").lower() == "true"
+    return HashPrefixLayout(
+        logger, provider, shards, recorded=None if detect else False
+    )
+
+
+def detect(logger: Logger, provider: ProviderInterface) -> ProviderInterface:
+    """
+    Return the provider storing the keys with the layout recorded in the container,
+    or the provider itself if the keys are stored as they are.
+    """
+    shards = read_layout(provider)
+    if shards is None:
+        return provider
+    logger.info(f"Layout detected: keys are stored in {shards} shards.")
+    return HashPrefixLayout(logger, provider, shards)
@@ -0,0 +1,205 @@
+"""
+Listing module for cshelve.
+
+Cloud providers list keys page by page, so listing millions of keys sequentially takes minutes.
+The listing engine splits the keyspace into partitions listed concurrently:
+- With the hash prefix layout, partitions are the shards.
+- Otherwise, partitions are discovered with a delimiter listing (ex: `user/`, `event/`), up to a maximum depth.
+
+Each key is listed exactly once: keys found while discovering the partitions are returned directly,
+so a flat keyspace costs a single sequential listing, as without the engine.
+Keys of the internal namespace are never returned.
+"""
+from logging import Logger
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from ._concurrency import ConcurrencyController
+from ._layout import HashPrefixLayout
+from .exceptions import ConfigurationError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface, is_internal
+
+
+# Keys that can be defined in the INI file.
+DELIMITER_KEY = "delimiter"
+DEPTH_KEY = "depth"
+PARALLEL_KEY = "parallel"
+
+DEFAULT_DELIMITER = "/"
+DEFAULT_DEPTH = 2
+
+
+class ListingEngine:
+    """
+    List the keys of a provider by partitions listed concurrently.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        delimiter: bytes = DEFAULT_DELIMITER.encode(),
+        depth: int = DEFAULT_DEPTH,
+        parallel: bool = True,
+    ) -> None:
+        if depth < 1:
+            raise ConfigurationError(
+                f"The listing depth must be positive, not {depth}."
+            )
+
+        self.logger = logger
+        self.delimiter = delimiter
+        self.depth = depth
+        # Without delimiter, partitions can't be discovered.
+        self.parallel = parallel and bool(delimiter)
+
+    def iter(
+        self,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        prefix: bytes = b"",
+    ) -> Iterator[bytes]:
+        """
+        Return an iterator over the keys starting with the prefix.
+        """
+        if not self._concurrent(provider):
+            keys = provider.iter_prefix(prefix) if prefix else provider.iter()
+            yield from _visible(keys)
+            return
+
+        partitions = []
+        for keys, prefixes in self._discover(provider, controller, prefix):
+            yield from _visible(keys)
+            partitions.extend(prefixes)
+
+        for keys in controller.map(
+            lambda p: list(_visible(self._iter_partition(provider, p))), partitions
+        ):
+            yield from keys
+
+    def count(
+        self,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        prefix: bytes = b"",
+    ) -> int:
+        """
+        Return the number of keys starting with the prefix.
+        """
+        if not self._concurrent(provider):
+            if prefix:
+                return sum(1 for _ in _visible(provider.iter_prefix(prefix)))
+            # The internal namespace is small, listing it is cheaper than listing all the keys.
+            return provider.len() - sum(
+                1 for _ in provider.iter_prefix(INTERNAL_PREFIX)
+            )
+
+        count, partitions = 0, []
+        for keys, prefixes in self._discover(provider, controller, prefix):
+            count += sum(1 for _ in _visible(keys))
+            partitions.extend(prefixes)
+
+        return count + sum(
+            controller.map(
+                lambda p: sum(1 for _ in _visible(self._iter_partition(provider, p))),
+                partitions,
+            )
+        )
+
+    def _concurrent(self, provider: ProviderInterface) -> bool:
+        """
+        Return whether the keys of the provider are listed by partitions.
+        """
+        return self.parallel and provider.paginated_listing
+
+    def _discover(
+        self,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        prefix: bytes,
+    ) -> Iterator[Tuple[List[bytes], List]]:
+        """
+        Yield the keys found while discovering the partitions, and the partitions themselves.
+        """
+        if isinstance(provider, HashPrefixLayout):
+            # Shards are known, there is nothing to discover.
+            yield [], [(shard, prefix) for shard in range(provider.shards)]
+            return
+
+        # The first level is streamed page by page as it may contain all the keys.
+        level = []
+        for page in self._pages(provider, prefix):
+            yield page.keys, []
+            level.extend(p for p in page.prefixes if not is_internal(p))
+
+        # Deeper levels are discovered concurrently while there are not enough partitions to use the whole window.
+        for _ in range(self.depth - 1):
+            if not level or len(level) >= controller.max_concurrency:
+                break
+
+            next_level = []
+            for keys, prefixes in controller.map(
+                lambda p: self._level(provider, p), level
+            ):
+                yield keys, []
+                next_level.extend(prefixes)
+            level = next_level
+
+        self.logger.debug(f"Listing {len(level)} partitions concurrently.")
+        yield [], level
+
+    def _pages(self, provider: ProviderInterface, prefix: bytes):
+        """
+        Yield the pages of the delimiter listing of the prefix.
+        """
+        token = None
+        while True:
+            page = provider.list_keys(
+                prefix, continuation_token=token, delimiter=self.delimiter
+            )
+            yield page
+            token = page.continuation_token
+            if token is None:
+                return
+
+    def _level(self, provider: ProviderInterface, prefix: bytes):
+        """
+        Return the keys and the prefixes of a level of the keyspace.
+        """
+        keys, prefixes = [], []
+        for page in self._pages(provider, prefix):
+            keys.extend(page.keys)
+            prefixes.extend(page.prefixes)
+        return keys, prefixes
+
+    @staticmethod
+    def _iter_partition(provider: ProviderInterface, partition) -> Iterator[bytes]:
+        if isinstance(provider, HashPrefixLayout):
+            return provider.iter_shard(*partition)
+        return provider.iter_prefix(partition)
+
+
+def _visible(keys: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Filter out the keys of the internal namespace.
+    """
+    return (key for key in keys if not is_internal(key))
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> ListingEngine:
+    """
+    Configure the listing engine based on the `listing` section of the configuration.
+    """
+    if not config:
+        return ListingEngine(logger)
+
+    try:
+        engine = ListingEngine(
+            logger,
+            delimiter=config.get(DELIMITER_KEY, DEFAULT_DELIMITER).encode(),
+            depth=int(config.get(DEPTH_KEY, DEFAULT_DEPTH)),
+            parallel=config.get(PARALLEL_KEY, "true").lower() == "true",
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid listing configuration: {e}") from e
+
+    logger.debug("Listing engine configured.")
+    return engine
@@ -0,0 +1,224 @@
+"""
+Lists module for cshelve.
+
+Appending to a list stored as a regular value downloads and uploads the whole list, so `n` appends cost O(n²).
+`db.append(key, item)` and `db.extend(key, items)` store the list as a chain of immutable segments and a small head listing them:
+- An append uploads a segment containing the new items, then the head.
+- `FANOUT` consecutive segments of the same size class are merged into one,
+  so a list has a logarithmic number of segments and each item is rewritten a logarithmic number of times.
+- `db.list(key)` iterates over the items segment by segment, downloading the next segments concurrently.
+
+Merged segments are deleted by the garbage collection (`compact`), as a reader may still iterate the previous head.
+Reading the key (`db[key]`) returns the whole list, and writing the key replaces the list.
+A list is updated by a single writer at a time: concurrent appends may be lost.
+"""
+from collections import namedtuple
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ._manifest import _read_varint, _varint
+from ._values import ID_SIZE, Head, decode_head, encode_head, new_id, part_name
+from .exceptions import KeyNotFoundError
+
+
+# Kind of the value in its head.
+KIND = b"L"
+# Number of segments of the same size class merged together.
+FANOUT = 8
+
+Segment = namedtuple("Segment", ["id", "count"])
+
+
+def encode_segments(segments: List[Segment]) -> bytes:
+    """
+    Serialize the id and the number of items of each segment.
+    """
+    data = bytearray(_varint(len(segments)))
+    for segment in segments:
+        data += segment.id + _varint(segment.count)
+    return bytes(data)
+
+
+def decode_segments(payload: bytes) -> List[Segment]:
+    """
+    Deserialize the segments of a head.
+    """
+    count, position = _read_varint(payload, 0)
+    segments = []
+    for _ in range(count):
+        segment_id = payload[position : position + ID_SIZE]
+        items, position = _read_varint(payload, position + ID_SIZE)
+        segments.append(Segment(segment_id, items))
+    return segments
+
+
+def size_class(count: int) -> int:
+    """
+    Return the size class of a segment: segments of the same class have the same order of magnitude.
+
+    >>> [size_class(count) for count in (1, 7, 8, 63, 64)]
+    [0, 0, 1, 1, 2]
+    """
+    level = 0
+    while count >= FANOUT:
+        count //= FANOUT
+        level += 1
+    return level
+
+
+def reachable(head: Head) -> Set[bytes]:
+    """
+    Return the names of the segments of a list.
+    """
+    return {part_name(head.id, s.id) for s in decode_segments(head.payload)}
+
+
+def load(shelf, head: Head) -> list:
+    """
+    Download the segments of a list concurrently and return its items.
+    """
+    return list(CloudList(shelf, None)._items(head.id, decode_segments(head.payload)))
+
+
+class CloudList:
+    """
+    View on a list stored as segments.
+    The head is read on each operation, so the view reflects the writes of the other shelves.
+    """
+
+    def __init__(self, shelf, key: str) -> None:
+        self._shelf = shelf
+        self.key = key
+
+    def __len__(self) -> int:
+        _, segments, inline = self._read()
+        return len(inline) if inline is not None else sum(s.count for s in segments)
+
+    def __iter__(self) -> Iterator[Any]:
+        value_id, segments, inline = self._read()
+        return iter(inline) if inline is not None else self._items(value_id, segments)
+
+    def __getitem__(self, index):
+        """
+        Return an item or a slice of the list, downloading only the segments containing them.
+        """
+        value_id, segments, inline = self._read()
+        if inline is not None:
+            return inline[index]
+
+        length = sum(s.count for s in segments)
+        if isinstance(index, slice):
+            positions = range(*index.indices(length))
+        else:
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError("list index out of range")
+            positions = range(index, index + 1)
+        if not positions:
+            return []
+
+        first, last = min(positions), max(positions)
+        needed, start, offset = [], None, 0
+        for segment in segments:
+            if offset + segment.count > first and offset <= last:
+                needed.append(segment)
+                start = offset if start is None else start
+            offset += segment.count
+
+        window = list(self._items(value_id, needed))
+        items = [window[p - start] for p in positions]
+        return items if isinstance(index, slice) else items[0]
+
+    def __repr__(self) -> str:
+        return f"CloudList({self.key!r})"
+
+    def append(self, item: Any) -> None:
+        """
+        Append an item, uploading only a segment containing it.
+        """
+        self.extend([item])
+
+    def extend(self, items: Iterable[Any]) -> None:
+        """
+        Append the items, uploading only a segment containing them.
+        """
+        items = list(items)
+        if not items:
+            return
+
+        self._shelf._uncache(self.key)
+        value_id, segments, inline = self._read()
+        if inline:
+            # A list stored as a regular value becomes the first segment.
+            segments = [self._upload(value_id, inline)]
+        segments.append(self._upload(value_id, items))
+
+        while len(segments) >= FANOUT:
+            tail = segments[-FANOUT:]
+            if len({size_class(s.count) for s in tail}) > 1:
+                break
+            segments = segments[:-FANOUT] + [self._merge(value_id, tail)]
+
+        self._write(value_id, segments)
+
+    def compact(self) -> None:
+        """
+        Merge all the segments into one, so the list is read with a single request.
+        """
+        self._shelf._uncache(self.key)
+        value_id, segments, _ = self._read()
+        if len(segments) > 1:
+            self._write(value_id, [self._merge(value_id, segments)])
+
+    def _read(self) -> Tuple[bytes, List[Segment], Optional[list]]:
+        """
+        Return the id and the segments of the list, a missing key being an empty list.
+        A list stored as a regular value is returned as-is, without segment.
+        """
+        try:
+            data = self._shelf.dict[self._encoded]
+        except KeyError:
+            return new_id(), [], None
+
+        head = decode_head(data)
+        if head is None:
+            value = self._shelf._loads(data)
+            if not isinstance(value, list):
+                raise TypeError(f"The value of {self.key} is not a list.")
+            return new_id(), [], value
+        if head.kind != KIND:
+            raise TypeError(f"The value of {self.key} is not a list.")
+        return head.id, decode_segments(head.payload), None
+
+    def _items(self, value_id: bytes, segments: List[Segment]) -> Iterator[Any]:
+        """
+        Yield the items of the segments, downloading the next segments concurrently.
+        """
+        names = [part_name(value_id, s.id) for s in segments]
+        try:
+            for data in self._shelf.dict.get_parts(names):
+                yield from self._shelf._loads(data)
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Segment of {self.key} not found.") from e
+
+    def _upload(self, value_id: bytes, items: List[Any]) -> Segment:
+        segment = Segment(new_id(), len(items))
+        data = self._shelf._dumps(items)
+        self._shelf.dict.set_parts([(part_name(value_id, segment.id), data)])
+        return segment
+
+    def _merge(self, value_id: bytes, segments: List[Segment]) -> Segment:
+        return self._upload(value_id, list(self._items(value_id, segments)))
+
+    def _write(self, value_id: bytes, segments: List[Segment]) -> None:
+        """
+        Write the head.
+        The merged segments are left to the garbage collection, as a reader may still iterate the previous head.
+        """
+        self._shelf.dict[self._encoded] = encode_head(
+            KIND, value_id, encode_segments(segments)
+        )
+
+    @property
+    def _encoded(self) -> bytes:
+        return self.key.encode(self._shelf.keyencoding)
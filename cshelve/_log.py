@@ -0,0 +1,690 @@
+"""
+Log-structured module for cshelve.
+
+Without log, each write of the shelf is a request, limiting an ingestion to a few hundred writes per second per client.
+In log mode, sets and deletions are appended as framed records to a buffer sent to a log segment (`__cshelve__/log/segments/...`)
+once `batch_size` bytes are buffered or on `sync`, so the throughput depends on the bytes written instead of the number of requests:
+- Providers supporting appends (Azure append blobs, in-memory) append each batch to the segment of the writer, rolled once it reaches `segment_size`.
+- Other providers (AWS S3) write each batch as a new immutable segment.
+
+An index of the last record of each key is checkpointed in `__cshelve__/log/checkpoint` with the length of each segment it covers.
+Readers load the checkpoint and replay the tail of the segments with ranged reads, again after `max_staleness` seconds.
+Records are timestamped: the most recent one wins, whatever the order in which the segments are replayed.
+A deletion is a record too, so the deletions are batched like the sets.
+
+The compaction rewrites the live values of the sealed segments mostly made of garbage and retires these segments.
+A segment is sealed once no writer appends to it anymore: it is full, rolled, closed, older than `segment_age`, or an immutable batch.
+Writers end the segment they close with a seal record, and the checkpoint keeps which segments are sealed.
+Retired segments stay in the checkpoint, so they are not replayed, and are deleted by a compaction running `grace_period` seconds later,
+as the readers with a stale index may still read them.
+
+Records still in the buffer are written on `sync`: like with `writeback=True`, they are lost if the shelf is not closed.
+"""
+from collections import namedtuple
+from logging import Logger
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import uuid
+import zlib
+
+from ._concurrency import ConcurrencyController
+from ._manifest import _common_prefix_length, _read_varint, _varint
+from ._packing import PackedProvider
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+BATCH_SIZE_KEY = "batch_size"
+SEGMENT_SIZE_KEY = "segment_size"
+CHECKPOINT_INTERVAL_KEY = "checkpoint_interval"
+MAX_STALENESS_KEY = "max_staleness"
+COMPACTION_THRESHOLD_KEY = "compaction_threshold"
+SEGMENT_AGE_KEY = "segment_age"
+
+DEFAULT_BATCH_SIZE = 1024 * 1024
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+# Number of records written before the index is checkpointed.
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+# Seconds during which the index is considered up-to-date.
+DEFAULT_MAX_STALENESS = 60.0
+# Segments with at least half of their bytes overwritten or deleted are compacted.
+DEFAULT_COMPACTION_THRESHOLD = 0.5
+# Seconds after which the segment of a writer is rolled, so it can be compacted.
+DEFAULT_SEGMENT_AGE = 3600.0
+# Seconds added to the age of a segment before it is considered sealed, for the appends in flight and the clock skew.
+SEAL_MARGIN = 300.0
+
+LOG_PREFIX = INTERNAL_PREFIX + b"log/"
+SEGMENT_PREFIX = LOG_PREFIX + b"segments/"
+CHECKPOINT_KEY = LOG_PREFIX + b"checkpoint"
+MAGIC = b"CSL\x00"
+
+# Header of a record: operation, timestamp, key length and value length.
+# The key, the value and the CRC32 of the record follow.
+_FRAME = struct.Struct("<BQII")
+_CRC = struct.Struct("<I")
+SET = 1
+DELETE = 2
+# Last record of a segment, written by the writer closing it.
+SEAL = 3
+
+# Last record of a key. The segment of a deletion is None.
+Entry = namedtuple("Entry", ["timestamp", "segment", "offset", "length"])
+
+
+def encode_frame(
+    operation: int, timestamp: int, key: bytes, value: bytes = b""
+) -> bytes:
+    """
+    Serialize a record.
+    """
+    frame = _FRAME.pack(operation, timestamp, len(key), len(value)) + key + value
+    return frame + _CRC.pack(zlib.crc32(frame))
+
+
+def decode_frames(
+    data: bytes, base: int = 0
+) -> Tuple[List[Tuple[int, int, bytes, int, int]], int]:
+    """
+    Deserialize the records of a segment read from the offset `base`.
+    Return the operation, timestamp, key, value offset and value length of each record, and the length of the valid records.
+    A truncated or corrupted record, left by an interrupted append, stops the decoding.
+
+    >>> decode_frames(encode_frame(SET, 1, b"key", b"value") + b"trunc")
+    ([(1, 1, b'key', 20, 5)], 29)
+    """
+    records, position = [], 0
+    while position + _FRAME.size <= len(data):
+        operation, timestamp, key_length, value_length = _FRAME.unpack_from(
+            data, position
+        )
+        start = position + _FRAME.size
+        end = start + key_length + value_length
+        if end + _CRC.size > len(data):
+            break
+        (crc,) = _CRC.unpack_from(data, end)
+        if crc != zlib.crc32(data[position:end]):
+            break
+
+        key = data[start : start + key_length]
+        records.append(
+            (operation, timestamp, key, base + start + key_length, value_length)
+        )
+        position = end + _CRC.size
+    return records, position
+
+
+def encode_checkpoint(
+    positions: Dict[bytes, int],
+    entries: Dict[bytes, Entry],
+    sealed: Set[bytes] = frozenset(),
+    retired: Set[bytes] = frozenset(),
+) -> bytes:
+    """
+    Serialize the length of the segments covered by the checkpoint, whether they are sealed or retired,
+    and the entries, keys being front-coded.
+    """
+    numbers = {name: number for number, name in enumerate(sorted(positions), 1)}
+    data = bytearray(MAGIC) + _varint(len(numbers))
+    for name in sorted(positions):
+        flags = (name in retired) << 1 | (name in sealed)
+        data += _varint(len(name)) + name + _varint(positions[name] << 2 | flags)
+
+    previous = b""
+    for key in sorted(entries):
+        timestamp, segment, offset, length = entries[key]
+        shared = _common_prefix_length(previous, key)
+        data += _varint(shared) + _varint(len(key) - shared) + key[shared:]
+        # Deletions are stored with the segment 0.
+        data += _varint(timestamp) + _varint(numbers.get(segment, 0))
+        data += _varint(offset) + _varint(length)
+        previous = key
+
+    return zlib.compress(bytes(data))
+
+
+def decode_checkpoint(
+    data: bytes,
+) -> Tuple[Dict[bytes, int], Dict[bytes, Entry], Set[bytes], Set[bytes]]:
+    """
+    Deserialize the length of the segments covered by the checkpoint, the entries, the sealed and the retired segments.
+    """
+    data = zlib.decompress(data)
+    if not data.startswith(MAGIC):
+        raise ValueError("Unsupported log checkpoint format.")
+
+    position = len(MAGIC)
+    count, position = _read_varint(data, position)
+    names, positions, sealed, retired = [None], {}, set(), set()
+    for _ in range(count):
+        length, position = _read_varint(data, position)
+        name = data[position : position + length]
+        size, position = _read_varint(data, position + length)
+        names.append(name)
+        positions[name] = size >> 2
+        if size & 1:
+            sealed.add(name)
+        if size & 2:
+            retired.add(name)
+
+    entries, previous = {}, b""
+    while position < len(data):
+        shared, position = _read_varint(data, position)
+        length, position = _read_varint(data, position)
+        key = previous[:shared] + data[position : position + length]
+        position += length
+        timestamp, position = _read_varint(data, position)
+        number, position = _read_varint(data, position)
+        offset, position = _read_varint(data, position)
+        size, position = _read_varint(data, position)
+        entries[key] = Entry(timestamp, names[number], offset, size)
+        previous = key
+
+    return positions, entries, sealed, retired
+
+
+class LogProvider(ProviderInterface):
+    """
+    Provider wrapper writing the sets and deletions as records appended to log segments.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+        compaction_threshold: float = DEFAULT_COMPACTION_THRESHOLD,
+        segment_age: float = DEFAULT_SEGMENT_AGE,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+    ) -> None:
+        super().__init__(logger)
+        if batch_size < 1 or segment_size < batch_size or checkpoint_interval < 1:
+            raise ConfigurationError(
+                f"Invalid log sizes: batch_size={batch_size}, segment_size={segment_size}, checkpoint_interval={checkpoint_interval}."
+            )
+
+        self.provider = provider
+        self.controller = controller
+        self.batch_size = batch_size
+        self.segment_size = segment_size
+        self.checkpoint_interval = checkpoint_interval
+        self.max_staleness = max_staleness
+        self.compaction_threshold = compaction_threshold
+        self.segment_age = segment_age
+        self.sweeper = Sweeper(logger, provider, controller, b"log", grace_period)
+
+        self._lock = threading.RLock()
+        # Index loaded on the first use: last record of each key and replayed length of each segment.
+        self._entries: Dict[bytes, Entry] = {}
+        self._positions: Dict[bytes, int] = {}
+        self._loaded_at: Optional[float] = None
+        # Segment of this writer: records up to `_flushed` are written, the following ones are buffered.
+        self._segment = self._segment_name()
+        self._flushed = 0
+        self._buffer = bytearray()
+        # Segments no writer appends to anymore: rolled by this writer or ended by a seal record.
+        self._sealed: Set[bytes] = set()
+        # Compacted segments, deleted after the grace period.
+        self._retired: Set[bytes] = set()
+        # Records written since the last checkpoint.
+        self._unchecked = 0
+        # Last timestamp used, so the records of this writer are strictly ordered.
+        self._clock = 0
+
+    def close(self) -> None:
+        self._flush()
+        with self._lock:
+            # Other writers can compact the segment once closed.
+            self._roll()
+        self.sync()
+        self.provider.close()
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        self.provider.configure_default(config)
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        self.provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        self.provider.set_provider_params(provider_params)
+
+    def create(self) -> None:
+        self.provider.create()
+
+    def exists(self) -> bool:
+        return self.provider.exists()
+
+    def reconnect(self) -> None:
+        # Locks of the parent process are not usable in a child process.
+        self._lock = threading.RLock()
+        self.provider.reconnect()
+
+    def contains(self, key: bytes) -> bool:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.contains(key)
+
+        entry = self._index().get(key)
+        if entry is not None:
+            return entry.segment is not None
+        # Keys written before the log mode was enabled.
+        return self.provider.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.get(key)
+
+        with self._lock:
+            entry = self._index().get(key)
+            if entry is None:
+                pass
+            elif entry.segment is None:
+                raise KeyNotFoundError(f"Key not found: {key}")
+            elif entry.segment == self._segment and entry.offset >= self._flushed:
+                start = entry.offset - self._flushed
+                return bytes(self._buffer[start : start + entry.length])
+
+        if entry is None:
+            return self.provider.get(key)
+        return self.provider.get_range(entry.segment, entry.offset, entry.length)
+
+    def set(self, key: bytes, value: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.set(key, value)
+        self._append(SET, key, value)
+
+    def delete(self, key: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.delete(key)
+
+        entry = self._index().get(key)
+        # Only the keys unknown to the log, which may have been written before the log mode, cost a request.
+        if entry is None:
+            exists = self.provider.contains(key)
+        else:
+            exists = entry.segment is not None
+        if not exists:
+            raise KeyNotFoundError(f"Key not found: {key}")
+        # The object of a key written before the log mode is deleted by the compaction.
+        self._append(DELETE, key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self.iter_prefix(b"")
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        if prefix.startswith(INTERNAL_PREFIX):
+            yield from self.provider.iter_prefix(prefix)
+            return
+
+        with self._lock:
+            logged = {k: e for k, e in self._index().items() if k.startswith(prefix)}
+        yield from sorted(k for k, e in logged.items() if e.segment is not None)
+
+        # Objects written before the log mode, unless overwritten or deleted since.
+        for key in (
+            self.provider.iter_prefix(prefix) if prefix else self.provider.iter()
+        ):
+            if key not in logged:
+                yield key
+
+    def len(self) -> int:
+        # Internal objects are counted like the providers do, the listing engine removes them.
+        # They are counted apart as some wrappers, like the layout, don't iterate over them.
+        keys = sum(1 for k in self.iter() if not k.startswith(INTERNAL_PREFIX))
+        return keys + sum(1 for _ in self.provider.iter_prefix(INTERNAL_PREFIX))
+
+    def sync(self) -> None:
+        """
+        Write the buffered records, and checkpoint the index if enough records were written since the last checkpoint.
+        """
+        self._flush()
+        if self._unchecked >= self.checkpoint_interval:
+            self.checkpoint()
+        self.provider.sync()
+
+    def checkpoint(self, merge: bool = True) -> None:
+        """
+        Write the index, merged with the stored one which may contain the records of other writers.
+        """
+        self._flush()
+        stored = self._load_checkpoint() if merge else None
+
+        with self._lock:
+            if stored is not None:
+                self._merge(*stored)
+            data = encode_checkpoint(
+                self._positions, self._entries, self._sealed, self._retired
+            )
+            self._unchecked = 0
+        self.provider.set(CHECKPOINT_KEY, data)
+
+    def compact(self) -> int:
+        """
+        Rewrite the live values of the sealed segments mostly made of garbage and retire these segments.
+        The segments other writers may still append to are left untouched.
+        The segments retired and the objects written before the log mode are deleted after the grace period.
+        Return the number of segments deleted.
+        """
+        self._flush()
+        # All the records must be known before deciding which ones are live.
+        self._refresh(force=True)
+
+        with self._lock:
+            # The segment of this writer is sealed so it can be compacted too.
+            if self._flushed:
+                self._roll()
+            live = {}
+            for key, entry in self._entries.items():
+                if entry.segment is not None:
+                    size = _FRAME.size + len(key) + entry.length + _CRC.size
+                    live[entry.segment] = live.get(entry.segment, 0) + size
+            candidates = [
+                name
+                for name, size in self._positions.items()
+                if name != self._segment
+                and name not in self._retired
+                and size
+                and self._is_sealed(name, size)
+                and 1 - live.get(name, 0) / size >= self.compaction_threshold
+            ]
+            moved = {
+                name: [(k, e) for k, e in self._entries.items() if e.segment == name]
+                for name in candidates
+            }
+
+        if candidates:
+            self._rewrite(candidates, moved)
+
+        # Objects written before the log mode and overwritten or deleted since are also garbage.
+        with self._lock:
+            logged = set(self._entries)
+            retired = sorted(self._retired)
+        outdated = [k for k in self.provider.iter() if k in logged]
+        deleted = set(self.sweeper.sweep(retired + outdated))
+
+        with self._lock:
+            # Deleted segments can't be replayed anymore.
+            removed = deleted & self._retired
+            for name in removed:
+                self._positions.pop(name, None)
+            self._sealed -= removed
+            self._retired -= removed
+            # Once no older record can be replayed nor older object read, deletions can be forgotten.
+            forget = (
+                not self._positions.keys() - {self._segment}
+                and deleted.issuperset(outdated)
+                and any(e.segment is None for e in self._entries.values())
+            )
+            if forget:
+                self._entries = {
+                    k: e for k, e in self._entries.items() if e.segment is not None
+                }
+        if removed or forget:
+            self.checkpoint(merge=False)
+
+        self.logger.info(f"{len(removed)} log segments deleted.")
+        return len(removed)
+
+    def _rewrite(
+        self, candidates: List[bytes], moved: Dict[bytes, List[Tuple[bytes, Entry]]]
+    ) -> None:
+        """
+        Rewrite the live values of the segments, then retire them.
+        """
+        self.logger.info(f"Compacting {len(candidates)} log segments...")
+
+        def load(name):
+            return name, self.provider.get(name) if moved[name] else b""
+
+        for name, data in self.controller.map(load, candidates):
+            for key, entry in moved[name]:
+                value = data[entry.offset : entry.offset + entry.length]
+                with self._lock:
+                    # The key may have been written since the compaction started.
+                    if self._entries.get(key) == entry:
+                        self._write_record(SET, key, value, entry.timestamp)
+
+        with self._lock:
+            self._retired.update(candidates)
+        # The checkpoint references the rewritten values before the segments are deleted.
+        self.checkpoint(merge=False)
+
+    def _index(self) -> Dict[bytes, Entry]:
+        """
+        Return the last record of each key, replaying the tail of the log if the index is stale.
+        """
+        self._refresh()
+        return self._entries
+
+    def _refresh(self, force: bool = False) -> None:
+        if (
+            not force
+            and self._loaded_at is not None
+            and time.monotonic() - self._loaded_at <= self.max_staleness
+        ):
+            return
+
+        with self._lock:
+            if self._loaded_at is None:
+                stored = self._load_checkpoint()
+                if stored is not None:
+                    self._merge(*stored)
+            positions, sealed = dict(self._positions), set(self._sealed)
+
+        def replay(name):
+            position = positions.get(name, 0)
+            # A sealed segment is not appended anymore.
+            if (
+                name in sealed
+                or position >= self.segment_size
+                or (position and not self.provider.supports_append)
+            ):
+                return name, position, []
+            try:
+                data = self._read_tail(name, position)
+            except KeyNotFoundError:
+                # Deleted by a compaction since listed.
+                return name, position, []
+            records, length = decode_frames(data, position)
+            return name, position + length, records
+
+        names = [
+            n for n in self.provider.iter_prefix(SEGMENT_PREFIX) if n != self._segment
+        ]
+        replayed = list(self.controller.map(replay, names))
+
+        with self._lock:
+            for name, position, records in replayed:
+                for operation, timestamp, key, offset, length in records:
+                    if operation == SEAL:
+                        self._sealed.add(name)
+                        continue
+                    entry = Entry(
+                        timestamp, name if operation == SET else None, offset, length
+                    )
+                    self._apply(key, entry)
+                if position:
+                    self._positions[name] = max(self._positions.get(name, 0), position)
+            self._loaded_at = time.monotonic()
+
+    def _merge(
+        self,
+        positions: Dict[bytes, int],
+        entries: Dict[bytes, Entry],
+        sealed: Set[bytes],
+        retired: Set[bytes],
+    ) -> None:
+        """
+        Merge an index into the local one. Must be called with the lock.
+        """
+        for name, position in positions.items():
+            self._positions[name] = max(self._positions.get(name, 0), position)
+        self._sealed |= sealed
+        self._retired |= retired
+        for key, entry in entries.items():
+            self._apply(key, entry)
+
+    def _apply(self, key: bytes, entry: Entry) -> None:
+        """
+        Keep the most recent record of the key. Must be called with the lock.
+        """
+        current = self._entries.get(key)
+        if current is None or entry.timestamp > current.timestamp:
+            self._entries[key] = entry
+
+    def _append(self, operation: int, key: bytes, value: bytes = b"") -> None:
+        with self._lock:
+            self._index()
+            # Strictly increasing, even if the clock doesn't move between two writes.
+            self._clock = max(self._clock + 1, time.time_ns())
+            self._write_record(operation, key, value, self._clock)
+            full = len(self._buffer) >= self.batch_size
+
+        if full:
+            self._flush()
+
+    def _write_record(
+        self, operation: int, key: bytes, value: bytes, timestamp: int
+    ) -> None:
+        """
+        Buffer a record and update the index. Must be called with the lock.
+        """
+        # A segment is rolled once old enough, so the compaction can rewrite it.
+        if (
+            not self._buffer
+            and self._flushed
+            and self._age(self._segment) >= self.segment_age
+        ):
+            self._roll()
+        offset = self._flushed + len(self._buffer) + _FRAME.size + len(key)
+        self._buffer += encode_frame(operation, timestamp, key, value)
+        segment = self._segment if operation == SET else None
+        self._entries[key] = Entry(timestamp, segment, offset, len(value))
+        self._unchecked += 1
+
+    def _flush(self) -> None:
+        """
+        Write the buffered records to the segment of this writer, rolled when full.
+        """
+        with self._lock:
+            if not self._buffer:
+                return
+
+            data = bytes(self._buffer)
+            if self.provider.supports_append:
+                self.provider.append(self._segment, data)
+            else:
+                self.provider.set(self._segment, data)
+            self._flushed += len(data)
+            self._positions[self._segment] = self._flushed
+            self._buffer = bytearray()
+
+            # Without appends, each batch is an immutable segment.
+            if self._flushed >= self.segment_size or not self.provider.supports_append:
+                self._roll()
+
+    def _roll(self) -> None:
+        """
+        Start a new segment, the current one being sealed. Must be called with the lock and an empty buffer.
+        """
+        if self._flushed:
+            self._sealed.add(self._segment)
+            # Full and immutable segments are known to be sealed, the others end with a seal record.
+            if self.provider.supports_append and self._flushed < self.segment_size:
+                seal = encode_frame(SEAL, self._clock, b"")
+                self.provider.append(self._segment, seal)
+                self._positions[self._segment] = self._flushed + len(seal)
+        self._segment, self._flushed = self._segment_name(), 0
+
+    def _is_sealed(self, name: bytes, size: int) -> bool:
+        """
+        Return whether no writer appends to the segment anymore. Must be called with the lock.
+        """
+        return (
+            name in self._sealed
+            or not self.provider.supports_append
+            or size >= self.segment_size
+            or self._age(name) >= self.segment_age + SEAL_MARGIN
+        )
+
+    def _read_tail(self, name: bytes, position: int) -> bytes:
+        """
+        Read the segment from the position with ranged reads, instead of downloading it entirely.
+        """
+        data = bytearray()
+        while True:
+            length = max(self.segment_size - position - len(data), self.batch_size)
+            chunk = self.provider.get_range(name, position + len(data), length)
+            data += chunk
+            # Reading past the end of the segment returns the bytes available.
+            if len(chunk) < length:
+                return bytes(data)
+
+    def _load_checkpoint(self):
+        try:
+            return decode_checkpoint(self.provider.get(CHECKPOINT_KEY))
+        except KeyNotFoundError:
+            return None
+
+    def _segment_name(self) -> bytes:
+        # Names are unique across writers and sorted by creation time.
+        return SEGMENT_PREFIX + f"{time.time_ns():016x}-{uuid.uuid4().hex}".encode()
+
+    @staticmethod
+    def _age(name: bytes) -> float:
+        """
+        Return the seconds since the creation of the segment, from its name.
+        """
+        try:
+            created = int(name[len(SEGMENT_PREFIX) :].split(b"-", 1)[0], 16)
+        except ValueError:
+            return 0.0
+        return time.time() - created / 1e9
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> ProviderInterface:
+    """
+    Wrap the provider with the log-structured storage defined in the `log` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return provider
+
+    if isinstance(provider, PackedProvider):
+        raise ConfigurationError("The log and packing modes can't be enabled together.")
+
+    try:
+        log = LogProvider(
+            logger,
+            provider,
+            controller,
+            batch_size=int(config.get(BATCH_SIZE_KEY, DEFAULT_BATCH_SIZE)),
+            segment_size=int(config.get(SEGMENT_SIZE_KEY, DEFAULT_SEGMENT_SIZE)),
+            checkpoint_interval=int(
+                config.get(CHECKPOINT_INTERVAL_KEY, DEFAULT_CHECKPOINT_INTERVAL)
+            ),
+            max_staleness=float(config.get(MAX_STALENESS_KEY, DEFAULT_MAX_STALENESS)),
+            compaction_threshold=float(
+                config.get(COMPACTION_THRESHOLD_KEY, DEFAULT_COMPACTION_THRESHOLD)
+            ),
+            segment_age=float(config.get(SEGMENT_AGE_KEY, DEFAULT_SEGMENT_AGE)),
+            grace_period=float(config.get(GRACE_PERIOD_KEY, DEFAULT_GRACE_PERIOD)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid log configuration: {e}") from e
+
+    mode = "append" if provider.supports_append else "rolling segments"
+    logger.debug(f"Log-structured mode enabled with {mode}.")
+    return log
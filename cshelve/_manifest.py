@@ -0,0 +1,353 @@
+"""
+Manifest module for cshelve.
+
+Without manifest, `len`, the iteration over the keys and the membership tests require requests on the provider,
+and a full listing of the container for the first two.
+The manifest is an index of the keys maintained by the shelf in its internal namespace:
+- The keys are split into shards (`__cshelve__/manifest/<shard>`) so an update only rewrites a small object.
+- Each shard is a front-coded (keys sorted and stored as a suffix of the previous one) and compressed list of entries.
+- Each entry contains the size, the checksum and the record version of the value.
+
+Updates are buffered and written on `sync`, on `close` or when too many updates are pending.
+Shards are cached and reloaded after `max_staleness` seconds, so changes made by other writers are seen with a bounded delay.
+The manifest can be rebuilt from a full listing with `repair` if it diverges (writers not using the manifest, crash, ...).
+"""
+from collections import namedtuple
+from logging import Logger
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import zlib
+
+from ._concurrency import ConcurrencyController
+from ._layout import key_hash
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+SHARDS_KEY = "shards"
+MAX_STALENESS_KEY = "max_staleness"
+
+DEFAULT_SHARDS = 16
+# Seconds during which a shard loaded from the provider is considered up-to-date.
+DEFAULT_MAX_STALENESS = 60.0
+# Number of pending updates triggering a write of the manifest.
+FLUSH_THRESHOLD = 1000
+
+# Prefix of the shards of the manifest.
+MANIFEST_PREFIX = INTERNAL_PREFIX + b"manifest/"
+# Header of a shard, containing the version of its format.
+MAGIC = b"CSM\x00"
+
+# Description of a value stored in the shelf.
+ManifestEntry = namedtuple("ManifestEntry", ["size", "checksum", "version"])
+
+_ENTRY = struct.Struct("<IB")
+
+
+def entry_of(record: bytes) -> ManifestEntry:
+    """
+    Return the manifest entry describing a record.
+    The checksum replaces the ETag as the providers don't return it on each write.
+    """
+    return ManifestEntry(len(record), zlib.crc32(record), record[0])
+
+
+def encode(entries: Dict[bytes, ManifestEntry]) -> bytes:
+    """
+    Serialize the entries of a shard.
+    """
+    data = bytearray(MAGIC)
+    previous = b""
+
+    for key in sorted(entries):
+        size, checksum, version = entries[key]
+        shared = _common_prefix_length(previous, key)
+        data += _varint(shared) + _varint(len(key) - shared) + key[shared:]
+        data += _varint(size) + _ENTRY.pack(checksum, version)
+        previous = key
+
+    return zlib.compress(bytes(data))
+
+
+def decode(data: bytes) -> Dict[bytes, ManifestEntry]:
+    """
+    Deserialize the entries of a shard.
+    """
+    data = zlib.decompress(data)
+    if not data.startswith(MAGIC):
+        raise ValueError("Unsupported manifest format.")
+
+    entries = {}
+    previous = b""
+    position = len(MAGIC)
+
+    while position < len(data):
+        shared, position = _read_varint(data, position)
+        length, position = _read_varint(data, position)
+        key = previous[:shared] + data[position : position + length]
+        position += length
+        size, position = _read_varint(data, position)
+        checksum, version = _ENTRY.unpack_from(data, position)
+        position += _ENTRY.size
+
+        entries[key] = ManifestEntry(size, checksum, version)
+        previous = key
+
+    return entries
+
+
+class Manifest:
+    """
+    Index of the keys of the shelf, stored in its internal namespace.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        shards: int = DEFAULT_SHARDS,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+    ) -> None:
+        if shards < 1:
+            raise ConfigurationError(
+                f"The number of manifest shards must be positive, not {shards}."
+            )
+
+        self.logger = logger
+        self.provider = provider
+        self.controller = controller
+        self.shards = shards
+        self.max_staleness = max_staleness
+
+        # Shards loaded from the provider, with their loading time.
+        self._cache: Dict[int, Tuple[float, Dict[bytes, ManifestEntry]]] = {}
+        # Updates not yet written, by shard. A None entry is a deletion.
+        self._pending: Dict[int, Dict[bytes, Optional[ManifestEntry]]] = {}
+        self._pending_count = 0
+        self._lock = threading.RLock()
+
+    def shard(self, key: bytes) -> int:
+        """
+        Return the shard of the manifest containing the key.
+        """
+        return key_hash(key) % self.shards
+
+    def record(self, key: bytes, record: bytes) -> None:
+        """
+        Register the new value of a key.
+        """
+        self._update(key, entry_of(record))
+
+    def remove(self, key: bytes) -> None:
+        """
+        Register the deletion of a key.
+        """
+        self._update(key, None)
+
+    def get(self, key: bytes) -> Optional[ManifestEntry]:
+        """
+        Return the entry of the key, or None if the key is not in the manifest.
+        """
+        return self._entries(self.shard(key)).get(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._all_entries())
+
+    def __iter__(self) -> Iterator[bytes]:
+        for entries in self._all_entries():
+            # Entries may be updated during the iteration.
+            yield from list(entries)
+
+    def flush(self, concurrent: bool = True) -> None:
+        """
+        Write the pending updates.
+        Each shard is reloaded before being written so the updates of other writers are kept.
+        """
+        with self._lock:
+            pending = {shard: dict(updates) for shard, updates in self._pending.items()}
+            self._pending_count = 0
+
+        def write(item):
+            shard, updates = item
+            entries = self._load(shard)
+            self._apply(entries, updates)
+            self._write(shard, entries, updates)
+
+        if not concurrent:
+            for item in pending.items():
+                write(item)
+            return
+
+        for _ in self.controller.map(write, pending.items()):
+            pass
+
+    def rebuild(self, records: Iterable[Tuple[bytes, bytes]]) -> None:
+        """
+        Replace the content of the manifest by the records provided.
+        """
+        shards = {shard: {} for shard in range(self.shards)}
+        for key, record in records:
+            shards[self.shard(key)][key] = entry_of(record)
+
+        with self._lock:
+            self._pending, self._pending_count = {}, 0
+
+        for _ in self.controller.map(lambda item: self._write(*item), shards.items()):
+            pass
+        self.logger.info(f"Manifest rebuilt with {len(self)} keys.")
+
+    def _after_fork(self) -> None:
+        """
+        Reset the lock in a child process: locks of the parent are not usable.
+        """
+        self._lock = threading.RLock()
+
+    def _update(self, key: bytes, entry: Optional[ManifestEntry]) -> None:
+        shard = self.shard(key)
+
+        with self._lock:
+            self._pending.setdefault(shard, {})[key] = entry
+            self._pending_count += 1
+            # The cache reflects the local updates immediately.
+            if shard in self._cache:
+                self._apply(self._cache[shard][1], {key: entry})
+            flush = self._pending_count >= FLUSH_THRESHOLD
+
+        if flush:
+            # Updates may come from the threads of the controller, which can't wait for its other threads.
+            self.flush(concurrent=False)
+
+    def _entries(self, shard: int) -> Dict[bytes, ManifestEntry]:
+        """
+        Return the entries of the shard, reloading it if it is stale.
+        """
+        with self._lock:
+            cached = self._cache.get(shard)
+        if cached is not None and time.monotonic() - cached[0] <= self.max_staleness:
+            return cached[1]
+
+        entries = self._load(shard)
+        with self._lock:
+            # Updates not yet written must stay visible.
+            self._apply(entries, self._pending.get(shard, {}))
+            self._cache[shard] = (time.monotonic(), entries)
+        return entries
+
+    def _all_entries(self) -> Iterator[Dict[bytes, ManifestEntry]]:
+        """
+        Return the entries of all the shards, stale shards being reloaded concurrently.
+        """
+        return self.controller.map(self._entries, range(self.shards))
+
+    def _load(self, shard: int) -> Dict[bytes, ManifestEntry]:
+        try:
+            return decode(self.provider.get(self._name(shard)))
+        except KeyNotFoundError:
+            return {}
+
+    def _write(
+        self,
+        shard: int,
+        entries: Dict[bytes, ManifestEntry],
+        written: Optional[Dict[bytes, Optional[ManifestEntry]]] = None,
+    ) -> None:
+        """
+        Write the shard and remove the updates it contains from the pending ones.
+        """
+        self.provider.set(self._name(shard), encode(entries))
+
+        with self._lock:
+            pending = self._pending.get(shard, {})
+            for key, entry in (written or {}).items():
+                # The key may have been updated again while writing.
+                if key in pending and pending[key] == entry:
+                    del pending[key]
+            if not pending:
+                self._pending.pop(shard, None)
+
+            entries = dict(entries)
+            self._apply(entries, pending)
+            self._cache[shard] = (time.monotonic(), entries)
+
+    def _name(self, shard: int) -> bytes:
+        return MANIFEST_PREFIX + str(shard).encode()
+
+    @staticmethod
+    def _apply(entries, updates) -> None:
+        for key, entry in updates.items():
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+
+
+def _common_prefix_length(a: bytes, b: bytes) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def _varint(value: int) -> bytes:
+    """
+    Encode a positive integer on a variable number of bytes (LEB128).
+    """
+    data = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    """
+    Decode a variable length integer, returning it with the position of the next byte.
+    """
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> Optional[Manifest]:
+    """
+    Configure the manifest based on the `manifest` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return None
+
+    try:
+        manifest = Manifest(
+            logger,
+            provider,
+            controller,
+            shards=int(config.get(SHARDS_KEY, DEFAULT_SHARDS)),
+            max_staleness=float(config.get(MAX_STALENESS_KEY, DEFAULT_MAX_STALENESS)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid manifest configuration: {e}") from e
+
+    logger.debug(f"Manifest enabled with {manifest.shards} shards.")
+    return manifest
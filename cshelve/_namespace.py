@@ -0,0 +1,125 @@
+"""
+Namespace module for cshelve.
+
+A namespace is a view of a shelf restricted to the keys starting with a prefix (ex: `tenant-a/`).
+It translates its keys and delegates everything to the database of the shelf, so all the namespaces share
+the provider client and its connection pool, the data processing, the concurrency controller, the manifest and the Bloom filter.
+Opening a namespace sends no request and costs a few objects.
+"""
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from .provider_interface import KeysPage
+
+
+class _NamespaceDatabase(MutableMapping):
+    """
+    MutableMapping over the keys of a database starting with a prefix, the prefix being removed.
+    """
+
+    def __init__(self, database, prefix: bytes) -> None:
+        if not prefix:
+            raise ValueError("A namespace requires a non-empty prefix.")
+
+        super().__init__()
+        self.database = database
+        self.prefix = prefix
+        self.logger = database.logger
+        self.flag = database.flag
+        # Shared with the parent so the bulk operations of all the namespaces are limited together.
+        self.concurrency = database.concurrency
+
+    def __getitem__(self, key: bytes) -> bytes:
+        return self.database[self.prefix + key]
+
+    def __setitem__(self, key: bytes, value: bytes) -> None:
+        self.database[self.prefix + key] = value
+
+    def __delitem__(self, key: bytes) -> None:
+        del self.database[self.prefix + key]
+
+    def __contains__(self, key: bytes) -> bool:
+        return self.prefix + key in self.database
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.iter_prefix(b"")
+
+    def __len__(self) -> int:
+        return self.database.count(self.prefix)
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, bytes]:
+        values = self.database.get_many(self.prefix + key for key in keys)
+        return {key[len(self.prefix) :]: value for key, value in values.items()}
+
+    def set_many(self, items: Iterable[Tuple[bytes, bytes]]) -> None:
+        self.database.set_many((self.prefix + key, value) for key, value in items)
+
+    def delete_many(self, keys: Iterable[bytes]) -> None:
+        self.database.delete_many(self.prefix + key for key in keys)
+
+    def get_parts(self, names: Iterable[bytes]) -> Iterator[bytes]:
+        # Parts are internal objects named after their value: they are not prefixed.
+        return self.database.get_parts(names)
+
+    def set_parts(self, parts: Iterable[Tuple[bytes, bytes]]) -> None:
+        self.database.set_parts(parts)
+
+    def delete_parts(self, names: Iterable[bytes]) -> None:
+        self.database.delete_parts(names)
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        for key in self.database.iter_prefix(self.prefix + prefix):
+            yield key[len(self.prefix) :]
+
+    def count(self, prefix: bytes = b"") -> int:
+        return self.database.count(self.prefix + prefix)
+
+    def delete_prefix(self, prefix: bytes) -> int:
+        return self.database.delete_prefix(self.prefix + prefix)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+    ) -> KeysPage:
+        page = self.database.list_keys(
+            self.prefix + prefix, page_size, continuation_token
+        )
+        return KeysPage(
+            [key[len(self.prefix) :] for key in page.keys],
+            [p[len(self.prefix) :] for p in page.prefixes],
+            page.continuation_token,
+        )
+
+    def iter_partition(self, index: int, count: int) -> Iterator[bytes]:
+        # Partitions are computed on the full keys so they match the partitions of the parent.
+        for key in self.database.iter_partition(index, count):
+            if key.startswith(self.prefix):
+                yield key[len(self.prefix) :]
+
+    def repair_manifest(self) -> None:
+        """
+        The manifest is shared by all the namespaces: it is repaired for the whole shelf.
+        """
+        self.database.repair_manifest()
+
+    def rebuild_bloom(self) -> None:
+        """
+        The Bloom filter is shared by all the namespaces: it is rebuilt for the whole shelf.
+        """
+        self.database.rebuild_bloom()
+
+    def compact(self, background: bool = False):
+        """
+        Segments, records, chunks and parts are shared by all the namespaces: the whole shelf is compacted.
+        """
+        return self.database.compact(background)
+
+    def sync(self) -> None:
+        self.database.sync()
+
+    def close(self) -> None:
+        """
+        The parent owns the shared resources and releases them when closed.
+        """
@@ -0,0 +1,709 @@
+"""
+Packing module for cshelve.
+
+With millions of small values, the number of requests, not the bytes transferred, is the bottleneck and the main cost.
+In packed mode, values smaller than `max_value_size` are appended to a buffer written as an immutable segment object
+(`__cshelve__/pack/segments/...`) once full or on `sync`, and an index keeps the segment, offset and length of each value.
+Larger values are still stored in dedicated objects.
+
+Reads of packed values are ranged reads of their segment; reads of several values coalesce the adjacent ranges into a single request.
+Segments can be compressed as a whole for a better ratio, in which case they are downloaded entirely and cached.
+Overwritten and deleted values leave garbage in their segments, reclaimed by the compaction: the segments rewritten
+and the outdated dedicated objects are deleted once the index doesn't reference them for `grace_period` seconds (mark-and-sweep),
+as readers with a stale index may still read them.
+
+The index is reloaded after `max_staleness` seconds, so the values packed by other writers are seen with a bounded delay.
+As the providers don't support conditional writes, the index is merged and written by a single writer at a time:
+the writer holds a lease (`__cshelve__/pack/writer`) renewed on each write and released on `close`,
+and another shelf writing packed values meanwhile raises a `ConcurrentWriterError`.
+Segments and the index are uploaded without blocking the reads and writes of the other threads.
+
+Values still in the buffer are written on `sync`: like with `writeback=True`, they are lost if the shelf is not closed.
+"""
+from collections import OrderedDict, namedtuple
+from logging import Logger
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+import zlib
+
+from ._concurrency import ConcurrencyController
+from ._manifest import _common_prefix_length, _read_varint, _varint
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConcurrentWriterError, ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ENABLED_KEY = "enabled"
+MAX_VALUE_SIZE_KEY = "max_value_size"
+SEGMENT_SIZE_KEY = "segment_size"
+COMPRESSION_KEY = "compression"
+COMPACTION_THRESHOLD_KEY = "compaction_threshold"
+MAX_STALENESS_KEY = "max_staleness"
+LEASE_DURATION_KEY = "lease_duration"
+
+DEFAULT_MAX_VALUE_SIZE = 4096
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+# Segments with at least half of their bytes overwritten or deleted are compacted.
+DEFAULT_COMPACTION_THRESHOLD = 0.5
+# Seconds during which the index is considered up-to-date.
+DEFAULT_MAX_STALENESS = 60.0
+# Seconds during which the writer of the index excludes the others, unless it renews or releases its lease.
+DEFAULT_LEASE_DURATION = 300.0
+
+# Ranges separated by less than this gap are read with a single request, the gap being discarded.
+COALESCE_GAP = 64 * 1024
+# Number of compressed segments kept decompressed in memory.
+SEGMENT_CACHE_SIZE = 8
+
+PACK_PREFIX = INTERNAL_PREFIX + b"pack/"
+SEGMENT_PREFIX = PACK_PREFIX + b"segments/"
+INDEX_KEY = PACK_PREFIX + b"index"
+WRITER_KEY = PACK_PREFIX + b"writer"
+# Suffix of the compressed segments.
+COMPRESSED_SUFFIX = b".z"
+MAGIC = b"CSP\x00"
+
+# Location of a packed value.
+Location = namedtuple("Location", ["segment", "offset", "length"])
+
+
+def encode_index(segments: Dict[bytes, int], entries: Dict[bytes, Location]) -> bytes:
+    """
+    Serialize the segments with their size and the locations of the values, keys being front-coded.
+    """
+    numbers = {name: number for number, name in enumerate(sorted(segments))}
+    data = bytearray(MAGIC) + _varint(len(numbers))
+    for name in sorted(segments):
+        data += _varint(len(name)) + name + _varint(segments[name])
+
+    previous = b""
+    for key in sorted(entries):
+        segment, offset, length = entries[key]
+        shared = _common_prefix_length(previous, key)
+        data += _varint(shared) + _varint(len(key) - shared) + key[shared:]
+        data += _varint(numbers[segment]) + _varint(offset) + _varint(length)
+        previous = key
+
+    return zlib.compress(bytes(data))
+
+
+def decode_index(data: bytes) -> Tuple[Dict[bytes, int], Dict[bytes, Location]]:
+    """
+    Deserialize the segments and the locations of the values.
+    """
+    data = zlib.decompress(data)
+    if not data.startswith(MAGIC):
+        raise ValueError("Unsupported pack index format.")
+
+    position = len(MAGIC)
+    count, position = _read_varint(data, position)
+    names, segments = [], {}
+    for _ in range(count):
+        length, position = _read_varint(data, position)
+        name = data[position : position + length]
+        size, position = _read_varint(data, position + length)
+        names.append(name)
+        segments[name] = size
+
+    entries, previous = {}, b""
+    while position < len(data):
+        shared, position = _read_varint(data, position)
+        length, position = _read_varint(data, position)
+        key = previous[:shared] + data[position : position + length]
+        position += length
+        number, position = _read_varint(data, position)
+        offset, position = _read_varint(data, position)
+        size, position = _read_varint(data, position)
+        entries[key] = Location(names[number], offset, size)
+        previous = key
+
+    return segments, entries
+
+
+def encode_lease(writer: str, expires: float) -> bytes:
+    """
+    Serialize the writer holding the lease and its expiration time.
+
+    >>> decode_lease(encode_lease("a1", 1.5))
+    ('a1', 1.5)
+    """
+    return f"{writer} {expires!r}".encode()
+
+
+def decode_lease(data: bytes) -> Tuple[str, float]:
+    """
+    Deserialize the writer holding the lease and its expiration time.
+    """
+    writer, expires = data.decode().split(" ", 1)
+    return writer, float(expires)
+
+
+def coalesce(locations: List[Tuple[Any, Location]], gap: int = COALESCE_GAP):
+    """
+    Group the locations of a segment into ranges read with a single request.
+
+    >>> [(start, end, [k for k, _ in items]) for start, end, items in coalesce(
+    ...     [("a", Location(b"s", 0, 10)), ("c", Location(b"s", 1000000, 5)), ("b", Location(b"s", 12, 4))])]
+    [(0, 16, ['a', 'b']), (1000000, 1000005, ['c'])]
+    """
+    ranges = []
+    for item in sorted(locations, key=lambda item: item[1].offset):
+        location = item[1]
+        end = location.offset + location.length
+        if ranges and location.offset - ranges[-1][1] <= gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+            ranges[-1][2].append(item)
+        else:
+            ranges.append([location.offset, end, [item]])
+    return [tuple(r) for r in ranges]
+
+
+class PackedProvider(ProviderInterface):
+    """
+    Provider wrapper packing the small values into segments.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        max_value_size: int = DEFAULT_MAX_VALUE_SIZE,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        compression: bool = False,
+        compaction_threshold: float = DEFAULT_COMPACTION_THRESHOLD,
+        max_staleness: float = DEFAULT_MAX_STALENESS,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+        lease_duration: float = DEFAULT_LEASE_DURATION,
+    ) -> None:
+        super().__init__(logger)
+        if max_value_size < 1 or segment_size < max_value_size:
+            raise ConfigurationError(
+                f"Invalid packing sizes: max_value_size={max_value_size}, segment_size={segment_size}."
+            )
+        if lease_duration <= 0:
+            raise ConfigurationError(
+                f"Invalid packing lease duration: {lease_duration}."
+            )
+
+        self.provider = provider
+        self.controller = controller
+        self.max_value_size = max_value_size
+        self.segment_size = segment_size
+        self.compression = compression
+        self.compaction_threshold = compaction_threshold
+        self.max_staleness = max_staleness
+        self.sweeper = Sweeper(logger, provider, controller, b"pack", grace_period)
+        self.lease_duration = lease_duration
+
+        self._lock = threading.RLock()
+        # Serializes the loads and writes of the index, without blocking the reads and writes of the values.
+        self._index_lock = threading.Lock()
+        # Index loaded on the first use: size of the segments and location of the packed values.
+        self._segments: Dict[bytes, int] = {}
+        self._entries: Dict[bytes, Location] = {}
+        self._loaded_at: Optional[float] = None
+        # Changes not yet written in the stored index. A None location is a deletion.
+        self._pending: Dict[bytes, Optional[Location]] = {}
+        self._new_segments: Dict[bytes, int] = {}
+        self._removed_segments = set()
+        # Identifier of this writer, and expiration time of its lease on the index.
+        self._writer = uuid.uuid4().hex
+        self._lease_expires = 0.0
+        # Segment being filled.
+        self._buffer_name = self._segment_name()
+        self._buffer = bytearray()
+        # Segments being written, or whose write failed, still serving the reads from memory.
+        self._flushing: Dict[bytes, bytes] = {}
+        self._uploading = set()
+        # Compressed segments recently read, decompressed.
+        self._segment_cache = OrderedDict()
+
+    def close(self) -> None:
+        self.sync()
+        self._release()
+        self.provider.close()
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        self.provider.configure_default(config)
+
+    def configure_logging(self, config: Dict[str, str]) -> None:
+        self.provider.configure_logging(config)
+
+    def set_provider_params(self, provider_params: Dict[str, Any]) -> None:
+        self.provider.set_provider_params(provider_params)
+
+    def create(self) -> None:
+        self.provider.create()
+
+    def exists(self) -> bool:
+        return self.provider.exists()
+
+    def reconnect(self) -> None:
+        # Locks of the parent process are not usable in a child process.
+        self._lock = threading.RLock()
+        self._index_lock = threading.Lock()
+        # A child process is another writer, which doesn't hold the lease of its parent.
+        self._writer = uuid.uuid4().hex
+        self._lease_expires = 0.0
+        self.provider.reconnect()
+
+    def contains(self, key: bytes) -> bool:
+        if not key.startswith(INTERNAL_PREFIX) and key in self._index():
+            return True
+        return self.provider.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.get(key)
+
+        self._index()
+        with self._lock:
+            location = self._entries.get(key)
+            data = self._unwritten(location)
+        if data is not None:
+            return bytes(data[location.offset : location.offset + location.length])
+
+        if location is None:
+            return self.provider.get(key)
+        return self._read(location)
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        if key.startswith(INTERNAL_PREFIX) or key not in self._index():
+            return self.provider.get_range(key, offset, length)
+        return self.get(key)[offset : offset + length]
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, bytes]:
+        """
+        Retrieve several values, coalescing the reads of adjacent packed values.
+        Missing keys are not returned.
+        """
+        self._index()
+        by_segment: Dict[bytes, list] = {}
+        others = []
+
+        values = {}
+
+        with self._lock:
+            for key in keys:
+                location = self._entries.get(key)
+                data = self._unwritten(location)
+                if location is None:
+                    others.append(key)
+                elif data is not None:
+                    start = location.offset
+                    values[key] = bytes(data[start : start + location.length])
+                else:
+                    by_segment.setdefault(location.segment, []).append((key, location))
+
+        def read_range(item):
+            segment, start, end, items = item
+            data = self._segment_range(segment, start, end - start)
+            return [
+                (key, data[l.offset - start : l.offset - start + l.length])
+                for key, l in items
+            ]
+
+        def read_other(key):
+            try:
+                return [(key, self.provider.get(key))]
+            except KeyNotFoundError:
+                return []
+
+        tasks = [
+            (segment, *r)
+            for segment, items in by_segment.items()
+            for r in coalesce(items)
+        ]
+        for results in self.controller.map(read_range, tasks):
+            values.update(results)
+        for results in self.controller.map(read_other, others):
+            values.update(results)
+        return values
+
+    def set(self, key: bytes, value: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.set(key, value)
+
+        self._index()
+        if len(value) > self.max_value_size:
+            self.provider.set(key, value)
+            with self._lock:
+                if key in self._entries:
+                    self._update(key, None)
+            return
+
+        with self._lock:
+            self._update(
+                key, Location(self._buffer_name, len(self._buffer), len(value))
+            )
+            self._buffer += value
+            full = len(self._buffer) >= self.segment_size
+
+        if full:
+            self._flush_buffer()
+
+    def delete(self, key: bytes) -> None:
+        if key.startswith(INTERNAL_PREFIX):
+            return self.provider.delete(key)
+
+        self._index()
+        with self._lock:
+            packed = key in self._entries
+            if packed:
+                self._update(key, None)
+        try:
+            self.provider.delete(key)
+        except KeyNotFoundError:
+            # A packed value may have no dedicated object.
+            if not packed:
+                raise
+
+    def iter(self) -> Iterator[bytes]:
+        return self.iter_prefix(b"")
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        if prefix.startswith(INTERNAL_PREFIX):
+            yield from self.provider.iter_prefix(prefix)
+            return
+
+        self._index()
+        with self._lock:
+            packed = sorted(k for k in self._entries if k.startswith(prefix))
+        yield from packed
+
+        # Dedicated objects of packed keys are outdated values removed by the compaction.
+        packed = set(packed)
+        for key in (
+            self.provider.iter_prefix(prefix) if prefix else self.provider.iter()
+        ):
+            if key not in packed:
+                yield key
+
+    def len(self) -> int:
+        # Internal objects are counted like the providers do, the listing engine removes them.
+        # They are counted apart as some wrappers, like the layout, don't iterate over them.
+        keys = sum(1 for k in self.iter() if not k.startswith(INTERNAL_PREFIX))
+        return keys + sum(1 for _ in self.provider.iter_prefix(INTERNAL_PREFIX))
+
+    def sync(self) -> None:
+        """
+        Write the buffer and the index.
+        """
+        self._flush_buffer()
+        self._save_index()
+        self.provider.sync()
+
+    def compact(self) -> int:
+        """
+        Rewrite the live values of the segments mostly made of garbage, then delete the segments and the outdated
+        dedicated objects the index doesn't reference anymore for the grace period (mark-and-sweep).
+        Return the number of segments deleted.
+        """
+        self._index()
+        with self._lock:
+            live = {}
+            for location in self._entries.values():
+                live[location.segment] = live.get(location.segment, 0) + location.length
+            candidates = [
+                name
+                for name, size in self._segments.items()
+                if name != self._buffer_name
+                and size
+                and 1 - live.get(name, 0) / size >= self.compaction_threshold
+            ]
+            moved = {
+                name: [(k, l) for k, l in self._entries.items() if l.segment == name]
+                for name in candidates
+            }
+
+        if candidates:
+            self.logger.info(f"Compacting {len(candidates)} segments...")
+
+        for name, items in moved.items():
+            data = self._segment_range(name, 0, self._segments[name]) if items else b""
+            for key, location in items:
+                value = data[location.offset : location.offset + location.length]
+                with self._lock:
+                    # The value may have been overwritten since the compaction started.
+                    if self._entries.get(key) == location:
+                        self._update(
+                            key,
+                            Location(self._buffer_name, len(self._buffer), len(value)),
+                        )
+                        self._buffer += value
+            with self._lock:
+                self._removed_segments.add(name)
+
+        # Segments are garbage once the index doesn't reference them anymore.
+        self.sync()
+        with self._lock:
+            referenced = {self._buffer_name, *self._flushing, *self._segments}
+            packed = set(self._entries)
+        garbage = [
+            name
+            for name in self.provider.iter_prefix(SEGMENT_PREFIX)
+            if name not in referenced
+        ]
+        # Outdated dedicated objects of packed keys are also garbage.
+        garbage += [k for k in self.provider.iter() if k in packed]
+
+        # Readers with a stale index may still read the rewritten segments, and other writers may have uploaded
+        # segments and dedicated objects not indexed yet: they are deleted once unreferenced for the grace period.
+        deleted = [
+            name
+            for name in self.sweeper.sweep(garbage)
+            if name.startswith(SEGMENT_PREFIX)
+        ]
+        with self._lock:
+            for name in deleted:
+                self._segment_cache.pop(name, None)
+
+        self.logger.info(f"{len(deleted)} segments deleted.")
+        return len(deleted)
+
+    def _index(self) -> Dict[bytes, Location]:
+        """
+        Return the locations of the packed values, reloading the stored index if it is stale.
+        Must be called without the lock, as the index is downloaded.
+        """
+        if self._stale():
+            with self._index_lock:
+                # Another thread may have reloaded it meanwhile.
+                if self._stale():
+                    segments, entries = self._load_index()
+                    with self._lock:
+                        self._install(segments, entries)
+        return self._entries
+
+    def _stale(self) -> bool:
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.max_staleness
+        )
+
+    def _install(
+        self, segments: Dict[bytes, int], entries: Dict[bytes, Location]
+    ) -> None:
+        """
+        Use the stored index, the changes not written in it yet being applied on top. Must be called with the lock.
+        """
+        segments.update(self._new_segments)
+        for name in self._removed_segments:
+            segments.pop(name, None)
+        for key, location in self._pending.items():
+            if location is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = location
+        self._segments, self._entries = segments, entries
+        self._loaded_at = time.monotonic()
+
+    def _load_index(self):
+        try:
+            return decode_index(self.provider.get(INDEX_KEY))
+        except KeyNotFoundError:
+            return {}, {}
+
+    def _update(self, key: bytes, location: Optional[Location]) -> None:
+        """
+        Update the location of a key. Must be called with the lock.
+        """
+        if location is None:
+            self._entries.pop(key, None)
+        else:
+            self._entries[key] = location
+        self._pending[key] = location
+
+    def _unwritten(self, location: Optional[Location]) -> Optional[bytearray]:
+        """
+        Return the data of the segment of the location if it is not written yet. Must be called with the lock.
+        """
+        if location is None:
+            return None
+        if location.segment == self._buffer_name:
+            return self._buffer
+        return self._flushing.get(location.segment)
+
+    def _flush_buffer(self) -> None:
+        """
+        Write the segment being filled, and start a new one.
+        The upload doesn't hold the lock: the segment keeps serving the reads from memory until written.
+        """
+        with self._lock:
+            if self._buffer:
+                self._flushing[self._buffer_name] = bytes(self._buffer)
+                self._buffer_name, self._buffer = self._segment_name(), bytearray()
+            # Segments whose write failed are written again.
+            segments = [
+                (name, data)
+                for name, data in self._flushing.items()
+                if name not in self._uploading
+            ]
+            self._uploading.update(name for name, _ in segments)
+
+        for name, data in segments:
+            try:
+                compressed = name.endswith(COMPRESSED_SUFFIX)
+                self.provider.set(name, zlib.compress(data) if compressed else data)
+            finally:
+                with self._lock:
+                    self._uploading.discard(name)
+
+            with self._lock:
+                del self._flushing[name]
+                self._segments[name] = len(data)
+                self._new_segments[name] = len(data)
+
+    def _save_index(self) -> None:
+        """
+        Merge the changes with the stored index, which may contain the changes of previous writers, and write it.
+        The upload doesn't hold the lock: the changes made meanwhile are written by the next synchronization.
+        """
+        with self._index_lock:
+            with self._lock:
+                # Values of the segments not written yet are not indexed yet.
+                unwritten = {self._buffer_name, *self._flushing}
+                pending = {
+                    key: location
+                    for key, location in self._pending.items()
+                    if location is None or location.segment not in unwritten
+                }
+                new_segments = dict(self._new_segments)
+                removed = set(self._removed_segments)
+            if not pending and not new_segments and not removed:
+                return
+
+            # Without conditional writes, concurrent writers would drop the changes of each other.
+            self._acquire()
+            segments, entries = self._load_index()
+            segments.update(new_segments)
+            for key, location in pending.items():
+                if location is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = location
+            for name in removed:
+                segments.pop(name, None)
+
+            self.provider.set(INDEX_KEY, encode_index(segments, entries))
+
+            with self._lock:
+                for key, location in pending.items():
+                    # Unless changed during the upload.
+                    if key in self._pending and self._pending[key] == location:
+                        del self._pending[key]
+                for name in new_segments:
+                    self._new_segments.pop(name, None)
+                self._removed_segments -= removed
+                self._install(segments, entries)
+
+    def _acquire(self) -> None:
+        """
+        Take or renew the lease of the index writer, raising if another writer holds it. Must be called with the index lock.
+        """
+        now = time.time()
+        # Renewed once half of the lease elapsed.
+        if self._lease_expires - now > self.lease_duration / 2:
+            return
+
+        writer, expires = self._lease()
+        if writer != self._writer and expires > now:
+            raise ConcurrentWriterError(
+                f"The packed index is written by another writer until {time.ctime(expires)}."
+            )
+
+        expires = now + self.lease_duration
+        self.provider.set(WRITER_KEY, encode_lease(self._writer, expires))
+        # The lease is read back, as another writer may have taken it at the same time.
+        if self._lease()[0] != self._writer:
+            raise ConcurrentWriterError(
+                "The packed index is written by another writer."
+            )
+        self._lease_expires = expires
+
+    def _release(self) -> None:
+        """
+        Release the lease of the index writer, so another writer doesn't wait for its expiration.
+        """
+        with self._index_lock:
+            if not self._lease_expires:
+                return
+            self._lease_expires = 0.0
+            if self._lease()[0] == self._writer:
+                try:
+                    self.provider.delete(WRITER_KEY)
+                except KeyNotFoundError:
+                    pass
+
+    def _lease(self) -> Tuple[Optional[str], float]:
+        try:
+            return decode_lease(self.provider.get(WRITER_KEY))
+        except KeyNotFoundError:
+            return None, 0.0
+
+    def _read(self, location: Location) -> bytes:
+        return self._segment_range(location.segment, location.offset, location.length)
+
+    def _segment_range(self, segment: bytes, offset: int, length: int) -> bytes:
+        """
+        Read a range of a segment: a ranged read, or the whole decompressed segment if it is compressed.
+        """
+        if not segment.endswith(COMPRESSED_SUFFIX):
+            return self.provider.get_range(segment, offset, length)
+
+        with self._lock:
+            data = self._segment_cache.get(segment)
+            if data is not None:
+                self._segment_cache.move_to_end(segment)
+        if data is None:
+            data = zlib.decompress(self.provider.get(segment))
+            with self._lock:
+                self._segment_cache[segment] = data
+                if len(self._segment_cache) > SEGMENT_CACHE_SIZE:
+                    self._segment_cache.popitem(last=False)
+        return data[offset : offset + length]
+
+    def _segment_name(self) -> bytes:
+        # Names are unique across writers and sorted by creation time.
+        name = SEGMENT_PREFIX + f"{time.time_ns():016x}-{uuid.uuid4().hex}".encode()
+        return name + COMPRESSED_SUFFIX if self.compression else name
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> ProviderInterface:
+    """
+    Wrap the provider with the packed storage defined in the `packing` section of the configuration.
+    """
+    if not config or config.get(ENABLED_KEY, "false").lower() != "true":
+        return provider
+
+    try:
+        packed = PackedProvider(
+            logger,
+            provider,
+            controller,
+            max_value_size=int(config.get(MAX_VALUE_SIZE_KEY, DEFAULT_MAX_VALUE_SIZE)),
+            segment_size=int(config.get(SEGMENT_SIZE_KEY, DEFAULT_SEGMENT_SIZE)),
+            compression=config.get(COMPRESSION_KEY, "false").lower() == "true",
+            compaction_threshold=float(
+                config.get(COMPACTION_THRESHOLD_KEY, DEFAULT_COMPACTION_THRESHOLD)
+            ),
+            max_staleness=float(config.get(MAX_STALENESS_KEY, DEFAULT_MAX_STALENESS)),
+            grace_period=float(config.get(GRACE_PERIOD_KEY, DEFAULT_GRACE_PERIOD)),
+            lease_duration=float(
+                config.get(LEASE_DURATION_KEY, DEFAULT_LEASE_DURATION)
+            ),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid packing configuration: {e}") from e
+
+    logger.debug(f"Values smaller than {packed.max_value_size} bytes are packed.")
+    return packed
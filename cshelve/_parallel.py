@@ -0,0 +1,107 @@
+"""
+Parallel processing module for cshelve.
+
+Unpickling and processing values is CPU-bound, so threads don't help.
+This module partitions the keys across worker processes; each worker receives its own copy of the shelf (and so its own provider client),
+downloads, decodes and processes the values locally and only sends back the results.
+Values never cross the process boundary.
+"""
+import multiprocessing
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+# Number of keys sent to a worker at once.
+DEFAULT_CHUNKSIZE = 64
+
+# Shelf opened by the worker process.
+_worker_shelf = None
+
+
+def map(
+    shelf,
+    fct: Callable[[Any], Any],
+    keys: Iterable[str],
+    processes: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    ordered: bool = True,
+    mp_context: Optional[str] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield the keys and the result of the function applied on their values, computed by worker processes.
+    """
+    context = multiprocessing.get_context(mp_context)
+
+    with context.Pool(processes, initializer=_init, initargs=(shelf,)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for results in imap(_map_chunk, _chunks(fct, keys, chunksize)):
+            yield from results
+
+
+def reduce(
+    shelf,
+    fct: Callable[[Any], Any],
+    reducer: Callable[[Any, Any], Any],
+    initial: Any,
+    keys: Iterable[str],
+    processes: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    mp_context: Optional[str] = None,
+) -> Any:
+    """
+    Apply the function on the values and fold the results with the reducer.
+    Each worker folds its chunk locally, then the partial results are folded by the caller.
+    The reducer must be associative and commutative, and `initial` its neutral element.
+    """
+    context = multiprocessing.get_context(mp_context)
+    result = initial
+
+    with context.Pool(processes, initializer=_init, initargs=(shelf,)) as pool:
+        chunks = ((reducer, initial, chunk) for chunk in _chunks(fct, keys, chunksize))
+        for partial in pool.imap_unordered(_reduce_chunk, chunks):
+            result = reducer(result, partial)
+
+    return result
+
+
+def _chunks(fct: Callable, keys: Iterable[str], chunksize: int):
+    """
+    Split the stream of keys into chunks sent to the workers along with the function.
+    """
+    chunk = []
+    for key in keys:
+        chunk.append(key)
+        if len(chunk) >= chunksize:
+            yield fct, chunk
+            chunk = []
+    if chunk:
+        yield fct, chunk
+
+
+def _init(shelf) -> None:
+    """
+    Keep the shelf of the worker process.
+    Depending on the start method, it is either inherited from the parent process or unpickled, but in both cases,
+    it connects to the provider with its own client.
+    """
+    global _worker_shelf
+    _worker_shelf = shelf
+
+
+def _values(keys: List[str]) -> Iterator[Tuple[str, Any]]:
+    """
+    Return an iterator over the keys and their values, downloaded concurrently by the worker.
+    Keys deleted in the meantime are skipped.
+    """
+    return _worker_shelf._prefetch(keys=keys)
+
+
+def _map_chunk(args) -> List[Tuple[str, Any]]:
+    fct, keys = args
+    return [(key, fct(value)) for key, value in _values(keys)]
+
+
+def _reduce_chunk(args) -> Any:
+    reducer, result, (fct, keys) = args
+    for _, value in _values(keys):
+        result = reducer(result, fct(value))
+    return result
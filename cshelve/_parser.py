@@ -27,11 +27,63 @@ COMPRESSION_KEY_STORE = "compression"
 ENCRYPTION_KEY_STORE = "encryption"
 # Provider parameter section.
 PROVIDER_PARAMS = "provider_params"
+# Concurrency configuration section.
+CONCURRENCY_KEY_STORE = "concurrency"
+# Latency configuration section.
+LATENCY_KEY_STORE = "latency"
+# Prefetch configuration section.
+PREFETCH_KEY_STORE = "prefetch"
+# Key layout configuration section.
+LAYOUT_KEY_STORE = "layout"
+# Listing configuration section.
+LISTING_KEY_STORE = "listing"
+# Manifest configuration section.
+MANIFEST_KEY_STORE = "manifest"
+# Bloom filter configuration section.
+BLOOM_KEY_STORE = "bloom"
+# Packing configuration section.
+PACKING_KEY_STORE = "packing"
+# Log-structured mode configuration section.
+LOG_KEY_STORE = "log"
+# Deduplication configuration section.
+DEDUP_KEY_STORE = "dedup"
+# Chunking configuration section.
+CHUNKING_KEY_STORE = "chunking"
+# Columnar mode configuration section.
+COLUMNAR_KEY_STORE = "columnar"
+# Array mode configuration section.
+ARRAYS_KEY_STORE = "arrays"
+# Structured values configuration section.
+VALUES_KEY_STORE = "values"
 
 # Tuple containing the provider name and its configuration.
+# Sections added after the initial release are optional to keep the object backward compatible.
 Config = namedtuple(
     "Config",
-    ["provider", "default", "logging", "compression", "encryption", "provider_params"],
+    [
+        "provider",
+        "default",
+        "logging",
+        "compression",
+        "encryption",
+        "provider_params",
+        "concurrency",
+        "latency",
+        "prefetch",
+        "layout",
+        "listing",
+        "manifest",
+        "bloom",
+        "packing",
+        "log",
+        "dedup",
+        "chunking",
+        "columnar",
+        "arrays",
+        "values",
+        "sections",
+    ],
+    defaults=({}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}),
 )
 
 
@@ -59,6 +111,22 @@ def load(logger: Logger, filename: Path) -> Tuple[str, Dict[str, str]]:
         config[ENCRYPTION_KEY_STORE] if ENCRYPTION_KEY_STORE in config else {}
     )
     provider_params = config[PROVIDER_PARAMS] if PROVIDER_PARAMS in config else {}
+    concurrency_config = (
+        config[CONCURRENCY_KEY_STORE] if CONCURRENCY_KEY_STORE in config else {}
+    )
+    latency_config = config[LATENCY_KEY_STORE] if LATENCY_KEY_STORE in config else {}
+    prefetch_config = config[PREFETCH_KEY_STORE] if PREFETCH_KEY_STORE in config else {}
+    layout_config = config[LAYOUT_KEY_STORE] if LAYOUT_KEY_STORE in config else {}
+    listing_config = config[LISTING_KEY_STORE] if LISTING_KEY_STORE in config else {}
+    manifest_config = config[MANIFEST_KEY_STORE] if MANIFEST_KEY_STORE in config else {}
+    bloom_config = config[BLOOM_KEY_STORE] if BLOOM_KEY_STORE in config else {}
+    packing_config = config[PACKING_KEY_STORE] if PACKING_KEY_STORE in config else {}
+    log_config = config[LOG_KEY_STORE] if LOG_KEY_STORE in config else {}
+    dedup_config = config[DEDUP_KEY_STORE] if DEDUP_KEY_STORE in config else {}
+    chunking_config = config[CHUNKING_KEY_STORE] if CHUNKING_KEY_STORE in config else {}
+    columnar_config = config[COLUMNAR_KEY_STORE] if COLUMNAR_KEY_STORE in config else {}
+    arrays_config = config[ARRAYS_KEY_STORE] if ARRAYS_KEY_STORE in config else {}
+    values_config = config[VALUES_KEY_STORE] if VALUES_KEY_STORE in config else {}
 
     logger.debug(f"Configuration file '{filename}' loaded.")
     return Config(
@@ -68,4 +136,20 @@ def load(logger: Logger, filename: Path) -> Tuple[str, Dict[str, str]]:
         compression=from_env(dict(compression_config)),
         encryption=from_env(dict(encryption_config)),
         provider_params=from_env(dict(provider_params)),
+        concurrency=from_env(dict(concurrency_config)),
+        latency=from_env(dict(latency_config)),
+        prefetch=from_env(dict(prefetch_config)),
+        layout=from_env(dict(layout_config)),
+        listing=from_env(dict(listing_config)),
+        manifest=from_env(dict(manifest_config)),
+        bloom=from_env(dict(bloom_config)),
+        packing=from_env(dict(packing_config)),
+        log=from_env(dict(log_config)),
+        dedup=from_env(dict(dedup_config)),
+        chunking=from_env(dict(chunking_config)),
+        columnar=from_env(dict(columnar_config)),
+        arrays=from_env(dict(arrays_config)),
+        values=from_env(dict(values_config)),
+        # All the sections, as composite providers are made of the providers of other sections.
+        sections={name: from_env(dict(config[name])) for name in config.sections()},
     )
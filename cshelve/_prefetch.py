@@ -0,0 +1,199 @@
+"""
+Prefetching module for cshelve.
+
+Iterating over the items of a shelf sequentially costs a network round-trip per key.
+The prefetcher consumes the key listing as a stream and keeps several downloads in flight, decoding the values in the worker threads.
+Results are yielded in listing order or as soon as they are available, while the bytes buffered are bounded.
+"""
+from collections import deque
+from collections.abc import ItemsView, KeysView, ValuesView
+from concurrent.futures import FIRST_COMPLETED, wait
+from logging import Logger
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from ._concurrency import ConcurrencyController
+from .exceptions import ConfigurationError, KeyNotFoundError
+
+
+# Keys that can be defined in the INI file.
+LOOKAHEAD_KEY = "lookahead"
+ORDERED_KEY = "ordered"
+MAX_BUFFER_BYTES_KEY = "max_buffer_bytes"
+
+DEFAULT_LOOKAHEAD = 32
+DEFAULT_ORDERED = True
+DEFAULT_MAX_BUFFER_BYTES = 256 * 1024 * 1024
+
+
+class Prefetcher:
+    """
+    Pipeline the downloads and decoding of the values of a stream of keys.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        lookahead: int = DEFAULT_LOOKAHEAD,
+        ordered: bool = DEFAULT_ORDERED,
+        max_buffer_bytes: int = DEFAULT_MAX_BUFFER_BYTES,
+    ) -> None:
+        if lookahead < 1:
+            raise ConfigurationError(
+                f"The lookahead must be positive, not {lookahead}."
+            )
+
+        self.logger = logger
+        self.lookahead = lookahead
+        self.ordered = ordered
+        self.max_buffer_bytes = max_buffer_bytes
+
+    def iter(
+        self,
+        controller: ConcurrencyController,
+        keys: Iterable[bytes],
+        load: Callable[[bytes], Tuple[Any, int]],
+        lookahead: Optional[int] = None,
+        ordered: Optional[bool] = None,
+        max_buffer_bytes: Optional[int] = None,
+    ) -> Iterator[Tuple[bytes, Any]]:
+        """
+        Yield the keys and their values loaded by the `load` function, which returns the value and its size in bytes.
+        Keys deleted between the listing and the download are skipped.
+        """
+        lookahead = lookahead or self.lookahead
+        ordered = self.ordered if ordered is None else ordered
+        max_buffer_bytes = max_buffer_bytes or self.max_buffer_bytes
+
+        def fetch(key):
+            try:
+                value, size = load(key)
+            except KeyNotFoundError:
+                self.logger.debug(f"Key {key} deleted during the iteration, skipped.")
+                return key, None, 0, False
+            return key, value, size, True
+
+        keys = iter(keys)
+        pending = deque() if ordered else set()
+        exhausted = False
+
+        while True:
+            # Schedule new downloads while the lookahead and the memory ceiling allow it.
+            while (
+                not exhausted
+                and len(pending) < lookahead
+                and _buffered(pending) < max_buffer_bytes
+            ):
+                try:
+                    key = next(keys)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                future = controller.submit(fetch, key)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+
+            if not pending:
+                return
+
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+
+            for future in done:
+                key, value, _, found = future.result()
+                if found:
+                    yield key, value
+
+
+def _buffered(futures) -> int:
+    """
+    Return the number of bytes downloaded but not yielded yet.
+    """
+    return sum(f.result()[2] for f in futures if f.done() and f.exception() is None)
+
+
+class PrefixKeysView(KeysView):
+    """
+    Keys view of a shelf restricted to the keys starting with a prefix.
+    """
+
+    def __init__(self, mapping, prefix: str = "") -> None:
+        super().__init__(mapping)
+        self._prefix = prefix
+
+    def __len__(self):
+        return self._mapping.count(self._prefix)
+
+    def __contains__(self, key):
+        return key.startswith(self._prefix) and key in self._mapping
+
+    def __iter__(self):
+        yield from self._mapping._iter_prefix(self._prefix)
+
+
+class PrefetchItemsView(ItemsView):
+    """
+    Items view of a shelf iterating with the prefetcher, optionally restricted to a prefix.
+    """
+
+    def __init__(self, mapping, prefix: str = "", **options) -> None:
+        super().__init__(mapping)
+        self._prefix = prefix
+        self._options = options
+
+    def __len__(self):
+        return self._mapping.count(self._prefix)
+
+    def __contains__(self, item):
+        return item[0].startswith(self._prefix) and super().__contains__(item)
+
+    def __iter__(self):
+        keys = self._mapping._iter_prefix(self._prefix) if self._prefix else None
+        yield from self._mapping._prefetch(keys, **self._options)
+
+
+class PrefetchValuesView(ValuesView):
+    """
+    Values view of a shelf iterating with the prefetcher, optionally restricted to a prefix.
+    """
+
+    def __init__(self, mapping, prefix: str = "", **options) -> None:
+        super().__init__(mapping)
+        self._prefix = prefix
+        self._options = options
+
+    def __len__(self):
+        return self._mapping.count(self._prefix)
+
+    def __iter__(self):
+        keys = self._mapping._iter_prefix(self._prefix) if self._prefix else None
+        for _, value in self._mapping._prefetch(keys, **self._options):
+            yield value
+
+
+def configure(logger: Logger, config: Dict[str, str]) -> Prefetcher:
+    """
+    Configure the prefetcher based on the `prefetch` section of the configuration.
+    """
+    if not config:
+        return Prefetcher(logger)
+
+    try:
+        prefetcher = Prefetcher(
+            logger,
+            lookahead=int(config.get(LOOKAHEAD_KEY, DEFAULT_LOOKAHEAD)),
+            ordered=config.get(ORDERED_KEY, str(DEFAULT_ORDERED)).lower() == "true",
+            max_buffer_bytes=int(
+                config.get(MAX_BUFFER_BYTES_KEY, DEFAULT_MAX_BUFFER_BYTES)
+            ),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid prefetch configuration: {e}") from e
+
+    logger.debug(f"Prefetch configured with a lookahead of {prefetcher.lookahead}.")
+    return prefetcher
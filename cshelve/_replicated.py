@@ -0,0 +1,379 @@
+"""
+Replicated provider module for cshelve.
+
+The replicated provider keeps a copy of the keys in several providers (regions, accounts, ...), each one configured in its own section:
+- Writes go to all the replicas, synchronously or in the background (`writes = async`).
+- Reads go to the replica with the lowest recent latency (exponentially weighted moving average).
+- A replica failing is skipped until its latency estimate recovers, and the read is retried on the next replica.
+  The estimate of a replica without request decays, so a replica that failed is probed again once the others are slower.
+- With `hedge = true`, a read slower than `hedge_factor` times the estimate of its replica is sent to the next replica,
+  and the first response is used.
+
+With asynchronous writes, a replica may lag behind: a key missing on a replica is looked up on the others,
+and `sync` waits for the background writes and raises their errors.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import Logger
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from ._composite import CompositeProvider, split_names
+from ._concurrency import ConcurrencyController
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+REPLICAS_KEY = "replicas"
+WRITES_KEY = "writes"
+HEDGE_KEY = "hedge"
+HEDGE_FACTOR_KEY = "hedge_factor"
+SMOOTHING_KEY = "smoothing"
+
+# Separator between the replica and the continuation token of the replica in a continuation token.
+TOKEN_SEPARATOR = ":"
+
+SYNC_WRITES = "sync"
+ASYNC_WRITES = "async"
+DEFAULT_HEDGE_FACTOR = 2.0
+# Weight of the last latency in the moving average.
+DEFAULT_SMOOTHING = 0.2
+# Latency (in seconds) recorded for a failed request, so the replica is avoided until its estimate decays.
+FAILURE_PENALTY = 10.0
+# Half-life (in seconds) of the latency estimate of a replica without request.
+# A failed replica is probed again after a few minutes, when its estimate becomes lower than the latency of the others.
+DECAY_HALF_LIFE = 30.0
+# Maximum number of threads executing the hedged reads.
+MAX_WORKERS = 64
+
+
+class ReplicatedProvider(CompositeProvider):
+    """
+    Provider writing to all its replicas and reading from the fastest one.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        providers: Dict[str, ProviderInterface],
+        controller: ConcurrencyController,
+        writes: str = SYNC_WRITES,
+        hedge: bool = False,
+        hedge_factor: float = DEFAULT_HEDGE_FACTOR,
+        smoothing: float = DEFAULT_SMOOTHING,
+    ) -> None:
+        super().__init__(logger, providers, controller)
+        self._configure(writes, hedge, hedge_factor, smoothing)
+
+        # Moving average of the latency of each replica, None until its first request.
+        self._latencies = {name: None for name in providers}
+        # Time of the last request of each replica, from which its estimate decays.
+        self._observed = {name: 0.0 for name in providers}
+        self._stats_lock = threading.Lock()
+        self._readers = None
+        # Background writes: one thread per replica, so the writes of a replica are applied in order.
+        self._writers = {}
+        self._pending = []
+        # Number of hedged reads sent, mainly for monitoring.
+        self.hedged = 0
+
+    @staticmethod
+    def sections(config: Dict[str, str]) -> List[str]:
+        if REPLICAS_KEY not in config:
+            raise ConfigurationError(
+                "The replicated provider requires a list of replicas."
+            )
+        return split_names(config[REPLICAS_KEY])
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        try:
+            self._configure(
+                config.get(WRITES_KEY, SYNC_WRITES).lower(),
+                config.get(HEDGE_KEY, "false").lower() == "true",
+                float(config.get(HEDGE_FACTOR_KEY, DEFAULT_HEDGE_FACTOR)),
+                float(config.get(SMOOTHING_KEY, DEFAULT_SMOOTHING)),
+            )
+        except ValueError as e:
+            raise ConfigurationError(f"Invalid replicated configuration: {e}") from e
+
+    @property
+    def latencies(self) -> Dict[str, Optional[float]]:
+        """
+        Moving average of the latency of each replica, in seconds.
+        """
+        with self._stats_lock:
+            return dict(self._latencies)
+
+    def close(self) -> None:
+        try:
+            self.sync()
+        finally:
+            for writer in self._writers.values():
+                writer.shutdown(wait=True)
+            self._writers = {}
+            if self._readers is not None:
+                self._readers.shutdown(wait=False)
+                self._readers = None
+            super().close()
+
+    def reconnect(self) -> None:
+        super().reconnect()
+        self._stats_lock = threading.Lock()
+        self._readers = None
+        self._writers = {}
+        self._pending = []
+
+    def contains(self, key: bytes) -> bool:
+        found = self._read(lambda p: p.contains(key))
+        if found or self.writes == SYNC_WRITES:
+            return found
+        return any(self._on_all(lambda p: p.contains(key)))
+
+    def get(self, key: bytes) -> bytes:
+        return self._read(lambda p: p.get(key))
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        return self._read(lambda p: p.get_range(key, offset, length))
+
+    def set(self, key: bytes, value: bytes) -> None:
+        self._write(lambda p: p.set(key, value))
+
+    def append(self, key: bytes, data: bytes) -> None:
+        self._write(lambda p: p.append(key, data))
+
+    def delete(self, key: bytes) -> None:
+        def delete(provider):
+            try:
+                provider.delete(key)
+                return True
+            except KeyNotFoundError:
+                # A lagging replica may not have the key yet.
+                return False
+
+        # Deletes wait for all the replicas, so a lagging replica can't return the key afterwards.
+        if not any(self._write(delete, wait_all=True)):
+            raise KeyNotFoundError(f"Key not found: {key}")
+
+    def iter(self) -> Iterator[bytes]:
+        return iter(self._read(lambda p: list(p.iter())))
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        return iter(self._read(lambda p: list(p.iter_prefix(prefix))))
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys from the fastest replica.
+        Continuation tokens are specific to a replica: the continuation token contains the replica of the first page,
+        from which the next pages are listed.
+        """
+        if continuation_token:
+            name, token = continuation_token.split(TOKEN_SEPARATOR, 1)
+            page = self._timed(
+                lambda p: p.list_keys(prefix, page_size, token, delimiter), name
+            )
+            return self._with_replica(name, page)
+
+        error = None
+        for name in self.ranking():
+            try:
+                page = self._timed(
+                    lambda p: p.list_keys(prefix, page_size, None, delimiter), name
+                )
+                return self._with_replica(name, page)
+            except Exception as e:
+                self.logger.warning(f"Replica {name} failed, failing over: {e}")
+                error = e
+        raise error
+
+    def len(self) -> int:
+        return self._read(lambda p: p.len())
+
+    def sync(self) -> None:
+        """
+        Wait for the background writes, then sync the replicas.
+        Raise the first error of the background writes.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        errors = [f.exception() for f in pending if f.exception() is not None]
+        super().sync()
+        if errors:
+            raise errors[0]
+
+    def ranking(self) -> List[str]:
+        """
+        Return the replicas from the fastest one.
+        Replicas without request yet are tried first, so the latency of every replica is measured.
+        """
+        now = time.monotonic()
+        with self._stats_lock:
+            estimates = {name: self._estimate(name, now) for name in self._latencies}
+        return sorted(
+            estimates,
+            key=lambda name: -1.0 if estimates[name] is None else estimates[name],
+        )
+
+    @staticmethod
+    def _with_replica(name: str, page: KeysPage) -> KeysPage:
+        if page.continuation_token is None:
+            return page
+        token = f"{name}{TOKEN_SEPARATOR}{page.continuation_token}"
+        return KeysPage(page.keys, page.prefixes, token)
+
+    def _read(self, fct: Callable[[ProviderInterface], Any]) -> Any:
+        """
+        Execute the read on the fastest replica, failing over to the next ones.
+        """
+        names = self.ranking()
+        error = None
+
+        while names:
+            name = names.pop(0)
+            try:
+                if self.hedge and names:
+                    return self._hedged(fct, name, names)
+                return self._timed(fct, name)
+            except KeyNotFoundError:
+                if self.writes == SYNC_WRITES:
+                    raise
+                # The replica may lag behind the others.
+                error = error or KeyNotFoundError("Key not found on any replica.")
+            except Exception as e:
+                self.logger.warning(f"Replica {name} failed, failing over: {e}")
+                error = e
+
+        raise error
+
+    def _hedged(
+        self, fct: Callable[[ProviderInterface], Any], name: str, names: List[str]
+    ) -> Any:
+        """
+        Execute the read on the replica, and on the next one if it is slower than expected.
+        The replica of the hedge is removed from `names`.
+        """
+        with self._stats_lock:
+            estimate = self._estimate(name, time.monotonic())
+        executor = self._get_readers()
+        futures = [executor.submit(self._timed, fct, name)]
+        if estimate is None:
+            return futures[0].result()
+
+        done, _ = wait(futures, timeout=estimate * self.hedge_factor)
+        if not done:
+            backup = names.pop(0)
+            self.logger.debug(
+                f"Replica {name} slower than {estimate:.3f}s, hedging on {backup}."
+            )
+            futures.append(executor.submit(self._timed, fct, backup))
+            self.hedged += 1
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    # The loser keeps running in the background, its result is ignored.
+                    return f.result()
+                error = error or f.exception()
+        raise error
+
+    def _timed(self, fct: Callable[[ProviderInterface], Any], name: str) -> Any:
+        """
+        Execute the request on the replica and update its latency estimate.
+        """
+        start = time.monotonic()
+        try:
+            result = fct(self.providers[name])
+        except KeyNotFoundError:
+            self._observe(name, time.monotonic() - start)
+            raise
+        except Exception:
+            self._observe(name, FAILURE_PENALTY)
+            raise
+        self._observe(name, time.monotonic() - start)
+        return result
+
+    def _observe(self, name: str, latency: float) -> None:
+        now = time.monotonic()
+        with self._stats_lock:
+            previous = self._estimate(name, now)
+            self._latencies[name] = (
+                latency
+                if previous is None
+                else self.smoothing * latency + (1 - self.smoothing) * previous
+            )
+            self._observed[name] = now
+
+    def _estimate(self, name: str, now: float) -> Optional[float]:
+        """
+        Return the latency estimate of the replica, decayed since its last request. Must be called with the lock.
+        """
+        latency = self._latencies[name]
+        if latency is None:
+            return None
+        return latency * 0.5 ** ((now - self._observed[name]) / DECAY_HALF_LIFE)
+
+    def _write(
+        self, fct: Callable[[ProviderInterface], Any], wait_all: bool = False
+    ) -> List[Any]:
+        """
+        Execute the write on all the replicas and return the results.
+        With asynchronous writes, only the write of the fastest replica is waited for, unless `wait_all`.
+        """
+        if self.writes == SYNC_WRITES:
+            return self._on_all(fct)
+
+        # All the writes of a replica go through its thread, so they are applied in order.
+        first, *others = self.ranking()
+        futures = [
+            self._get_writer(name).submit(self._timed, fct, name)
+            for name in [first] + others
+        ]
+        if wait_all:
+            return [f.result() for f in futures]
+
+        with self._lock:
+            # Errors of the completed background writes are kept until `sync`.
+            self._pending = [f for f in self._pending if not f.done() or f.exception()]
+            self._pending.extend(futures[1:])
+        return [futures[0].result()]
+
+    def _get_readers(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._readers is None:
+                self._readers = ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix="cshelve-replicas"
+                )
+            return self._readers
+
+    def _get_writer(self, name: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if name not in self._writers:
+                self._writers[name] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"cshelve-replica-{name}"
+                )
+            return self._writers[name]
+
+    def _configure(
+        self, writes: str, hedge: bool, hedge_factor: float, smoothing: float
+    ) -> None:
+        if writes not in (SYNC_WRITES, ASYNC_WRITES):
+            raise ConfigurationError(
+                f"Writes must be '{SYNC_WRITES}' or '{ASYNC_WRITES}', not '{writes}'."
+            )
+        if hedge_factor <= 0 or not 0 < smoothing <= 1:
+            raise ConfigurationError(
+                f"Invalid replicated settings: hedge_factor={hedge_factor}, smoothing={smoothing}."
+            )
+
+        self.writes = writes
+        self.hedge = hedge
+        self.hedge_factor = hedge_factor
+        self.smoothing = smoothing
@@ -0,0 +1,326 @@
+"""
+Routed provider module for cshelve.
+
+A shelf mixing millions of small records with a few huge artifacts may store them in different providers.
+The routed provider stores each key in the first of its routes whose rules match, each route being a provider configured in its own section:
+- `<route>.match`: glob the key must match (ex: `*.parquet`).
+- `<route>.max_size`: maximum size of the value, in bytes.
+The last route has no rule: it stores the keys no other route accepts, and the internal objects.
+
+The route of a key is known from the key alone, except for the size rules.
+The first route matching the key regardless of the size is its home: when the value is stored on another route,
+the home stores a small pointer to it, so a lookup costs a single request on the home and iterating the homes lists each key once.
+Values overwritten or deleted on another route are deleted by the garbage collection (`compact`), once without pointer for `grace_period` seconds,
+as a value is written on its route before the pointer of its home.
+"""
+from fnmatch import fnmatchcase
+from logging import Logger
+from typing import Dict, Iterator, List, Optional
+
+from ._composite import CompositeProvider, split_names
+from ._concurrency import ConcurrencyController
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+ROUTES_KEY = "routes"
+MATCH_KEY = "match"
+MAX_SIZE_KEY = "max_size"
+
+# Header of a pointer, followed by the name of the route storing the value.
+# Records always start with their version, so they can't be mistaken for a pointer.
+MAGIC = b"CSR\x00"
+# Separator between the route and the continuation token of the route in a continuation token.
+TOKEN_SEPARATOR = ":"
+# Characters starting a wildcard in a glob.
+WILDCARDS = b"*?["
+
+
+def may_match(pattern: bytes, prefix: bytes) -> bool:
+    """
+    Return whether keys starting with the prefix may match the glob.
+
+    >>> may_match(b"meta/*", b"me")
+    True
+    >>> may_match(b"meta/*", b"data/")
+    False
+    """
+    literal = len(pattern)
+    for wildcard in WILDCARDS:
+        index = pattern.find(bytes([wildcard]))
+        if index != -1:
+            literal = min(literal, index)
+    head = pattern[:literal]
+    return head.startswith(prefix) or prefix.startswith(head)
+
+
+class Route:
+    """
+    Provider of a route and its rules.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        provider: ProviderInterface,
+        match: Optional[bytes] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.provider = provider
+        self.match = match
+        self.max_size = max_size
+
+    def accepts_key(self, key: bytes) -> bool:
+        if key.startswith(INTERNAL_PREFIX):
+            # Internal objects are stored on the last route.
+            return self.match is None and self.max_size is None
+        return self.match is None or fnmatchcase(key, self.match)
+
+    def accepts(self, key: bytes, size: int) -> bool:
+        return self.accepts_key(key) and (
+            self.max_size is None or size <= self.max_size
+        )
+
+
+class RoutedProvider(CompositeProvider):
+    """
+    Provider storing each key on the first route whose rules match.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        providers: Dict[str, ProviderInterface],
+        controller: ConcurrencyController,
+        rules: Optional[Dict[str, Dict[str, str]]] = None,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+    ) -> None:
+        super().__init__(logger, providers, controller)
+        self.grace_period = grace_period
+        self._configure(rules or {})
+
+    @staticmethod
+    def sections(config: Dict[str, str]) -> List[str]:
+        if ROUTES_KEY not in config:
+            raise ConfigurationError("The routed provider requires a list of routes.")
+        return split_names(config[ROUTES_KEY])
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        try:
+            self.grace_period = float(config.get(GRACE_PERIOD_KEY, self.grace_period))
+        except ValueError as e:
+            raise ConfigurationError(f"Invalid routed configuration: {e}") from e
+        if self.grace_period < 0:
+            raise ConfigurationError("The grace period can't be negative.")
+
+        rules = {}
+        for option, value in config.items():
+            name, _, rule = option.rpartition(".")
+            if name:
+                rules.setdefault(name, {})[rule] = value
+        self._configure(rules)
+
+    @property
+    def supports_append(self) -> bool:
+        # Values of the homes with a size rule are rewritten as they may move to another route.
+        return False
+
+    def home(self, key: bytes) -> Route:
+        """
+        Return the route storing the key or a pointer to its value.
+        """
+        return next(route for route in self.routes if route.accepts_key(key))
+
+    def route(self, key: bytes, size: int) -> Route:
+        """
+        Return the route storing a value of this size.
+        """
+        return next(route for route in self.routes if route.accepts(key, size))
+
+    def contains(self, key: bytes) -> bool:
+        return self.home(key).provider.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        value = self.home(key).provider.get(key)
+        target = self._target(value)
+        if target is None:
+            return value
+        try:
+            return target.provider.get(key)
+        except KeyNotFoundError as e:
+            raise KeyNotFoundError(f"Value of {key} not found on {target.name}.") from e
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        home = self.home(key)
+        if home.max_size is None:
+            # Without size rule, the home stores the values and no pointer.
+            return home.provider.get_range(key, offset, length)
+
+        value = home.provider.get(key)
+        target = self._target(value)
+        if target is None:
+            return value[offset : offset + length]
+        return target.provider.get_range(key, offset, length)
+
+    def set(self, key: bytes, value: bytes) -> None:
+        home, route = self.home(key), self.route(key, len(value))
+        if route is not home:
+            route.provider.set(key, value)
+            value = MAGIC + route.name.encode()
+        home.provider.set(key, value)
+
+    def delete(self, key: bytes) -> None:
+        # A reader may have just read the pointer: the value is left to the garbage collection.
+        self.home(key).provider.delete(key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self._iter_all(lambda p: self._homed(p, p.iter()))
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        routes = [r.provider for r in self.routes if self._may_store(r, prefix)]
+        return self._iter_all(lambda p: self._homed(p, p.iter_prefix(prefix)), routes)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys, route after route.
+        The continuation token contains the route and the continuation token of the route.
+        Keys are sorted inside a route, but not across routes.
+        """
+        if delimiter:
+            raise ValueError("The routed provider doesn't support delimiters.")
+
+        index, token = 0, None
+        if continuation_token:
+            index, token = continuation_token.split(TOKEN_SEPARATOR, 1)
+            index, token = int(index), token or None
+
+        while index < len(self.routes):
+            provider = self.routes[index].provider
+            page = provider.list_keys(prefix, page_size, token)
+            keys = list(self._homed(provider, page.keys))
+
+            if page.continuation_token:
+                next_token = f"{index}{TOKEN_SEPARATOR}{page.continuation_token}"
+            elif index + 1 < len(self.routes):
+                next_token = f"{index + 1}{TOKEN_SEPARATOR}"
+            else:
+                next_token = None
+
+            # Routes without keys are skipped to avoid returning empty pages.
+            if keys or next_token is None:
+                return KeysPage(keys, [], next_token)
+            if page.continuation_token:
+                token = page.continuation_token
+            else:
+                index, token = index + 1, None
+
+        return KeysPage([], [], None)
+
+    def len(self) -> int:
+        # Values stored away from their home are not keys.
+        return sum(self._on_all(lambda p: sum(1 for _ in self._homed(p, p.iter()))))
+
+    def compact(self) -> int:
+        """
+        Delete the values stored away from their home that no pointer references anymore for the grace period.
+        Return the number of values deleted.
+        """
+        self.logger.info("Collecting the values without pointer...")
+
+        def referenced(item):
+            key, route = item
+            try:
+                return self._target(self.home(key).provider.get(key)) is route
+            except KeyNotFoundError:
+                return False
+
+        # Internal objects, like the candidates of the sweepers, are never stored away.
+        stored_away = [
+            (key, route)
+            for route, keys in zip(self.routes, self._on_all(lambda p: list(p.iter())))
+            for key in keys
+            if self.home(key) is not route and not key.startswith(INTERNAL_PREFIX)
+        ]
+        garbage = {route.name: [] for route in self.routes}
+        for (key, route), pointed in zip(
+            stored_away, self.controller.map(referenced, stored_away)
+        ):
+            if not pointed:
+                garbage[route.name].append(key)
+
+        # Each route records its candidates, so they are deleted on the route storing them.
+        deleted = sum(
+            len(
+                Sweeper(
+                    self.logger,
+                    route.provider,
+                    self.controller,
+                    b"routed",
+                    self.grace_period,
+                ).sweep(garbage[route.name])
+            )
+            for route in self.routes
+        )
+
+        self.logger.info(f"{deleted} values without pointer deleted.")
+        return deleted
+
+    def _homed(self, provider: ProviderInterface, keys) -> Iterator[bytes]:
+        """
+        Filter the keys stored on the provider to the ones it is the home of.
+        """
+        return (key for key in keys if self.home(key).provider is provider)
+
+    def _may_store(self, route: Route, prefix: bytes) -> bool:
+        """
+        Return whether the route may store keys starting with the prefix.
+        """
+        if prefix.startswith(INTERNAL_PREFIX):
+            return route is self.routes[-1]
+        return route.match is None or may_match(route.match, prefix)
+
+    def _target(self, value: bytes) -> Optional[Route]:
+        """
+        Return the route a pointer references, or None if the value is stored as-is.
+        """
+        if not value.startswith(MAGIC):
+            return None
+        name = value[len(MAGIC) :].decode()
+        if name not in self._by_name:
+            raise ConfigurationError(
+                f"Values are stored on the unknown route '{name}'."
+            )
+        return self._by_name[name]
+
+    def _configure(self, rules: Dict[str, Dict[str, str]]) -> None:
+        unknown = set(rules) - {name.lower() for name in self.providers}
+        if unknown:
+            raise ConfigurationError(f"Rules of unknown routes: {sorted(unknown)}.")
+
+        routes = []
+        for name, provider in self.providers.items():
+            rule = rules.get(name.lower(), {})
+            try:
+                max_size = int(rule[MAX_SIZE_KEY]) if MAX_SIZE_KEY in rule else None
+            except ValueError as e:
+                raise ConfigurationError(f"Invalid routed configuration: {e}") from e
+            match = rule[MATCH_KEY].encode() if MATCH_KEY in rule else None
+            routes.append(Route(name, provider, match, max_size))
+
+        last = routes[-1]
+        if last.match is not None or last.max_size is not None:
+            raise ConfigurationError(
+                f"The last route ({last.name}) must accept all the keys."
+            )
+
+        self.routes = routes
+        self._by_name = {route.name: route for route in routes}
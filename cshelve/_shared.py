@@ -0,0 +1,115 @@
+"""
+Shared objects module for cshelve.
+
+Values embedding the same large object (a vocabulary, a lookup table...) store a copy of it in each pickle.
+`db.share(key, obj)` stores the object once under its own key, and the values pickled afterwards
+reference it by its key instead of embedding it, using the persistent IDs of pickle:
+- The object is recognized by identity: values must embed the object shared, not a copy.
+- On load, the reference is resolved through the object cache of the shelf, so the shared object is downloaded once
+  and all the values loaded embed the same instance.
+- Shared objects loaded through a reference are shared again when the values are stored back.
+
+Shared objects are expected to be immutable: the cache is not invalidated when another process updates them.
+A value referencing a deleted shared object can't be loaded anymore.
+"""
+from io import BytesIO
+import pickle
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .exceptions import KeyNotFoundError
+
+
+# Tag of the persistent IDs, so other persistent IDs are refused.
+TAG = "cshelve.shared"
+
+
+class SharedObjects:
+    """
+    Registry of the shared objects of a shelf by key, used as the object cache of the references.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        # The objects are kept alive so their identity is not reused.
+        self._objects: Dict[str, Any] = {}
+        self._keys: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._objects.get(key, default)
+
+    def add(self, key: str, obj: Any) -> Any:
+        """
+        Register the object under the key and return the object registered,
+        the first one if another thread registered the key concurrently.
+        """
+        with self._lock:
+            current = self._objects.get(key)
+            if current is not None:
+                return current
+            self._objects[key] = obj
+            self._keys[id(obj)] = key
+            return obj
+
+    def discard(self, key: str, obj: Any = None) -> None:
+        """
+        Unregister the object of the key, unless it is the object provided.
+        """
+        with self._lock:
+            current = self._objects.get(key)
+            if current is None or current is obj:
+                return
+            del self._objects[key]
+            del self._keys[id(current)]
+
+    def dumps(self, value: Any, protocol: int) -> bytes:
+        """
+        Pickle the value, the shared objects it embeds being replaced by their key.
+        """
+        f = BytesIO()
+        _Pickler(f, protocol, self._keys, value).dump(value)
+        return f.getvalue()
+
+    def loads(self, data: bytes, load: Callable[[str], Any]) -> Any:
+        """
+        Unpickle the value, the references being resolved through the cache or by loading their key.
+        """
+        return _Unpickler(BytesIO(data), self, load).load()
+
+    def resolve(self, key: str, load: Callable[[str], Any]) -> Any:
+        obj = self._objects.get(key)
+        if obj is None:
+            try:
+                obj = self.add(key, load(key))
+            except KeyNotFoundError as e:
+                raise KeyNotFoundError(f"Shared object {key} not found.") from e
+        return obj
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, protocol: int, keys: Dict[int, str], root: Any) -> None:
+        super().__init__(file, protocol)
+        self._shared_keys = keys
+        self._root = root
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple[str, str]]:
+        # The shared object itself is pickled when stored under its key.
+        if obj is self._root:
+            return None
+        key = self._shared_keys.get(id(obj))
+        return None if key is None else (TAG, key)
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, shared: SharedObjects, load: Callable[[str], Any]) -> None:
+        super().__init__(file)
+        self._shared = shared
+        self._load = load
+
+    def persistent_load(self, pid: Any) -> Any:
+        if not (isinstance(pid, tuple) and len(pid) == 2 and pid[0] == TAG):
+            raise pickle.UnpicklingError(f"Unsupported persistent ID: {pid!r}.")
+        return self._shared.resolve(pid[1], self._load)
@@ -0,0 +1,244 @@
+"""
+Striped provider module for cshelve.
+
+A container (bucket, storage account) has bandwidth and request rate limits a large shelf may reach.
+The striped provider spreads the keys across several providers, named stripes, each one configured in its own section:
+- Each key is placed on a stripe by consistent hashing, so adding a stripe only moves the keys it takes over.
+- Listings and `len` query the stripes concurrently.
+
+After adding a stripe, `rebalance` moves the keys to their new stripe.
+Until then, `fallback = true` looks up the keys missing on their stripe on the other stripes.
+"""
+from bisect import bisect
+import hashlib
+from logging import Logger
+from typing import Dict, Iterator, List, Optional
+
+from ._composite import CompositeProvider, split_names
+from ._concurrency import ConcurrencyController
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+STRIPES_KEY = "stripes"
+VNODES_KEY = "vnodes"
+FALLBACK_KEY = "fallback"
+
+# Number of points of each stripe on the ring, evening out the number of keys per stripe.
+DEFAULT_VNODES = 128
+# Separator between the stripe and the continuation token of the stripe in a continuation token.
+TOKEN_SEPARATOR = ":"
+
+
+def ring_position(value: bytes) -> int:
+    """
+    Position of a value on the ring, identical across runs, processes and platforms.
+    """
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+
+class StripedProvider(CompositeProvider):
+    """
+    Provider spreading the keys across several providers by consistent hashing.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        providers: Dict[str, ProviderInterface],
+        controller: ConcurrencyController,
+        vnodes: int = DEFAULT_VNODES,
+        fallback: bool = False,
+    ) -> None:
+        super().__init__(logger, providers, controller)
+        self.fallback = fallback
+        self._build_ring(vnodes)
+
+    @staticmethod
+    def sections(config: Dict[str, str]) -> List[str]:
+        if STRIPES_KEY not in config:
+            raise ConfigurationError("The striped provider requires a list of stripes.")
+        return split_names(config[STRIPES_KEY])
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        try:
+            vnodes = int(config.get(VNODES_KEY, DEFAULT_VNODES))
+        except ValueError as e:
+            raise ConfigurationError(f"Invalid striped configuration: {e}") from e
+        self.fallback = config.get(FALLBACK_KEY, "false").lower() == "true"
+        self._build_ring(vnodes)
+
+    def stripe(self, key: bytes) -> str:
+        """
+        Return the name of the stripe storing the key.
+        """
+        index = bisect(self._positions, ring_position(key)) % len(self._positions)
+        return self._owners[index]
+
+    def contains(self, key: bytes) -> bool:
+        return self._locate(key) is not None
+
+    def get(self, key: bytes) -> bytes:
+        return self._located(key).get(key)
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        return self._located(key).get_range(key, offset, length)
+
+    def set(self, key: bytes, value: bytes) -> None:
+        self.providers[self.stripe(key)].set(key, value)
+
+    def append(self, key: bytes, data: bytes) -> None:
+        provider = self.providers[self.stripe(key)]
+        if self.fallback and not provider.contains(key):
+            # The value to append to may still be on its former stripe.
+            current = self._locate(key)
+            if current is not None and current is not provider:
+                self._move(key, current, provider)
+        provider.append(key, data)
+
+    def delete(self, key: bytes) -> None:
+        if not self.fallback:
+            return self.providers[self.stripe(key)].delete(key)
+
+        # Former copies must be deleted too, otherwise the fallback would find them.
+        found = self._on_all(lambda p: p.contains(key))
+        if not any(found):
+            raise KeyNotFoundError(f"Key not found: {key}")
+        for provider, exists in zip(self.providers.values(), found):
+            if exists:
+                provider.delete(key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self._iter_all(lambda p: p.iter())
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        return self._iter_all(lambda p: p.iter_prefix(prefix))
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys, stripe after stripe.
+        The continuation token contains the stripe and the continuation token of the stripe.
+        Keys are sorted inside a stripe, but not across stripes.
+        """
+        if delimiter:
+            raise ValueError("The striped provider doesn't support delimiters.")
+
+        names = list(self.providers)
+        index, token = 0, None
+        if continuation_token:
+            index, token = continuation_token.split(TOKEN_SEPARATOR, 1)
+            index, token = int(index), token or None
+
+        while index < len(names):
+            page = self.providers[names[index]].list_keys(prefix, page_size, token)
+
+            if page.continuation_token:
+                next_token = f"{index}{TOKEN_SEPARATOR}{page.continuation_token}"
+            elif index + 1 < len(names):
+                next_token = f"{index + 1}{TOKEN_SEPARATOR}"
+            else:
+                next_token = None
+
+            # Empty stripes are skipped to avoid returning empty pages.
+            if page.keys or next_token is None:
+                return KeysPage(page.keys, [], next_token)
+            if page.continuation_token:
+                token = page.continuation_token
+            else:
+                index, token = index + 1, None
+
+        return KeysPage([], [], None)
+
+    def len(self) -> int:
+        return sum(self._on_all(lambda p: p.len()))
+
+    def rebalance(self) -> int:
+        """
+        Move the keys stored on another stripe than theirs, after a stripe is added or removed from the ring.
+        Return the number of keys moved.
+        """
+        self.logger.info("Rebalancing the keys across the stripes...")
+
+        names = list(self.providers)
+        listed = self._on_all(lambda p: list(p.iter()))
+        moves = [
+            (key, self.providers[name])
+            for name, keys in zip(names, listed)
+            for key in keys
+            if self.stripe(key) != name
+        ]
+
+        def move(item):
+            key, provider = item
+            self._move(key, provider, self.providers[self.stripe(key)])
+
+        for _ in self.controller.map(move, moves):
+            pass
+
+        self.logger.info(f"{len(moves)} keys moved.")
+        return len(moves)
+
+    def _locate(self, key: bytes) -> Optional[ProviderInterface]:
+        """
+        Return the provider storing the key, or None if the key doesn't exist.
+        """
+        provider = self.providers[self.stripe(key)]
+        if provider.contains(key):
+            return provider
+        if not self.fallback:
+            return None
+
+        others = [p for p in self.providers.values() if p is not provider]
+        for other, found in zip(
+            others, self._on_all(lambda p: p.contains(key), others)
+        ):
+            if found:
+                return other
+        return None
+
+    def _located(self, key: bytes) -> ProviderInterface:
+        """
+        Return the provider to read the key from.
+        Without fallback, it's the stripe of the key and no request is sent to locate it.
+        """
+        if not self.fallback:
+            return self.providers[self.stripe(key)]
+
+        provider = self._locate(key)
+        if provider is None:
+            raise KeyNotFoundError(f"Key not found: {key}")
+        return provider
+
+    def _move(
+        self, key: bytes, source: ProviderInterface, target: ProviderInterface
+    ) -> None:
+        try:
+            # A value written on the target since the stripe was added is newer than the one of the source.
+            if not target.contains(key):
+                target.set(key, source.get(key))
+            source.delete(key)
+        except KeyNotFoundError:
+            # Deleted since listed.
+            pass
+
+    def _build_ring(self, vnodes: int) -> None:
+        if vnodes < 1:
+            raise ConfigurationError(
+                f"The number of vnodes must be positive, not {vnodes}."
+            )
+
+        # Points depend on the name of the stripes only, so adding a stripe doesn't move the others.
+        ring = sorted(
+            (ring_position(f"{name}#{i}".encode()), name)
+            for name in self.providers
+            for i in range(vnodes)
+        )
+        self._positions = [position for position, _ in ring]
+        self._owners = [name for _, name in ring]
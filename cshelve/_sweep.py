@@ -0,0 +1,110 @@
+"""
+Sweep module for cshelve.
+
+The garbage collections of the wrappers list the internal objects nothing references anymore (deduplicated records, chunks...).
+A concurrent writer may have uploaded such an object right before writing the reference to it, so the unreferenced objects are not deleted right away:
+the sweeper records when each one was first found unreferenced in an internal object (`__cshelve__/sweep/<name>`),
+and only deletes the ones still unreferenced by a collection running `grace_period` seconds later.
+An object referenced again in the meantime is forgotten.
+
+With a grace period of 0, the unreferenced objects are deleted by the collection finding them.
+"""
+from logging import Logger
+import time
+from typing import Dict, Iterable, List
+import zlib
+
+from ._concurrency import ConcurrencyController
+from .exceptions import KeyNotFoundError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+# Key that can be defined in the sections of the wrappers collecting garbage.
+GRACE_PERIOD_KEY = "grace_period"
+
+# Seconds during which an unreferenced object is kept, for the writers uploading it before its reference.
+DEFAULT_GRACE_PERIOD = 3600.0
+
+SWEEP_PREFIX = INTERNAL_PREFIX + b"sweep/"
+
+
+def encode_candidates(candidates: Dict[bytes, float]) -> bytes:
+    """
+    Serialize the time each candidate was first found unreferenced.
+
+    >>> decode_candidates(encode_candidates({b"a": 1.5}))
+    {b'a': 1.5}
+    """
+    lines = (f"{seen!r} {name.hex()}" for name, seen in sorted(candidates.items()))
+    return zlib.compress("\n".join(lines).encode())
+
+
+def decode_candidates(data: bytes) -> Dict[bytes, float]:
+    """
+    Deserialize the time each candidate was first found unreferenced.
+    """
+    candidates = {}
+    for line in zlib.decompress(data).decode().splitlines():
+        seen, name = line.split(" ", 1)
+        candidates[bytes.fromhex(name)] = float(seen)
+    return candidates
+
+
+class Sweeper:
+    """
+    Delete the objects found unreferenced for at least the grace period.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        provider: ProviderInterface,
+        controller: ConcurrencyController,
+        name: bytes,
+        grace_period: float = DEFAULT_GRACE_PERIOD,
+    ) -> None:
+        if grace_period < 0:
+            raise ValueError("The grace period can't be negative.")
+
+        self.logger = logger
+        self.provider = provider
+        self.controller = controller
+        self.key = SWEEP_PREFIX + name
+        self.grace_period = grace_period
+
+    def sweep(self, garbage: Iterable[bytes]) -> List[bytes]:
+        """
+        Delete the unreferenced objects found by a collection at least `grace_period` seconds ago, and record the others.
+        Return the objects deleted.
+        """
+        now = time.time()
+        try:
+            previous = decode_candidates(self.provider.get(self.key))
+        except KeyNotFoundError:
+            previous = {}
+
+        # Objects referenced again since the previous collection are not candidates anymore.
+        candidates = {name: previous.get(name, now) for name in garbage}
+        expired = [
+            name for name, seen in candidates.items() if now - seen >= self.grace_period
+        ]
+        for name in expired:
+            del candidates[name]
+
+        def delete(name):
+            try:
+                self.provider.delete(name)
+            except KeyNotFoundError:
+                pass
+
+        for _ in self.controller.map(delete, expired):
+            pass
+
+        if candidates:
+            self.provider.set(self.key, encode_candidates(candidates))
+            self.logger.info(
+                f"{len(candidates)} unreferenced objects kept during the grace period."
+            )
+        elif previous:
+            delete(self.key)
+        return expired
@@ -0,0 +1,315 @@
+"""
+Tiered provider module for cshelve.
+
+The tiered provider serves the frequently read keys from a fast tier (ex: `in-memory`) and the others from a cold tier (ex: `aws-s3`):
+- Writes go through to the cold tier, which holds all the keys and answers the listings.
+- A key read `promote_after` times is copied to the hot tier.
+- The hot tier holds at most `capacity` bytes: the least recently used keys are demoted to make room,
+  unless the promoted key is read less often than them.
+
+Read counts are estimated by a count-min sketch of a few kilobytes, halved periodically so old accesses fade away.
+The hot tier is a cache private to the shelf: it only serves the keys this shelf promoted, and is emptied on `close`.
+"""
+from array import array
+from collections import OrderedDict
+from logging import Logger
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from ._bloom import fnv1a
+from ._composite import CompositeProvider
+from ._concurrency import ConcurrencyController
+from .exceptions import ConfigurationError, KeyNotFoundError
+from .provider_interface import KeysPage, ProviderInterface
+
+
+# Keys that can be defined in the INI file.
+HOT_KEY = "hot"
+COLD_KEY = "cold"
+PROMOTE_AFTER_KEY = "promote_after"
+CAPACITY_KEY = "capacity"
+SKETCH_WIDTH_KEY = "sketch_width"
+
+DEFAULT_PROMOTE_AFTER = 2
+DEFAULT_CAPACITY = 256 * 1024 * 1024
+DEFAULT_SKETCH_WIDTH = 4096
+# Number of rows of the sketch.
+SKETCH_DEPTH = 4
+# Largest value of a counter.
+MAX_COUNT = 2**16 - 1
+
+
+class FrequencySketch:
+    """
+    Count-min sketch estimating how often each key was read.
+    Counters are halved every `10 * width` reads, so the estimates follow the recent accesses.
+    """
+
+    def __init__(self, width: int = DEFAULT_SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        if width < 1:
+            raise ConfigurationError(f"The sketch width must be positive, not {width}.")
+
+        self.width = width
+        self.depth = depth
+        self._counters = array("H", bytes(2 * width * depth))
+        self._reads = 0
+        self._period = 10 * width
+
+    def add(self, key: bytes) -> int:
+        """
+        Count a read of the key and return its estimated number of reads.
+        """
+        positions = list(self._positions(key))
+        estimate = min(self._counters[p] for p in positions)
+        # Conservative update: only the smallest counters are incremented, reducing the overestimation.
+        for p in positions:
+            if self._counters[p] == estimate and estimate < MAX_COUNT:
+                self._counters[p] += 1
+
+        self._reads += 1
+        if self._reads >= self._period:
+            self._decay()
+        return min(estimate + 1, MAX_COUNT)
+
+    def estimate(self, key: bytes) -> int:
+        """
+        Return the estimated number of reads of the key, never lower than the actual one since the last decay.
+        """
+        return min(self._counters[p] for p in self._positions(key))
+
+    def _decay(self) -> None:
+        for i, count in enumerate(self._counters):
+            if count:
+                self._counters[i] = count >> 1
+        self._reads //= 2
+
+    def _positions(self, key: bytes) -> Iterator[int]:
+        h = fnv1a(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return (
+            row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)
+        )
+
+
+class TieredProvider(CompositeProvider):
+    """
+    Provider serving the frequently read keys from a hot tier and writing through to a cold tier.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        providers: Dict[str, ProviderInterface],
+        controller: ConcurrencyController,
+        promote_after: int = DEFAULT_PROMOTE_AFTER,
+        capacity: int = DEFAULT_CAPACITY,
+        sketch_width: int = DEFAULT_SKETCH_WIDTH,
+    ) -> None:
+        super().__init__(logger, providers, controller)
+        if len(providers) != 2:
+            raise ConfigurationError(
+                "The tiered provider requires a hot and a cold tier."
+            )
+
+        self.hot, self.cold = providers.values()
+        self._configure(promote_after, capacity, sketch_width)
+
+    def create(self) -> None:
+        if not self.hot.exists():
+            self.hot.create()
+        self.cold.create()
+
+    def exists(self) -> bool:
+        # The hot tier is a cache: a shelf exists if its cold tier does.
+        return self.cold.exists()
+
+    @staticmethod
+    def sections(config: Dict[str, str]) -> List[str]:
+        if HOT_KEY not in config or COLD_KEY not in config:
+            raise ConfigurationError(
+                "The tiered provider requires a hot and a cold tier."
+            )
+        return [config[HOT_KEY].strip(), config[COLD_KEY].strip()]
+
+    def configure_default(self, config: Dict[str, str]) -> None:
+        try:
+            self._configure(
+                int(config.get(PROMOTE_AFTER_KEY, DEFAULT_PROMOTE_AFTER)),
+                int(config.get(CAPACITY_KEY, DEFAULT_CAPACITY)),
+                int(config.get(SKETCH_WIDTH_KEY, DEFAULT_SKETCH_WIDTH)),
+            )
+        except ValueError as e:
+            raise ConfigurationError(f"Invalid tiered configuration: {e}") from e
+
+    @property
+    def paginated_listing(self) -> bool:
+        return self.cold.paginated_listing
+
+    @property
+    def supports_append(self) -> bool:
+        return self.cold.supports_append
+
+    @property
+    def hot_size(self) -> int:
+        """
+        Number of bytes stored in the hot tier.
+        """
+        return self._used
+
+    def close(self) -> None:
+        # Keys left in the hot tier wouldn't be invalidated by the next writers.
+        with self._tier_lock:
+            resident, self._resident, self._used = (
+                list(self._resident),
+                OrderedDict(),
+                0,
+            )
+        for key in resident:
+            self._delete_hot(key)
+        super().close()
+
+    def reconnect(self) -> None:
+        super().reconnect()
+        self._tier_lock = threading.Lock()
+
+    def contains(self, key: bytes) -> bool:
+        with self._tier_lock:
+            if key in self._resident:
+                return True
+        return self.cold.contains(key)
+
+    def get(self, key: bytes) -> bytes:
+        with self._tier_lock:
+            reads = self._sketch.add(key)
+
+        if self._is_resident(key):
+            try:
+                return self.hot.get(key)
+            except KeyNotFoundError:
+                # Evicted by the hot tier itself.
+                self._forget(key)
+
+        value = self.cold.get(key)
+        if reads >= self.promote_after:
+            self._promote(key, value)
+        return value
+
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        if self._is_resident(key):
+            try:
+                return self.hot.get_range(key, offset, length)
+            except KeyNotFoundError:
+                self._forget(key)
+        return self.cold.get_range(key, offset, length)
+
+    def set(self, key: bytes, value: bytes) -> None:
+        self.cold.set(key, value)
+        if self._is_resident(key):
+            # The hot copy is refreshed rather than dropped, as the key is read often.
+            self._forget(key)
+            if not self._promote(key, value):
+                self._delete_hot(key)
+
+    def append(self, key: bytes, data: bytes) -> None:
+        self.cold.append(key, data)
+        if self._is_resident(key):
+            self._forget(key)
+            self._delete_hot(key)
+
+    def delete(self, key: bytes) -> None:
+        if self._is_resident(key):
+            self._forget(key)
+            self._delete_hot(key)
+        self.cold.delete(key)
+
+    def iter(self) -> Iterator[bytes]:
+        return self.cold.iter()
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        return self.cold.iter_prefix(prefix)
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        return self.cold.list_keys(prefix, page_size, continuation_token, delimiter)
+
+    def len(self) -> int:
+        return self.cold.len()
+
+    def _promote(self, key: bytes, value: bytes) -> bool:
+        """
+        Copy the value to the hot tier if it fits, demoting the least recently used keys read less often than it.
+        Return whether the value was promoted.
+        """
+        size = len(value)
+        if size > self.capacity:
+            return False
+
+        demoted = []
+        with self._tier_lock:
+            if key in self._resident:
+                return True
+            reads = self._sketch.estimate(key)
+            victims, freed = [], 0
+            for victim, victim_size in self._resident.items():
+                if self._used - freed + size <= self.capacity:
+                    break
+                if self._sketch.estimate(victim) > reads:
+                    # The candidate isn't worth evicting a key read more often.
+                    return False
+                victims.append(victim)
+                freed += victim_size
+            for victim in victims:
+                self._used -= self._resident.pop(victim)
+                demoted.append(victim)
+            self._resident[key] = size
+            self._used += size
+
+        for victim in demoted:
+            self._delete_hot(victim)
+        try:
+            self.hot.set(key, value)
+        except Exception as e:
+            # The value is still served by the cold tier.
+            self.logger.warning(f"Can't promote {key}: {e}")
+            self._forget(key)
+            return False
+        self.logger.debug(f"{key} promoted, {len(demoted)} keys demoted.")
+        return True
+
+    def _is_resident(self, key: bytes) -> bool:
+        with self._tier_lock:
+            if key in self._resident:
+                self._resident.move_to_end(key)
+                return True
+            return False
+
+    def _forget(self, key: bytes) -> None:
+        with self._tier_lock:
+            size = self._resident.pop(key, None)
+            if size is not None:
+                self._used -= size
+
+    def _delete_hot(self, key: bytes) -> None:
+        try:
+            self.hot.delete(key)
+        except KeyNotFoundError:
+            pass
+
+    def _configure(self, promote_after: int, capacity: int, sketch_width: int) -> None:
+        if promote_after < 1 or capacity < 0:
+            raise ConfigurationError(
+                f"Invalid tiered sizes: promote_after={promote_after}, capacity={capacity}."
+            )
+
+        self.promote_after = promote_after
+        self.capacity = capacity
+        self._tier_lock = threading.Lock()
+        self._sketch = FrequencySketch(sketch_width)
+        # Keys stored in the hot tier with their size, from the least recently read.
+        self._resident = OrderedDict()
+        self._used = 0
@@ -0,0 +1,119 @@
+"""
+Structured values module for cshelve.
+
+Some values are updated in place instead of being rewritten, like the lists appended to.
+Such a value is stored as immutable parts, and the object of its key is a small head referencing them:
+- Parts are stored under `__cshelve__/values/<value id>/<part id>`, compressed and encrypted like any record.
+- The head contains the kind of the value, its id and the description of its parts.
+- A write uploads the new parts, then the head. The parts it replaced are left to the garbage collection,
+  as a reader may still use the previous head.
+- Before its first head, each value records its key in a marker (`__cshelve__/heads/<value id>`), indexing the heads.
+
+The parts of an overwritten or deleted value are deleted by the garbage collection (`compact`),
+which reads the head of the key of each value found in the parts, then deletes the parts of the values no head references anymore
+for `grace_period` seconds (mark-and-sweep), as the parts of a value are uploaded before its head.
+"""
+from collections import namedtuple
+from logging import Logger
+import os
+from typing import Dict, Optional
+
+from ._concurrency import ConcurrencyController
+from ._sweep import DEFAULT_GRACE_PERIOD, GRACE_PERIOD_KEY, Sweeper
+from .exceptions import ConfigurationError
+from .provider_interface import INTERNAL_PREFIX, ProviderInterface
+
+
+VALUES_PREFIX = INTERNAL_PREFIX + b"values/"
+HEADS_PREFIX = INTERNAL_PREFIX + b"heads/"
+# Header of a head, followed by the kind of the value, its id and the description of its parts.
+# Pickles start with their protocol, so they can't be mistaken for a head.
+MAGIC = b"CSV\x00"
+ID_SIZE = 16
+
+Head = namedtuple("Head", ["kind", "id", "payload"])
+
+
+def new_id() -> bytes:
+    """
+    Return a random id for a value or a part.
+    """
+    return os.urandom(ID_SIZE)
+
+
+def encode_head(kind: bytes, value_id: bytes, payload: bytes) -> bytes:
+    """
+    Serialize the head of a value.
+
+    >>> decode_head(encode_head(b"L", bytes(16), b"parts")).payload
+    b'parts'
+    """
+    return MAGIC + kind + value_id + payload
+
+
+def decode_head(data: bytes) -> Optional[Head]:
+    """
+    Deserialize the head of a value, or return None if the data is a pickle.
+    """
+    if not data.startswith(MAGIC):
+        return None
+
+    position = len(MAGIC)
+    kind = data[position : position + 1]
+    value_id = data[position + 1 : position + 1 + ID_SIZE]
+    return Head(kind, value_id, data[position + 1 + ID_SIZE :])
+
+
+def part_name(value_id: bytes, part_id: bytes) -> bytes:
+    """
+    Return the name of a part of a value.
+    """
+    return VALUES_PREFIX + value_id.hex().encode() + b"/" + part_id.hex().encode()
+
+
+def owner(name: bytes) -> bytes:
+    """
+    Return the id of the value owning the part.
+
+    >>> owner(part_name(b"a" * 16, b"b" * 16)) == b"a" * 16
+    True
+    """
+    return bytes.fromhex(name[len(VALUES_PREFIX) :].split(b"/", 1)[0].decode())
+
+
+def marker_name(value_id: bytes) -> bytes:
+    """
+    Return the name of the marker recording the key of a value.
+    """
+    return HEADS_PREFIX + value_id.hex().encode()
+
+
+def marked(name: bytes) -> bytes:
+    """
+    Return the id of the value of a marker.
+
+    >>> marked(marker_name(b"a" * 16)) == b"a" * 16
+    True
+    """
+    return bytes.fromhex(name[len(HEADS_PREFIX) :].decode())
+
+
+def configure(
+    logger: Logger,
+    provider: ProviderInterface,
+    controller: ConcurrencyController,
+    config: Dict[str, str],
+) -> Sweeper:
+    """
+    Return the sweeper of the parts, with the grace period defined in the `values` section of the configuration.
+    """
+    try:
+        return Sweeper(
+            logger,
+            provider,
+            controller,
+            b"values",
+            float(config.get(GRACE_PERIOD_KEY, DEFAULT_GRACE_PERIOD)),
+        )
+    except ValueError as e:
+        raise ConfigurationError(f"Invalid values configuration: {e}") from e
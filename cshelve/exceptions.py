@@ -110,6 +110,30 @@ class AuthArgumentError(AuthError):
     pass
 
 
+class ThrottlingError(RuntimeError):
+    """
+    Raised when the provider rejects a request because the request rate is too high.
+    """
+
+    pass
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    Raised when a request to the provider exceeds its deadline.
+    """
+
+    pass
+
+
+class ConcurrentWriterError(RuntimeError):
+    """
+    Raised when another writer holds an object that only supports a single writer at a time.
+    """
+
+    pass
+
+
 class ConfigurationError(RuntimeError):
     """
     Raised when the configuration provided for a provider is incorrect.
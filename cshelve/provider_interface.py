@@ -3,10 +3,37 @@ This Interface defines the interface for storage provider supporting the `Mutabl
 This class is used by the `Shelf` class to interact with the cloud storage provider.
 """
 from abc import abstractmethod
-from typing import Any, Dict, Iterator
+from collections import namedtuple
+from typing import Any, Dict, Iterator, Optional
 
+from .exceptions import KeyNotFoundError
 
-__all__ = ["ProviderInterface"]
+
+__all__ = ["INTERNAL_PREFIX", "KeysPage", "ProviderInterface", "is_internal"]
+
+
+# Namespace of the objects maintained by cshelve itself (manifest, ...).
+# Keys of this namespace are hidden from the listings of the shelf.
+INTERNAL_PREFIX = b"__cshelve__/"
+
+
+def is_internal(key) -> bool:
+    """
+    Return whether the key belongs to the internal namespace.
+    Keys are bytes, but providers used directly may also hold `str` keys.
+
+    >>> is_internal(b"__cshelve__/manifest"), is_internal("__cshelve__/manifest"), is_internal("key")
+    (True, True, False)
+    """
+    if isinstance(key, str):
+        return key.startswith(INTERNAL_PREFIX.decode())
+    return key.startswith(INTERNAL_PREFIX)
+
+
+# Page of a listing.
+# Keys sharing a prefix up to the delimiter are grouped in `prefixes` when a delimiter is provided.
+# The continuation token is None on the last page.
+KeysPage = namedtuple("KeysPage", ["keys", "prefixes", "continuation_token"])
 
 
 class ProviderInterface:
@@ -15,6 +42,11 @@ class ProviderInterface:
     Some methods may be left empty if not needed by the storage provider.
     """
 
+    # Whether the provider lists the keys remotely page by page, so listing partitions concurrently is faster.
+    paginated_listing = False
+    # Whether the provider appends to an object without rewriting it, so a log can be written with one request per batch.
+    supports_append = False
+
     def __init__(self, logger) -> None:
         self.logger = logger
 
@@ -88,6 +120,71 @@ class ProviderInterface:
         """
         raise NotImplementedError
 
+    def get_range(self, key: bytes, offset: int, length: int) -> bytes:
+        """
+        Retrieve `length` bytes of the value starting at `offset`.
+        Reading past the end of the value returns the bytes available, possibly none.
+        Providers supporting ranged reads should override this default implementation, which downloads the whole value.
+        """
+        return self.get(key)[offset : offset + length]
+
+    def append(self, key: bytes, data: bytes) -> None:
+        """
+        Append the data to the value of the key, creating it if it doesn't exist.
+        Providers supporting appends should override this default implementation, which rewrites the whole value.
+        """
+        try:
+            value = self.get(key)
+        except KeyNotFoundError:
+            value = b""
+        self.set(key, value + data)
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[bytes]:
+        """
+        Return an iterator over the keys starting with the prefix.
+        Providers able to filter the listing server-side should override this default implementation.
+        """
+        for key in self.iter():
+            # Keys of another type can't start with the prefix.
+            if isinstance(key, type(prefix)) and key.startswith(prefix):
+                yield key
+
+    def list_keys(
+        self,
+        prefix: bytes = b"",
+        page_size: Optional[int] = None,
+        continuation_token: Optional[str] = None,
+        delimiter: Optional[bytes] = None,
+    ) -> KeysPage:
+        """
+        Return a page of the keys starting with the prefix, in lexicographic order.
+        Providers supporting a paginated listing should override this default implementation,
+        which lists all the keys and uses the last key returned as continuation token.
+        """
+        start = continuation_token.encode() if continuation_token else None
+        keys, prefixes = [], []
+
+        for key in sorted(self.iter_prefix(prefix)):
+            if start is not None and (
+                key <= start
+                or (delimiter and start.endswith(delimiter) and key.startswith(start))
+            ):
+                continue
+
+            if page_size and len(keys) + len(prefixes) >= page_size:
+                last = max(keys[-1:] + prefixes[-1:])
+                return KeysPage(keys, prefixes, last.decode())
+
+            index = key.find(delimiter, len(prefix)) if delimiter else -1
+            if index == -1:
+                keys.append(key)
+            else:
+                common_prefix = key[: index + len(delimiter)]
+                if not prefixes or prefixes[-1] != common_prefix:
+                    prefixes.append(common_prefix)
+
+        return KeysPage(keys, prefixes, None)
+
     @abstractmethod
     def len(self) -> int:
         """
@@ -102,6 +199,14 @@ class ProviderInterface:
         """
         raise NotImplementedError
 
+    def reconnect(self) -> None:
+        """
+        Drop the clients so they are created again on the next operation.
+        Called in a child process after a `fork` as connection pools can't be shared between processes.
+        Providers without network clients don't need to implement it.
+        """
+        pass
+
     @abstractmethod
     def sync(self) -> None:
         """
@@ -73,22 +73,19 @@ while True:
         break
     # This character was added by the user.
     # Let's retrieve where he/she is from and display it.
-    elif _from := db[NEW_FRIENDS_KEY].get(personnage):
+    elif _from := db.mapping(NEW_FRIENDS_KEY).get(personnage):
         print(f"{personnage} is a true {_from}")
     # Unknown character, let's add it to the DB.
     else:
         _from = (
             input(f"I don't know {personnage}, where is he/she from? ").strip().lower()
         )
-        # Unknown location.
-        if _from not in db:
-            db[_from] = [personnage]
-        # Some characters are already from this location, we want to keep them too.
-        else:
-            db[_from] += [personnage]
+        # The list of the location is created if unknown, and only the new character is uploaded.
+        db.append(_from, personnage)
         print("Thanks for this new friend!")
         # Add the new friend to the nested dict to simplify the parsing.
-        db[NEW_FRIENDS_KEY] = {**db[NEW_FRIENDS_KEY], personnage: _from}
+        # Only the leaf containing the new friend is uploaded.
+        db.mapping(NEW_FRIENDS_KEY)[personnage] = _from
 
 # Display friends and where they are from.
 for _from, personages in db.items():
@@ -0,0 +1,178 @@
+"""
+In array mode, arrays are stored by chunks, so a window can be read or written without transferring the whole array.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._arrays import ChunkedArrays, chunk_shape, configure
+from cshelve._values import VALUES_PREFIX
+from cshelve.exceptions import ConfigurationError
+
+np = pytest.importorskip("numpy")
+
+
+CONFIG = "tests/configurations/in-memory/arrays.ini"
+PICKLED = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def _matrix():
+    # 100 x 50 float64 are split into chunks of 13 x 50 with 8 KiB chunks.
+    return np.arange(100 * 50, dtype="float64").reshape(100, 50)
+
+
+def _parts(db):
+    return {k for k in db.dict.db.db if k.startswith(VALUES_PREFIX)}
+
+
+def _record(monkeypatch, db):
+    downloaded, uploaded = [], []
+    get_parts, set_parts = db.dict.get_parts, db.dict.set_parts
+
+    def record_get(names):
+        names = list(names)
+        downloaded.extend(names)
+        return get_parts(names)
+
+    def record_set(parts):
+        parts = list(parts)
+        uploaded.extend(name for name, _ in parts)
+        set_parts(parts)
+
+    monkeypatch.setattr(db.dict, "get_parts", record_get)
+    monkeypatch.setattr(db.dict, "set_parts", record_set)
+    return downloaded, uploaded
+
+
+def test_chunk_shape():
+    """
+    Ensure the chunks fit in the size, and the small arrays are a single chunk.
+    """
+    assert chunk_shape((100, 50), 8, 8192) == (13, 50)
+    assert chunk_shape((10, 10), 8, 8192) == (10, 10)
+    assert chunk_shape((0, 3), 8, 8) == (1, 1)
+
+
+def test_array():
+    """
+    Ensure an array is stored by chunks and read back identical.
+    """
+    arrays = [
+        _matrix(),
+        np.arange(24, dtype="int16").reshape(2, 3, 4),
+        np.array(["asterix", "obelix"]),
+        np.zeros((0, 3)),
+    ]
+    with cshelve.open(CONFIG) as db:
+        for i, array in enumerate(arrays):
+            db[f"array-{i}"] = array
+            result = db[f"array-{i}"]
+            assert result.dtype == array.dtype
+            np.testing.assert_array_equal(result, array)
+
+        assert len(_parts(db)) == 8 + 1 + 1 + 1
+        view = db.array("array-0")
+        assert view.shape == (100, 50)
+        assert view.chunks == (13, 50)
+        assert len(view) == 100
+
+
+def test_read_window(monkeypatch):
+    """
+    Ensure only the chunks overlapping the window are downloaded.
+    """
+    array = _matrix()
+    with cshelve.open(CONFIG) as db:
+        db["matrix"] = array
+        downloaded, _ = _record(monkeypatch, db)
+
+        window = db.array("matrix")[20:30, 5:10]
+        np.testing.assert_array_equal(window, array[20:30, 5:10])
+        assert len(downloaded) == 2
+
+        view = db.array("matrix")
+        for index in [
+            5,
+            -1,
+            (slice(None, None, -7), 3),
+            (Ellipsis, 2),
+            (slice(90, 10, -3), slice(1, None, 4)),
+            slice(200, 300),
+        ]:
+            np.testing.assert_array_equal(view[index], array[index])
+        with pytest.raises(IndexError):
+            view[100]
+        with pytest.raises(IndexError):
+            view[1, 2, 3]
+
+
+def test_write_window(monkeypatch):
+    """
+    Ensure a write only uploads the chunks overlapping the window, downloading the ones partially overwritten.
+    """
+    array = _matrix()
+    with cshelve.open(CONFIG) as db:
+        db["matrix"] = array
+        parts = _parts(db)
+        downloaded, uploaded = _record(monkeypatch, db)
+
+        # Rows 13 to 25 are the second chunk, row 30 is in the third one.
+        db.array("matrix")[13:31] = -1
+        array[13:31] = -1
+
+        assert len(uploaded) == 2
+        assert len(downloaded) == 1
+        assert _parts(db) == parts
+
+        db.array("matrix")[::10, 7] = np.arange(10)
+        array[::10, 7] = np.arange(10)
+        np.testing.assert_array_equal(db["matrix"], array)
+
+
+def test_regular_values():
+    """
+    Ensure an array stored as a regular value is readable, converted by a write, and other values are refused.
+    """
+    array = _matrix()
+    with cshelve.open(PICKLED) as db:
+        db["matrix"] = array
+        assert _parts(db) == set()
+        np.testing.assert_array_equal(db.array("matrix")[1:3], array[1:3])
+
+        db.array("matrix")[0] = 0
+        array[0] = 0
+        assert _parts(db)
+        np.testing.assert_array_equal(db["matrix"], array)
+
+        db["gaule"] = ["asterix"]
+        with pytest.raises(TypeError):
+            db.array("gaule")[0]
+
+
+def test_compact():
+    """
+    Ensure the chunks of an overwritten array are deleted by the compaction.
+    """
+    with cshelve.open(CONFIG) as db:
+        db["matrix"] = _matrix()
+        db["matrix"] = np.zeros(3)
+
+        assert db.compact() == 8
+        assert len(_parts(db)) == 1
+
+
+def test_configure():
+    """
+    Ensure the array mode is only enabled on demand and validates its parameters.
+    """
+    logger = Mock()
+
+    assert configure(logger, {}) is None
+    arrays = configure(logger, {"enabled": "true", "chunk_bytes": "1024"})
+    assert isinstance(arrays, ChunkedArrays)
+    assert arrays.chunk_bytes == 1024
+    with pytest.raises(ConfigurationError):
+        configure(logger, {"enabled": "true", "chunk_bytes": "x"})
+    with pytest.raises(ConfigurationError):
+        configure(logger, {"enabled": "true", "chunk_bytes": "0"})
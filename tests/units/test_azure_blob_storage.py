@@ -290,6 +290,38 @@ def test_set(BlobServiceClient, DefaultAzureCredential):
     )
 
 
+@patch("azure.identity.DefaultAzureCredential")
+@patch("azure.storage.blob.BlobServiceClient")
+def test_append(BlobServiceClient, DefaultAzureCredential):
+    """
+    Ensure the data is appended to an append blob, created on the first append.
+    """
+    config = {
+        "account_url": "https://account.blob.core.windows.net",
+        "auth_type": "passwordless",
+        "container_name": "container",
+    }
+    blob_client = Mock()
+    blob_service_client = Mock()
+    BlobServiceClient.return_value = blob_service_client
+    blob_service_client.get_blob_client.return_value = blob_client
+    blob_client.append_block.side_effect = [ResourceNotFoundError(), None, None]
+
+    provider = factory(Mock(), "azure-blob")
+    provider.configure_default(config)
+
+    assert provider.supports_append
+    provider.append(b"log", b"data")
+    provider.append(b"log", b"more")
+
+    blob_client.create_append_blob.assert_called_once()
+    assert [c.args for c in blob_client.append_block.call_args_list] == [
+        (b"data",),
+        (b"data",),
+        (b"more",),
+    ]
+
+
 @patch("azure.identity.DefaultAzureCredential")
 @patch("azure.storage.blob.BlobServiceClient")
 def test_close(BlobServiceClient, DefaultAzureCredential):
@@ -318,6 +350,30 @@ def test_close(BlobServiceClient, DefaultAzureCredential):
     blob_service_client.close.assert_called_once()
 
 
+@patch("azure.identity.DefaultAzureCredential")
+@patch("azure.storage.blob.BlobServiceClient")
+def test_reconnect(BlobServiceClient, DefaultAzureCredential):
+    """
+    Ensure the clients are created again after a reconnection, as done in a child process after a fork.
+    """
+    config = {
+        "account_url": "https://account.blob.core.windows.net",
+        "auth_type": "passwordless",
+        "container_name": "container",
+    }
+    DefaultAzureCredential.return_value = Mock()
+
+    provider = factory(Mock(), "azure-blob")
+    provider.configure_default(config)
+
+    provider.contains(b"key")
+    provider.reconnect()
+    provider.contains(b"key")
+
+    assert BlobServiceClient.call_count == 2
+    assert BlobServiceClient.return_value.get_blob_client.call_count == 2
+
+
 @patch("azure.identity.DefaultAzureCredential")
 @patch("azure.storage.blob.BlobServiceClient")
 def test_delete(BlobServiceClient, DefaultAzureCredential):
@@ -381,6 +437,62 @@ def test_iter(BlobServiceClient, DefaultAzureCredential):
     assert list(provider.iter()) == list_blob_names_attended
 
 
+@patch("azure.identity.DefaultAzureCredential")
+@patch("azure.storage.blob.BlobServiceClient")
+def test_list_keys(BlobServiceClient, DefaultAzureCredential):
+    """
+    Ensure the keys and the prefixes are returned page by page using the Azure Blob Storage pagination.
+    """
+    from azure.storage.blob import BlobPrefix
+
+    config = {
+        "account_url": "https://account.blob.core.windows.net",
+        "auth_type": "passwordless",
+        "container_name": "container",
+    }
+
+    blob_service_client = Mock()
+    container_client = Mock()
+    BlobServiceClient.return_value = blob_service_client
+    blob_service_client.get_container_client.return_value = container_client
+
+    pages = Mock()
+    pages.__next__ = Mock(return_value=iter(["key1", "key2"]))
+    pages.continuation_token = "token"
+    container_client.list_blob_names.return_value.by_page.return_value = pages
+
+    provider = factory(Mock(), "azure-blob")
+    provider.configure_default(config)
+
+    page = provider.list_keys(b"key", page_size=2, continuation_token="previous")
+
+    assert page.keys == [b"key1", b"key2"]
+    assert page.continuation_token == "token"
+    container_client.list_blob_names.assert_called_once_with(
+        name_starts_with="key", results_per_page=2
+    )
+    container_client.list_blob_names.return_value.by_page.assert_called_once_with(
+        continuation_token="previous"
+    )
+
+    blob = Mock()
+    blob.name = "key"
+    prefix = BlobPrefix(prefix="user/")
+    pages = Mock()
+    pages.__next__ = Mock(return_value=iter([blob, prefix]))
+    pages.continuation_token = None
+    container_client.walk_blobs.return_value.by_page.return_value = pages
+
+    page = provider.list_keys(delimiter=b"/")
+
+    assert page.keys == [b"key"]
+    assert page.prefixes == [b"user/"]
+    assert page.continuation_token is None
+    container_client.walk_blobs.assert_called_once_with(
+        name_starts_with="", delimiter="/", results_per_page=None
+    )
+
+
 @patch("azure.identity.DefaultAzureCredential")
 @patch("azure.storage.blob.BlobServiceClient")
 def test_contains(BlobServiceClient, DefaultAzureCredential):
@@ -0,0 +1,145 @@
+"""
+The Bloom filter answers locally the lookups of missing keys.
+"""
+import random
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._bloom import BLOOM_KEY, BloomFilter, configure, fnv1a, fnv1a_many
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/bloom.ini"
+
+
+def _database(provider=None, max_staleness=60.0):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    bloom = BloomFilter(logger, provider, 1000, 0.01, max_staleness)
+    db = _Database(logger, provider, "w", DataProcessing(logger), bloom=bloom)
+    return provider, db
+
+
+def test_vectorized_hash():
+    """
+    Ensure the vectorized hash is identical to the scalar one used for the lookups.
+    """
+    rng = random.Random(0)
+    keys = [b""] + [rng.randbytes(rng.randint(1, 40)) for _ in range(500)]
+
+    assert [int(h) for h in fnv1a_many(keys)] == [fnv1a(k) for k in keys]
+
+
+def test_build():
+    """
+    Ensure the built filter contains all the keys and respects the false positive rate.
+    """
+    keys = [f"key{i}".encode() for i in range(1000)]
+    bloom = BloomFilter(Mock(), InMemory(Mock()), 1000, 0.01)
+
+    bloom.build(keys)
+
+    assert all(bloom.might_contain(k) for k in keys)
+    false_positives = sum(
+        bloom.might_contain(f"missing{i}".encode()) for i in range(10000)
+    )
+    assert false_positives < 300
+
+
+def test_missing_keys_are_answered_locally():
+    """
+    Ensure definitely absent keys don't reach the provider.
+    """
+    provider, db = _database()
+    db[b"key"] = b"value"
+    provider.get = Mock(wraps=provider.get)
+    provider.contains = Mock(wraps=provider.contains)
+
+    with pytest.raises(KeyNotFoundError):
+        db[b"missing"]
+    assert b"missing" not in db
+    # Only the filter itself is downloaded.
+    provider.get.assert_called_once_with(BLOOM_KEY)
+    provider.contains.assert_not_called()
+
+    assert db[b"key"] == b"value"
+    assert b"key" in db
+
+
+def test_built_from_listing_and_persisted():
+    """
+    Ensure the filter is built from a listing on its first use and persisted next to the data.
+    """
+    provider, writer = _database()
+    for i in range(10):
+        provider.set(f"key{i}".encode(), writer._to_record(b"value"))
+
+    assert b"key3" in writer
+    assert BLOOM_KEY in provider.db
+
+    _, reader = _database(provider)
+    reader.bloom.build = Mock()
+    assert b"key3" in reader
+    reader.bloom.build.assert_not_called()
+
+
+def test_writers_are_merged():
+    """
+    Ensure the keys added by several writers are kept when they synchronize.
+    """
+    provider, first = _database()
+    _, second = _database(provider)
+    assert b"x" not in first and b"x" not in second
+
+    first[b"first"] = b"value"
+    second[b"second"] = b"value"
+    first.sync()
+    second.sync()
+
+    _, reader = _database(provider, max_staleness=0)
+    assert b"first" in reader
+    assert b"second" in reader
+
+
+def test_rebuild_and_purge():
+    """
+    Ensure the filter is rebuilt on demand and reset when the shelf is purged.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["a"] = 1
+        db.rebuild_bloom()
+        assert "a" in db
+        assert db.dict.bloom.count == 1
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert db.dict.bloom.count == 0
+        assert "a" not in db
+
+
+def test_configure():
+    """
+    Ensure the filter is only enabled on demand.
+    """
+    provider = InMemory(Mock())
+
+    assert configure(Mock(), provider, {}) is None
+
+    bloom = configure(
+        Mock(),
+        provider,
+        {"enabled": "true", "expected_keys": "100", "false_positive_rate": "0.001"},
+    )
+    assert bloom.expected_keys == 100
+    assert bloom.false_positive_rate == 0.001
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, {"enabled": "true", "false_positive_rate": "2"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, {"enabled": "true", "expected_keys": "many"})
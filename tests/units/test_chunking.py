@@ -0,0 +1,227 @@
+"""
+Large values are split into chunks stored once, so only the modified chunks are uploaded.
+"""
+import random
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._chunking import (
+    CHUNK_PREFIX,
+    ChunkedProvider,
+    configure,
+    cut_points,
+    decode_chunks,
+)
+from cshelve._concurrency import ConcurrencyController
+from cshelve._in_memory import InMemory
+from cshelve.exceptions import ConfigurationError
+
+
+CONFIG = "tests/configurations/in-memory/chunking.ini"
+
+
+def _data(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def _chunked(provider=None, **kwargs):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    kwargs.setdefault("threshold", 4096)
+    kwargs.setdefault("chunk_size", 1024)
+    return provider, ChunkedProvider(
+        logger, provider, ConcurrencyController(logger), **kwargs
+    )
+
+
+def _chunks(provider):
+    return {k for k in provider.db if k.startswith(CHUNK_PREFIX)}
+
+
+def test_cut_points():
+    """
+    Ensure the chunks cover the data and respect the size bounds.
+    """
+    data = _data(200_000)
+
+    points = cut_points(data, 1024)
+
+    assert points[-1] == len(data)
+    sizes = [end - start for start, end in zip([0] + points[:-1], points)]
+    assert all(256 <= size <= 4096 for size in sizes[:-1])
+    assert 512 < len(data) / len(points) < 2048
+
+
+def test_cut_points_are_content_defined():
+    """
+    Ensure an insertion only changes the chunks around it.
+    """
+    data = _data(200_000)
+    modified = data[:100_000] + b"inserted" + data[100_000:]
+
+    before = set(cut_points(data, 1024))
+    after = {p - 8 for p in cut_points(modified, 1024) if p > 100_000}
+
+    assert len(before & after) >= len([p for p in before if p > 100_000]) - 2
+
+
+def test_cut_points_dont_depend_on_blocks(monkeypatch):
+    """
+    Ensure the data hashed block by block is cut as if hashed at once.
+    """
+    data = _data(200_000)
+    expected = cut_points(data, 1024)
+
+    monkeypatch.setattr("cshelve._chunking.BLOCK_SIZE", 1000)
+
+    assert cut_points(data, 1024) == expected
+
+
+def test_round_trip():
+    """
+    Ensure a chunked value is read as written.
+    """
+    provider, chunked = _chunked()
+    data = _data(50_000)
+
+    chunked.set(b"key", data)
+
+    assert decode_chunks(provider.db[b"key"]) is not None
+    assert chunked.get(b"key") == data
+    assert chunked.get_range(b"key", 10_000, 5000) == data[10_000:15_000]
+    assert chunked.get_range(b"key", 49_990, 100) == data[49_990:]
+
+
+def test_only_new_chunks_are_uploaded():
+    """
+    Ensure a modified value only uploads the modified chunks.
+    """
+    provider, chunked = _chunked()
+    data = _data(100_000)
+    chunked.set(b"key", data)
+    count = len(_chunks(provider))
+    provider.set = Mock(wraps=provider.set)
+
+    chunked.set(b"key", data[:50_000] + b"modified" + data[50_008:])
+
+    uploaded = [c.args[0] for c in provider.set.call_args_list if c.args[0] != b"key"]
+    assert 1 <= len(uploaded) <= 3
+    assert len(_chunks(provider)) == count + len(uploaded)
+
+
+def test_chunks_collected_by_another_process():
+    """
+    Ensure the chunks deleted by the garbage collection of another process are uploaded again.
+    """
+    provider, first = _chunked()
+    _, second = _chunked(provider, grace_period=0)
+    data = _data(50_000)
+    first.set(b"a", data)
+    second.delete(b"a")
+    assert second.compact() > 0
+
+    first.set(b"b", data)
+
+    assert first.get(b"b") == data
+
+
+def test_small_values_are_not_chunked():
+    """
+    Ensure values smaller than the threshold are stored as-is.
+    """
+    provider, chunked = _chunked()
+
+    chunked.set(b"key", b"small")
+
+    assert provider.db[b"key"] == b"small"
+    assert chunked.get(b"key") == b"small"
+    assert chunked.get_range(b"key", 1, 2) == b"ma"
+
+
+def test_compact():
+    """
+    Ensure only the chunks no key references are deleted.
+    """
+    provider, chunked = _chunked(grace_period=0)
+    data = _data(50_000)
+    chunked.set(b"a", data)
+    chunked.set(b"b", data)
+    chunked.set(b"c", _data(50_000, seed=1))
+    referenced = _chunks(provider)
+    chunked.delete(b"a")
+    chunked.delete(b"c")
+
+    deleted = chunked.compact()
+
+    assert deleted > 0
+    assert len(_chunks(provider)) == len(referenced) - deleted
+    assert chunked.get(b"b") == data
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure the unreferenced chunks are only deleted once unreferenced for the grace period.
+    """
+    provider, chunked = _chunked(grace_period=60)
+    chunked.set(b"a", _data(50_000))
+    chunked.delete(b"a")
+    count = len(_chunks(provider))
+
+    assert chunked.compact() == 0
+    assert len(_chunks(provider)) == count
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert chunked.compact() == count
+    assert _chunks(provider) == set()
+
+
+def test_configure():
+    """
+    Ensure the chunking is only enabled on demand and validates its parameters.
+    """
+    logger, provider = Mock(), InMemory(Mock())
+    controller = ConcurrencyController(logger)
+
+    assert configure(logger, provider, controller, {}) is provider
+    chunked = configure(
+        logger,
+        provider,
+        controller,
+        {"enabled": "true", "threshold": "100000", "chunk_size": "10000"},
+    )
+    assert isinstance(chunked, ChunkedProvider)
+    assert chunked.chunk_size == 10000
+    with pytest.raises(ConfigurationError):
+        configure(logger, provider, controller, {"enabled": "true", "threshold": "x"})
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger,
+            provider,
+            controller,
+            {"enabled": "true", "threshold": "10", "chunk_size": "100"},
+        )
+
+
+def test_shelf():
+    """
+    Ensure a chunked shelf behaves like any shelf and purges its chunks.
+    """
+    rows = [(i, f"row {i}") for i in range(20_000)]
+    with cshelve.open(CONFIG, "n") as db:
+        db["table"] = rows
+        rows[10_000] = (10_000, "modified")
+        db["table"] = rows
+        db.sync()
+
+        assert db["table"] == rows
+        assert len(db) == 1
+        assert db.compact() > 0
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert len(db) == 0
+        assert _chunks(db.dict.db.provider) == set()
@@ -0,0 +1,136 @@
+"""
+In columnar mode, DataFrames are stored by column chunks, so a subset of the columns can be read.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._columnar import Columnar, configure
+from cshelve._values import VALUES_PREFIX
+from cshelve.exceptions import ConfigurationError
+
+pd = pytest.importorskip("pandas")
+
+
+CONFIG = "tests/configurations/in-memory/columnar.ini"
+PICKLED = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def _frame(rows=2500):
+    return pd.DataFrame(
+        {
+            "a": range(rows),
+            "b": [float(i) / 2 for i in range(rows)],
+            "c": [f"row {i}" for i in range(rows)],
+            "d": pd.Categorical(["x", "y"] * (rows // 2) + ["x"] * (rows % 2)),
+        },
+        index=pd.Index([f"id-{i}" for i in range(rows)], name="id"),
+    )
+
+
+def _parts(db):
+    return {k for k in db.dict.db.db if k.startswith(VALUES_PREFIX)}
+
+
+def test_frame():
+    """
+    Ensure a DataFrame is stored by column chunks and read back identical.
+    """
+    df = _frame()
+    df.attrs["source"] = "unit test"
+    with cshelve.open(CONFIG) as db:
+        db["frame"] = df
+
+        # The index and 3 chunks of 1000 rows per column.
+        assert len(_parts(db)) == 1 + 4 * 3
+        result = db["frame"]
+        pd.testing.assert_frame_equal(result, df)
+        assert result.attrs == {"source": "unit test"}
+
+
+def test_read_columns(monkeypatch):
+    """
+    Ensure only the chunks of the columns read are downloaded.
+    """
+    df = _frame()
+    with cshelve.open(CONFIG) as db:
+        db["frame"] = df
+        downloaded, get_parts = [], db.dict.get_parts
+
+        def record(names):
+            names = list(names)
+            downloaded.extend(names)
+            return get_parts(names)
+
+        monkeypatch.setattr(db.dict, "get_parts", record)
+
+        result = db.read_columns("frame", ["c", "a"])
+
+        pd.testing.assert_frame_equal(result, df[["c", "a"]])
+        assert len(downloaded) == 1 + 2 * 3
+        with pytest.raises(KeyError):
+            db.read_columns("frame", ["missing"])
+
+
+def test_special_frames():
+    """
+    Ensure the frames without rows, with duplicated or non-string columns are read back identical.
+    """
+    frames = [
+        _frame(0),
+        pd.DataFrame([[1, 2, 3]], columns=["a", "a", "b"]),
+        pd.DataFrame({0: [1.5], 1: ["x"]}),
+        pd.DataFrame(index=pd.RangeIndex(5)),
+    ]
+    with cshelve.open(CONFIG) as db:
+        for i, df in enumerate(frames):
+            db[f"frame-{i}"] = df
+            pd.testing.assert_frame_equal(db[f"frame-{i}"], df)
+
+        pd.testing.assert_frame_equal(
+            db.read_columns("frame-1", ["a"]), frames[1][["a"]]
+        )
+
+
+def test_pickled_frames():
+    """
+    Ensure the frames are pickled without columnar mode, and `read_columns` still selects their columns.
+    """
+    df = _frame()
+    with cshelve.open(PICKLED) as db:
+        db["frame"] = df
+        db["other"] = [1, 2]
+
+        assert _parts(db) == set()
+        pd.testing.assert_frame_equal(db.read_columns("frame", ["b"]), df[["b"]])
+        with pytest.raises(TypeError):
+            db.read_columns("other", ["b"])
+
+
+def test_compact():
+    """
+    Ensure the chunks of an overwritten DataFrame are deleted by the compaction.
+    """
+    with cshelve.open(CONFIG) as db:
+        db["frame"] = _frame()
+        db["frame"] = _frame(10)
+
+        assert db.compact() == 1 + 4 * 3
+        assert len(_parts(db)) == 1 + 4
+
+
+def test_configure():
+    """
+    Ensure the columnar mode is only enabled on demand and validates its parameters.
+    """
+    logger = Mock()
+
+    assert configure(logger, {}) is None
+    columnar = configure(logger, {"enabled": "true", "chunk_rows": "10"})
+    assert isinstance(columnar, Columnar)
+    assert columnar.chunk_rows == 10
+    with pytest.raises(ConfigurationError):
+        configure(logger, {"enabled": "true", "chunk_rows": "x"})
+    with pytest.raises(ConfigurationError):
+        configure(logger, {"enabled": "true", "chunk_rows": "0"})
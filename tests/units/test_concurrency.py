@@ -0,0 +1,239 @@
+"""
+The concurrency controller adapts the number of in-flight requests of the bulk operations based on the provider feedback.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from cshelve import ThrottlingError
+from cshelve._concurrency import ConcurrencyController, configure, is_throttling
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve.exceptions import ConfigurationError
+
+
+class ThrottlingInMemory(InMemory):
+    """
+    Stand-in provider rejecting requests when too many of them are in-flight.
+    """
+
+    def __init__(self, logger, capacity: int) -> None:
+        super().__init__(logger)
+        self.capacity = capacity
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _request(self, fct, *args):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            overloaded = self.in_flight > self.capacity
+            if overloaded:
+                self.throttled += 1
+        try:
+            # Simulate the network latency.
+            time.sleep(0.001)
+            if overloaded:
+                raise ThrottlingError("SlowDown")
+            return fct(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def set(self, key, value):
+        return self._request(super().set, key, value)
+
+    def delete(self, key):
+        return self._request(super().delete, key)
+
+
+def test_is_throttling():
+    """
+    Ensure throttling signals of the providers are detected without importing their SDKs.
+    """
+    aws_error = Exception()
+    aws_error.response = {"Error": {"Code": "SlowDown"}}
+    aws_status = Exception()
+    aws_status.response = {"Error": {}, "ResponseMetadata": {"HTTPStatusCode": 503}}
+    azure_error = Exception()
+    azure_error.error_code = "ServerBusy"
+    azure_status = Exception()
+    azure_status.status_code = 429
+
+    assert is_throttling(ThrottlingError())
+    assert is_throttling(aws_error)
+    assert is_throttling(aws_status)
+    assert is_throttling(azure_error)
+    assert is_throttling(azure_status)
+    assert not is_throttling(KeyError())
+    assert not is_throttling(ValueError())
+
+
+def test_window_grows_when_healthy():
+    """
+    Ensure the window grows additively while the requests succeed.
+    """
+    controller = ConcurrencyController(
+        Mock(), initial_concurrency=2, max_concurrency=4, latency_tolerance=1000
+    )
+
+    list(controller.map(lambda x: x, range(100)))
+
+    assert controller.window == 4
+    controller.close()
+
+
+def test_window_shrinks_on_throttling():
+    """
+    Ensure the window is halved on throttling and the request retried.
+    """
+    controller = ConcurrencyController(
+        Mock(), initial_concurrency=16, backoff_base=0.0001
+    )
+    calls = []
+
+    def throttled_once():
+        calls.append(None)
+        if len(calls) == 1:
+            raise ThrottlingError()
+        return 42
+
+    assert controller.call(throttled_once) == 42
+    assert len(calls) == 2
+    assert controller.window == 8
+
+
+def test_non_throttling_errors_are_not_retried():
+    """
+    Ensure errors that are not throttling signals are raised immediately.
+    """
+    controller = ConcurrencyController(Mock())
+    fct = Mock(side_effect=KeyError)
+
+    with pytest.raises(KeyError):
+        controller.call(fct)
+
+    fct.assert_called_once()
+
+
+def test_retry_budget():
+    """
+    Ensure the retry budget is shared between requests and the error is raised once exhausted.
+    """
+    controller = ConcurrencyController(
+        Mock(), max_retries=100, retry_reserve=3, backoff_base=0.0001
+    )
+    fct = Mock(side_effect=ThrottlingError)
+
+    with pytest.raises(ThrottlingError):
+        controller.call(fct)
+
+    # The first call and the three retries of the budget.
+    assert fct.call_count == 4
+    assert controller.retry_tokens < 1
+
+    # The budget is shared: a new request is not retried.
+    fct.reset_mock()
+    with pytest.raises(ThrottlingError):
+        controller.call(fct)
+    fct.assert_called_once()
+
+
+def test_map_keeps_order():
+    """
+    Ensure the results are yielded in the order of the input.
+    """
+    controller = ConcurrencyController(Mock())
+
+    assert list(controller.map(lambda x: x * 2, range(1000))) == [
+        x * 2 for x in range(1000)
+    ]
+    controller.close()
+
+
+def test_nested_map():
+    """
+    Ensure a task of the controller can run a bulk operation without waiting for a full pool.
+    """
+    controller = ConcurrencyController(Mock(), max_concurrency=2, initial_concurrency=2)
+
+    def nested(x):
+        return sum(controller.map(lambda y: x * y, range(10)))
+
+    assert list(controller.map(nested, range(20))) == [x * 45 for x in range(20)]
+    controller.close()
+
+
+def test_purge_against_throttling_provider():
+    """
+    Ensure the purge succeeds against a throttling provider and the window converges below its capacity.
+    """
+    logger = Mock()
+    provider = ThrottlingInMemory(logger, capacity=4)
+    provider.configure_default({"exists": "True"})
+    for i in range(300):
+        provider.db[f"key{i}".encode()] = b"value"
+
+    controller = ConcurrencyController(
+        logger,
+        initial_concurrency=32,
+        max_retries=1000,
+        retry_reserve=1000,
+        backoff_base=0.001,
+        latency_tolerance=1000,
+    )
+    db = _Database(logger, provider, "n", DataProcessing(logger), controller)
+    db._init()
+
+    assert provider.len() == 0
+    assert provider.throttled > 0
+    assert controller.window <= 2 * provider.capacity
+    controller.close()
+
+
+def test_set_many_against_throttling_provider():
+    """
+    Ensure the batch writes succeed against a throttling provider.
+    """
+    logger = Mock()
+    provider = ThrottlingInMemory(logger, capacity=2)
+    controller = ConcurrencyController(
+        logger,
+        max_retries=1000,
+        retry_reserve=1000,
+        backoff_base=0.001,
+        latency_tolerance=1000,
+    )
+    db = _Database(logger, provider, "c", DataProcessing(logger), controller)
+    db._init()
+
+    db.set_many((f"key{i}".encode(), b"value") for i in range(100))
+
+    assert provider.len() == 100
+    assert db[b"key42"] == b"value"
+    controller.close()
+
+
+def test_configure():
+    """
+    Ensure the controller is configured from the configuration file.
+    """
+    controller = configure(
+        Mock(), {"min": "2", "max": "10", "initial": "4", "max_retries": "3"}
+    )
+
+    assert controller.min_concurrency == 2
+    assert controller.max_concurrency == 10
+    assert controller.window == 4
+    assert controller.max_retries == 3
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"min": "10", "max": "2"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"max": "many"})
@@ -0,0 +1,232 @@
+"""
+Identical values are stored once, keys pointing to them.
+"""
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._dedup import CAS_PREFIX, ContentAddressedProvider, configure
+from cshelve._in_memory import InMemory
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/dedup.ini"
+VALUE = b"x" * 100
+
+
+def _dedup(provider=None, **kwargs):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    kwargs.setdefault("min_size", 10)
+    return provider, ContentAddressedProvider(
+        logger, provider, ConcurrencyController(logger), **kwargs
+    )
+
+
+def _records(provider):
+    return [k for k in provider.db if k.startswith(CAS_PREFIX)]
+
+
+def test_identical_values_are_stored_once():
+    """
+    Ensure keys holding the same value share a single record.
+    """
+    provider, dedup = _dedup()
+
+    dedup.set(b"v1", VALUE)
+    dedup.set(b"latest", VALUE)
+
+    assert len(_records(provider)) == 1
+    assert dedup.get(b"v1") == VALUE
+    assert dedup.get(b"latest") == VALUE
+
+
+def test_known_records_are_not_uploaded():
+    """
+    Ensure writing a value already stored only writes the pointer, even if the key already points to it.
+    """
+    provider, dedup = _dedup()
+    dedup.set(b"v1", VALUE)
+    provider.set = Mock(wraps=provider.set)
+
+    dedup.set(b"latest", VALUE)
+    provider.set.assert_called_once()
+    assert provider.set.call_args.args[0] == b"latest"
+
+    provider.set.reset_mock()
+    dedup.set(b"latest", VALUE)
+    provider.set.assert_called_once()
+    assert provider.set.call_args.args[0] == b"latest"
+
+
+def test_pointers_are_always_written():
+    """
+    Ensure a key overwritten by another writer is written again.
+    """
+    provider, first = _dedup()
+    _, second = _dedup(provider)
+    first.set(b"key", VALUE)
+    second.set(b"key", b"y" * 100)
+
+    first.set(b"key", VALUE)
+
+    assert second.get(b"key") == VALUE
+
+
+def test_records_collected_by_another_process():
+    """
+    Ensure a record deleted by the garbage collection of another process is uploaded again.
+    """
+    provider, first = _dedup()
+    _, second = _dedup(provider, grace_period=0)
+    first.set(b"a", VALUE)
+    second.delete(b"a")
+    assert second.compact() == 1
+
+    first.set(b"b", VALUE)
+
+    assert first.get(b"b") == VALUE
+
+
+def test_records_of_other_writers_are_not_uploaded():
+    """
+    Ensure a record stored by another writer is not uploaded again.
+    """
+    provider, first = _dedup()
+    _, second = _dedup(provider)
+    first.set(b"a", VALUE)
+    provider.set = Mock(wraps=provider.set)
+
+    second.set(b"b", VALUE)
+
+    provider.set.assert_called_once()
+
+
+def test_small_values_are_inline():
+    """
+    Ensure values smaller than the minimum size are stored as-is.
+    """
+    provider, dedup = _dedup()
+
+    dedup.set(b"small", b"abc")
+
+    assert provider.db[b"small"] == b"abc"
+    assert _records(provider) == []
+    assert dedup.get(b"small") == b"abc"
+
+
+def test_overwrite_with_small_value():
+    """
+    Ensure a key pointing to a record can be overwritten by an inline value and back.
+    """
+    _, dedup = _dedup()
+    dedup.set(b"key", VALUE)
+    dedup.set(b"key", b"abc")
+    assert dedup.get(b"key") == b"abc"
+
+    dedup.set(b"key", VALUE)
+    assert dedup.get(b"key") == VALUE
+
+
+def test_compact():
+    """
+    Ensure only the records no key points to are deleted.
+    """
+    provider, dedup = _dedup(grace_period=0)
+    dedup.set(b"a", VALUE)
+    dedup.set(b"b", VALUE)
+    dedup.set(b"c", b"y" * 100)
+    dedup.delete(b"a")
+    dedup.delete(b"c")
+
+    assert dedup.compact() == 1
+
+    assert len(_records(provider)) == 1
+    assert dedup.get(b"b") == VALUE
+    # The deleted record is uploaded again if needed.
+    dedup.set(b"c", b"y" * 100)
+    assert dedup.get(b"c") == b"y" * 100
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure the unreferenced records are only deleted once unreferenced for the grace period.
+    """
+    provider, dedup = _dedup(grace_period=60)
+    dedup.set(b"a", VALUE)
+    dedup.set(b"b", b"y" * 100)
+    dedup.delete(b"a")
+    dedup.delete(b"b")
+    assert dedup.compact() == 0
+    assert len(_records(provider)) == 2
+
+    # Referenced again during the grace period.
+    dedup.set(b"b", b"y" * 100)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+
+    assert dedup.compact() == 1
+    assert dedup.get(b"b") == b"y" * 100
+    assert len(_records(provider)) == 1
+
+
+def test_missing_key():
+    """
+    Ensure missing keys are reported as such.
+    """
+    _, dedup = _dedup()
+
+    with pytest.raises(KeyNotFoundError):
+        dedup.get(b"missing")
+
+
+def test_configure():
+    """
+    Ensure the deduplication is only enabled on demand and validates its parameters.
+    """
+    logger, provider = Mock(), InMemory(Mock())
+    controller = ConcurrencyController(logger)
+
+    assert configure(logger, provider, controller, {}) is provider
+    dedup = configure(
+        logger, provider, controller, {"enabled": "true", "algorithm": "blake2b"}
+    )
+    assert isinstance(dedup, ContentAddressedProvider)
+    assert dedup.algorithm == "blake2b"
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "algorithm": "unknown"}
+        )
+    with pytest.raises(ConfigurationError):
+        configure(logger, provider, controller, {"enabled": "true", "min_size": "x"})
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "grace_period": "-1"}
+        )
+
+
+def test_shelf():
+    """
+    Ensure a deduplicated shelf behaves like any shelf and purges its records.
+    """
+    artifact = list(range(1000))
+    with cshelve.open(CONFIG, "n") as db:
+        db["model/v1"] = artifact
+        db["model/v2"] = artifact
+        db["model/latest"] = artifact
+        db["small"] = 1
+
+        assert len(db) == 4
+        assert db["model/latest"] == artifact
+        assert len(_records(db.dict.db.provider)) == 1
+
+        del db["model/v1"]
+        assert db.compact() == 0
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert len(db) == 0
+        assert _records(db.dict.db.provider) == []
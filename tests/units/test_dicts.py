@@ -0,0 +1,156 @@
+"""
+Dictionaries are stored as a trie of nodes, so a write only uploads the nodes on the path of the entry.
+"""
+import pytest
+
+import cshelve
+from cshelve._dicts import LEAF, LEAF_SIZE, key_hash
+from cshelve._values import VALUES_PREFIX
+
+
+CONFIG = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def _parts(db):
+    return {k for k in db.dict.db.db if k.startswith(VALUES_PREFIX)}
+
+
+def _record_uploads(monkeypatch, db):
+    uploaded, set_parts = [], db.dict.set_parts
+
+    def record(parts):
+        parts = list(parts)
+        uploaded.extend(parts)
+        set_parts(parts)
+
+    monkeypatch.setattr(db.dict, "set_parts", record)
+    return uploaded
+
+
+def test_key_hash():
+    """
+    Ensure the keys are hashed by type and other types are refused.
+    """
+    assert key_hash("1") != key_hash(1) != key_hash(b"1")
+    with pytest.raises(TypeError):
+        key_hash(1.0)
+
+
+def test_mapping():
+    """
+    Ensure the entries are read back, updated and deleted.
+    """
+    with cshelve.open(CONFIG) as db:
+        friends = db.mapping("friends")
+        friends["cleopatre"] = "egypte"
+        friends["chipolata"] = "corse"
+        friends["cleopatre"] = "rome"
+
+        assert friends["cleopatre"] == "rome"
+        assert friends.get("numerobis") is None
+        assert "chipolata" in friends
+        assert len(friends) == 2
+        assert db["friends"] == {"cleopatre": "rome", "chipolata": "corse"}
+
+        del friends["chipolata"]
+        with pytest.raises(KeyError):
+            del friends["chipolata"]
+        assert dict(friends) == {"cleopatre": "rome"}
+
+
+def test_large():
+    """
+    Ensure a dictionary larger than a leaf is split into nodes and read back.
+    """
+    expected = {i: f"value {i}" for i in range(20 * LEAF_SIZE)}
+    with cshelve.open(CONFIG) as db:
+        numbers = db.mapping("numbers")
+        numbers.update(expected)
+
+        assert len(numbers) == len(expected)
+        assert numbers[123] == "value 123"
+        assert db["numbers"] == expected
+        assert sorted(numbers) == sorted(expected)
+
+        for i in range(0, len(expected), 2):
+            del numbers[i]
+        assert db["numbers"] == {k: v for k, v in expected.items() if k % 2}
+        assert len(numbers) == len(expected) // 2
+
+
+def test_write_uploads_path(monkeypatch):
+    """
+    Ensure a write uploads a single leaf and the nodes on its path, the replaced ones being deleted by the compaction.
+    """
+    with cshelve.open(CONFIG) as db:
+        numbers = db.mapping("numbers")
+        numbers.update({i: i for i in range(100 * LEAF_SIZE)})
+        parts = len(_parts(db))
+        uploaded = _record_uploads(monkeypatch, db)
+
+        numbers[42] = "modified"
+
+        leaves = [data for _, data in uploaded if data.startswith(LEAF)]
+        assert len(leaves) == 1
+        assert len(uploaded) <= 3
+        assert numbers[42] == "modified"
+        # The readers of the previous trie may still download the replaced nodes.
+        assert len(_parts(db)) == parts + len(uploaded)
+        assert db.compact() == len(uploaded)
+        assert len(_parts(db)) == parts
+        assert numbers[42] == "modified"
+
+
+def test_regular_values():
+    """
+    Ensure a dictionary stored as a regular value is converted by a write, and other values are refused.
+    """
+    with cshelve.open(CONFIG) as db:
+        db["friends"] = {"cleopatre": "egypte"}
+        friends = db.mapping("friends")
+        assert friends["cleopatre"] == "egypte"
+        assert _parts(db) == set()
+
+        del friends["cleopatre"]
+        friends["chipolata"] = "corse"
+        assert db["friends"] == {"chipolata": "corse"}
+
+        db["gaule"] = ["asterix"]
+        with pytest.raises(TypeError):
+            db.mapping("gaule")["asterix"] = 1
+
+
+def test_compact():
+    """
+    Ensure the nodes of a replaced dictionary are deleted by the compaction.
+    """
+    with cshelve.open(CONFIG) as db:
+        db.mapping("kept").update({i: i for i in range(10)})
+        db.mapping("replaced").update({i: i for i in range(10)})
+
+        db["replaced"] = {}
+
+        assert db.compact() == 1
+        assert db["kept"] == {i: i for i in range(10)}
+
+
+def test_lookup_downloads_leaf(monkeypatch):
+    """
+    Ensure a lookup downloads only the leaf once the inner nodes are cached.
+    """
+    with cshelve.open(CONFIG) as db:
+        numbers = db.mapping("numbers")
+        numbers.update({i: i for i in range(100 * LEAF_SIZE)})
+        assert numbers[1] == 1
+
+        downloaded, get_parts = [], db.dict.get_parts
+
+        def record(names):
+            names = list(names)
+            downloaded.extend(names)
+            return get_parts(names)
+
+        monkeypatch.setattr(db.dict, "get_parts", record)
+
+        assert numbers[2] == 2
+        assert len(downloaded) == 1
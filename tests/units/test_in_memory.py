@@ -156,3 +156,58 @@ def test_create():
     provider = factory(Mock(), "in-memory")
     provider.configure_default({})
     provider.create()
+
+
+def test_list_keys():
+    """
+    Ensure the keys are returned page by page in lexicographic order.
+    """
+    provider = factory(Mock(), "in-memory")
+    provider.configure_default({})
+    for i in range(5):
+        provider.set(f"key{i}".encode(), b"value")
+    provider.set(b"other", b"value")
+
+    page = provider.list_keys(b"key", page_size=3)
+    assert page.keys == [b"key0", b"key1", b"key2"]
+
+    page = provider.list_keys(
+        b"key", page_size=3, continuation_token=page.continuation_token
+    )
+    assert page.keys == [b"key3", b"key4"]
+    assert page.continuation_token is None
+
+
+def test_list_keys_delimiter():
+    """
+    Ensure the keys sharing a prefix up to the delimiter are grouped.
+    """
+    provider = factory(Mock(), "in-memory")
+    provider.configure_default({})
+    for key in [b"a/1", b"a/2", b"b/1/x", b"c", b"d/1"]:
+        provider.set(key, b"value")
+
+    page = provider.list_keys(delimiter=b"/", page_size=2)
+    assert page.prefixes == [b"a/", b"b/"]
+
+    page = provider.list_keys(
+        delimiter=b"/", continuation_token=page.continuation_token
+    )
+    assert page.keys == [b"c"]
+    assert page.prefixes == [b"d/"]
+    assert provider.list_keys(b"b/", delimiter=b"/").prefixes == [b"b/1/"]
+
+
+def test_latency(monkeypatch):
+    """
+    Ensure every request on a key waits for the simulated latency.
+    """
+    provider = factory(Mock(), "in-memory")
+    provider.configure_default({"latency": "0.01"})
+    sleep = Mock()
+    monkeypatch.setattr("cshelve._in_memory.time.sleep", sleep)
+
+    provider.set(b"key", b"a")
+    provider.append(b"key", b"b")
+    assert provider.get(b"key") == b"ab"
+    assert sleep.call_count == 3
@@ -0,0 +1,179 @@
+"""
+The latency policy applies deadlines and hedging on the requests sent to the provider.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from cshelve import DeadlineExceededError, KeyNotFoundError
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve._latency import LatencyPolicy, configure
+from cshelve.exceptions import ConfigurationError
+
+
+class SlowInMemory(InMemory):
+    """
+    Stand-in provider whose `get` are slow when the key is in `stuck`.
+    The first request of a stuck key is slow, the following ones are fast, simulating a stuck connection.
+    """
+
+    def __init__(self, logger, delay: float) -> None:
+        super().__init__(logger)
+        self.delay = delay
+        self.stuck = set()
+        self.gets = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            self.gets += 1
+            stuck = key in self.stuck
+            self.stuck.discard(key)
+        if stuck:
+            time.sleep(self.delay)
+        return super().get(key)
+
+    def set(self, key, value):
+        if key in self.stuck:
+            time.sleep(self.delay)
+        super().set(key, value)
+
+
+def _database(provider, policy):
+    logger = Mock()
+    db = _Database(logger, provider, "c", DataProcessing(logger), latency=policy)
+    db._init()
+    return db
+
+
+def test_no_policy_calls_directly():
+    """
+    Ensure that without configuration, requests are executed in the calling thread.
+    """
+    policy = LatencyPolicy(Mock())
+
+    assert policy.read(threading.current_thread) is threading.current_thread()
+    assert policy.write(threading.current_thread) is threading.current_thread()
+    assert policy._executor is None
+
+
+def test_read_deadline():
+    """
+    Ensure a read exceeding its deadline raises an error.
+    """
+    provider = SlowInMemory(Mock(), delay=0.5)
+    db = _database(provider, LatencyPolicy(Mock(), read_timeout=0.05))
+    db[b"key"] = b"value"
+    provider.stuck.add(b"key")
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        db[b"key"]
+    assert time.monotonic() - start < 0.4
+
+    # Deadline errors are also timeouts.
+    assert issubclass(DeadlineExceededError, TimeoutError)
+    db.close()
+
+
+def test_write_deadline():
+    """
+    Ensure a write exceeding its deadline raises an error.
+    """
+    provider = SlowInMemory(Mock(), delay=0.5)
+    db = _database(provider, LatencyPolicy(Mock(), write_timeout=0.05))
+    provider.stuck.add(b"key")
+
+    with pytest.raises(DeadlineExceededError):
+        db[b"key"] = b"value"
+    db.close()
+
+
+def test_errors_are_propagated():
+    """
+    Ensure errors raised by the provider are not hidden by the policy.
+    """
+    provider = SlowInMemory(Mock(), delay=0)
+    db = _database(provider, LatencyPolicy(Mock(), read_timeout=1, hedge_percentile=50))
+
+    with pytest.raises(KeyNotFoundError):
+        db[b"missing"]
+    db.close()
+
+
+def test_hedged_read():
+    """
+    Ensure a slow read is hedged and the fastest response is used.
+    """
+    provider = SlowInMemory(Mock(), delay=1)
+    policy = LatencyPolicy(Mock(), hedge_percentile=90, hedge_min_samples=5)
+    db = _database(provider, policy)
+    db[b"key"] = b"value"
+
+    # Collect the latency of fast reads.
+    for _ in range(10):
+        assert db[b"key"] == b"value"
+    assert policy.hedged == 0
+
+    provider.stuck.add(b"key")
+    start = time.monotonic()
+    assert db[b"key"] == b"value"
+
+    # The hedge returned before the stuck request.
+    assert time.monotonic() - start < 0.5
+    assert policy.hedged == 1
+    assert provider.gets == 12
+    db.close()
+
+
+def test_hedging_requires_samples():
+    """
+    Ensure reads are not hedged until enough latencies are observed.
+    """
+    policy = LatencyPolicy(Mock(), hedge_percentile=50, hedge_min_samples=3)
+
+    assert policy._hedge_delay() is None
+    for latency in (0.3, 0.1, 0.2):
+        policy._latencies.append(latency)
+    assert policy._hedge_delay() == 0.2
+
+
+def test_contains_does_not_download():
+    """
+    Ensure the membership test uses the provider `contains` method.
+    """
+    provider = SlowInMemory(Mock(), delay=0)
+    db = _database(provider, LatencyPolicy(Mock()))
+    db[b"key"] = b"value"
+
+    assert b"key" in db
+    assert b"missing" not in db
+    assert provider.gets == 0
+
+
+def test_configure():
+    """
+    Ensure the policy is configured from the configuration file.
+    """
+    policy = configure(
+        Mock(),
+        {"read_timeout": "1.5", "write_timeout": "10", "hedge_percentile": "95"},
+    )
+
+    assert policy.read_timeout == 1.5
+    assert policy.write_timeout == 10
+    assert policy.hedge_percentile == 95
+
+    policy = configure(Mock(), {})
+    assert policy.read_timeout is None
+    assert policy.hedge_percentile is None
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"hedge_percentile": "100"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"read_timeout": "soon"})
@@ -0,0 +1,261 @@
+"""
+The hash prefix layout stores the keys in shards that can be listed independently.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve._layout import (
+    LAYOUT_KEY,
+    HashPrefixLayout,
+    configure,
+    detect,
+    detects,
+    key_hash,
+)
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+from cshelve.provider_interface import INTERNAL_PREFIX
+
+
+CONFIG = "tests/configurations/in-memory/layout.ini"
+KEYS = [f"key-{i}".encode() for i in range(200)]
+
+
+def _layout(shards=16):
+    provider = InMemory(Mock())
+    layout = HashPrefixLayout(Mock(), provider, shards)
+    for key in KEYS:
+        layout.set(key, b"value")
+    return provider, layout
+
+
+def test_key_hash_is_stable():
+    """
+    Ensure the hash doesn't depend on the process (as the built-in `hash` does).
+    """
+    assert key_hash(b"key") == 2324736937
+
+
+def test_keys_are_prefixed():
+    """
+    Ensure keys are stored under their shard prefix and are transparently accessible.
+    """
+    provider, layout = _layout()
+
+    name = layout.prefix(layout.shard(b"key-1")) + b"key-1"
+    assert name in provider.db
+    assert len(name) == len(b"x/key-1")
+
+    assert layout.get(b"key-1") == b"value"
+    assert layout.contains(b"key-1")
+    layout.delete(b"key-1")
+    assert not layout.contains(b"key-1")
+    assert layout.len() == len(KEYS) - 1
+
+
+def test_iter_reverse_maps_names():
+    """
+    Ensure the iteration returns the keys and not the object names.
+    """
+    _, layout = _layout()
+
+    assert sorted(layout.iter()) == sorted(KEYS)
+    assert sorted(layout.iter_prefix(b"key-1")) == sorted(
+        k for k in KEYS if k.startswith(b"key-1")
+    )
+
+
+@pytest.mark.parametrize("count", [1, 2, 4, 16, 3, 5])
+def test_partitions(count):
+    """
+    Ensure the partitions are disjoint, cover all the keys and match the partitions without layout.
+    """
+    _, layout = _layout()
+    logger = Mock()
+    flat = _Database(logger, InMemory(logger), "c", DataProcessing(logger))
+    flat._init()
+    for key in KEYS:
+        flat.db.set(key, b"value")
+
+    partitions = [list(layout.iter_partition(i, count)) for i in range(count)]
+
+    assert sorted(k for p in partitions for k in p) == sorted(KEYS)
+    for i, partition in enumerate(partitions):
+        assert sorted(partition) == sorted(flat.iter_partition(i, count))
+
+
+def test_partitions_skip_internal_objects():
+    """
+    Ensure the partitions without layout don't contain the internal objects.
+    """
+    logger = Mock()
+    flat = _Database(logger, InMemory(logger), "c", DataProcessing(logger))
+    flat._init()
+    for key in KEYS:
+        flat.db.set(key, b"value")
+    flat.db.set(INTERNAL_PREFIX + b"manifest", b"internal")
+
+    partitions = [list(flat.iter_partition(i, 4)) for i in range(4)]
+
+    assert sorted(k for p in partitions for k in p) == sorted(KEYS)
+
+
+def test_partition_lists_only_its_shards():
+    """
+    Ensure a partition lists only its own shards when the number of partitions divides the number of shards.
+    """
+    provider, layout = _layout(shards=16)
+    provider.iter_prefix = Mock(wraps=provider.iter_prefix)
+
+    list(layout.iter_partition(1, 4))
+
+    assert provider.iter_prefix.call_count == 4
+    assert {c.args[0] for c in provider.iter_prefix.call_args_list} == {
+        b"1/",
+        b"5/",
+        b"9/",
+        b"d/",
+    }
+
+
+def test_list_keys_pages_through_the_shards():
+    """
+    Ensure the pages of keys go through all the shards and skip the empty ones.
+    """
+    provider, layout = _layout(shards=256)
+
+    listed, token = [], None
+    while True:
+        page = layout.list_keys(page_size=7, continuation_token=token)
+        # Only the last page may be empty, if the last shards are.
+        assert page.keys or page.continuation_token is None
+        listed += page.keys
+        token = page.continuation_token
+        if token is None:
+            break
+
+    assert sorted(listed) == sorted(KEYS)
+
+    with pytest.raises(ValueError):
+        layout.list_keys(delimiter=b"/")
+
+
+def test_invalid_partition():
+    """
+    Ensure an error is raised when the partition doesn't exist.
+    """
+    _, layout = _layout()
+
+    with pytest.raises(ValueError):
+        list(layout.iter_partition(4, 4))
+
+
+def test_shelf_partitions():
+    """
+    Ensure the partitions are available from the shelf.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(50):
+            db[f"shelf-{i}"] = i
+
+        assert isinstance(db.dict.db, HashPrefixLayout)
+        partitions = [set(db.iter_partition(i, 8)) for i in range(8)]
+
+        assert set().union(*partitions) == set(db)
+        assert sum(len(p) for p in partitions) == len(db) == 50
+        assert db["shelf-1"] == 1
+
+
+def test_configure():
+    """
+    Ensure the layout is configured from the configuration file.
+    """
+    provider = InMemory(Mock())
+
+    assert configure(Mock(), provider, {}) is provider
+    assert configure(Mock(), provider, {"shards": "256"}).prefix(255) == b"ff/"
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, {"shards": "0"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, {"shards": "many"})
+
+
+def test_layout_is_recorded():
+    """
+    Ensure the first write records the layout, so the other providers read the keys where they are.
+    """
+    provider = InMemory(Mock())
+
+    writer = configure(Mock(), provider, {"shards": "16"})
+    assert not provider.contains(LAYOUT_KEY)
+    writer.set(b"key", b"value")
+    assert provider.contains(LAYOUT_KEY)
+
+    reader = detect(Mock(), provider)
+    assert isinstance(reader, HashPrefixLayout)
+    assert reader.shards == 16
+    assert reader.get(b"key") == b"value"
+    assert list(reader.iter()) == [b"key"]
+
+    empty = InMemory(Mock())
+    assert detect(Mock(), empty) is empty
+    assert configure(Mock(), provider, {}) is provider
+    assert detects({}) and not detects({"detect": "false"})
+    assert not detects({"shards": "16"})
+
+
+def test_layout_mismatch():
+    """
+    Ensure a shelf can't access the keys with another layout than the one recorded, unless the detection is disabled.
+    """
+    provider = InMemory(Mock())
+    configure(Mock(), provider, {"shards": "16"}).set(b"key", b"value")
+
+    assert configure(Mock(), provider, {"shards": "16"}).get(b"key") == b"value"
+    # The recorded layout is checked on the first access to a key.
+    layout = configure(Mock(), provider, {"shards": "32"})
+    with pytest.raises(ConfigurationError):
+        layout.get(b"key")
+    with pytest.raises(ConfigurationError):
+        list(layout.iter())
+    layout = configure(Mock(), provider, {"shards": "32", "detect": "false"})
+    with pytest.raises(KeyNotFoundError):
+        layout.get(b"key")
+
+
+def test_shelf_detects_layout(tmp_path):
+    """
+    Ensure a shelf opened without layout section detects the layout the keys were written with on the first access to a key.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["detected"] = 42
+
+    reader = tmp_path / "reader.ini"
+    reader.write_text(
+        "[default]\nprovider = in-memory\npersist-key = layout\nexists = true\n"
+    )
+    with cshelve.open(reader, "r") as db:
+        provider = db.dict.db
+        provider.get = Mock(wraps=provider.get)
+        # Opening the shelf doesn't read the layout.
+        assert not isinstance(db.dict.db, HashPrefixLayout)
+
+        assert db["detected"] == 42
+        assert list(db) == ["detected"]
+        assert isinstance(db.dict.db, HashPrefixLayout)
+        provider.get.assert_any_call(LAYOUT_KEY)
+
+    reader.write_text(
+        "[default]\nprovider = in-memory\npersist-key = layout\nexists = true\n"
+        "[layout]\ndetect = false\n"
+    )
+    with cshelve.open(reader, "r") as db:
+        # The keys are read as they are stored.
+        assert "detected" not in db
+        assert [key.split("/")[1] for key in db] == ["detected"]
@@ -0,0 +1,198 @@
+"""
+The listing engine lists the keys by partitions listed concurrently.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve._layout import HashPrefixLayout
+from cshelve._listing import ListingEngine, configure
+from cshelve.exceptions import ConfigurationError
+
+
+class RemoteInMemory(InMemory):
+    """
+    Stand-in provider listing its keys remotely, with a latency on each listing request.
+    """
+
+    paginated_listing = True
+
+    def __init__(self, logger) -> None:
+        super().__init__(logger)
+        self.configure_default({"exists": "True"})
+        self.listed_prefixes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def iter_prefix(self, prefix):
+        with self._lock:
+            self.listed_prefixes.append(prefix)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            return iter(list(super().iter_prefix(prefix)))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def populate(provider):
+    keys = [b"root"]
+    keys += [f"user/{i}/profile".encode() for i in range(20)]
+    keys += [f"event/{i}".encode() for i in range(30)]
+    for key in keys:
+        provider.set(key, b"value")
+    return keys
+
+
+def test_iter_lists_each_key_once():
+    """
+    Ensure the keys are listed once, whatever their depth.
+    """
+    provider = RemoteInMemory(Mock())
+    keys = populate(provider)
+    controller = ConcurrencyController(Mock(), initial_concurrency=8)
+    engine = ListingEngine(Mock())
+
+    assert sorted(engine.iter(provider, controller)) == sorted(keys)
+    assert engine.count(provider, controller) == len(keys)
+    controller.close()
+
+
+def test_partitions_are_listed_concurrently():
+    """
+    Ensure the partitions discovered with the delimiter are listed concurrently.
+    """
+    provider = RemoteInMemory(Mock())
+    populate(provider)
+    controller = ConcurrencyController(
+        Mock(), initial_concurrency=8, latency_tolerance=1000
+    )
+    engine = ListingEngine(Mock(), depth=2)
+
+    list(engine.iter(provider, controller))
+
+    # The second level of `user/` is expanded, `event/` only contains leaves.
+    assert b"user/0/" in provider.listed_prefixes
+    assert provider.max_in_flight > 1
+    controller.close()
+
+
+def test_iter_prefix():
+    """
+    Ensure only the keys starting with the prefix are listed.
+    """
+    provider = RemoteInMemory(Mock())
+    populate(provider)
+    controller = ConcurrencyController(Mock())
+    engine = ListingEngine(Mock())
+
+    assert sorted(engine.iter(provider, controller, b"user/")) == sorted(
+        f"user/{i}/profile".encode() for i in range(20)
+    )
+    assert engine.count(provider, controller, b"event/") == 30
+    controller.close()
+
+
+def test_layout_shards_are_partitions():
+    """
+    Ensure the shards of the hash prefix layout are listed without discovery.
+    """
+    provider = RemoteInMemory(Mock())
+    layout = HashPrefixLayout(Mock(), provider, 8)
+    keys = populate(layout)
+    controller = ConcurrencyController(Mock())
+    engine = ListingEngine(Mock())
+
+    assert sorted(engine.iter(layout, controller)) == sorted(keys)
+    assert engine.count(layout, controller, b"user/") == 20
+    assert sorted(provider.listed_prefixes[:8]) == sorted(
+        layout.prefix(shard) for shard in range(8)
+    )
+    controller.close()
+
+
+def test_sequential_fallback():
+    """
+    Ensure providers listing their keys locally, or a disabled engine, use the sequential listing.
+    """
+    provider = InMemory(Mock())
+    provider.configure_default({"exists": "True"})
+    populate(provider)
+    remote = RemoteInMemory(Mock())
+    populate(remote)
+    controller = ConcurrencyController(Mock())
+
+    assert list(ListingEngine(Mock()).iter(provider, controller)) == list(
+        provider.iter()
+    )
+    assert list(ListingEngine(Mock(), delimiter=b"").iter(remote, controller)) == list(
+        remote.iter()
+    )
+    assert ListingEngine(Mock(), parallel=False).count(remote, controller) == 51
+
+
+def test_database_uses_the_engine():
+    """
+    Ensure the database iterates, counts and pages through the keys with the engine.
+    """
+    logger = Mock()
+    provider = RemoteInMemory(logger)
+    keys = populate(provider)
+    db = _Database(logger, provider, "w", DataProcessing(logger))
+
+    assert sorted(db) == sorted(keys)
+    assert len(db) == len(keys)
+
+    page = db.list_keys(b"event/", page_size=10)
+    assert len(page.keys) == 10
+    assert page.continuation_token is not None
+    db.close()
+
+
+def test_shelf_list_keys():
+    """
+    Ensure the shelf returns the pages of keys and their continuation tokens.
+    """
+    with cshelve.open("tests/configurations/in-memory/not-persisted.ini") as db:
+        for i in range(25):
+            db[f"key{i:02}"] = i
+
+        keys, token = db.list_keys(page_size=10)
+        assert keys == [f"key{i:02}" for i in range(10)]
+
+        listed = keys
+        while token is not None:
+            keys, token = db.list_keys(page_size=10, continuation_token=token)
+            listed += keys
+
+        assert listed == [f"key{i:02}" for i in range(25)]
+        assert db.list_keys("key2")[0] == [f"key{i:02}" for i in range(20, 25)]
+
+
+def test_configure():
+    """
+    Ensure the engine is configured from the configuration file.
+    """
+    engine = configure(Mock(), {"delimiter": "-", "depth": "3"})
+    assert engine.delimiter == b"-"
+    assert engine.depth == 3
+    assert engine.parallel
+
+    assert not configure(Mock(), {"parallel": "false"}).parallel
+    assert not configure(Mock(), {"delimiter": ""}).parallel
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"depth": "0"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"depth": "deep"})
@@ -0,0 +1,207 @@
+"""
+Lists appended to are stored as segments, so an append only uploads the new items.
+"""
+import time
+
+import pytest
+
+import cshelve
+from cshelve._lists import decode_segments
+from cshelve._values import VALUES_PREFIX, decode_head, new_id, part_name
+
+
+CONFIG = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def _parts(db):
+    return {k for k in db.dict.db.db if k.startswith(VALUES_PREFIX)}
+
+
+def _segments(db, key):
+    head = decode_head(db.dict[key.encode()])
+    return [s.count for s in decode_segments(head.payload)]
+
+
+def test_append():
+    """
+    Ensure the appended items are read back and the segments are merged by size class.
+    """
+    with cshelve.open(CONFIG) as db:
+        for i in range(100):
+            db.append("events", i)
+
+        assert db["events"] == list(range(100))
+        assert list(db.list("events")) == list(range(100))
+        assert len(db.list("events")) == 100
+        # 100 = 64 + 4 * 8 + 4 * 1
+        assert _segments(db, "events") == [64, 8, 8, 8, 8, 1, 1, 1, 1]
+        # The merged segments are deleted by the compaction.
+        assert db.compact() == 104
+        assert len(_parts(db)) == 9
+
+
+def test_append_uploads_new_items(monkeypatch):
+    """
+    Ensure an append without merge uploads a segment containing only the new items.
+    """
+    with cshelve.open(CONFIG) as db:
+        db.extend("events", range(1000))
+        uploaded, set_parts = [], db.dict.set_parts
+
+        def record(parts):
+            parts = list(parts)
+            uploaded.extend(parts)
+            set_parts(parts)
+
+        monkeypatch.setattr(db.dict, "set_parts", record)
+
+        db.append("events", "new")
+
+        assert len(uploaded) == 1
+        assert db._loads(uploaded[0][1]) == ["new"]
+        assert db["events"][-1] == "new"
+
+
+def test_indexing():
+    """
+    Ensure items and slices are read from the segments containing them.
+    """
+    expected = list(range(50))
+    with cshelve.open(CONFIG) as db:
+        for start in range(0, 50, 7):
+            db.extend("numbers", range(start, min(start + 7, 50)))
+        numbers = db.list("numbers")
+
+        assert numbers[0] == 0
+        assert numbers[-1] == 49
+        assert numbers[20] == 20
+        assert numbers[5:30:3] == expected[5:30:3]
+        assert numbers[::-4] == expected[::-4]
+        assert numbers[60:] == []
+        with pytest.raises(IndexError):
+            numbers[50]
+
+
+def test_regular_values():
+    """
+    Ensure a list stored as a regular value is converted by an append, and other values are refused.
+    """
+    with cshelve.open(CONFIG) as db:
+        db["gaule"] = ["asterix", "obelix"]
+        assert list(db.list("gaule")) == ["asterix", "obelix"]
+
+        db.append("gaule", "panoramix")
+        assert db["gaule"] == ["asterix", "obelix", "panoramix"]
+        assert _segments(db, "gaule") == [2, 1]
+
+        db["rome"] = {"cesar": 1}
+        with pytest.raises(TypeError):
+            db.append("rome", "brutus")
+        with pytest.raises(TypeError):
+            len(db.list("rome"))
+
+
+def test_compact():
+    """
+    Ensure the segments of replaced lists are deleted by the compaction and a list can be merged into one segment.
+    """
+    with cshelve.open(CONFIG) as db:
+        db.extend("kept", range(3))
+        db.extend("kept", range(3, 6))
+        db.extend("replaced", range(3))
+        db.extend("deleted", range(3))
+
+        db["replaced"] = []
+        del db["deleted"]
+        assert db.compact() == 2
+        assert len(_parts(db)) == 2
+
+        db.list("kept").compact()
+        assert _segments(db, "kept") == [6]
+        assert db["kept"] == list(range(6))
+        assert db.compact() == 2
+        assert len(_parts(db)) == 1
+        assert db.compact() == 0
+
+
+def test_merge_during_iteration():
+    """
+    Ensure a reader iterating a list while its segments are merged reads the previous segments.
+    """
+    with cshelve.open(CONFIG) as db:
+        db.extend("events", range(8))
+        for i in range(8, 15):
+            db.append("events", i)
+
+        items = iter(db.list("events"))
+        assert next(items) == 0
+        db.append("events", 15)
+        assert _segments(db, "events") == [8, 8]
+        assert list(items) == list(range(1, 15))
+
+
+def test_compact_reads_the_heads_only(monkeypatch):
+    """
+    Ensure the compaction only reads the heads of the structured values, not the other values.
+    """
+    with cshelve.open(CONFIG) as db:
+        for i in range(20):
+            db[f"pickled-{i}"] = i
+        db.extend("kept", range(3))
+        db.extend("replaced", range(3))
+        db["replaced"] = []
+
+        read, get = [], db.dict.db.get
+        monkeypatch.setattr(db.dict.db, "get", lambda key: read.append(key) or get(key))
+        assert db.compact() == 1
+        assert not any(key.startswith(b"pickled") for key in read)
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure the parts without head, as uploaded before their head, are only deleted once unreferenced for the grace period.
+    """
+    with cshelve.open(CONFIG) as db:
+        db.dict.sweeper.grace_period = 60
+        db.extend("replaced", range(3))
+        db["replaced"] = []
+        # Part of a concurrent write whose head is not written yet.
+        db.dict.set_parts([(part_name(new_id(), new_id()), b"part")])
+
+        assert db.compact() == 0
+        assert len(_parts(db)) == 2
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 60)
+        assert db.compact() == 2
+        assert _parts(db) == set()
+
+
+def test_writeback():
+    """
+    Ensure an append doesn't lose the modifications of the cached value.
+    """
+    with cshelve.open(CONFIG, writeback=True) as db:
+        db["users"] = []
+        db["users"].append("asterix")
+
+        db.append("users", "obelix")
+
+        assert db["users"] == ["asterix", "obelix"]
+        db.sync()
+        assert db["users"] == ["asterix", "obelix"]
+
+
+def test_namespace():
+    """
+    Ensure the lists of a namespace are stored under its prefix.
+    """
+    with cshelve.open(CONFIG) as db:
+        tenant = db.namespace("tenant/")
+
+        tenant.append("events", 1)
+        tenant.extend("events", [2, 3])
+
+        assert tenant["events"] == [1, 2, 3]
+        assert db["tenant/events"] == [1, 2, 3]
+        assert db.count() == 1
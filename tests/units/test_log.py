@@ -0,0 +1,404 @@
+"""
+Writes are appended to a log instead of being sent one by one.
+"""
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._in_memory import InMemory
+from cshelve._log import (
+    CHECKPOINT_KEY,
+    DELETE,
+    SEGMENT_PREFIX,
+    SET,
+    Entry,
+    LogProvider,
+    configure,
+    decode_checkpoint,
+    decode_frames,
+    encode_checkpoint,
+    encode_frame,
+)
+from cshelve._packing import PackedProvider
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+from cshelve.provider_interface import INTERNAL_PREFIX
+
+
+CONFIG = "tests/configurations/in-memory/log.ini"
+
+
+class _NoAppend(InMemory):
+    """
+    Provider without appends, like AWS S3.
+    """
+
+    supports_append = False
+
+
+def _log(provider=None, **kwargs):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    kwargs.setdefault("batch_size", 64)
+    kwargs.setdefault("segment_size", 256)
+    kwargs.setdefault("grace_period", 0)
+    return provider, LogProvider(
+        logger, provider, ConcurrencyController(logger), **kwargs
+    )
+
+
+def _keys(log):
+    return sorted(k for k in log.iter() if not k.startswith(INTERNAL_PREFIX))
+
+
+def _segments(provider):
+    return sorted(k for k in provider.db if k.startswith(SEGMENT_PREFIX))
+
+
+def test_frames():
+    """
+    Ensure the records are decoded up to the first truncated or corrupted one.
+    """
+    first = encode_frame(SET, 1, b"key", b"value")
+    second = encode_frame(DELETE, 2, b"key")
+    corrupted = bytearray(encode_frame(SET, 3, b"key", b"other"))
+    corrupted[-1] ^= 0xFF
+
+    records, length = decode_frames(first + second + bytes(corrupted))
+
+    assert records == [(SET, 1, b"key", 20, 5), (DELETE, 2, b"key", len(first) + 20, 0)]
+    assert length == len(first + second)
+
+
+def test_checkpoint_round_trip():
+    """
+    Ensure the checkpoint is serialized and deserialized without loss.
+    """
+    positions = {SEGMENT_PREFIX + b"a": 100, SEGMENT_PREFIX + b"b": 20}
+    entries = {
+        b"key1": Entry(5, SEGMENT_PREFIX + b"a", 20, 10),
+        b"key2": Entry(6, None, 0, 0),
+        b"other": Entry(7, SEGMENT_PREFIX + b"b", 0, 20),
+    }
+
+    sealed = {SEGMENT_PREFIX + b"a", SEGMENT_PREFIX + b"b"}
+    retired = {SEGMENT_PREFIX + b"b"}
+
+    assert decode_checkpoint(
+        encode_checkpoint(positions, entries, sealed, retired)
+    ) == (positions, entries, sealed, retired)
+
+
+def test_writes_are_batched():
+    """
+    Ensure the records are appended by batches to a single segment.
+    """
+    provider, log = _log(segment_size=1024)
+    provider.append = Mock(wraps=provider.append)
+
+    for i in range(10):
+        log.set(f"key{i}".encode(), b"x" * 10)
+    log.sync()
+
+    assert provider.append.call_count < 10
+    assert len(_segments(provider)) == 1
+    assert not any(k.startswith(b"key") for k in provider.db)
+    assert log.get(b"key3") == b"x" * 10
+    assert _keys(log) == [f"key{i}".encode() for i in range(10)]
+
+
+def test_buffered_records_are_readable():
+    """
+    Ensure the records not yet written are visible to the writer.
+    """
+    provider, log = _log(batch_size=1024, segment_size=1024)
+
+    log.set(b"a", b"1")
+    log.set(b"b", b"2")
+    log.delete(b"b")
+
+    assert _segments(provider) == []
+    assert log.get(b"a") == b"1"
+    assert log.contains(b"a") and not log.contains(b"b")
+    with pytest.raises(KeyNotFoundError):
+        log.get(b"b")
+
+
+def test_rolling_segments():
+    """
+    Ensure each batch is an immutable segment without appends.
+    """
+    provider, log = _log(_NoAppend(Mock()))
+
+    for i in range(10):
+        log.set(f"key{i}".encode(), b"x" * 10)
+    log.sync()
+
+    assert len(_segments(provider)) > 1
+    _, reader = _log(provider)
+    assert _keys(reader) == [f"key{i}".encode() for i in range(10)]
+    assert reader.get(b"key9") == b"x" * 10
+
+
+def test_segments_are_rolled():
+    """
+    Ensure the segment of the writer is rolled once full.
+    """
+    provider, log = _log()
+
+    for i in range(50):
+        log.set(f"key{i}".encode(), b"x" * 10)
+    log.sync()
+
+    assert len(_segments(provider)) > 1
+    assert log.get(b"key0") == b"x" * 10
+
+
+def test_readers_replay_the_tail():
+    """
+    Ensure a reader sees the records written after the checkpoint, the most recent record winning.
+    """
+    provider, writer = _log(checkpoint_interval=2)
+    writer.set(b"a", b"1")
+    writer.set(b"b", b"1")
+    writer.sync()
+    assert CHECKPOINT_KEY in provider.db
+    writer.set(b"a", b"2")
+    writer.delete(b"b")
+    writer.sync()
+
+    _, reader = _log(provider)
+    assert reader.get(b"a") == b"2"
+    assert not reader.contains(b"b")
+    assert _keys(reader) == [b"a"]
+
+
+def test_stale_index_is_refreshed():
+    """
+    Ensure the records of other writers are seen once the index is stale.
+    """
+    provider, reader = _log(max_staleness=0)
+    _, writer = _log(provider)
+    assert not reader.contains(b"a")
+
+    writer.set(b"a", b"1")
+    writer.sync()
+
+    assert reader.get(b"a") == b"1"
+
+
+def test_truncated_tail_is_ignored():
+    """
+    Ensure a record partially appended by an interrupted writer is ignored.
+    """
+    provider, writer = _log()
+    writer.set(b"a", b"1")
+    writer.sync()
+    (segment,) = _segments(provider)
+    provider.db[segment] += encode_frame(SET, 2**62, b"b", b"2")[:-3]
+
+    _, reader = _log(provider)
+    assert _keys(reader) == [b"a"]
+
+
+def test_pre_existing_objects():
+    """
+    Ensure the objects written before the log mode stay readable and can be deleted.
+    """
+    provider, log = _log()
+    provider.set(b"old", b"1")
+    provider.set(b"other", b"2")
+
+    assert log.get(b"old") == b"1"
+    log.set(b"other", b"3")
+    log.delete(b"old")
+
+    assert _keys(log) == [b"other"]
+    assert log.get(b"other") == b"3"
+    with pytest.raises(KeyNotFoundError):
+        log.delete(b"old")
+    with pytest.raises(KeyNotFoundError):
+        log.delete(b"missing")
+
+    # The deletion is a record, the object is deleted by the compaction.
+    assert b"old" in provider.db
+    log.compact()
+    assert b"old" not in provider.db
+    assert _keys(log) == [b"other"]
+
+
+def test_deletions_are_logged(monkeypatch):
+    """
+    Ensure the deletions are batched records instead of a request per key.
+    """
+    provider, log = _log(batch_size=1024, segment_size=1024)
+    for i in range(10):
+        log.set(f"key{i}".encode(), b"value")
+    log.sync()
+    monkeypatch.setattr(provider, "delete", Mock(side_effect=AssertionError))
+
+    for i in range(10):
+        log.delete(f"key{i}".encode())
+    log.sync()
+
+    _, reader = _log(provider)
+    assert _keys(reader) == []
+
+
+def test_replay_reads_ranges(monkeypatch):
+    """
+    Ensure the readers only download the tail of the segments.
+    """
+    provider, log = _log(max_staleness=0)
+    _, reader = _log(provider, max_staleness=0)
+    log.set(b"key1", b"value1")
+    log.sync()
+    assert _keys(reader) == [b"key1"]
+
+    ranges = []
+    get_range = provider.get_range
+
+    def record(key, start, length):
+        ranges.append(start)
+        return get_range(key, start, length)
+
+    monkeypatch.setattr(provider, "get_range", record)
+    log.set(b"key2", b"value2")
+    log.sync()
+
+    assert _keys(reader) == [b"key1", b"key2"]
+    # The records already replayed are not downloaded again.
+    assert ranges and min(ranges) > 0
+
+
+def test_live_segments_are_not_compacted(monkeypatch):
+    """
+    Ensure the segments other writers may still append to are only compacted once closed or old enough.
+    """
+    provider, writer = _log(batch_size=1024, segment_size=1024)
+    _, compactor = _log(provider, batch_size=1024, segment_size=1024)
+    for i in range(10):
+        writer.set(f"key{i}".encode(), b"value")
+    for i in range(10):
+        writer.delete(f"key{i}".encode())
+    writer.sync()
+    (segment,) = _segments(provider)
+
+    assert compactor.compact() == 0
+    assert _segments(provider) == [segment]
+
+    monkeypatch.setattr("cshelve._log.SEAL_MARGIN", -compactor.segment_age)
+    assert compactor.compact() == 1
+    assert _segments(provider) == []
+
+    monkeypatch.undo()
+    monkeypatch.setattr(provider, "close", Mock())
+    writer.set(b"key", b"value")
+    writer.delete(b"key")
+    writer.close()
+    assert compactor.compact() == 1
+    assert _segments(provider) == []
+
+
+def test_compact():
+    """
+    Ensure the segments mostly made of garbage are rewritten and deleted, the live values being kept.
+    """
+    provider, log = _log(batch_size=1024, segment_size=1024)
+    for i in range(10):
+        log.set(f"key{i}".encode(), str(i).encode() * 10)
+    log.sync()
+    (old,) = _segments(provider)
+    for i in range(8):
+        log.delete(f"key{i}".encode())
+    log.sync()
+
+    assert log.compact() == 1
+
+    assert old not in provider.db
+    assert _keys(log) == [b"key8", b"key9"]
+    _, reader = _log(provider)
+    assert _keys(reader) == [b"key8", b"key9"]
+    assert reader.get(b"key9") == b"9" * 10
+    # Nothing left to compact.
+    assert log.compact() == 0
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure the compacted segments are only deleted after the grace period, so the readers with a stale index still read them.
+    """
+    provider, log = _log(batch_size=1024, segment_size=1024, grace_period=60)
+    for i in range(10):
+        log.set(f"key{i}".encode(), str(i).encode() * 10)
+    log.sync()
+    (old,) = _segments(provider)
+    _, reader = _log(provider)
+    assert reader.get(b"key9") == b"9" * 10
+    for i in range(8):
+        log.delete(f"key{i}".encode())
+    log.sync()
+
+    assert log.compact() == 0
+    assert old in provider.db
+    assert reader.get(b"key9") == b"9" * 10
+    # Retired segments are not replayed.
+    _, fresh = _log(provider)
+    assert _keys(fresh) == [b"key8", b"key9"]
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert log.compact() == 1
+    assert old not in provider.db
+    _, fresh = _log(provider)
+    assert _keys(fresh) == [b"key8", b"key9"]
+    assert fresh.get(b"key9") == b"9" * 10
+
+
+def test_configure():
+    """
+    Ensure the log mode is only enabled on demand and validates its parameters.
+    """
+    logger, provider = Mock(), InMemory(Mock())
+    controller = ConcurrencyController(logger)
+
+    assert configure(logger, provider, controller, {}) is provider
+    log = configure(
+        logger, provider, controller, {"enabled": "true", "batch_size": "10"}
+    )
+    assert isinstance(log, LogProvider)
+    assert log.batch_size == 10
+    with pytest.raises(ConfigurationError):
+        configure(logger, provider, controller, {"enabled": "true", "batch_size": "x"})
+    with pytest.raises(ConfigurationError):
+        configure(logger, provider, controller, {"enabled": "true", "batch_size": "0"})
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "grace_period": "-1"}
+        )
+    packed = PackedProvider(logger, provider, controller)
+    with pytest.raises(ConfigurationError):
+        configure(logger, packed, controller, {"enabled": "true"})
+
+
+def test_shelf():
+    """
+    Ensure a shelf in log mode behaves like any shelf and persists its values.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(1000):
+            db[f"key{i}"] = i
+        del db["key0"]
+        assert len(db) == 999
+
+    with cshelve.open(CONFIG, "r") as db:
+        assert db["key999"] == 999
+        assert "key0" not in db
+        assert len(db) == 999
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert len(db) == 0
+        assert _segments(db.dict.db.provider) == []
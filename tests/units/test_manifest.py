@@ -0,0 +1,220 @@
+"""
+The manifest indexes the keys of the shelf in its internal namespace.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve._layout import HashPrefixLayout
+from cshelve._manifest import (
+    MANIFEST_PREFIX,
+    Manifest,
+    ManifestEntry,
+    configure,
+    decode,
+    encode,
+)
+from cshelve.exceptions import ConfigurationError
+
+
+CONFIG = "tests/configurations/in-memory/manifest.ini"
+
+
+def _database(provider=None, max_staleness=60.0):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    controller = ConcurrencyController(logger)
+    manifest = Manifest(logger, provider, controller, 4, max_staleness)
+    db = _Database(
+        logger, provider, "w", DataProcessing(logger), controller, manifest=manifest
+    )
+    return provider, db
+
+
+def test_encode_decode():
+    """
+    Ensure the shard format is front-coded, compressed and reversible.
+    """
+    entries = {
+        f"user/{i:05}/profile".encode(): ManifestEntry(i * 100, i, 0)
+        for i in range(1000)
+    }
+
+    data = encode(entries)
+
+    assert decode(data) == entries
+    assert len(data) < sum(len(k) for k in entries) / 2
+    assert decode(encode({})) == {}
+
+
+def test_len_iter_contains():
+    """
+    Ensure the manifest answers the length, the iteration and the membership tests.
+    """
+    provider, db = _database()
+
+    for i in range(10):
+        db[f"key{i}".encode()] = b"value"
+    del db[b"key3"]
+
+    # Answered from the manifest without requests on the provider.
+    provider.contains = Mock()
+    provider.iter = Mock()
+    assert len(db) == 9
+    assert sorted(db) == sorted(f"key{i}".encode() for i in range(10) if i != 3)
+    assert b"key1" in db
+    assert b"key3" not in db
+    provider.contains.assert_not_called()
+    provider.iter.assert_not_called()
+    db.close()
+
+
+def test_entries():
+    """
+    Ensure each entry contains the size, the checksum and the version of the record.
+    """
+    _, db = _database()
+    db[b"key"] = b"value"
+
+    entry = db.manifest.get(b"key")
+
+    assert entry.size == len(db._to_record(b"value"))
+    assert entry.version == 0
+    assert db.manifest.get(b"missing") is None
+
+
+def test_flush_and_hidden_namespace():
+    """
+    Ensure the manifest is written on sync in the internal namespace, hidden from the listings.
+    """
+    provider, db = _database()
+    db[b"key"] = b"value"
+
+    assert not list(provider.iter_prefix(MANIFEST_PREFIX))
+    db.sync()
+    assert list(provider.iter_prefix(MANIFEST_PREFIX))
+
+    # Without the manifest, internal keys are not listed nor counted.
+    plain = _Database(Mock(), provider, "r", DataProcessing(Mock()))
+    assert list(plain) == [b"key"]
+    assert len(plain) == 1
+
+    with pytest.raises(ValueError):
+        db[MANIFEST_PREFIX + b"0"] = b"value"
+
+
+def test_bounded_staleness():
+    """
+    Ensure the updates of other writers are seen once the cache is stale.
+    """
+    provider, writer = _database()
+    _, cached = _database(provider, max_staleness=60)
+    _, fresh = _database(provider, max_staleness=0)
+    assert len(cached) == 0
+
+    writer[b"key"] = b"value"
+    writer.sync()
+
+    assert len(cached) == 0
+    assert len(fresh) == 1
+    assert b"key" in fresh
+
+
+def test_flush_merges_writers():
+    """
+    Ensure a writer keeps the updates of the other writers when flushing.
+    """
+    provider, first = _database(max_staleness=0)
+    _, second = _database(provider, max_staleness=0)
+
+    for i in range(20):
+        first[f"first{i}".encode()] = b"value"
+        second[f"second{i}".encode()] = b"value"
+    first.sync()
+    second.sync()
+
+    assert len(first) == 40
+
+
+def test_repair():
+    """
+    Ensure the manifest is rebuilt from the keys written without the manifest.
+    """
+    provider, db = _database()
+    db[b"key"] = b"value"
+    db.sync()
+
+    plain = _Database(Mock(), provider, "w", DataProcessing(Mock()))
+    plain[b"other"] = b"value"
+    del plain[b"key"]
+    assert sorted(db) == [b"key"]
+
+    db.repair_manifest()
+
+    assert sorted(db) == [b"other"]
+    assert db.manifest.get(b"other").size == len(db._to_record(b"value"))
+
+
+def test_layout_does_not_shard_internal_keys():
+    """
+    Ensure the manifest is stored untranslated with the hash prefix layout.
+    """
+    provider = InMemory(Mock())
+    layout = HashPrefixLayout(Mock(), provider, 16)
+    _, db = _database(layout)
+
+    db[b"key"] = b"value"
+    db.sync()
+
+    assert any(key.startswith(MANIFEST_PREFIX) for key in provider.db)
+    assert list(db) == [b"key"]
+    assert len(_Database(Mock(), layout, "r", DataProcessing(Mock()))) == 1
+
+
+def test_shelf():
+    """
+    Ensure the shelf uses the manifest and clears it with the `n` flag.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["a"] = 1
+        db["b"] = 2
+
+    with cshelve.open(CONFIG) as db:
+        assert len(db) == 2
+        assert sorted(db.keys()) == ["a", "b"]
+        db.repair_manifest()
+        assert "a" in db
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert len(db) == 0
+
+
+def test_configure():
+    """
+    Ensure the manifest is only enabled on demand.
+    """
+    provider, controller = InMemory(Mock()), Mock()
+
+    assert configure(Mock(), provider, controller, {}) is None
+    assert configure(Mock(), provider, controller, {"shards": "8"}) is None
+
+    manifest = configure(
+        Mock(),
+        provider,
+        controller,
+        {"enabled": "true", "shards": "8", "max_staleness": "5"},
+    )
+    assert manifest.shards == 8
+    assert manifest.max_staleness == 5
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, controller, {"enabled": "true", "shards": "0"})
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), provider, controller, {"enabled": "true", "shards": "x"})
@@ -0,0 +1,134 @@
+"""
+Namespaces are shelves restricted to a prefix, sharing the resources of their parent.
+"""
+import pickle
+
+import pytest
+
+import cshelve
+
+
+CONFIG = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def test_isolation():
+    """
+    Ensure each namespace only sees its own keys, stored under its prefix.
+    """
+    with cshelve.open(CONFIG) as db:
+        a, b = db.namespace("tenant-a/"), db.namespace("tenant-b/")
+
+        a["key"] = 1
+        b["key"] = 2
+        b["other"] = 3
+
+        assert a["key"] == 1
+        assert b["key"] == 2
+        assert sorted(db) == ["tenant-a/key", "tenant-b/key", "tenant-b/other"]
+        assert sorted(b) == ["key", "other"]
+        assert len(a) == 1
+        assert "other" not in a
+
+        del b["key"]
+        assert "tenant-b/key" not in db
+        with pytest.raises(KeyError):
+            a["other"]
+
+
+def test_shared_resources():
+    """
+    Ensure the namespaces reuse the provider, the data processing and the controller of their parent.
+    """
+    with cshelve.open(CONFIG) as db:
+        namespace = db.namespace("tenant/")
+
+        assert namespace.dict.database is db.dict
+        assert namespace.dict.concurrency is db.dict.concurrency
+        assert namespace._prefetcher is db._prefetcher
+
+        # Closing a namespace keeps its parent usable.
+        namespace["key"] = 1
+        namespace.close()
+        assert db["tenant/key"] == 1
+
+
+def test_shelf_interface():
+    """
+    Ensure the namespace supports the operations of the shelf.
+    """
+    with cshelve.open(CONFIG) as db:
+        namespace = db.namespace("tenant/")
+        db["outside"] = 0
+
+        namespace.update({f"user/{i}": i for i in range(5)})
+        namespace["event/1"] = 1
+
+        assert dict(namespace.items(prefix="user/")) == {
+            f"user/{i}": i for i in range(5)
+        }
+        assert sorted(namespace.values()) == [0, 1, 1, 2, 3, 4]
+        assert list(namespace.keys("event/")) == ["event/1"]
+        assert namespace.count("user/") == 5
+        assert namespace.list_keys("user/", page_size=2)[0] == ["user/0", "user/1"]
+
+        assert namespace.delete_prefix("user/") == 5
+        assert sorted(db) == ["outside", "tenant/event/1"]
+
+
+def test_nested_namespaces():
+    """
+    Ensure namespaces can be nested.
+    """
+    with cshelve.open(CONFIG) as db:
+        nested = db.namespace("tenant/").namespace("project/")
+        nested["key"] = 1
+
+        assert list(db) == ["tenant/project/key"]
+        assert list(nested) == ["key"]
+
+
+def test_writeback():
+    """
+    Ensure a namespace has its own writeback cache, written on sync.
+    """
+    with cshelve.open(CONFIG, writeback=True) as db:
+        namespace = db.namespace("tenant/")
+        namespace["key"] = [1]
+        namespace["key"].append(2)
+        namespace.sync()
+
+        assert db["tenant/key"] == [1, 2]
+
+
+def test_manifest_is_shared():
+    """
+    Ensure the writes of a namespace are recorded in the manifest of the shelf.
+    """
+    with cshelve.open("tests/configurations/in-memory/manifest.ini", "n") as db:
+        db.namespace("tenant/")["key"] = 1
+
+        assert db.dict.manifest.get(b"tenant/key") is not None
+        assert len(db) == 1
+
+
+def test_pickle():
+    """
+    Ensure a namespace is pickled as its parent and its prefix.
+    """
+    with cshelve.open("tests/configurations/in-memory/persisted.ini") as db:
+        namespace = db.namespace("pickled-namespace/")
+        namespace["key"] = 1
+
+        restored = pickle.loads(pickle.dumps(namespace))
+
+        assert restored["key"] == 1
+        assert restored.dict.prefix == b"pickled-namespace/"
+
+
+def test_empty_prefix():
+    """
+    Ensure a namespace requires a prefix.
+    """
+    with cshelve.open(CONFIG) as db:
+        with pytest.raises(ValueError):
+            db.namespace("")
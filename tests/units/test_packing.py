@@ -0,0 +1,506 @@
+"""
+Small values are packed into segments to reduce the number of requests.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+from cshelve._layout import HashPrefixLayout
+from cshelve._packing import (
+    INDEX_KEY,
+    SEGMENT_PREFIX,
+    WRITER_KEY,
+    Location,
+    PackedProvider,
+    configure,
+    decode_index,
+    encode_index,
+)
+from cshelve.exceptions import (
+    ConcurrentWriterError,
+    ConfigurationError,
+    KeyNotFoundError,
+)
+from cshelve.provider_interface import INTERNAL_PREFIX
+
+
+CONFIG = "tests/configurations/in-memory/packing.ini"
+
+
+def _packed(provider=None, **kwargs):
+    logger = Mock()
+    provider = provider or InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    kwargs.setdefault("max_value_size", 16)
+    kwargs.setdefault("segment_size", 64)
+    kwargs.setdefault("grace_period", 0)
+    return provider, PackedProvider(
+        logger, provider, ConcurrencyController(logger), **kwargs
+    )
+
+
+def _persisted(key):
+    # Providers sharing the same objects, closed independently.
+    provider = InMemory(Mock())
+    provider.configure_default({"persist-key": key})
+    return provider
+
+
+def _keys(packed):
+    return sorted(k for k in packed.iter() if not k.startswith(INTERNAL_PREFIX))
+
+
+def _segments(provider):
+    return [k for k in provider.db if k.startswith(SEGMENT_PREFIX)]
+
+
+def test_index_round_trip():
+    """
+    Ensure the index is serialized and deserialized without loss.
+    """
+    segments = {SEGMENT_PREFIX + b"a": 30, SEGMENT_PREFIX + b"b": 12}
+    entries = {
+        b"key1": Location(SEGMENT_PREFIX + b"a", 0, 10),
+        b"key2": Location(SEGMENT_PREFIX + b"a", 10, 20),
+        b"other": Location(SEGMENT_PREFIX + b"b", 0, 12),
+    }
+
+    assert decode_index(encode_index(segments, entries)) == (segments, entries)
+
+
+def test_small_values_are_packed():
+    """
+    Ensure small values are written in a single segment and large ones in dedicated objects.
+    """
+    provider, packed = _packed()
+
+    packed.set(b"a", b"1" * 10)
+    packed.set(b"b", b"2" * 10)
+    packed.set(b"large", b"3" * 100)
+    # Values of the buffer are readable before being written.
+    assert packed.get(b"a") == b"1" * 10
+    packed.sync()
+
+    assert b"a" not in provider.db and b"b" not in provider.db
+    assert provider.db[b"large"] == b"3" * 100
+    assert len(_segments(provider)) == 1
+    assert packed.get(b"a") == b"1" * 10
+    assert packed.get(b"b") == b"2" * 10
+    assert packed.get(b"large") == b"3" * 100
+    assert _keys(packed) == [b"a", b"b", b"large"]
+
+
+def test_reads_are_ranged():
+    """
+    Ensure a packed value is read with a ranged read of its segment.
+    """
+    provider, packed = _packed()
+    packed.set(b"a", b"1" * 10)
+    packed.set(b"b", b"2" * 10)
+    packed.sync()
+    provider.get_range = Mock(wraps=provider.get_range)
+
+    assert packed.get(b"b") == b"2" * 10
+    provider.get_range.assert_called_once_with(_segments(provider)[0], 10, 10)
+
+
+def test_full_segment_is_written():
+    """
+    Ensure the buffer is written as soon as the segment is full.
+    """
+    provider, packed = _packed()
+
+    for i in range(7):
+        packed.set(f"key{i}".encode(), b"x" * 10)
+
+    assert len(_segments(provider)) == 1
+
+
+def test_index_is_shared():
+    """
+    Ensure the next writer sees the synchronized values and keeps them when synchronizing its own.
+    """
+    _, first = _packed(_persisted("test_index_is_shared"))
+    provider, second = _packed(_persisted("test_index_is_shared"))
+
+    first.set(b"a", b"1")
+    first.close()
+    second.set(b"b", b"2")
+    second.sync()
+
+    _, reader = _packed(provider)
+    assert reader.get(b"a") == b"1"
+    assert reader.get(b"b") == b"2"
+    # The lease of the closed writer was released, the other one holds it.
+    assert WRITER_KEY in provider.db
+
+
+def test_single_writer(monkeypatch):
+    """
+    Ensure a single writer writes the index at a time, so the writers don't drop the changes of each other.
+    """
+    provider, first = _packed(lease_duration=60)
+    _, second = _packed(provider)
+    first.set(b"a", b"1")
+    first.sync()
+
+    second.set(b"b", b"2")
+    with pytest.raises(ConcurrentWriterError):
+        second.sync()
+    # Readers don't need the lease.
+    _, reader = _packed(provider)
+    assert reader.get(b"a") == b"1"
+    reader.sync()
+
+    # The lease of a writer that didn't close its shelf expires.
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    second.sync()
+    _, reader = _packed(provider)
+    assert reader.get(b"a") == b"1"
+    assert reader.get(b"b") == b"2"
+    first.set(b"c", b"3")
+    with pytest.raises(ConcurrentWriterError):
+        first.sync()
+
+
+def test_index_is_refreshed():
+    """
+    Ensure a reader sees the values packed by another writer once its index is stale.
+    """
+    provider, writer = _packed()
+    _, reader = _packed(provider, max_staleness=0)
+    _, cached = _packed(provider)
+    assert not reader.contains(b"a") and not cached.contains(b"a")
+
+    writer.set(b"a", b"1")
+    writer.sync()
+
+    assert reader.get(b"a") == b"1"
+    assert b"a" in list(reader.iter())
+    # Within the staleness, the index is not downloaded again.
+    assert not cached.contains(b"a")
+
+
+def test_uploads_dont_block():
+    """
+    Ensure the reads and writes are not blocked while a segment is uploaded.
+    """
+
+    class SlowProvider(InMemory):
+        def set(self, key, value):
+            if key.startswith(SEGMENT_PREFIX):
+                uploading.set()
+                assert release.wait(5)
+            super().set(key, value)
+
+    uploading, release = threading.Event(), threading.Event()
+    provider, packed = _packed(SlowProvider(Mock()))
+    packed.set(b"a", b"1")
+
+    flush = threading.Thread(target=packed.sync)
+    flush.start()
+    assert uploading.wait(5)
+    try:
+        # Values of the segment being uploaded are read from memory.
+        assert packed.get(b"a") == b"1"
+        packed.set(b"b", b"2")
+        assert packed.get_many([b"a", b"b"]) == {b"a": b"1", b"b": b"2"}
+    finally:
+        release.set()
+        flush.join()
+
+    packed.sync()
+    _, reader = _packed(provider)
+    assert reader.get(b"a") == b"1"
+    assert reader.get(b"b") == b"2"
+
+
+def test_get_many_coalesces_reads():
+    """
+    Ensure adjacent packed values are read with a single request.
+    """
+    provider, packed = _packed(segment_size=1024)
+    for i in range(10):
+        packed.set(f"key{i}".encode(), str(i).encode())
+    packed.set(b"large", b"x" * 100)
+    packed.sync()
+    provider.get_range = Mock(wraps=provider.get_range)
+
+    values = packed.get_many([b"key1", b"key5", b"key9", b"large", b"missing"])
+
+    assert values == {b"key1": b"1", b"key5": b"5", b"key9": b"9", b"large": b"x" * 100}
+    provider.get_range.assert_called_once()
+
+
+def test_compressed_segments():
+    """
+    Ensure compressed segments are decompressed once and cached.
+    """
+    provider, packed = _packed(compression=True)
+    packed.set(b"a", b"1" * 10)
+    packed.set(b"b", b"2" * 10)
+    packed.sync()
+    provider.get = Mock(wraps=provider.get)
+
+    assert packed.get(b"a") == b"1" * 10
+    assert packed.get(b"b") == b"2" * 10
+    provider.get.assert_called_once_with(_segments(provider)[0])
+
+
+def test_delete():
+    """
+    Ensure deleted values are neither listed nor readable.
+    """
+    _, packed = _packed()
+    packed.set(b"a", b"1")
+    packed.sync()
+
+    packed.delete(b"a")
+
+    assert not packed.contains(b"a")
+    assert _keys(packed) == []
+    with pytest.raises(KeyNotFoundError):
+        packed.get(b"a")
+    with pytest.raises(KeyNotFoundError):
+        packed.delete(b"a")
+
+
+def test_overwrite_with_large_value():
+    """
+    Ensure a packed value overwritten by a large value is read from its dedicated object.
+    """
+    _, packed = _packed()
+    packed.set(b"a", b"1")
+    packed.sync()
+
+    packed.set(b"a", b"2" * 100)
+    packed.sync()
+
+    assert packed.get(b"a") == b"2" * 100
+    assert _keys(packed) == [b"a"]
+
+
+def test_compact():
+    """
+    Ensure the segments mostly made of garbage are rewritten and deleted, the live values being kept.
+    """
+    provider, packed = _packed(segment_size=1024)
+    for i in range(10):
+        packed.set(f"key{i}".encode(), str(i).encode() * 10)
+    packed.sync()
+    (old,) = _segments(provider)
+    for i in range(8):
+        packed.delete(f"key{i}".encode())
+
+    assert packed.compact() == 1
+
+    assert old not in provider.db
+    assert len(_segments(provider)) == 1
+    assert _keys(packed) == [b"key8", b"key9"]
+    assert packed.get(b"key9") == b"9" * 10
+    _, reader = _packed(provider)
+    assert reader.get(b"key8") == b"8" * 10
+    # Nothing left to compact.
+    assert packed.compact() == 0
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure the rewritten segments and the outdated dedicated objects are only deleted after the grace period,
+    so the readers with a stale index still read them.
+    """
+    provider, packed = _packed(segment_size=1024, grace_period=60)
+    packed.set(b"large", b"x" * 100)
+    packed.sync()
+    packed.set(b"large", b"y")
+    for i in range(10):
+        packed.set(f"key{i}".encode(), str(i).encode() * 10)
+    packed.sync()
+    (old,) = _segments(provider)
+    _, reader = _packed(provider)
+    assert reader.get(b"key9") == b"9" * 10
+    for i in range(8):
+        packed.delete(f"key{i}".encode())
+
+    assert packed.compact() == 0
+    assert old in provider.db and b"large" in provider.db
+    assert reader.get(b"key9") == b"9" * 10
+    _, fresh = _packed(provider)
+    assert _keys(fresh) == [b"key8", b"key9", b"large"]
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert packed.compact() == 1
+    assert old not in provider.db and b"large" not in provider.db
+    _, fresh = _packed(provider)
+    assert _keys(fresh) == [b"key8", b"key9", b"large"]
+    assert fresh.get(b"large") == b"y"
+
+
+def test_internal_keys_are_not_packed():
+    """
+    Ensure the objects of the internal namespace are stored as-is.
+    """
+    provider, packed = _packed()
+
+    packed.set(b"__cshelve__/manifest/0", b"data")
+
+    assert provider.db[b"__cshelve__/manifest/0"] == b"data"
+
+
+def test_database_get_many():
+    """
+    Ensure the database decodes the values retrieved together.
+    """
+    provider, packed = _packed()
+    db = _Database(Mock(), packed, "w", DataProcessing(Mock()))
+    db[b"a"] = b"1"
+    db[b"b"] = b"2"
+
+    assert db.get_many([b"a", b"b", b"missing"]) == {b"a": b"1", b"b": b"2"}
+
+
+def test_configure():
+    """
+    Ensure the packed storage is only enabled on demand and validates its parameters.
+    """
+    logger, provider = Mock(), InMemory(Mock())
+    controller = ConcurrencyController(logger)
+
+    assert configure(logger, provider, controller, {}) is provider
+    packed = configure(
+        logger,
+        provider,
+        controller,
+        {"enabled": "true", "max_value_size": "100", "compression": "true"},
+    )
+    assert isinstance(packed, PackedProvider)
+    assert packed.max_value_size == 100 and packed.compression
+    assert packed.max_staleness == 60.0
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "segment_size": "x"}
+        )
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "max_value_size": "0"}
+        )
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "grace_period": "-1"}
+        )
+    with pytest.raises(ConfigurationError):
+        configure(
+            logger, provider, controller, {"enabled": "true", "lease_duration": "0"}
+        )
+
+
+def test_shelf():
+    """
+    Ensure a packed shelf behaves like any shelf and persists its values.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(100):
+            db[f"key{i}"] = i
+        db["large"] = "x" * 10000
+        del db["key0"]
+
+        assert len(db) == 100
+        assert db.get_many(["key1", "key2", "large", "missing"]) == {
+            "key1": 1,
+            "key2": 2,
+            "large": "x" * 10000,
+        }
+
+    with cshelve.open(CONFIG, "r") as db:
+        assert db["key99"] == 99
+        assert "key0" not in db
+        assert sorted(db.keys()) == sorted(
+            [f"key{i}" for i in range(1, 100)] + ["large"]
+        )
+
+    with cshelve.open(CONFIG, "n") as db:
+        assert len(db) == 0
+        # Only the empty index is left.
+        assert _segments(db.dict.db.provider) == []
+
+
+def test_get_many_writeback():
+    """
+    Ensure the values are read from the cache in writeback mode, and the keys can be a generator.
+    """
+    with cshelve.open(CONFIG, "n", writeback=True) as db:
+        db["cached"] = [1]
+        db["stored"] = [2]
+        db.sync()
+        db["cached"].append(3)
+
+        keys = (key for key in ["cached", "stored", "missing"])
+        assert db.get_many(keys) == {"cached": [1, 3], "stored": [2]}
+
+
+def test_compact_in_background():
+    """
+    Ensure the compaction can run in a thread.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(10):
+            db[f"key{i}"] = i
+        db.sync()
+        for i in range(9):
+            del db[f"key{i}"]
+
+        db.compact(background=True).join()
+
+        assert list(db.keys()) == ["key9"]
+        assert db["key9"] == 9
+
+
+def test_close_joins_the_compaction(monkeypatch):
+    """
+    Ensure closing the shelf waits for the compaction running in the background.
+    """
+    db = cshelve.open(CONFIG, "n")
+    db["key"] = 1
+    started, release = threading.Event(), threading.Event()
+    compact = db.dict._compact
+
+    def slow_compact():
+        started.set()
+        release.wait()
+        return compact()
+
+    monkeypatch.setattr(db.dict, "_compact", slow_compact)
+    thread = db.compact(background=True)
+    started.wait()
+    threading.Timer(0.1, release.set).start()
+
+    db.close()
+
+    assert not thread.is_alive()
+
+
+def test_len_with_layout():
+    """
+    Ensure the internal objects are not counted as keys with the hash prefix layout.
+    """
+    logger = Mock()
+    provider = InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    layout = HashPrefixLayout(logger, provider, 4)
+    _, packed = _packed(layout)
+    db = _Database(logger, packed, "w", DataProcessing(logger))
+
+    for i in range(10):
+        db[f"key{i}".encode()] = b"x" * (100 if i % 2 else 1)
+    db.sync()
+
+    assert len(db) == 10
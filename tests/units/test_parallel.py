@@ -0,0 +1,76 @@
+"""
+The map and reduce operations process the values of a shelf in worker processes.
+"""
+import multiprocessing
+import operator
+
+import pytest
+
+import cshelve
+
+
+CONFIG = "tests/configurations/in-memory/persisted.ini"
+
+# The in-memory provider is only shared with the workers if they are forked.
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="The in-memory provider requires the fork start method.",
+)
+
+
+def _square(value):
+    return value * value
+
+
+def _fill(db, size):
+    for i in range(size):
+        db[f"parallel-{i}"] = i
+
+
+def test_map():
+    """
+    Ensure the function is applied on all the values and the results are yielded in order.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db, 100)
+        keys = [f"parallel-{i}" for i in range(100)]
+
+        result = list(
+            db.map(_square, keys=keys, processes=2, chunksize=7, mp_context="fork")
+        )
+
+        assert result == [(f"parallel-{i}", i * i) for i in range(100)]
+
+
+def test_map_unordered_and_missing_keys():
+    """
+    Ensure missing keys are skipped when the order is not required.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db, 10)
+        keys = ["parallel-1", "does-not-exist", "parallel-2"]
+
+        result = db.map(_square, keys=keys, ordered=False, mp_context="fork")
+
+        assert sorted(result) == [("parallel-1", 1), ("parallel-2", 4)]
+
+
+def test_reduce():
+    """
+    Ensure the results are folded by the workers then by the caller.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db, 100)
+        keys = [f"parallel-{i}" for i in range(100)]
+
+        result = db.reduce(
+            _square,
+            operator.add,
+            0,
+            keys=keys,
+            processes=3,
+            chunksize=10,
+            mp_context="fork",
+        )
+
+        assert result == sum(i * i for i in range(100))
@@ -0,0 +1,107 @@
+"""
+Cloud shelves can be pickled to be sent to other processes, which open them again on their first use.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import pickle
+from unittest.mock import Mock, patch
+
+import pytest
+
+import cshelve
+from cshelve._concurrency import ConcurrencyController
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _after_fork, _Database
+from cshelve._in_memory import InMemory
+from cshelve._latency import LatencyPolicy
+
+
+CONFIG = "tests/configurations/in-memory/persisted.ini"
+
+
+def _read(db, key):
+    return db[key]
+
+
+def test_pickle_round_trip():
+    """
+    Ensure a pickled shelf is restored with the same configuration.
+    """
+    with cshelve.open(CONFIG, writeback=True, provider_params={"a": 1}) as db:
+        db["pickled"] = [1, 2, 3]
+        db.sync()
+
+        restored = pickle.loads(pickle.dumps(db))
+
+        assert isinstance(restored, cshelve.CloudShelf)
+        assert restored.writeback is True
+        assert restored._protocol == db._protocol
+        assert restored.dict.db._provider_params == {"a": 1}
+        assert restored["pickled"] == [1, 2, 3]
+        restored.close()
+
+
+def test_pickle_does_not_purge():
+    """
+    Ensure a shelf opened with the 'n' flag is not purged again when restored.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["kept"] = "value"
+
+        restored = pickle.loads(pickle.dumps(db))
+
+        assert restored.dict.flag == "w"
+        assert restored["kept"] == "value"
+        restored.close()
+
+
+def test_restored_shelf_is_lazy():
+    """
+    Ensure the restored shelf doesn't send any request before its first use.
+    """
+    with cshelve.open(CONFIG) as db:
+        data = pickle.dumps(db)
+
+    with patch.object(_Database, "_init") as init:
+        restored = pickle.loads(data)
+
+    init.assert_not_called()
+    restored.close()
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="The in-memory provider requires the fork start method.",
+)
+def test_process_pool():
+    """
+    Ensure a shelf can be sent to a process pool.
+    """
+    with cshelve.open(CONFIG) as db:
+        db["pool"] = {"answer": 42}
+
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(2, mp_context=context) as executor:
+            assert executor.submit(_read, db, "pool").result() == {"answer": 42}
+
+
+def test_after_fork():
+    """
+    Ensure clients, threads and locks are dropped in the child process after a fork.
+    """
+    logger = Mock()
+    provider = InMemory(logger)
+    provider.reconnect = Mock()
+    concurrency = ConcurrencyController(logger)
+    latency = LatencyPolicy(logger, read_timeout=1)
+    db = _Database(logger, provider, "c", DataProcessing(logger), concurrency, latency)
+    db._init()
+    db.set_many([(b"key", b"value")])
+    db[b"key"]
+
+    _after_fork()
+
+    provider.reconnect.assert_called_once()
+    assert concurrency._executor is None
+    assert latency._executor is None
+    assert db[b"key"] == b"value"
@@ -0,0 +1,146 @@
+"""
+The prefetcher pipelines the downloads and the decoding of the values during the iteration.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve import KeyNotFoundError
+from cshelve._concurrency import ConcurrencyController
+from cshelve._prefetch import Prefetcher, configure
+from cshelve.exceptions import ConfigurationError
+
+
+CONFIG = "tests/configurations/in-memory/not-persisted.ini"
+
+
+class Loader:
+    """
+    Load function recording the maximum number of concurrent loads.
+    """
+
+    def __init__(self, delay=0.01, size=1):
+        self.delay = delay
+        self.size = size
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if key == b"deleted":
+            raise KeyNotFoundError(key)
+        return key.upper(), self.size
+
+
+def test_ordered():
+    """
+    Ensure the values are yielded in listing order while several downloads are in flight.
+    """
+    keys = [f"key{i}".encode() for i in range(50)]
+    loader = Loader()
+    prefetcher = Prefetcher(Mock(), lookahead=8)
+
+    result = list(prefetcher.iter(ConcurrencyController(Mock()), keys, loader))
+
+    assert result == [(k, k.upper()) for k in keys]
+    assert 1 < loader.max_in_flight <= 8
+
+
+def test_as_completed():
+    """
+    Ensure all the values are yielded when the order is not required.
+    """
+    keys = [f"key{i}".encode() for i in range(50)]
+    prefetcher = Prefetcher(Mock(), ordered=False)
+
+    result = prefetcher.iter(ConcurrencyController(Mock()), keys, Loader(delay=0))
+
+    assert sorted(result) == sorted((k, k.upper()) for k in keys)
+
+
+def test_deleted_keys_are_skipped():
+    """
+    Ensure keys deleted between the listing and the download are skipped.
+    """
+    prefetcher = Prefetcher(Mock())
+
+    result = prefetcher.iter(
+        ConcurrencyController(Mock()), [b"a", b"deleted", b"b"], Loader(delay=0)
+    )
+
+    assert list(result) == [(b"a", b"A"), (b"b", b"B")]
+
+
+def test_memory_ceiling():
+    """
+    Ensure no new download is scheduled while the buffered bytes exceed the ceiling.
+    """
+    keys = [f"key{i}".encode() for i in range(20)]
+    # Downloads are slow enough to not complete while the lookahead is filled.
+    loader = Loader(delay=0.02, size=100)
+    prefetcher = Prefetcher(Mock(), lookahead=10, max_buffer_bytes=100)
+    iterator = prefetcher.iter(ConcurrencyController(Mock()), keys, loader)
+
+    next(iterator)
+    time.sleep(0.1)
+    next(iterator)
+
+    # Downloaded values exceed the ceiling, so no download is scheduled beyond the initial lookahead.
+    assert loader.calls == 10
+    assert len(list(iterator)) == 18
+    assert loader.calls == 20
+
+
+def test_items_and_values():
+    """
+    Ensure the shelf items and values views use the prefetcher.
+    """
+    with cshelve.open(CONFIG) as db:
+        for i in range(20):
+            db[f"key{i}"] = [i]
+
+        assert dict(db.items(lookahead=4)) == {f"key{i}": [i] for i in range(20)}
+        assert list(db.values()) == [[i] for i in range(20)]
+        assert sorted(db.values(ordered=False)) == [[i] for i in range(20)]
+        # The views keep the standard behavior.
+        assert len(db.items()) == 20
+        assert ("key1", [1]) in db.items()
+
+
+def test_items_with_writeback():
+    """
+    Ensure the cache remains the source of truth with writeback.
+    """
+    with cshelve.open(CONFIG, writeback=True) as db:
+        db["key"] = [1]
+        db.sync()
+        db["key"].append(2)
+
+        assert dict(db.items()) == {"key": [1, 2]}
+
+
+def test_configure():
+    """
+    Ensure the prefetcher is configured from the configuration file.
+    """
+    prefetcher = configure(
+        Mock(), {"lookahead": "4", "ordered": "false", "max_buffer_bytes": "1024"}
+    )
+
+    assert prefetcher.lookahead == 4
+    assert prefetcher.ordered is False
+    assert prefetcher.max_buffer_bytes == 1024
+
+    with pytest.raises(ConfigurationError):
+        configure(Mock(), {"lookahead": "0"})
@@ -0,0 +1,116 @@
+"""
+Prefix-scoped operations only list the keys starting with the prefix.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._data_processing import DataProcessing
+from cshelve._database import _Database
+from cshelve._in_memory import InMemory
+
+
+CONFIG = "tests/configurations/in-memory/not-persisted.ini"
+
+
+def _fill(db):
+    for i in range(5):
+        db[f"user/{i}/profile"] = i
+        db[f"event/{i}"] = i
+    db["users"] = "not a user"
+
+
+def test_keys_prefix():
+    """
+    Ensure the keys view is restricted to the prefix.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db)
+
+        keys = db.keys("user/")
+
+        assert list(keys) == [f"user/{i}/profile" for i in range(5)]
+        assert len(keys) == 5
+        assert "user/1/profile" in keys
+        assert "event/1" not in keys
+        # Without prefix, the view behaves as the standard one.
+        assert len(db.keys()) == 11
+        assert "users" in db.keys()
+
+
+def test_items_and_values_prefix():
+    """
+    Ensure the items and values views are restricted to the prefix.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db)
+
+        assert dict(db.items(prefix="event/")) == {f"event/{i}": i for i in range(5)}
+        assert sorted(db.values(prefix="user/")) == list(range(5))
+        assert len(db.items(prefix="event/")) == 5
+        assert ("event/1", 1) in db.items(prefix="event/")
+        assert ("users", "not a user") not in db.items(prefix="user/")
+
+
+def test_count_prefix():
+    """
+    Ensure the keys starting with a prefix are counted.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db)
+
+        assert db.count("user") == 6
+        assert db.count("user/") == 5
+        assert db.count("missing/") == 0
+        assert db.count() == 11
+
+
+def test_delete_prefix():
+    """
+    Ensure only the keys starting with the prefix are deleted.
+    """
+    with cshelve.open(CONFIG) as db:
+        _fill(db)
+
+        assert db.delete_prefix("user/") == 5
+
+        assert sorted(db) == sorted([f"event/{i}" for i in range(5)] + ["users"])
+        with pytest.raises(ValueError):
+            db.delete_prefix("")
+
+
+def test_delete_prefix_writeback():
+    """
+    Ensure the entries of the writeback cache are also deleted.
+    """
+    with cshelve.open(CONFIG, writeback=True) as db:
+        db["user/1"] = [1]
+        db.sync()
+        db["user/1"].append(2)
+        db["user/2"] = [2]
+
+        db.delete_prefix("user/")
+        db.sync()
+
+        assert "user/1" not in db
+        assert len(db) == 0
+
+
+def test_prefix_is_pushed_down():
+    """
+    Ensure the prefix is sent to the provider instead of filtering the full listing.
+    """
+    logger = Mock()
+    provider = InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    db = _Database(logger, provider, "w", DataProcessing(logger))
+    for key in [b"b/2", b"a/1", b"b/1"]:
+        db[key] = b"value"
+    provider.iter = Mock()
+    provider.iter_prefix = Mock(wraps=provider.iter_prefix)
+
+    assert list(db.iter_prefix(b"b/")) == [b"b/1", b"b/2"]
+
+    provider.iter.assert_not_called()
+    provider.iter_prefix.assert_called_once_with(b"b/")
@@ -0,0 +1,230 @@
+"""
+The replicated provider writes to all its replicas and reads from the fastest one.
+"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._composite import build
+from cshelve._concurrency import ConcurrencyController
+from cshelve._factory import factory
+from cshelve._in_memory import InMemory
+from cshelve._replicated import ReplicatedProvider
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/replicated.ini"
+
+
+def _replica(latency=0.0):
+    provider = InMemory(Mock())
+    provider.configure_default({"latency": str(latency)})
+    return provider
+
+
+def _replicated(latencies=(0.0, 0.0), **kwargs):
+    logger = Mock()
+    providers = {f"r{i}": _replica(latency) for i, latency in enumerate(latencies)}
+    return providers, ReplicatedProvider(
+        logger, providers, ConcurrencyController(logger), **kwargs
+    )
+
+
+def test_writes_go_to_all_replicas():
+    """
+    Ensure the writes and deletes are applied on all the replicas.
+    """
+    providers, replicated = _replicated()
+    replicated.set(b"key", b"value")
+    assert all(p.db == {b"key": b"value"} for p in providers.values())
+
+    replicated.delete(b"key")
+    assert all(p.db == {} for p in providers.values())
+    with pytest.raises(KeyNotFoundError):
+        replicated.delete(b"key")
+
+
+def test_reads_go_to_the_fastest_replica():
+    """
+    Ensure each replica is measured, then the reads go to the fastest one.
+    """
+    providers, replicated = _replicated((0.02, 0.0))
+    replicated.set(b"key", b"value")
+    for _ in range(3):
+        assert replicated.get(b"key") == b"value"
+
+    assert replicated.ranking() == ["r1", "r0"]
+    latencies = replicated.latencies
+    assert latencies["r0"] > latencies["r1"]
+
+    providers["r0"].get = Mock(side_effect=AssertionError("slowest replica"))
+    assert replicated.get(b"key") == b"value"
+
+
+def test_failover():
+    """
+    Ensure a read failing on a replica is retried on the next one, which is then preferred.
+    """
+    providers, replicated = _replicated()
+    replicated.set(b"key", b"value")
+    providers["r0"].get = Mock(side_effect=ConnectionError("down"))
+
+    assert replicated.get(b"key") == b"value"
+    assert replicated.get(b"key") == b"value"
+    assert replicated.ranking()[0] == "r1"
+    providers["r0"].get.assert_called_once()
+
+    with pytest.raises(KeyNotFoundError):
+        replicated.get(b"missing")
+
+
+def test_failed_replica_recovers(monkeypatch):
+    """
+    Ensure the penalty of a failed replica decays, so it is probed again after a few minutes and preferred once healthy.
+    """
+    providers, replicated = _replicated((0.0, 0.01))
+    replicated.set(b"key", b"value")
+    get = providers["r0"].get
+    providers["r0"].get = Mock(side_effect=ConnectionError("down"))
+    assert replicated.get(b"key") == b"value"
+
+    offset, monotonic = [0.0], time.monotonic
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic() + offset[0])
+    # The other replica serves the reads until the estimate of the failed one falls below its latency.
+    providers["r0"].get = Mock(wraps=get)
+    while not providers["r0"].get.called:
+        offset[0] += 10
+        assert replicated.get(b"key") == b"value"
+    assert 240 < offset[0] <= 360
+
+    for _ in range(3):
+        assert replicated.get(b"key") == b"value"
+    assert providers["r0"].get.call_count == 4
+    assert replicated.ranking()[0] == "r0"
+
+
+def test_all_replicas_fail():
+    """
+    Ensure the error is raised when no replica answers.
+    """
+    providers, replicated = _replicated()
+    for provider in providers.values():
+        provider.get = Mock(side_effect=ConnectionError("down"))
+
+    with pytest.raises(ConnectionError):
+        replicated.get(b"key")
+
+
+def test_list_keys_failover():
+    """
+    Ensure the pages are listed from a healthy replica, the next pages from the replica of the first one.
+    """
+    providers, replicated = _replicated((0.0, 0.0, 0.0))
+    for i in range(5):
+        replicated.set(f"key{i}".encode(), b"value")
+    providers["r0"].list_keys = Mock(side_effect=ConnectionError("down"))
+
+    page = replicated.list_keys(page_size=2)
+    name = page.continuation_token.split(":", 1)[0]
+    assert name in ["r1", "r2"]
+    keys = page.keys
+    while page.continuation_token:
+        page = replicated.list_keys(continuation_token=page.continuation_token)
+        keys += page.keys
+    assert keys == [f"key{i}".encode() for i in range(5)]
+    providers["r0"].list_keys.assert_called_once()
+
+
+def test_hedging():
+    """
+    Ensure a read slower than usual is sent to the next replica.
+    """
+    providers, replicated = _replicated(hedge=True, hedge_factor=2)
+    replicated.set(b"key", b"value")
+    for _ in range(4):
+        replicated.get(b"key")
+
+    # The fastest replica becomes very slow.
+    fastest = replicated.ranking()[0]
+    release = threading.Event()
+    original = providers[fastest].get
+    providers[fastest].get = lambda key: release.wait(5) and original(key)
+    # Reads of the warm-up may have been hedged by a scheduling hiccup.
+    replicated.hedged = 0
+
+    assert replicated.get(b"key") == b"value"
+    assert replicated.hedged == 1
+    release.set()
+
+
+def test_async_writes():
+    """
+    Ensure the background writes are applied in order, and their errors raised on sync.
+    """
+    providers, replicated = _replicated((0.0, 0.005), writes="async")
+    # Measure the replicas.
+    replicated.set(b"key", b"init")
+    replicated.sync()
+    for i in range(10):
+        replicated.set(b"key", f"{i}".encode())
+
+    assert replicated.get(b"key") == b"9"
+    replicated.sync()
+    assert all(p.db[b"key"] == b"9" for p in providers.values())
+
+    # A key not yet written on a lagging replica is found on the others.
+    providers["r0"].db[b"lagging"] = b"value"
+    providers["r1"].db.pop(b"lagging", None)
+    assert replicated.contains(b"lagging")
+
+    providers["r1"].set = Mock(side_effect=ConnectionError("down"))
+    replicated.set(b"other", b"value")
+    with pytest.raises(ConnectionError):
+        replicated.sync()
+
+
+def test_build():
+    """
+    Ensure the replicas are created from the sections of the configuration.
+    """
+    logger = Mock()
+    sections = {"a": {"provider": "in-memory"}, "b": {"provider": "in-memory"}}
+    build_replicated = lambda config: build(
+        logger,
+        factory,
+        ConcurrencyController(logger),
+        "replicated",
+        config,
+        sections,
+        {},
+        {},
+    )
+
+    replicated = build_replicated({"replicas": "a, b", "writes": "async"})
+    assert list(replicated.providers) == ["a", "b"]
+    assert replicated.writes == "async"
+
+    with pytest.raises(ConfigurationError):
+        build_replicated({})
+    with pytest.raises(ConfigurationError):
+        build_replicated({"replicas": "a, b", "writes": "eventually"})
+    with pytest.raises(ConfigurationError):
+        build_replicated({"replicas": "a, b", "smoothing": "2"})
+
+
+def test_shelf():
+    """
+    Ensure a shelf can be replicated from the configuration file.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(5):
+            db[f"key-{i}"] = i
+        for _ in range(3):
+            assert db["key-1"] == 1
+
+        assert isinstance(db.dict.db, ReplicatedProvider)
+        assert db.dict.db.ranking()[0] == "near"
+        assert len(db) == 5
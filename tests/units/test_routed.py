@@ -0,0 +1,194 @@
+"""
+The routed provider stores each key on the first route whose rules match.
+"""
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._composite import build
+from cshelve._concurrency import ConcurrencyController
+from cshelve._factory import factory
+from cshelve._in_memory import InMemory
+from cshelve._routed import MAGIC, RoutedProvider
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/routed.ini"
+
+
+def _routed(rules, names=("small", "large"), **kwargs):
+    logger = Mock()
+    providers = {name: InMemory(logger) for name in names}
+    return providers, RoutedProvider(
+        logger, providers, ConcurrencyController(logger), rules, **kwargs
+    )
+
+
+def test_size_rule():
+    """
+    Ensure the values are stored by size, the home of the key pointing to the values stored elsewhere.
+    """
+    providers, routed = _routed({"small": {"max_size": "10"}})
+    routed.set(b"tiny", b"value")
+    routed.set(b"huge", b"x" * 100)
+
+    assert providers["small"].db == {b"tiny": b"value", b"huge": MAGIC + b"large"}
+    assert providers["large"].db == {b"huge": b"x" * 100}
+
+    assert routed.get(b"tiny") == b"value"
+    assert routed.get(b"huge") == b"x" * 100
+    assert routed.get_range(b"huge", 10, 3) == b"xxx"
+    assert routed.contains(b"huge")
+    assert sorted(routed.iter()) == [b"huge", b"tiny"]
+    assert routed.len() == 2
+
+    routed.delete(b"huge")
+    # The value is left to the garbage collection.
+    assert list(providers["large"].db) == [b"huge"]
+    assert not routed.contains(b"huge")
+    with pytest.raises(KeyNotFoundError):
+        routed.get(b"huge")
+
+
+def test_match_rule():
+    """
+    Ensure the keys are stored by glob, without pointer as the route only depends on the key.
+    """
+    providers, routed = _routed({"small": {"match": "meta/*"}})
+    routed.set(b"meta/a", b"x" * 100)
+    routed.set(b"data/a", b"value")
+
+    assert list(providers["small"].db) == [b"meta/a"]
+    assert list(providers["large"].db) == [b"data/a"]
+
+    # Routes that can't store keys starting with the prefix are not listed.
+    providers["small"].iter_prefix = Mock(side_effect=AssertionError("listed"))
+    assert list(routed.iter_prefix(b"data/")) == [b"data/a"]
+
+
+def test_internal_objects_use_the_last_route():
+    """
+    Ensure the internal objects don't depend on the rules.
+    """
+    providers, routed = _routed({"small": {"max_size": "1000"}})
+    routed.set(b"__cshelve__/object", b"value")
+
+    assert list(providers["large"].db) == [b"__cshelve__/object"]
+    assert list(routed.iter_prefix(b"__cshelve__/")) == [b"__cshelve__/object"]
+
+
+def test_compact():
+    """
+    Ensure the values no pointer references anymore, overwritten or deleted, are deleted.
+    """
+    providers, routed = _routed({"small": {"max_size": "10"}}, grace_period=0)
+    routed.set(b"key", b"x" * 100)
+    routed.set(b"key", b"small")
+    routed.set(b"deleted", b"x" * 100)
+    routed.delete(b"deleted")
+    routed.set(b"kept", b"x" * 100)
+
+    assert sorted(providers["large"].db) == [b"deleted", b"kept", b"key"]
+    assert routed.get(b"key") == b"small"
+    assert routed.compact() == 2
+    assert list(providers["large"].db) == [b"kept"]
+    assert routed.get(b"kept") == b"x" * 100
+
+
+def test_compact_grace_period(monkeypatch):
+    """
+    Ensure a value without pointer, as written before its pointer, is only deleted once without pointer for the grace period.
+    """
+    providers, routed = _routed({"small": {"max_size": "10"}}, grace_period=60)
+    # The value of a concurrent writer, whose pointer is not written yet.
+    providers["large"].set(b"key", b"x" * 100)
+    providers["large"].set(b"other", b"x" * 100)
+
+    assert routed.compact() == 0
+    assert b"key" in providers["large"].db
+
+    routed.set(b"key", b"x" * 100)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+
+    assert routed.compact() == 1
+    assert routed.get(b"key") == b"x" * 100
+    assert b"other" not in providers["large"].db
+
+
+def test_list_keys_skips_the_values_stored_away():
+    """
+    Ensure the pages contain each key once.
+    """
+    _, routed = _routed({"small": {"max_size": "10"}})
+    keys = [f"key-{i}".encode() for i in range(50)]
+    for i, key in enumerate(keys):
+        routed.set(key, b"x" * (i % 20))
+
+    listed, token = [], None
+    while True:
+        page = routed.list_keys(page_size=7, continuation_token=token)
+        listed.extend(page.keys)
+        token = page.continuation_token
+        if token is None:
+            break
+
+    assert sorted(listed) == sorted(keys)
+
+
+def test_configuration():
+    """
+    Ensure the rules are read from the configuration and validated.
+    """
+    logger = Mock()
+    sections = {"small": {"provider": "in-memory"}, "large": {"provider": "in-memory"}}
+    build_routed = lambda config: build(
+        logger,
+        factory,
+        ConcurrencyController(logger),
+        "routed",
+        config,
+        sections,
+        {},
+        {},
+    )
+
+    routed = build_routed(
+        {"routes": "small, large", "small.max_size": "64", "small.match": "*.json"}
+    )
+    assert routed.routes[0].max_size == 64
+    assert routed.routes[0].match == b"*.json"
+
+    with pytest.raises(ConfigurationError):
+        build_routed({})
+    with pytest.raises(ConfigurationError):
+        build_routed({"routes": "small, large", "large.max_size": "64"})
+    with pytest.raises(ConfigurationError):
+        build_routed({"routes": "small, large", "other.max_size": "64"})
+    with pytest.raises(ConfigurationError):
+        build_routed({"routes": "small, large", "small.max_size": "big"})
+    with pytest.raises(ConfigurationError):
+        build_routed({"routes": "small, large", "grace_period": "x"})
+    assert (
+        build_routed({"routes": "small, large", "grace_period": "0"}).grace_period == 0
+    )
+
+
+def test_shelf():
+    """
+    Ensure a shelf can be routed from the configuration file and compacted.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["small"] = 1
+        db["large"] = "x" * 10_000
+        db["large"] = 2
+
+        assert isinstance(db.dict.db, RoutedProvider)
+        assert len(db) == 2
+        assert sorted(db) == ["large", "small"]
+        assert db.compact() == 1
+
+    with cshelve.open(CONFIG, "r") as db:
+        assert db["large"] == 2
@@ -0,0 +1,94 @@
+"""
+Shared objects are stored once under their key, the other values referencing them.
+"""
+import pickle
+
+import pytest
+
+import cshelve
+from cshelve._shared import SharedObjects
+from cshelve.exceptions import KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/shared.ini"
+
+
+def _vocabulary():
+    return {f"word {i}": i for i in range(1000)}
+
+
+def test_reference():
+    """
+    Ensure the values embedding a shared object store a reference instead of a copy.
+    """
+    vocabulary = _vocabulary()
+    with cshelve.open(CONFIG) as db:
+        db.share("vocabulary", vocabulary)
+        db["document"] = {"vocabulary": vocabulary, "words": [1, 2, 3]}
+        size = len(db.dict["document".encode()])
+
+        assert size < len(pickle.dumps(vocabulary)) // 10
+        assert db["document"]["vocabulary"] is vocabulary
+        assert db["vocabulary"] is vocabulary
+
+
+def test_resolve_once():
+    """
+    Ensure the references are resolved by downloading the shared object once, and the loaded values embed the same instance.
+    """
+    vocabulary = _vocabulary()
+    with cshelve.open(CONFIG) as db:
+        db.share("vocabulary", vocabulary)
+        db["a"] = [vocabulary, "a"]
+        db["b"] = [vocabulary, "b"]
+
+    with cshelve.open(CONFIG) as db:
+        a, b = db["a"], db["b"]
+
+        assert a[0] == vocabulary
+        assert a[0] is b[0] is db["vocabulary"]
+
+        # A shared object loaded through a reference is shared again.
+        db["c"] = [a[0], "c"]
+        assert len(db.dict["c".encode()]) < len(pickle.dumps(vocabulary)) // 10
+
+
+def test_replaced():
+    """
+    Ensure an object stops being shared when its key is overwritten or deleted, and the references to a deleted object fail.
+    """
+    vocabulary = _vocabulary()
+    with cshelve.open(CONFIG) as db:
+        db.share("vocabulary", vocabulary)
+        db["vocabulary"] = vocabulary
+        db["a"] = [vocabulary]
+        db["vocabulary"] = {}
+        db["b"] = [vocabulary]
+        assert db["b"] == [vocabulary]
+        assert db["vocabulary"] == {}
+
+        db.share("other", vocabulary)
+        db["c"] = [vocabulary]
+        del db["other"]
+        db["d"] = [vocabulary]
+        assert db["d"] == [vocabulary]
+
+    with cshelve.open(CONFIG) as db:
+        assert db["b"] == [vocabulary]
+        with pytest.raises(KeyNotFoundError):
+            db["c"]
+
+
+def test_registry():
+    """
+    Ensure the first object registered under a key is kept, and it is only unregistered by another object.
+    """
+    shared, first, second = SharedObjects(), [1], [2]
+
+    assert shared.add("key", first) is first
+    assert shared.add("key", second) is first
+    shared.discard("key", first)
+    assert shared.get("key") is first
+    shared.discard("key", second)
+    assert shared.get("key") is None
+    assert len(shared) == 0
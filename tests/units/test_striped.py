@@ -0,0 +1,190 @@
+"""
+The striped provider spreads the keys across several providers by consistent hashing.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._composite import build
+from cshelve._concurrency import ConcurrencyController
+from cshelve._factory import factory
+from cshelve._in_memory import InMemory
+from cshelve._striped import StripedProvider
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/striped.ini"
+KEYS = [f"key-{i}".encode() for i in range(300)]
+
+
+def _striped(names=("a", "b", "c"), **kwargs):
+    logger = Mock()
+    providers = {name: InMemory(logger) for name in names}
+    return providers, StripedProvider(
+        logger, providers, ConcurrencyController(logger), **kwargs
+    )
+
+
+def test_keys_are_spread():
+    """
+    Ensure each key is stored on a single stripe, and the stripes share the keys.
+    """
+    providers, striped = _striped()
+    for key in KEYS:
+        striped.set(key, key)
+
+    for name, provider in providers.items():
+        assert len(provider.db) > len(KEYS) / 6
+        assert all(striped.stripe(key) == name for key in provider.db)
+
+    assert all(striped.get(key) == key for key in KEYS)
+    assert sorted(striped.iter()) == sorted(KEYS)
+    assert striped.len() == len(KEYS)
+    assert striped.contains(KEYS[0])
+    assert not striped.contains(b"missing")
+
+
+def test_placement_is_stable():
+    """
+    Ensure the placement only depends on the names of the stripes, and adding a stripe only moves the keys it takes over.
+    """
+    _, before = _striped(("a", "b", "c"))
+    _, same = _striped(("c", "a", "b"))
+    _, after = _striped(("a", "b", "c", "d"))
+
+    assert all(before.stripe(key) == same.stripe(key) for key in KEYS)
+    for key in KEYS:
+        assert after.stripe(key) in (before.stripe(key), "d")
+
+
+def test_rebalance():
+    """
+    Ensure the keys are moved to their stripe after a stripe is added, without overwriting the newer values.
+    """
+    providers, striped = _striped(("a", "b"))
+    for key in KEYS:
+        striped.set(key, b"old")
+
+    providers["c"] = InMemory(Mock())
+    grown = StripedProvider(
+        Mock(), providers, ConcurrencyController(Mock()), fallback=True
+    )
+    taken = [key for key in KEYS if grown.stripe(key) == "c"]
+    assert taken
+
+    # Keys not moved yet are found on their former stripe.
+    assert grown.get(taken[0]) == b"old"
+    grown.set(taken[1], b"new")
+
+    assert grown.rebalance() == len(taken)
+    assert sorted(providers["c"].db) == sorted(taken)
+    assert grown.get(taken[1]) == b"new"
+    assert sorted(grown.iter()) == sorted(KEYS)
+    assert grown.rebalance() == 0
+
+
+def test_delete_with_fallback():
+    """
+    Ensure a deleted key isn't found again on its former stripe.
+    """
+    providers, striped = _striped(("a", "b"))
+    for key in KEYS:
+        striped.set(key, b"old")
+    providers["c"] = InMemory(Mock())
+    grown = StripedProvider(
+        Mock(), providers, ConcurrencyController(Mock()), fallback=True
+    )
+    key = next(key for key in KEYS if grown.stripe(key) == "c")
+
+    grown.set(key, b"new")
+    grown.delete(key)
+
+    assert not grown.contains(key)
+    with pytest.raises(KeyNotFoundError):
+        grown.get(key)
+    with pytest.raises(KeyNotFoundError):
+        grown.delete(key)
+
+
+def test_list_keys_pages_through_the_stripes():
+    """
+    Ensure the pages cover all the keys, stripe after stripe.
+    """
+    _, striped = _striped()
+    for key in KEYS:
+        striped.set(key, key)
+
+    keys, token = [], None
+    while True:
+        page = striped.list_keys(page_size=40, continuation_token=token)
+        keys.extend(page.keys)
+        token = page.continuation_token
+        if token is None:
+            break
+
+    assert sorted(keys) == sorted(KEYS)
+
+    with pytest.raises(ValueError):
+        striped.list_keys(delimiter=b"/")
+
+
+def test_build():
+    """
+    Ensure the stripes are created from the sections of the configuration.
+    """
+    logger = Mock()
+    sections = {
+        "a": {"provider": "in-memory"},
+        "b": {"provider": "in-memory"},
+        "loop": {"provider": "striped", "stripes": "a, loop"},
+    }
+    build_striped = lambda config: build(
+        logger,
+        factory,
+        ConcurrencyController(logger),
+        "striped",
+        config,
+        sections,
+        {},
+        {},
+    )
+
+    striped = build_striped({"stripes": "a, b", "vnodes": "16"})
+    assert list(striped.providers) == ["a", "b"]
+    assert len(striped._positions) == 32
+
+    with pytest.raises(ConfigurationError):
+        build_striped({})
+    with pytest.raises(ConfigurationError):
+        build_striped({"stripes": "a, unknown"})
+    with pytest.raises(ConfigurationError):
+        build_striped({"stripes": "loop"})
+    with pytest.raises(ConfigurationError):
+        build_striped({"stripes": "a", "vnodes": "0"})
+
+
+def test_shelf():
+    """
+    Ensure a shelf can be striped from the configuration file and rebalanced.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        for i in range(60):
+            db[f"shelf-{i}"] = i
+
+        assert isinstance(db.dict.db, StripedProvider)
+        assert len(db) == 60
+        assert db["shelf-1"] == 1
+        assert db.rebalance() == 0
+
+    with cshelve.open(CONFIG, "r") as db:
+        assert sorted(db) == sorted(f"shelf-{i}" for i in range(60))
+
+
+def test_rebalance_requires_stripes():
+    """
+    Ensure rebalancing a shelf that isn't striped is an error.
+    """
+    with cshelve.open("tests/configurations/in-memory/persisted.ini") as db:
+        with pytest.raises(ValueError):
+            db.rebalance()
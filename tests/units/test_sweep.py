@@ -0,0 +1,60 @@
+"""
+Unreferenced objects are deleted once unreferenced for the grace period.
+"""
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from cshelve._concurrency import ConcurrencyController
+from cshelve._in_memory import InMemory
+from cshelve._sweep import SWEEP_PREFIX, Sweeper
+
+
+def _sweeper(grace_period):
+    logger = Mock()
+    provider = InMemory(logger)
+    provider.configure_default({"exists": "True"})
+    for name in [b"a", b"b", b"c"]:
+        provider.set(name, b"garbage")
+    return provider, Sweeper(
+        logger, provider, ConcurrencyController(logger), b"test", grace_period
+    )
+
+
+def test_grace_period(monkeypatch):
+    """
+    Ensure the objects are deleted once unreferenced for the grace period, and forgotten when referenced again.
+    """
+    provider, sweeper = _sweeper(60)
+
+    assert sweeper.sweep([b"a", b"b"]) == []
+    assert SWEEP_PREFIX + b"test" in provider.db
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 30)
+    assert sweeper.sweep([b"a", b"c"]) == []
+
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert sweeper.sweep([b"a", b"b", b"c"]) == [b"a"]
+    assert sorted(k for k in provider.db if not k.startswith(SWEEP_PREFIX)) == [
+        b"b",
+        b"c",
+    ]
+
+    monkeypatch.setattr(time, "time", lambda: now + 100)
+    assert sweeper.sweep([b"b", b"c"]) == [b"c"]
+    assert sweeper.sweep([]) == []
+    assert list(provider.db) == [b"b"]
+
+
+def test_without_grace_period():
+    """
+    Ensure the objects are deleted right away without grace period, and negative ones are refused.
+    """
+    provider, sweeper = _sweeper(0)
+
+    assert sweeper.sweep([b"a", b"missing"]) == [b"a", b"missing"]
+    assert sorted(provider.db) == [b"b", b"c"]
+    with pytest.raises(ValueError):
+        _sweeper(-1)
@@ -0,0 +1,193 @@
+"""
+The tiered provider serves the frequently read keys from a hot tier and writes through to a cold tier.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+import cshelve
+from cshelve._composite import build
+from cshelve._concurrency import ConcurrencyController
+from cshelve._factory import factory
+from cshelve._in_memory import InMemory
+from cshelve._tiered import FrequencySketch, TieredProvider
+from cshelve.exceptions import ConfigurationError, KeyNotFoundError
+
+
+CONFIG = "tests/configurations/in-memory/tiered.ini"
+
+
+def _tiered(**kwargs):
+    logger = Mock()
+    hot, cold = InMemory(logger), InMemory(logger)
+    tiered = TieredProvider(
+        logger, {"hot": hot, "cold": cold}, ConcurrencyController(logger), **kwargs
+    )
+    return hot, cold, tiered
+
+
+def test_sketch():
+    """
+    Ensure the sketch never underestimates the reads, and forgets the old ones.
+    """
+    sketch = FrequencySketch(width=64)
+    for i in range(10):
+        assert sketch.add(b"hot") >= i + 1
+    sketch.add(b"cold")
+
+    assert sketch.estimate(b"hot") >= 10
+    assert sketch.estimate(b"cold") >= 1
+
+    for i in range(640):
+        sketch.add(f"other-{i}".encode())
+    assert sketch.estimate(b"hot") < 10
+
+
+def test_writes_go_through():
+    """
+    Ensure the writes are stored in the cold tier only.
+    """
+    hot, cold, tiered = _tiered()
+    tiered.set(b"key", b"value")
+
+    assert cold.db == {b"key": b"value"}
+    assert hot.db == {}
+    assert list(tiered.iter()) == [b"key"]
+    assert tiered.len() == 1
+
+
+def test_promotion():
+    """
+    Ensure a key read often enough is served by the hot tier, and kept up-to-date.
+    """
+    hot, cold, tiered = _tiered(promote_after=2)
+    tiered.set(b"key", b"value")
+
+    assert tiered.get(b"key") == b"value"
+    assert hot.db == {}
+    assert tiered.get(b"key") == b"value"
+    assert hot.db == {b"key": b"value"}
+
+    cold.get = Mock(side_effect=AssertionError("served by the hot tier"))
+    assert tiered.get(b"key") == b"value"
+    assert tiered.get_range(b"key", 1, 2) == b"al"
+    assert tiered.contains(b"key")
+
+    tiered.set(b"key", b"new")
+    assert tiered.get(b"key") == b"new"
+    assert cold.db[b"key"] == b"new"
+
+    tiered.delete(b"key")
+    assert hot.db == {} and cold.db == {}
+    assert tiered.hot_size == 0
+
+
+def test_capacity():
+    """
+    Ensure the hot tier respects its capacity, demoting the keys read less often.
+    """
+    hot, _, tiered = _tiered(promote_after=1, capacity=10)
+    for key in (b"a", b"b", b"c"):
+        tiered.set(key, b"12345")
+
+    tiered.get(b"a")
+    tiered.get(b"b")
+    tiered.get(b"a")
+    assert sorted(hot.db) == [b"a", b"b"]
+
+    # Read as often as the least recently read key: it takes its place.
+    tiered.get(b"c")
+    assert sorted(hot.db) == [b"a", b"c"]
+    assert tiered.hot_size == 10
+
+    # Too large for the hot tier.
+    tiered.set(b"large", b"x" * 11)
+    tiered.get(b"large")
+    assert b"large" not in hot.db
+
+
+def test_admission():
+    """
+    Ensure a key read rarely doesn't evict a key read more often.
+    """
+    hot, _, tiered = _tiered(promote_after=1, capacity=5)
+    tiered.set(b"frequent", b"12345")
+    tiered.set(b"rare", b"12345")
+    for _ in range(5):
+        tiered.get(b"frequent")
+
+    tiered.get(b"rare")
+    assert list(hot.db) == [b"frequent"]
+
+
+def test_close_empties_the_hot_tier():
+    """
+    Ensure the hot tier doesn't keep copies the next writers wouldn't invalidate.
+    """
+    hot, _, tiered = _tiered(promote_after=1)
+    tiered.set(b"key", b"value")
+    tiered.get(b"key")
+    assert hot.db
+
+    db = hot.db
+    tiered.close()
+    assert db == {}
+
+
+def test_hot_tier_miss():
+    """
+    Ensure a key evicted from the hot tier by itself is read from the cold tier.
+    """
+    hot, _, tiered = _tiered(promote_after=1)
+    tiered.set(b"key", b"value")
+    tiered.get(b"key")
+    hot.db.clear()
+
+    assert tiered.get(b"key") == b"value"
+    with pytest.raises(KeyNotFoundError):
+        tiered.get(b"missing")
+
+
+def test_build():
+    """
+    Ensure the tiers are created from the sections of the configuration.
+    """
+    logger = Mock()
+    sections = {"fast": {"provider": "in-memory"}, "slow": {"provider": "in-memory"}}
+    build_tiered = lambda config: build(
+        logger,
+        factory,
+        ConcurrencyController(logger),
+        "tiered",
+        config,
+        sections,
+        {},
+        {},
+    )
+
+    tiered = build_tiered({"hot": "fast", "cold": "slow", "capacity": "100"})
+    assert tiered.hot is not tiered.cold
+    assert tiered.capacity == 100
+
+    with pytest.raises(ConfigurationError):
+        build_tiered({"hot": "fast"})
+    with pytest.raises(ConfigurationError):
+        build_tiered({"hot": "fast", "cold": "slow", "promote_after": "0"})
+    with pytest.raises(ConfigurationError):
+        build_tiered({"hot": "fast", "cold": "slow", "capacity": "big"})
+
+
+def test_shelf():
+    """
+    Ensure a shelf can be tiered from the configuration file.
+    """
+    with cshelve.open(CONFIG, "n") as db:
+        db["key"] = "value"
+        for _ in range(3):
+            assert db["key"] == "value"
+
+        assert isinstance(db.dict.db, TieredProvider)
+        assert db.dict.db.hot_size > 0
+
+    with cshelve.open(CONFIG, "r") as db:
+        assert db["key"] == "value"